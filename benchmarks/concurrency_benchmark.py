@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Adaptive concurrency simulation benchmark.
+
+Simulates notifier worker threads sending through a fake relay
+with a fixed capacity. Sends beyond the relay capacity are slower,
+and sends well beyond it are throttled (SMTP 421). The benchmark
+compares a static concurrency equal to the number of workers with
+the AdaptiveConcurrencyLimiter.
+
+Usage:
+    python benchmarks/concurrency_benchmark.py --workers 32 --capacity 8
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+SERVICE_NAME = "notificationsvc"
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from concurrency import AdaptiveConcurrencyLimiter
+
+
+class RelayThrottled(Exception):
+    pass
+
+
+class FakeRelay(object):
+    """Fake relay with a concurrency capacity ceiling.
+
+    Latency grows linearly with the number of sends above capacity,
+    and sends above throttle_factor * capacity are rejected.
+    """
+    def __init__(self, capacity, latency, throttle_factor=1.5):
+        self.capacity = capacity
+        self.latency = latency
+        self.throttle_factor = throttle_factor
+        self.lock = threading.Lock()
+        self.active = 0
+
+    def send(self):
+        with self.lock:
+            self.active += 1
+            active = self.active
+        try:
+            if active > self.capacity * self.throttle_factor:
+                time.sleep(self.latency / 10.0)
+                raise RelayThrottled()
+            overload = max(0, active - self.capacity)
+            time.sleep(self.latency * (1 + float(overload) / self.capacity))
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def run(limiter, relay, workers, duration):
+    stats = {"sends": 0, "throttled": 0, "latency": 0.0, "limit_samples": []}
+    stats_lock = threading.Lock()
+    end = time.time() + duration
+
+    def worker():
+        while time.time() < end:
+            slot = limiter.acquire()
+            start = time.time()
+            try:
+                relay.send()
+                latency = time.time() - start
+                slot.record(latency)
+                with stats_lock:
+                    stats["sends"] += 1
+                    stats["latency"] += latency
+            except RelayThrottled:
+                slot.record(time.time() - start, throttled=True)
+                with stats_lock:
+                    stats["throttled"] += 1
+            finally:
+                limiter.release(slot)
+
+    threads = [threading.Thread(target=worker) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    while time.time() < end:
+        stats["limit_samples"].append(limiter.limit)
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    return stats
+
+
+def report(name, stats, duration):
+    sends = stats["sends"]
+    samples = stats["limit_samples"] or [0]
+    print "%-10s sends/sec=%8.1f throttled=%6d avg_latency_ms=%7.1f avg_limit=%5.1f final_limit=%d" % (
+        name,
+        sends / duration,
+        stats["throttled"],
+        1000.0 * stats["latency"] / sends if sends else 0,
+        float(sum(samples)) / len(samples),
+        samples[-1])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Adaptive concurrency simulation benchmark")
+    parser.add_argument("--workers", type=int, default=32, help="number of worker threads")
+    parser.add_argument("--capacity", type=int, default=8, help="relay concurrency capacity")
+    parser.add_argument("--latency", type=float, default=0.02, help="relay base latency (seconds)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    args = parser.parse_args(argv[1:])
+
+    relay = FakeRelay(args.capacity, args.latency)
+
+    static = AdaptiveConcurrencyLimiter(
+        min_limit=args.workers,
+        max_limit=args.workers,
+        latency_target=args.latency)
+    report("static", run(static, relay, args.workers, args.duration), args.duration)
+
+    adaptive = AdaptiveConcurrencyLimiter(
+        min_limit=1,
+        max_limit=args.workers,
+        latency_target=args.latency * 1.5)
+    report("adaptive", run(adaptive, relay, args.workers, args.duration), args.duration)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
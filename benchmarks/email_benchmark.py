@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""Email provider throughput benchmark.
+
+Sends templated messages from concurrent worker threads through
+SmtpProvider to a local FakeSmtpServer, and through
+HttpEmailApiProvider to a local FakeEmailApi, where all
+recipients of the message are batched into shared API calls.
+
+Usage:
+    python benchmarks/email_benchmark.py --messages 2000 --threads 64 --latency 0.02
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+SERVICE_NAME = "notificationsvc"
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+TESTS_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", "tests"))
+sys.path.insert(0, SERVICE_ROOT)
+sys.path.insert(0, TESTS_ROOT)
+
+from providers.emailapi import EmailApiClient, HttpEmailApiProvider
+from providers.http import HttpConnectionPool
+from providers.smtp import SmtpProvider
+
+from fakehttp import FakeEmailApi
+from fakesmtp import FakeSmtpServer
+
+
+FROM_EMAIL = "Support <support@techresidents.com>"
+SUBJECT = "Hello $first_name"
+PLAIN_TEXT = "Dear $first_name $last_name, this is a benchmark message."
+HTML_TEXT = "<p>Dear $first_name $last_name, this is a benchmark message.</p>"
+
+
+def run_workers(messages, threads, send):
+    remaining = [messages]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                index = remaining[0]
+            send(index)
+
+    start = time.time()
+    workers = [threading.Thread(target=worker) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.time() - start
+
+
+def run_smtp(latency, messages, threads):
+    server = FakeSmtpServer(latency={"DATA": latency})
+    server.start()
+    try:
+        local = threading.local()
+
+        def send(index):
+            # One provider per worker, as with the notifier pool.
+            if not hasattr(local, "provider"):
+                local.provider = SmtpProvider(
+                    username=None,
+                    password=None,
+                    host=server.host,
+                    port=server.port,
+                    from_email=FROM_EMAIL,
+                    use_tls=False,
+                    connect_timeout=30,
+                    read_timeout=30)
+            substitutions = {"first_name": "user%d" % index, "last_name": "Benchmark"}
+            local.provider.send(
+                recipient="user%d@techresidents.com" % index,
+                subject=SUBJECT.replace("$first_name", substitutions["first_name"]),
+                plain_text=PLAIN_TEXT,
+                html_text=HTML_TEXT)
+
+        elapsed = run_workers(messages, threads, send)
+        print "smtp                 messages/sec=%8.1f connections=%6d" % (
+            messages / elapsed, server.connections)
+    finally:
+        server.stop()
+
+
+def run_api(latency, messages, threads, pool_size, batch_size, batch_delay, compress):
+    api = FakeEmailApi(latency=latency)
+    api.start()
+    try:
+        connection_pool = HttpConnectionPool(
+            host=api.host,
+            port=api.port,
+            size=pool_size,
+            timeout=30)
+        client = EmailApiClient(
+            connection_pool=connection_pool,
+            path=api.path,
+            from_email=FROM_EMAIL,
+            max_batch_size=batch_size,
+            max_batch_delay=batch_delay,
+            batch_threads=pool_size,
+            compress=compress,
+            timeout=30)
+        provider = HttpEmailApiProvider(client)
+
+        def send(index):
+            provider.send(
+                recipient="user%d@techresidents.com" % index,
+                subject=SUBJECT,
+                plain_text=PLAIN_TEXT,
+                html_text=HTML_TEXT,
+                substitutions={"first_name": "user%d" % index, "last_name": "Benchmark"})
+
+        elapsed = run_workers(messages, threads, send)
+        client.close()
+        print "api batch_size=%-5d messages/sec=%8.1f requests=%6d connections=%d gzip=%s" % (
+            batch_size,
+            messages / elapsed,
+            len(api.requests),
+            connection_pool.connections_created,
+            compress)
+    finally:
+        api.stop()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Email provider throughput benchmark")
+    parser.add_argument("--messages", type=int, default=2000, help="number of messages")
+    parser.add_argument("--threads", type=int, default=64, help="number of worker threads")
+    parser.add_argument("--pool-size", type=int, default=4, help="connection pool size")
+    parser.add_argument("--latency", type=float, default=0.02, help="server latency per message/request (seconds)")
+    parser.add_argument("--batch-delay", type=float, default=0.01, help="max batch delay (seconds)")
+    args = parser.parse_args(argv[1:])
+
+    run_smtp(args.latency, args.messages, args.threads)
+    for batch_size in [1, 100, 1000]:
+        run_api(args.latency, args.messages, args.threads, args.pool_size,
+                batch_size, args.batch_delay, True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
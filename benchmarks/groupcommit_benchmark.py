@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""Group commit intake benchmark.
+
+Simulates concurrent notify() calls, each inserting a notification
+row and a job row per recipient, and compares committing each call
+in its own transaction with the GroupCommitter. Reports notifies/sec,
+commits/sec, and call latency percentiles for each mode.
+
+By default a temporary SQLite database is used, with
+synchronous=FULL so each commit is fsynced; pass --database to
+benchmark against another database, i.e. postgresql.
+
+Usage:
+    python benchmarks/groupcommit_benchmark.py --clients 32 --notifies 4000 --recipients 2
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, Column, ForeignKey, Integer, MetaData, String, Table
+from sqlalchemy.orm import sessionmaker
+
+SERVICE_NAME = "notificationsvc"
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from groupcommit import GroupCommitter
+from metrics import MetricRegistry
+
+
+metadata = MetaData()
+notification_table = Table("benchmark_notification", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("token", String(64), nullable=False))
+job_table = Table("benchmark_notification_job", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("notification_id", Integer, ForeignKey("benchmark_notification.id"), nullable=False),
+    Column("recipient_id", Integer, nullable=False))
+
+
+def create_session_factory(database):
+    engine_args = {}
+    if database.startswith("sqlite"):
+        engine_args["connect_args"] = {"check_same_thread": False, "timeout": 60}
+    engine = create_engine(database, **engine_args)
+    if database.startswith("sqlite"):
+        @event.listens_for(engine, "connect")
+        def on_connect(connection, record):
+            connection.execute("PRAGMA synchronous=FULL")
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)
+
+
+def notify_write(token, recipients):
+    def write(db_session):
+        result = db_session.execute(notification_table.insert().values(token=token))
+        notification_id = result.inserted_primary_key[0]
+        db_session.execute(job_table.insert(), [
+            {"notification_id": notification_id, "recipient_id": recipient_id}
+            for recipient_id in range(recipients)])
+        return notification_id
+    return write
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(name, notify, notifies, clients, commits):
+    remaining = [notifies]
+    lock = threading.Lock()
+    latencies = []
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                index = remaining[0]
+            start = time.time()
+            notify("%s-%d" % (name, index))
+            latency = time.time() - start
+            with lock:
+                latencies.append(latency)
+
+    start = time.time()
+    threads = [threading.Thread(target=client) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    commit_count = commits()
+    print "%-8s %6d notifies in %.2fs: %8.1f notifies/sec %8.1f commits/sec " \
+          "(%.1f notifies/commit) p50=%.1fms p99=%.1fms" % (
+        name, len(latencies), elapsed, len(latencies) / elapsed, commit_count / elapsed,
+        float(len(latencies)) / max(1, commit_count),
+        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Group commit intake benchmark")
+    parser.add_argument("--database", default=None,
+            help="sqlalchemy database url, defaults to a temporary sqlite database")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--notifies", type=int, default=4000)
+    parser.add_argument("--recipients", type=int, default=2)
+    parser.add_argument("--max-wait", type=float, default=0.005)
+    parser.add_argument("--max-batch", type=int, default=100)
+    args = parser.parse_args(argv[1:])
+
+    directory = None
+    database = args.database
+    if database is None:
+        directory = tempfile.mkdtemp()
+        database = "sqlite:///%s" % os.path.join(directory, "benchmark.db")
+
+    try:
+        engine, db_session_factory = create_session_factory(database)
+
+        # Each notify() commits its own transaction
+        direct_commits = [0]
+        commit_lock = threading.Lock()
+        def direct_notify(token):
+            db_session = db_session_factory()
+            try:
+                notify_write(token, args.recipients)(db_session)
+                db_session.commit()
+                with commit_lock:
+                    direct_commits[0] += 1
+            finally:
+                db_session.close()
+        run("direct", direct_notify, args.notifies, args.clients, lambda: direct_commits[0])
+
+        # Concurrent notify() calls are group committed
+        metrics = MetricRegistry()
+        committer = GroupCommitter(
+            db_session_factory=db_session_factory,
+            max_wait=args.max_wait,
+            max_batch=args.max_batch,
+            metrics=metrics)
+        committer.start()
+        try:
+            def group_notify(token):
+                committer.submit(notify_write(token, args.recipients))
+            run("group", group_notify, args.notifies, args.clients,
+                lambda: metrics.get("notifier_group_commits") or 0)
+        finally:
+            committer.stop()
+            committer.join()
+
+        metadata.drop_all(engine)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+"""Load generator for the notify() Thrift endpoint.
+
+Drives TNotificationService.notify from many concurrent clients,
+each with its own connection, and reports requests/sec, latency
+percentiles, and the database rows written.
+
+Recipient counts per notification are drawn from a distribution:
+    fixed:N           always N recipients
+    uniform:A-B       uniformly between A and B recipients
+    pareto:ALPHA:MAX  heavy tailed, mostly small with rare large
+                      fan-outs, capped at MAX recipients
+
+The priority mix is given as weights, i.e. 'high=5,default=90,low=5',
+and --template-fraction sets the fraction of notifications using
+${first_name}/${last_name} template strings.
+
+Recipients are sampled from --user-ids, which must be existing
+users, i.e. '1-1000'. If --database is given, rows written are
+counted from the database; otherwise they are estimated.
+
+Clients send through a connection created by run()'s connect
+callable, ThriftConnection by default, so the generator can also
+be driven against an in-process handler.
+
+Usage:
+    python benchmarks/notify_loadgen.py --host localhost --port 9095 \\
+        --clients 16 --requests 5000 --recipients pareto:1.5:500 \\
+        --database postgresql+psycopg2://techresidents:techresidents@/localdev_techresidents?host=localdev
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+SERVICE_NAME = "notificationsvc"
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+
+PRIORITIES = ["high", "default", "low"]
+
+
+def parse_user_ids(spec):
+    """Parse a user id list, i.e. '1-100,200,300-310'."""
+    user_ids = []
+    for part in spec.split(","):
+        start, _, end = part.partition("-")
+        if end:
+            user_ids.extend(range(int(start), int(end) + 1))
+        else:
+            user_ids.append(int(start))
+    return user_ids
+
+
+def recipient_distribution(spec, max_recipients):
+    """Returns a callable(random) drawing a recipient count."""
+    kind, _, args = spec.partition(":")
+    if kind == "fixed":
+        count = int(args)
+        draw = lambda r: count
+    elif kind == "uniform":
+        low, _, high = args.partition("-")
+        draw = lambda r: r.randint(int(low), int(high))
+    elif kind == "pareto":
+        alpha, _, cap = args.partition(":")
+        alpha = float(alpha)
+        cap = int(cap) if cap else max_recipients
+        draw = lambda r: min(cap, int(r.paretovariate(alpha)))
+    else:
+        raise ValueError("Unknown recipient distribution '%s'" % spec)
+    return lambda r: max(1, min(max_recipients, draw(r)))
+
+
+def priority_mix(spec):
+    """Returns a callable(random) drawing a priority name from weights."""
+    choices = []
+    total = 0.0
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in PRIORITIES:
+            raise ValueError("Unknown priority '%s'" % name)
+        total += float(weight)
+        choices.append((total, name))
+    def draw(r):
+        value = r.random() * total
+        for limit, priority in choices:
+            if value < limit:
+                return priority
+        return choices[-1][1]
+    return draw
+
+
+def percentile(values, p):
+    """Returns the p-th percentile of sorted values."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+class DatabaseCounter(object):
+    """Counts notification rows, to measure rows written."""
+    def __init__(self, database):
+        from sqlalchemy import create_engine, func
+        from sqlalchemy.orm import sessionmaker
+        from trsvcscore.db.models import Notification as NotificationModel
+        from trsvcscore.db.models import NotificationJob as NotificationJobModel
+        from trsvcscore.db.models.notification_models import NotificationUser as NotificationUserModel
+        self.func = func
+        self.models = [NotificationModel, NotificationJobModel, NotificationUserModel]
+        self.db_session_factory = sessionmaker(bind=create_engine(database))
+
+    def count(self):
+        """Returns dict of table name to row count."""
+        db_session = self.db_session_factory()
+        try:
+            return dict((model.__tablename__,
+                         db_session.query(self.func.count(model.id)).scalar())
+                        for model in self.models)
+        finally:
+            db_session.close()
+
+
+class ThriftConnection(object):
+    """notify() client over its own Thrift connection.
+
+    Thrift and the service IDL packages are imported here, so
+    the generator can be driven by other connections without them.
+    """
+    def __init__(self, args):
+        from thrift.protocol import TBinaryProtocol
+        from thrift.transport import TSocket, TTransport
+        from tridlcore.gen.ttypes import RequestContext
+        from trnotificationsvc.gen import TNotificationService
+        from trnotificationsvc.gen.ttypes import Notification, NotificationPriority
+
+        self.Notification = Notification
+        self.priorities = {
+            "high": NotificationPriority.HIGH_PRIORITY,
+            "default": NotificationPriority.DEFAULT_PRIORITY,
+            "low": NotificationPriority.LOW_PRIORITY
+        }
+        self.request_context = RequestContext(userId=0, impersonatingUserId=0,
+                sessionId="loadgen", context="")
+
+        socket = TSocket.TSocket(args.host, args.port)
+        socket.setTimeout(args.timeout * 1000)
+        if args.framed:
+            self.transport = TTransport.TFramedTransport(socket)
+        else:
+            self.transport = TTransport.TBufferedTransport(socket)
+        protocol = TBinaryProtocol.TBinaryProtocol(self.transport)
+        self.transport.open()
+        self.client = TNotificationService.Client(protocol)
+
+    def notify(self, context, notification):
+        """Send a notification dict to notify()."""
+        self.client.notify(self.request_context, context, self.Notification(
+            token=notification["token"],
+            priority=self.priorities[notification["priority"]],
+            recipientUserIds=notification["recipient_ids"],
+            subject=notification["subject"],
+            plainText=notification["plain_text"],
+            htmlText=notification["html_text"]))
+
+    def is_open(self):
+        return self.transport.isOpen()
+
+    def close(self):
+        self.transport.close()
+
+
+class Client(threading.Thread):
+    """Load generating client with its own connection."""
+    def __init__(self, index, args, connect, next_request, draw_recipients, draw_priority, user_ids):
+        super(Client, self).__init__()
+        self.daemon = True
+        self.args = args
+        self.connect = connect
+        self.next_request = next_request
+        self.draw_recipients = draw_recipients
+        self.draw_priority = draw_priority
+        self.user_ids = user_ids
+        self.random = random.Random(args.seed + index)
+        self.latencies = []
+        self.errors = {}
+        self.recipients = 0
+
+    def _notification(self):
+        count = self.draw_recipients(self.random)
+        templated = self.random.random() < self.args.template_fraction
+        if templated:
+            subject = "Load test for ${first_name}"
+            plain_text = "Dear ${first_name} ${last_name}, this is a load test."
+            html_text = "<p>Dear ${first_name} ${last_name}, this is a load test.</p>"
+        else:
+            subject = "Load test"
+            plain_text = "This is a load test."
+            html_text = "<p>This is a load test.</p>"
+        return {
+            "token": uuid.uuid4().hex,
+            "priority": self.draw_priority(self.random),
+            "recipient_ids": self.random.sample(self.user_ids, min(count, len(self.user_ids))),
+            "subject": subject,
+            "plain_text": plain_text,
+            "html_text": html_text
+        }
+
+    def run(self):
+        connection = self.connect(self.args)
+        try:
+            while self.next_request():
+                notification = self._notification()
+                start = time.time()
+                try:
+                    connection.notify(self.args.context, notification)
+                    self.latencies.append(time.time() - start)
+                    self.recipients += len(notification["recipient_ids"])
+                except Exception as error:
+                    name = error.__class__.__name__
+                    self.errors[name] = self.errors.get(name, 0) + 1
+                    if not connection.is_open():
+                        connection = self.connect(self.args)
+        finally:
+            connection.close()
+
+
+def parse_args(argv):
+    """Parse command line arguments, excluding the program name."""
+    parser = argparse.ArgumentParser(description="notify() load generator")
+    parser.add_argument("--host", default="localhost", help="service host")
+    parser.add_argument("--port", type=int, default=9095, help="service port")
+    parser.add_argument("--framed", action="store_true", help="use framed transport")
+    parser.add_argument("--timeout", type=float, default=30, help="request timeout (seconds)")
+    parser.add_argument("--clients", type=int, default=8, help="number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=1000, help="total number of requests")
+    parser.add_argument("--duration", type=float, default=None, help="run for seconds instead of --requests")
+    parser.add_argument("--recipients", default="fixed:1", help="recipient count distribution")
+    parser.add_argument("--max-recipients", type=int, default=1000, help="maximum recipients per notification")
+    parser.add_argument("--priorities", default="high=5,default=90,low=5", help="priority weights")
+    parser.add_argument("--template-fraction", type=float, default=0.5, help="fraction using template strings")
+    parser.add_argument("--user-ids", default="1-100", help="recipient user ids to sample from")
+    parser.add_argument("--context", default="loadgen", help="notification context")
+    parser.add_argument("--database", default=None, help="sqlalchemy database URL to count rows written")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    return parser.parse_args(argv)
+
+
+def run(args, connect=ThriftConnection):
+    """Run the load and return its results.
+
+    Args:
+        args: parsed arguments
+        connect: callable(args) returning a new connection
+            with notify(context, notification), is_open() and
+            close() methods; ThriftConnection by default.
+    Returns:
+        dict with the 'elapsed' seconds, sorted 'latencies',
+        number of 'recipients', 'errors' dict of exception
+        name to count, and 'written' dict of table to rows
+        written if --database was given, otherwise None.
+    """
+    draw_recipients = recipient_distribution(args.recipients, args.max_recipients)
+    draw_priority = priority_mix(args.priorities)
+    user_ids = parse_user_ids(args.user_ids)
+
+    lock = threading.Lock()
+    remaining = [args.requests]
+    deadline = [None]
+
+    def next_request():
+        if deadline[0] is not None:
+            return time.time() < deadline[0]
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    counter = DatabaseCounter(args.database) if args.database else None
+    rows_before = counter.count() if counter else None
+
+    clients = [Client(i, args, connect, next_request, draw_recipients, draw_priority, user_ids)
+               for i in range(args.clients)]
+    start = time.time()
+    if args.duration is not None:
+        deadline[0] = start + args.duration
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.time() - start
+
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    recipients = sum(client.recipients for client in clients)
+    errors = {}
+    for client in clients:
+        for name, count in client.errors.items():
+            errors[name] = errors.get(name, 0) + count
+
+    written = None
+    if counter:
+        rows_after = counter.count()
+        written = dict((table, rows_after[table] - rows_before[table]) for table in rows_after)
+
+    return {
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "recipients": recipients,
+        "errors": errors,
+        "written": written
+    }
+
+
+def main(argv):
+    result = run(parse_args(argv[1:]))
+    elapsed = result["elapsed"]
+    latencies = result["latencies"]
+    recipients = result["recipients"]
+    errors = result["errors"]
+    written = result["written"]
+
+    print "requests=%d errors=%d elapsed=%.2fs requests/sec=%.1f recipients/sec=%.1f" % (
+        len(latencies), sum(errors.values()), elapsed,
+        len(latencies) / elapsed, recipients / elapsed)
+    for name, count in sorted(errors.items()):
+        print "  %s: %d" % (name, count)
+    print "latency ms: p50=%.2f p90=%.2f p99=%.2f max=%.2f" % (
+        percentile(latencies, 50) * 1000,
+        percentile(latencies, 90) * 1000,
+        percentile(latencies, 99) * 1000,
+        (latencies[-1] if latencies else 0) * 1000)
+
+    if written is not None:
+        print "rows written: %s total=%d rows/sec=%.1f" % (
+            " ".join("%s=%d" % item for item in sorted(written.items())),
+            sum(written.values()), sum(written.values()) / elapsed)
+    else:
+        # One notification row, plus a job and a recipient row per recipient
+        estimated = len(latencies) + 2 * recipients
+        print "rows written (estimated): total=%d rows/sec=%.1f" % (estimated, estimated / elapsed)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
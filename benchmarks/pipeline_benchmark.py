@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""Full pipeline throughput benchmark.
+
+Seeds notifications x recipients jobs into a database and
+processes them with NotificationJobMonitor, NotificationThreadPool
+and Notifier, delivering to a SinkProvider so the numbers reflect
+the cost of the service itself rather than an email provider.
+
+Reports jobs/sec and latency percentiles for each stage:
+    queue:    run start until the monitor dispatches the job
+    pool:     dispatch until a worker thread picks up the job
+    process:  claiming, rendering, sending and finishing the job
+    send:     provider send
+    total:    run start until the job is finished
+
+Usage:
+    python benchmarks/pipeline_benchmark.py --notifications 100 --recipients 100 --threads 8
+    python benchmarks/pipeline_benchmark.py --database postgresql://localhost/notification_benchmark
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+SERVICE_NAME = "notificationsvc"
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import func
+
+from trpycore.factory.base import Factory
+from trpycore.pool.queue import QueuePool
+from trsvcscore.db.models import Notification as NotificationModel
+from trsvcscore.db.models import NotificationJob as NotificationJobModel
+from trsvcscore.db.models import User
+
+from constants import EMAIL_CHANNEL, NOTIFICATION_PRIORITY_VALUES
+from jobmonitor import NotificationJobMonitor, NotificationThreadPool
+from models import create_tables
+from notifier import Notifier
+from providers.sink import SinkProvider, SinkStats
+
+
+def percentile(values, p):
+    """Returns the p-th percentile of sorted values."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def seed(db_session_factory, notifications, recipients):
+    """Seed users, notifications and a job per recipient.
+
+    Returns:
+        number of jobs created
+    """
+    db_session = db_session_factory()
+    try:
+        users = []
+        for i in range(recipients):
+            user = User(
+                first_name="first%d" % i,
+                last_name="last%d" % i,
+                email="user%d@benchmark.techresidents.com" % i)
+            users.append(user)
+        db_session.add_all(users)
+        db_session.flush()
+
+        priority = NOTIFICATION_PRIORITY_VALUES["DEFAULT_PRIORITY"]
+        for i in range(notifications):
+            notification = NotificationModel(
+                created=func.current_timestamp(),
+                token="benchmark-%d-%d" % (time.time(), i),
+                context="benchmark",
+                priority=priority,
+                subject="Benchmark notification %d for ${first_name}" % i,
+                plain_text="Dear ${first_name} ${last_name}, this is a benchmark.",
+                html_text="<p>Dear ${first_name} ${last_name}, this is a benchmark.</p>")
+            db_session.add(notification)
+            db_session.flush()
+
+            # Bulk insert jobs, bypassing the ORM unit of work
+            db_session.execute(NotificationJobModel.__table__.insert(), [{
+                "created": func.current_timestamp(),
+                "not_before": func.current_timestamp(),
+                "notification_id": notification.id,
+                "recipient_id": user.id,
+                "priority": priority,
+                "retries_remaining": 0
+            } for user in users])
+
+        db_session.commit()
+        return notifications * recipients
+    finally:
+        db_session.close()
+
+
+class StageTimer(object):
+    """Records per-job timestamps for each pipeline stage."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dispatched = {}
+        self.started = {}
+        self.finished = {}
+
+    def mark(self, stage, job_id):
+        now = time.time()
+        with self.lock:
+            stage[job_id] = now
+
+
+def run(args):
+    engine_args = {}
+    if args.database.startswith("sqlite"):
+        engine_args["connect_args"] = {"check_same_thread": False, "timeout": 60}
+    engine = create_engine(args.database, **engine_args)
+    # Create shared tables (users, notifications, jobs) if needed
+    NotificationJobModel.metadata.create_all(bind=engine, checkfirst=True)
+    create_tables(engine)
+    db_session_factory = sessionmaker(bind=engine)
+
+    total = seed(db_session_factory, args.notifications, args.recipients)
+    print "seeded %d jobs (%d notifications x %d recipients)" % (
+        total, args.notifications, args.recipients)
+
+    stats = SinkStats()
+    timer = StageTimer()
+
+    class TimedNotifier(Notifier):
+        def send(self, database_job):
+            timer.mark(timer.started, database_job.id)
+            try:
+                return super(TimedNotifier, self).send(database_job)
+            finally:
+                timer.mark(timer.finished, database_job.id)
+
+    def notifier_factory():
+        return TimedNotifier(
+            db_session_factory=db_session_factory,
+            providers={EMAIL_CHANNEL: SinkProvider(stats, latency=args.latency)},
+            job_retry_seconds=300,
+            channel=EMAIL_CHANNEL)
+
+    thread_pool = NotificationThreadPool(
+        num_threads=args.threads,
+        notifier_pool=QueuePool(size=args.threads, factory=Factory(notifier_factory)),
+        name=EMAIL_CHANNEL,
+        max_queue_size=args.max_queue_size)
+
+    monitor = NotificationJobMonitor(
+        db_session_factory=db_session_factory,
+        thread_pools={EMAIL_CHANNEL: thread_pool},
+        router=lambda job: EMAIL_CHANNEL,
+        poll_seconds=args.poll_seconds)
+
+    dispatch = monitor.dispatch
+    def timed_dispatch(job):
+        dispatched = dispatch(job)
+        if dispatched:
+            timer.mark(timer.dispatched, job.id)
+        return dispatched
+    monitor.dispatch = timed_dispatch
+
+    start = time.time()
+    thread_pool.start()
+    monitor.start()
+    try:
+        deadline = start + args.timeout
+        while time.time() < deadline:
+            with timer.lock:
+                if len(timer.finished) >= total:
+                    break
+            time.sleep(0.05)
+    finally:
+        monitor.stop()
+        thread_pool.stop()
+        monitor.join(5)
+        thread_pool.join(5)
+    elapsed = time.time() - start
+
+    with timer.lock:
+        finished = dict(timer.finished)
+        started = dict(timer.started)
+        dispatched = dict(timer.dispatched)
+
+    print "processed %d/%d jobs in %.2fs: %.1f jobs/sec, sends=%d" % (
+        len(finished), total, elapsed, len(finished) / elapsed, stats.count)
+
+    stages = [
+        ("queue", [dispatched[id] - start for id in dispatched]),
+        ("pool", [started[id] - dispatched[id] for id in started if id in dispatched]),
+        ("process", [finished[id] - started[id] for id in finished if id in started]),
+        ("send", list(stats.durations)),
+        ("total", [finished[id] - start for id in finished])
+    ]
+    print "%-8s %10s %10s %10s %10s" % ("stage", "p50 ms", "p95 ms", "p99 ms", "max ms")
+    for name, values in stages:
+        values.sort()
+        print "%-8s %10.2f %10.2f %10.2f %10.2f" % (
+            name,
+            percentile(values, 50) * 1000,
+            percentile(values, 95) * 1000,
+            percentile(values, 99) * 1000,
+            (values[-1] if values else 0) * 1000)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Full pipeline throughput benchmark")
+    parser.add_argument("--database", default="sqlite:///pipeline_benchmark.db", help="sqlalchemy database URL")
+    parser.add_argument("--notifications", type=int, default=100, help="number of notifications")
+    parser.add_argument("--recipients", type=int, default=100, help="recipients per notification")
+    parser.add_argument("--threads", type=int, default=8, help="number of worker threads")
+    parser.add_argument("--max-queue-size", type=int, default=1000, help="worker pool queue size")
+    parser.add_argument("--poll-seconds", type=float, default=0.1, help="job monitor poll interval")
+    parser.add_argument("--latency", type=float, default=0, help="simulated provider latency (seconds)")
+    parser.add_argument("--timeout", type=float, default=600, help="maximum run time (seconds)")
+    args = parser.parse_args(argv[1:])
+
+    run(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""SMS provider throughput benchmark.
+
+Sends messages through HttpSmsProvider from concurrent worker
+threads to a local FakeSmsGateway, comparing unbatched sends
+with batched sends.
+
+Usage:
+    python benchmarks/sms_benchmark.py --messages 2000 --threads 16 --latency 0.02
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+SERVICE_NAME = "notificationsvc"
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+TESTS_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", "tests"))
+sys.path.insert(0, SERVICE_ROOT)
+sys.path.insert(0, TESTS_ROOT)
+
+from providers.http import HttpConnectionPool
+from providers.sms import HttpSmsProvider, SmsGatewayClient
+
+from fakehttp import FakeSmsGateway
+
+
+def run(gateway, messages, threads, pool_size, batch_size, batch_delay):
+    connection_pool = HttpConnectionPool(
+        host=gateway.host,
+        port=gateway.port,
+        size=pool_size,
+        timeout=30)
+    client = SmsGatewayClient(
+        connection_pool=connection_pool,
+        path=gateway.path,
+        max_batch_size=batch_size,
+        max_batch_delay=batch_delay,
+        batch_threads=pool_size,
+        timeout=30)
+    provider = HttpSmsProvider(client, "+15555550100")
+
+    requests_before = len(gateway.requests)
+    remaining = [messages]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            provider.send(recipient="+15555550101", text="benchmark message")
+
+    start = time.time()
+    workers = [threading.Thread(target=worker) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - start
+    client.close()
+
+    print "batch_size=%-4d messages/sec=%8.1f requests=%6d connections_created=%d" % (
+        batch_size,
+        messages / elapsed,
+        len(gateway.requests) - requests_before,
+        connection_pool.connections_created)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="SMS provider throughput benchmark")
+    parser.add_argument("--messages", type=int, default=2000, help="number of messages")
+    parser.add_argument("--threads", type=int, default=16, help="number of worker threads")
+    parser.add_argument("--pool-size", type=int, default=4, help="connection pool size")
+    parser.add_argument("--latency", type=float, default=0.02, help="gateway latency (seconds)")
+    parser.add_argument("--batch-delay", type=float, default=0.01, help="max batch delay (seconds)")
+    args = parser.parse_args(argv[1:])
+
+    gateway = FakeSmsGateway(latency=args.latency)
+    gateway.start()
+    try:
+        for batch_size in [1, 10, 50]:
+            run(gateway, args.messages, args.threads, args.pool_size, batch_size, args.batch_delay)
+    finally:
+        gateway.stop()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
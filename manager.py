@@ -27,11 +27,13 @@ class ManagerException(Exception):
 
 #Operations
 
-def start(env=None, user=None, group=None):
+def start(env=None, user=None, group=None, workers=None):
     #Set environment variable for forked daemon
     #This will not change os.environ for current process.
     if env:
         os.putenv("SERVICE_ENV", env)
+    if workers is not None:
+        os.putenv("NOTIFIER_WORKER_PROCESSES", str(workers))
     
     #If env directory exists, use that python.
     #Otherwise backoff to /usr/bin/env python.
@@ -85,19 +87,108 @@ def stop(env=None, block=False, timeout=None):
                 time.sleep(1)
         
 
-def restart(env=None, block=False, timeout=None, user=None, group=None):
+def restart(env=None, block=False, timeout=None, user=None, group=None, workers=None):
     stop(env, block, timeout)
-    start(env, user, group)
+    start(env, user, group, workers)
+
+
+def _import_settings(env=None):
+    #Modify process environment and import settings.
+    if env:
+        os.environ["SERVICE_ENV"] = env
+    import settings
+    return settings
+
+def _db_session_factory(settings):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    engine = create_engine(settings.DATABASE_CONNECTION)
+    return sessionmaker(bind=engine)
+
+def _parse_utc_datetime(value):
+    """Parse epoch timestamp or 'YYYY-MM-DD[ HH:MM[:SS]]' as UTC."""
+    import datetime
+    import pytz
+    try:
+        return datetime.datetime.fromtimestamp(float(value), pytz.utc)
+    except ValueError:
+        pass
+    for format in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]:
+        try:
+            return datetime.datetime.strptime(value, format).replace(tzinfo=pytz.utc)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("invalid datetime: %s" % value)
+
+def list_dead_letters(env=None, context=None, error_class=None,
+        since=None, until=None, include_replayed=False, limit=None):
+    settings = _import_settings(env)
+    from deadletter import query_dead_letters
+
+    db_session = _db_session_factory(settings)()
+    try:
+        query = query_dead_letters(
+                db_session,
+                context=context,
+                error_class=error_class,
+                since=since,
+                until=until,
+                include_replayed=include_replayed)
+        if limit:
+            query = query.limit(limit)
+
+        count = 0
+        for dead_letter in query.yield_per(1000):
+            print "%d\t%s\tjob=%d\tnotification=%d\trecipient=%d\t%s\t%s\t%s" % (
+                    dead_letter.id,
+                    dead_letter.created.isoformat(),
+                    dead_letter.job_id,
+                    dead_letter.notification_id,
+                    dead_letter.recipient_id,
+                    dead_letter.context,
+                    dead_letter.error_class,
+                    dead_letter.replayed.isoformat() if dead_letter.replayed else "-")
+            count += 1
+        print "%d dead letters" % count
+    finally:
+        db_session.close()
+
+def replay_dead_letters(env=None, context=None, error_class=None,
+        since=None, until=None, limit=None, chunk_size=None, rate=None):
+    settings = _import_settings(env)
+    from deadletter import replay_dead_letters as replay
+
+    count = replay(
+            db_session_factory=_db_session_factory(settings),
+            retries_remaining=settings.NOTIFIER_JOB_MAX_RETRY_ATTEMPTS,
+            context=context,
+            error_class=error_class,
+            since=since,
+            until=until,
+            limit=limit,
+            chunk_size=chunk_size or settings.NOTIFIER_DEAD_LETTER_REPLAY_CHUNK_SIZE,
+            rate=rate or settings.NOTIFIER_DEAD_LETTER_REPLAY_RATE)
+    print "%d dead letters replayed" % count
+
+def backfill_tokens(env=None, chunk_size=None):
+    settings = _import_settings(env)
+    from idempotency import backfill_tokens as backfill
+
+    count = backfill(
+            db_session_factory=_db_session_factory(settings),
+            chunk_size=chunk_size or 500)
+    print "%d notification tokens backfilled" % count
 
 
 #Command handlers
 def startCommandHandler(args):
     """Start service as daemon process"""
-    start(args.env, args.user, args.group)
+    start(args.env, args.user, args.group, args.workers)
 
 startCommandHandler.examples = """Examples:
-    manager.py start             #Start service
-    manager.py --env prod start  #Start prod service
+    manager.py start              #Start service
+    manager.py --env prod start   #Start prod service
+    manager.py start --workers 4  #Start service with 4 worker processes
 """
 
 
@@ -114,7 +205,7 @@ stopCommandHandler.examples = """Examples:
 
 def restartCommandHandler(args):
     """Restart service"""
-    restart(args.env, True, args.timeout, args.user, args.group)
+    restart(args.env, True, args.timeout, args.user, args.group, args.workers)
 
 restartCommandHandler.examples = """Examples:
     manager.py restart               #Restart service
@@ -122,6 +213,32 @@ restartCommandHandler.examples = """Examples:
 """
 
 
+def deadletterCommandHandler(args):
+    """List or replay dead letter notification jobs"""
+    if args.action == "list":
+        list_dead_letters(args.env, args.context, args.error_class,
+                args.since, args.until, args.include_replayed, args.limit)
+    else:
+        replay_dead_letters(args.env, args.context, args.error_class,
+                args.since, args.until, args.limit, args.chunk_size, args.rate)
+
+deadletterCommandHandler.examples = """Examples:
+    manager.py deadletter list                             #List dead letters
+    manager.py deadletter list --error-class SMTPException #List by error class
+    manager.py deadletter replay --since "2012-10-01 12:00"  #Replay since time
+    manager.py deadletter replay --rate 50 --chunk-size 1000 #Replay at 50 jobs/sec
+"""
+
+
+def tokensCommandHandler(args):
+    """Backfill the unique tokens of existing notifications"""
+    backfill_tokens(args.env, args.chunk_size)
+
+tokensCommandHandler.examples = """Examples:
+    manager.py tokens backfill                   #Backfill notification tokens
+    manager.py tokens backfill --chunk-size 1000 #Scan 1000 notifications per transaction
+"""
+
 
 def main(argv):
 
@@ -142,6 +259,7 @@ def main(argv):
         startCommandParser.set_defaults(command="start", commandHandler=startCommandHandler)
         startCommandParser.add_argument("-u", "--user", help="Drop privileges to user (also requires --group)")
         startCommandParser.add_argument("-g", "--group", help="Drop privileges to group (also requires --user)")
+        startCommandParser.add_argument("--workers", type=int, help="Number of worker processes delivering jobs")
 
         #stop parser
         stopCommandParser = commandParsers.add_parser(
@@ -167,6 +285,38 @@ def main(argv):
         restartCommandParser.add_argument("-t", "--timeout", default="15", type=int, help="Timeout in seconds for service to stop.")
         restartCommandParser.add_argument("-u", "--user", help="Drop privileges to user (also requires --group)")
         restartCommandParser.add_argument("-g", "--group", help="Drop privileges to group (also requires --user)")
+        restartCommandParser.add_argument("--workers", type=int, help="Number of worker processes delivering jobs")
+
+        #deadletter parser
+        deadletterCommandParser = commandParsers.add_parser(
+                "deadletter",
+                help="list or replay dead letters",
+                description=deadletterCommandHandler.__doc__,
+                epilog=deadletterCommandHandler.examples,
+                formatter_class=argparse.RawDescriptionHelpFormatter
+                )
+        deadletterCommandParser.set_defaults(command="deadletter", commandHandler=deadletterCommandHandler)
+        deadletterCommandParser.add_argument("action", choices=["list", "replay"], help="list or replay dead letters")
+        deadletterCommandParser.add_argument("-c", "--context", help="Filter by notification context.")
+        deadletterCommandParser.add_argument("--error-class", help="Filter by last error class name.")
+        deadletterCommandParser.add_argument("--since", type=_parse_utc_datetime, help="Filter by created time >= since (UTC).")
+        deadletterCommandParser.add_argument("--until", type=_parse_utc_datetime, help="Filter by created time < until (UTC).")
+        deadletterCommandParser.add_argument("--include-replayed", action="store_true", help="List already replayed dead letters.")
+        deadletterCommandParser.add_argument("-l", "--limit", type=int, help="Maximum number of dead letters.")
+        deadletterCommandParser.add_argument("--chunk-size", type=int, help="Dead letters replayed per transaction.")
+        deadletterCommandParser.add_argument("--rate", type=float, help="Maximum replayed jobs per second.")
+
+        #tokens parser
+        tokensCommandParser = commandParsers.add_parser(
+                "tokens",
+                help="backfill notification tokens",
+                description=tokensCommandHandler.__doc__,
+                epilog=tokensCommandHandler.examples,
+                formatter_class=argparse.RawDescriptionHelpFormatter
+                )
+        tokensCommandParser.set_defaults(command="tokens", commandHandler=tokensCommandHandler)
+        tokensCommandParser.add_argument("action", choices=["backfill"], help="backfill notification tokens")
+        tokensCommandParser.add_argument("--chunk-size", type=int, help="Notifications scanned per transaction.")
 
         return parser.parse_args(argv[1:])
 
@@ -44,6 +44,34 @@ struct Notification {
 }
 
 
+/*
+NotificationStatus
+   token: notification token
+   pending: number of jobs which haven't been processed
+   sent: number of jobs sent
+   failed: number of failed jobs, including failed attempts
+       which are retried.
+   cancelled: number of cancelled jobs
+   unknown: number of jobs whose send timed out after the
+       request was made, which may have been sent. These are
+       not retried.
+   created: the time the notification was created (epoch timestamp)
+   updated: the time the status last changed (epoch timestamp)
+   lastSent: the time a job was last sent (epoch timestamp)
+*/
+struct NotificationStatus {
+    1: string token,
+    2: i32 pending,
+    3: i32 sent,
+    4: i32 failed,
+    5: i32 cancelled,
+    6: double created,
+    7: double updated,
+    8: optional double lastSent,
+    9: i32 unknown,
+}
+
+
 service TNotificationService extends core.TRService
 {
     /*
@@ -64,11 +92,41 @@ service TNotificationService extends core.TRService
                 2:InvalidNotificationException invalidNotificationException),
 
     /*
-    For future.
+        Cancel a notification.
+        Args:
+            token: token of the notification to cancel
+            context: string representing the request context
+        Jobs of the notification which haven't been sent
+        are cancelled. Cancelling a notification more than
+        once has no further effect.
+    */
     void cancel(
         1: string token,
         2: string context) throws (
                 1:UnavailableException unavailableException,
                 2:InvalidNotificationException invalidNotificationException),
+
+    /*
+        Get the status of a notification.
+        Args:
+            token: notification token
+        Returns:
+            The notification's job counts and timestamps.
+    */
+    NotificationStatus getNotificationStatus(
+        1: string token) throws (
+                1:UnavailableException unavailableException,
+                2:InvalidNotificationException invalidNotificationException),
+
+    /*
+        Get the statuses of several notifications.
+        Args:
+            tokens: list of notification tokens
+        Returns:
+            Map of token to status. Tokens which don't
+            match a notification are omitted.
     */
+    map<string, NotificationStatus> getNotificationStatuses(
+        1: list<string> tokens) throws (
+                1:UnavailableException unavailableException),
 }
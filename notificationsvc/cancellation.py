@@ -0,0 +1,120 @@
+
+import logging
+import threading
+import time
+
+from sqlalchemy.sql import func
+
+from models import NotificationCancellation
+
+
+class CancellationSet(object):
+    """In-memory set of recently cancelled notifications.
+
+    cancel() ends a notification's unclaimed jobs in the
+    database, but jobs may already be queued in memory, or
+    claimed (i.e. by the express lane). Workers check this set
+    before rendering a job, so jobs of cancelled notifications
+    are dropped without a database query per job.
+
+    New cancellations are loaded incrementally, by id, every
+    refresh_seconds, and cancellations made by this process are
+    added immediately. Since the set starts at the latest
+    cancellation when the processor starts (nothing is queued
+    in memory yet), and entries are dropped after
+    retention_seconds, it stays small. The set is a fast path:
+    a job missing from it which was ended by cancel() fails
+    to be claimed.
+    """
+    def __init__(self, db_session_factory, refresh_seconds=5, retention_seconds=3600, clock=time.time):
+        """CancellationSet constructor.
+
+        Args:
+            db_session_factory: callable returning a new sqlalchemy db session
+            refresh_seconds: seconds between loads of new cancellations
+            retention_seconds: seconds a cancellation is kept
+            clock: callable returning current time in seconds
+        """
+        self.log = logging.getLogger(__name__)
+        self.db_session_factory = db_session_factory
+        self.refresh_seconds = refresh_seconds
+        self.retention_seconds = retention_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.cancelled = {}
+        self.last_id = None
+        self.running = False
+        self.thread = None
+        self.exit_event = threading.Event()
+
+    def __contains__(self, notification_id):
+        return notification_id in self.cancelled
+
+    def __len__(self):
+        return len(self.cancelled)
+
+    def add(self, notification_id):
+        """Add a notification cancelled by this process."""
+        with self.lock:
+            self.cancelled[notification_id] = self.clock()
+
+    def refresh(self):
+        """Load cancellations made since the last refresh.
+
+        Returns:
+            number of new cancellations loaded
+        """
+        db_session = self.db_session_factory()
+        try:
+            if self.last_id is None:
+                # Jobs cancelled before the processor started
+                # aren't queued in memory, so start at the latest.
+                self.last_id = db_session.query(func.max(NotificationCancellation.id)).scalar() or 0
+                return 0
+            rows = db_session.query(
+                    NotificationCancellation.id,
+                    NotificationCancellation.notification_id).\
+                filter(NotificationCancellation.id > self.last_id).\
+                order_by(NotificationCancellation.id).\
+                all()
+        finally:
+            db_session.close()
+
+        now = self.clock()
+        with self.lock:
+            for row in rows:
+                self.cancelled[row.notification_id] = now
+                self.last_id = row.id
+            for notification_id, added in self.cancelled.items():
+                if now - added >= self.retention_seconds:
+                    del self.cancelled[notification_id]
+        return len(rows)
+
+    def start(self):
+        """Start the refresh thread."""
+        if not self.running:
+            self.running = True
+            self.exit_event.clear()
+            self.thread = threading.Thread(target=self.run, name="CancellationSet")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        """Refresh thread run method."""
+        while self.running:
+            try:
+                self.refresh()
+            except Exception as error:
+                self.log.exception(error)
+            self.exit_event.wait(self.refresh_seconds)
+
+    def stop(self):
+        """Stop the refresh thread."""
+        if self.running:
+            self.running = False
+            self.exit_event.set()
+
+    def join(self, timeout=None):
+        """Join the refresh thread."""
+        if self.thread is not None:
+            self.thread.join(timeout)
@@ -0,0 +1,145 @@
+
+import logging
+import threading
+import time
+
+
+class ConcurrencySlot(object):
+    """Slot acquired from an AdaptiveConcurrencyLimiter.
+
+    The holder records the outcome of the send made while
+    holding the slot, which the limiter uses on release
+    to adjust the concurrency limit.
+    """
+    def __init__(self, acquired):
+        self.acquired = acquired
+        self.latency = None
+        self.failed = False
+        self.throttled = False
+
+    def record(self, latency, failed=False, throttled=False):
+        """Record send outcome.
+
+        Args:
+            latency: send latency in seconds
+            failed: True if the send failed
+            throttled: True if the send failed due to throttling
+                or overload (i.e. SMTP 421/451 or timeout).
+        """
+        self.latency = latency
+        self.failed = failed or throttled
+        self.throttled = throttled
+
+
+class AdaptiveConcurrencyLimiter(object):
+    """AIMD concurrency limiter.
+
+    Bounds the number of concurrent sends to a limit which is
+    adjusted between min_limit and max_limit using additive
+    increase / multiplicative decrease:
+
+        - a successful send with latency at or below the target
+          increases the limit by 1/limit, so the limit grows by
+          roughly one per round of sends.
+        - a throttled send, a send above the latency target, or
+          an error rate above error_threshold multiplies the
+          limit by decrease_factor.
+
+    Only one decrease is applied per round of sends; outcomes
+    of sends acquired before the last decrease are not used to
+    decrease the limit again.
+    """
+    def __init__(
+            self,
+            min_limit,
+            max_limit,
+            latency_target,
+            initial_limit=None,
+            decrease_factor=0.5,
+            error_threshold=0.5,
+            error_decay=0.9,
+            clock=time.time):
+        """Constructor.
+
+        Args:
+            min_limit: minimum concurrency limit (>= 1)
+            max_limit: maximum concurrency limit
+            latency_target: send latency in seconds above which
+                the limit is decreased.
+            initial_limit: initial limit, defaults to min_limit
+            decrease_factor: multiplicative decrease factor
+            error_threshold: error rate (exponentially weighted)
+                above which the limit is decreased.
+            error_decay: weight of the previous error rate in the
+                exponentially weighted error rate.
+            clock: callable returning the current time in seconds
+        """
+        self.log = logging.getLogger(__name__)
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.error_threshold = error_threshold
+        self.error_decay = error_decay
+        self.clock = clock
+        self.condition = threading.Condition()
+        self._limit = float(initial_limit or self.min_limit)
+        self.in_use = 0
+        self.error_rate = 0.0
+        self.last_decrease = 0
+
+    @property
+    def limit(self):
+        """Current integer concurrency limit."""
+        return int(self._limit)
+
+    def acquire(self, timeout=None):
+        """Acquire slot, blocking until one is available.
+
+        Args:
+            timeout: optional number of seconds to wait
+        Returns:
+            ConcurrencySlot, or None if timeout expired
+        """
+        with self.condition:
+            end = None if timeout is None else self.clock() + timeout
+            while self.in_use >= self.limit:
+                if end is None:
+                    self.condition.wait()
+                else:
+                    remaining = end - self.clock()
+                    if remaining <= 0:
+                        return None
+                    self.condition.wait(remaining)
+            self.in_use += 1
+            return ConcurrencySlot(self.clock())
+
+    def release(self, slot):
+        """Release slot and adjust limit from its outcome.
+
+        Args:
+            slot: ConcurrencySlot returned from acquire()
+        """
+        with self.condition:
+            self.in_use -= 1
+            if slot.latency is not None:
+                self._adjust(slot)
+            self.condition.notify_all()
+
+    def _adjust(self, slot):
+        self.error_rate = self.error_decay * self.error_rate + \
+            (1 - self.error_decay) * (1 if slot.failed else 0)
+
+        congested = slot.throttled or \
+            slot.latency > self.latency_target or \
+            self.error_rate > self.error_threshold
+
+        if congested:
+            if slot.acquired >= self.last_decrease:
+                previous = self.limit
+                self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                self.last_decrease = self.clock()
+                if self.limit != previous:
+                    self.log.info("Concurrency limit decreased to %d" % self.limit)
+        elif not slot.failed:
+            self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
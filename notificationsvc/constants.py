@@ -15,3 +15,16 @@ NOTIFICATION_PRIORITY_VALUES = {
     "DEFAULT_PRIORITY": 50,
     "LOW_PRIORITY": 100
 }
+
+
+# Notification delivery channels. Each channel has its own
+# provider, worker thread pool and notifier pool.
+EMAIL_CHANNEL = "email"
+SMS_CHANNEL = "sms"
+WEBHOOK_CHANNEL = "webhook"
+
+
+# Owner of the jobs of cancelled notifications. Outstanding
+# jobs are ended as unsuccessful with this owner, so they're
+# never claimed, and can be told apart from failed jobs.
+CANCELLED_JOB_OWNER = "cancelled"
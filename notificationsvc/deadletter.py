@@ -0,0 +1,210 @@
+
+import datetime
+import json
+import logging
+
+from trpycore.timezone import tz
+from trsvcscore.db.models import Notification as NotificationModel
+from trsvcscore.db.models import NotificationJob as NotificationJobModel
+
+from models import NotificationDeadLetter
+from status import update_status
+
+
+log = logging.getLogger(__name__)
+
+
+def _timestamp(value):
+    """Convert a UTC DateTime to an epoch timestamp, or None."""
+    if value is None:
+        return None
+    return tz.utc_to_timestamp(value)
+
+
+def create_dead_letter(db_session, failed_job, error=None):
+    """Create a dead letter for a job with no retries remaining.
+
+    The attempt history is built from all NotificationJobs
+    for the same notification and recipient, since each
+    retry is written as a new job.
+
+    Args:
+        db_session: sqlalchemy db session. The dead letter is
+            added to the session but not committed.
+        failed_job: NotificationJob model which failed
+        error: exception which caused the final failure, or None
+    Returns:
+        NotificationDeadLetter model
+    """
+    jobs = db_session.query(NotificationJobModel).\
+        filter(NotificationJobModel.notification_id==failed_job.notification_id).\
+        filter(NotificationJobModel.recipient_id==failed_job.recipient_id).\
+        order_by(NotificationJobModel.id).\
+        all()
+
+    attempts = []
+    for job in jobs:
+        attempts.append({
+            "job_id": job.id,
+            "not_before": _timestamp(job.not_before),
+            "start": _timestamp(job.start),
+            "end": _timestamp(job.end),
+            "successful": job.successful
+        })
+
+    context = db_session.query(NotificationModel.context).\
+        filter(NotificationModel.id==failed_job.notification_id).\
+        scalar()
+
+    dead_letter = NotificationDeadLetter(
+        created=tz.utcnow(),
+        job_id=failed_job.id,
+        notification_id=failed_job.notification_id,
+        recipient_id=failed_job.recipient_id,
+        priority=failed_job.priority,
+        context=context,
+        error_class=error.__class__.__name__ if error is not None else None,
+        error_message=str(error) if error is not None else None,
+        attempts=json.dumps(attempts))
+    db_session.add(dead_letter)
+    return dead_letter
+
+
+def query_dead_letters(
+        db_session,
+        context=None,
+        error_class=None,
+        since=None,
+        until=None,
+        include_replayed=False):
+    """Query dead letters matching the given filters.
+
+    Args:
+        db_session: sqlalchemy db session
+        context: optional notification context filter
+        error_class: optional error class name filter
+        since: optional UTC DateTime; only include dead
+            letters created at or after this time.
+        until: optional UTC DateTime; only include dead
+            letters created before this time.
+        include_replayed: if True, include dead letters
+            which have already been replayed.
+    Returns:
+        sqlalchemy Query of NotificationDeadLetter ordered by id.
+    """
+    query = db_session.query(NotificationDeadLetter)
+    if context is not None:
+        query = query.filter(NotificationDeadLetter.context==context)
+    if error_class is not None:
+        query = query.filter(NotificationDeadLetter.error_class==error_class)
+    if since is not None:
+        query = query.filter(NotificationDeadLetter.created>=since)
+    if until is not None:
+        query = query.filter(NotificationDeadLetter.created<until)
+    if not include_replayed:
+        query = query.filter(NotificationDeadLetter.replayed==None)
+    return query.order_by(NotificationDeadLetter.id)
+
+
+def replay_dead_letters(
+        db_session_factory,
+        retries_remaining,
+        context=None,
+        error_class=None,
+        since=None,
+        until=None,
+        limit=None,
+        chunk_size=500,
+        rate=None):
+    """Replay dead letters by creating new NotificationJobs.
+
+    Dead letters are replayed in chunks, each in its own
+    transaction, so a failure part way through only loses
+    the current chunk and a replay can be safely restarted.
+    New jobs are inserted with a single bulk insert per chunk.
+
+    Rather than sleeping between chunks, the not_before time
+    of each new job is staggered by 1/rate seconds. This lets
+    the replay itself complete quickly while the service
+    delivers the replayed jobs at no more than the requested
+    rate, so a large backlog does not flood the relay.
+
+    Args:
+        db_session_factory: callable returning a new sqlalchemy db session
+        retries_remaining: retries_remaining for each new job
+        context: optional notification context filter
+        error_class: optional error class name filter
+        since: optional UTC DateTime lower bound on creation time
+        until: optional UTC DateTime upper bound on creation time
+        limit: optional maximum number of dead letters to replay
+        chunk_size: number of dead letters per transaction
+        rate: optional maximum jobs per second to schedule
+    Returns:
+        number of dead letters replayed
+    """
+    replayed = 0
+    last_id = 0
+    start_time = tz.utcnow()
+    job_table = NotificationJobModel.__table__
+    dead_letter_table = NotificationDeadLetter.__table__
+
+    while limit is None or replayed < limit:
+        db_session = db_session_factory()
+        try:
+            size = chunk_size
+            if limit is not None:
+                size = min(size, limit - replayed)
+
+            dead_letters = query_dead_letters(
+                db_session,
+                context=context,
+                error_class=error_class,
+                since=since,
+                until=until).\
+                filter(NotificationDeadLetter.id>last_id).\
+                limit(size).\
+                all()
+
+            if not dead_letters:
+                break
+
+            now = tz.utcnow()
+            jobs = []
+            for index, dead_letter in enumerate(dead_letters):
+                not_before = now
+                if rate:
+                    offset = float(replayed + index) / rate
+                    not_before = max(now, start_time +
+                            datetime.timedelta(seconds=offset))
+                jobs.append({
+                    "created": now,
+                    "not_before": not_before,
+                    "notification_id": dead_letter.notification_id,
+                    "recipient_id": dead_letter.recipient_id,
+                    "priority": dead_letter.priority,
+                    "retries_remaining": retries_remaining
+                })
+
+            ids = [dead_letter.id for dead_letter in dead_letters]
+            db_session.execute(job_table.insert(), jobs)
+            counts = {}
+            for dead_letter in dead_letters:
+                counts[dead_letter.notification_id] = counts.get(dead_letter.notification_id, 0) + 1
+            for notification_id, count in counts.items():
+                update_status(db_session, notification_id, pending=count)
+            db_session.execute(dead_letter_table.update().\
+                where(dead_letter_table.c.id.in_(ids)).\
+                values(replayed=now))
+            db_session.commit()
+
+            last_id = ids[-1]
+            replayed += len(ids)
+            log.info("Replayed %d dead letters (%d total)" % (len(ids), replayed))
+
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+    return replayed
@@ -0,0 +1,222 @@
+
+import logging
+import Queue
+import threading
+import time
+
+
+class GroupCommitStopped(Exception):
+    """Raised if a write is submitted to a stopped GroupCommitter."""
+    pass
+
+
+class GroupCommitRequest(object):
+    """A write waiting to be group committed."""
+    def __init__(self, write, rollback=None):
+        """GroupCommitRequest constructor.
+
+        Args:
+            write: callable(db_session) adding the write to the
+                session and returning its result
+            rollback: optional callable invoked if a transaction
+                including the write is rolled back
+        """
+        self.write = write
+        self.rollback = rollback
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class GroupCommitter(object):
+    """Commits concurrent writes together in one transaction.
+
+    Writes submitted by concurrent callers (i.e. notify()
+    threads) are gathered by a commit thread for up to
+    max_wait seconds after the first arrives, or until
+    max_batch writes are waiting, and committed in a single
+    transaction, so the cost of the commit (and its fsync) is
+    shared by the batch. submit() blocks until the caller's
+    write is committed, so callers are only acknowledged once
+    their data is durable.
+
+    If a write raises, or the batch commit fails, the batch is
+    rolled back and each of its writes is retried in its own
+    transaction, so a bad write only fails its own caller.
+    Writes must therefore be safe to invoke again after a
+    rollback, and should undo any side effects outside the
+    database in their rollback callable.
+    """
+    def __init__(self, db_session_factory, max_wait=0.005, max_batch=100, metrics=None):
+        """GroupCommitter constructor.
+
+        Args:
+            db_session_factory: callable returning a new sqlalchemy db session
+            max_wait: maximum seconds to wait for more writes
+                after the first write of a batch arrives
+            max_batch: maximum number of writes per transaction
+            metrics: optional MetricRegistry
+        """
+        self.log = logging.getLogger(__name__)
+        self.db_session_factory = db_session_factory
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.metrics = metrics
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+        if self.metrics is not None:
+            self.metrics.register_gauge("notifier_group_commit_waiting", self.queue.qsize)
+
+    def start(self):
+        """Start the commit thread."""
+        with self.lock:
+            if not self.running:
+                self.running = True
+                self.thread = threading.Thread(target=self.run, name="GroupCommitter")
+                self.thread.daemon = True
+                self.thread.start()
+
+    def stop(self):
+        """Stop the commit thread once waiting writes are committed."""
+        with self.lock:
+            if self.running:
+                self.running = False
+                self.queue.put(None)
+
+    def join(self, timeout=None):
+        """Join the commit thread."""
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def submit(self, write, rollback=None):
+        """Commit a write with other concurrent writes.
+
+        Args:
+            write: callable(db_session) adding the write to the
+                session and returning its result. It may flush
+                the session, but must not commit it.
+            rollback: optional callable invoked if a transaction
+                including the write is rolled back, to undo side
+                effects of the write outside the database.
+        Returns:
+            result of write, once it is committed.
+        Raises:
+            GroupCommitStopped if the committer is stopped.
+            Exception raised by the write or its commit.
+        """
+        request = GroupCommitRequest(write, rollback)
+        with self.lock:
+            if not self.running:
+                raise GroupCommitStopped()
+            self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _gather(self):
+        """Wait for the next batch of writes.
+
+        Returns:
+            (batch, stopped) tuple, where batch is a list of
+            GroupCommitRequests, and stopped is True once the
+            committer has been stopped and the queue drained.
+        """
+        request = self.queue.get()
+        if request is None:
+            return [], True
+
+        batch = [request]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.time()
+            try:
+                if timeout > 0:
+                    request = self.queue.get(True, timeout)
+                else:
+                    request = self.queue.get(False)
+            except Queue.Empty:
+                break
+            if request is None:
+                # Commit the batch, then drain the rest
+                self.queue.put(None)
+                break
+            batch.append(request)
+        return batch, False
+
+    def run(self):
+        """Commit thread run method."""
+        while True:
+            batch, stopped = self._gather()
+            if stopped:
+                break
+            try:
+                self.commit(batch)
+            except Exception as error:
+                self.log.exception(error)
+                for request in batch:
+                    if not request.done.is_set():
+                        request.error = error
+                        request.done.set()
+
+    def _commit(self, batch):
+        """Commit writes in one transaction, setting their results.
+
+        Raises:
+            Exception if a write or the commit fails, in which
+            case the transaction has been rolled back.
+        """
+        start = time.time()
+        results = []
+        db_session = self.db_session_factory()
+        try:
+            for request in batch:
+                results.append(request.write(db_session))
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            for request in batch:
+                if request.rollback is not None:
+                    try:
+                        request.rollback()
+                    except Exception as error:
+                        self.log.exception(error)
+            raise
+        finally:
+            db_session.close()
+
+        if self.metrics is not None:
+            self.metrics.increment("notifier_group_commits")
+            self.metrics.increment("notifier_group_commit_writes", len(batch))
+            self.metrics.observe("notifier_group_commit_batch_size", len(batch))
+            self.metrics.observe("notifier_group_commit_ms", (time.time() - start) * 1000)
+
+        for request, result in zip(batch, results):
+            request.result = result
+            request.done.set()
+
+    def commit(self, batch):
+        """Commit a batch of writes.
+
+        If the batch fails, each write is retried alone and
+        fails only its own caller.
+
+        Args:
+            batch: list of GroupCommitRequests
+        """
+        try:
+            self._commit(batch)
+        except Exception:
+            if len(batch) == 1:
+                raise
+            if self.metrics is not None:
+                self.metrics.increment("notifier_group_commit_retries")
+            for request in batch:
+                try:
+                    self._commit([request])
+                except Exception as error:
+                    request.error = error
+                    request.done.set()
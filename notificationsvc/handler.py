@@ -1,11 +1,11 @@
 import logging
 from string import Template
+import time
 import uuid
 
+from sqlalchemy.exc import IntegrityError, InterfaceError, OperationalError
 from sqlalchemy.sql import func
 
-from trpycore.factory.base import Factory
-from trpycore.pool.queue import QueuePool
 from trpycore.thread.util import join
 from trpycore.timezone import tz
 from trsvcscore.db.models import Notification as NotificationModel
@@ -13,13 +13,26 @@ from trsvcscore.db.models import NotificationJob as NotificationJobModel
 from trsvcscore.db.models import User
 from trsvcscore.service.handler.service import ServiceHandler
 from trnotificationsvc.gen import TNotificationService
-from trnotificationsvc.gen.ttypes import NotificationPriority, UnavailableException, InvalidNotificationException
+from trnotificationsvc.gen.ttypes import Notification, NotificationPriority, NotificationStatus, UnavailableException, InvalidNotificationException
 
 import settings
 
-from constants import NOTIFICATION_PRIORITY_VALUES
-from jobmonitor import NotificationJobMonitor, NotificationThreadPool
-from notifier import Notifier
+from constants import CANCELLED_JOB_OWNER, NOTIFICATION_PRIORITY_VALUES
+from groupcommit import GroupCommitter
+from idempotency import RecentTokenIndex
+from journal import NotificationJournal
+from metrics import MetricRegistry
+from models import create_tables, NotificationCancellation, NotificationToken
+from processor import NotificationProcessor
+from prometheus import MetricsHttpServer
+from queuestats import JobQueueStats
+from status import create_status, load_statuses, update_status
+from tracing import LatencyTracer, to_timestamp
+
+
+# Database errors raised when the database can't be reached,
+# for which notifications are journaled if enabled.
+DATABASE_UNAVAILABLE_ERRORS = (OperationalError, InterfaceError)
 
 
 class NotificationServiceHandler(TNotificationService.Iface, ServiceHandler):
@@ -31,7 +44,15 @@ class NotificationServiceHandler(TNotificationService.Iface, ServiceHandler):
     and join.
 
     """
-    def __init__(self, service):
+    def __init__(self, service, workers=None):
+        """NotificationServiceHandler constructor.
+
+        Args:
+            service: NotificationService
+            workers: optional WorkerSupervisor whose worker
+                processes claim and deliver jobs. If None,
+                jobs are processed by this process.
+        """
         super(NotificationServiceHandler, self).__init__(
 		    service,
             zookeeper_hosts=settings.ZOOKEEPER_HOSTS,
@@ -39,47 +60,143 @@ class NotificationServiceHandler(TNotificationService.Iface, ServiceHandler):
 
         self.log = logging.getLogger("%s.%s" % (__name__, NotificationServiceHandler.__name__))
 
-        # Create pool of Notifier objects which will do the
-        # actual work of sending notifications
-        def notifier_factory():
-            return Notifier(
+        # Service metrics exposed through getCounter/getCounters
+        self.metrics = MetricRegistry()
+
+        # Create tracer recording per-priority latency histograms
+        self.tracer = LatencyTracer(
+            metrics=self.metrics,
+            sample_rate=settings.NOTIFIER_TRACE_SAMPLE_RATE)
+
+        # Create the processor which claims and delivers jobs,
+        # unless jobs are processed by prefork worker processes,
+        # in which case the workers' metrics are aggregated.
+        self.workers = workers
+        self.processor = None
+        if self.workers is None:
+            self.processor = NotificationProcessor(
                 db_session_factory=self.get_database_session,
-                email_provider=settings.EMAIL_PROVIDER_FACTORY(),
-                job_retry_seconds=settings.NOTIFIER_JOB_RETRY_SECONDS
-            )
-        self.notifier_pool = QueuePool(
-            size=settings.NOTIFIER_POOL_SIZE,
-            factory=Factory(notifier_factory))
-
-        # Create pool of threads to manage the work
-        self.thread_pool = NotificationThreadPool(
-            num_threads=settings.NOTIFIER_THREADS,
-            notifier_pool=self.notifier_pool)
-
-        # Create job monitor which scans for new jobs
-        # to process and delegates to the thread pool
-        self.job_monitor = NotificationJobMonitor(
+                metrics=self.metrics,
+                tracer=self.tracer)
+        else:
+            self.metrics.register_source(self.workers.metrics)
+            self.metrics.register_gauge("notifier_workers_alive", self.workers.alive)
+            self.metrics.register_gauge("notifier_worker_restarts",
+                lambda: self.workers.restarts)
+
+        # Create index of recently committed tokens, answering
+        # retried notify() calls without a database query.
+        self.token_index = RecentTokenIndex(
+            size=settings.NOTIFIER_TOKEN_INDEX_SIZE,
+            ttl=settings.NOTIFIER_TOKEN_INDEX_TTL)
+        self.metrics.register_gauge("notifier_token_index_size",
+            lambda: len(self.token_index))
+
+        # Create optional group committer, committing
+        # concurrent notify() calls in one transaction.
+        self.group_committer = None
+        if settings.NOTIFIER_GROUP_COMMIT:
+            self.group_committer = GroupCommitter(
+                db_session_factory=self.get_database_session,
+                max_wait=settings.NOTIFIER_GROUP_COMMIT_MAX_WAIT,
+                max_batch=settings.NOTIFIER_GROUP_COMMIT_MAX_BATCH,
+                metrics=self.metrics)
+
+        # Create optional local journal accepting notifications
+        # while the database is unavailable.
+        self.journal = None
+        if settings.NOTIFIER_JOURNAL:
+            self.journal = NotificationJournal(
+                directory=settings.NOTIFIER_JOURNAL_DIRECTORY,
+                apply=self._replay_journal,
+                segment_bytes=settings.NOTIFIER_JOURNAL_SEGMENT_BYTES,
+                batch_size=settings.NOTIFIER_JOURNAL_REPLAY_BATCH_SIZE,
+                replay_seconds=settings.NOTIFIER_JOURNAL_REPLAY_SECONDS,
+                metrics=self.metrics)
+
+        # Create cached job queue statistics (pending jobs,
+        # oldest due job age, etc.) exposed as gauges.
+        self.job_queue_stats = JobQueueStats(
             db_session_factory=self.get_database_session,
-            thread_pool=self.thread_pool,
-            poll_seconds=settings.NOTIFIER_POLL_SECONDS)
+            cache_seconds=settings.NOTIFIER_QUEUE_STATS_CACHE_SECONDS)
+        self.job_queue_stats.register(self.metrics)
 
+        # Create optional HTTP server exporting the metrics
+        # to Prometheus.
+        self.metrics_server = None
+        if settings.METRICS_SERVER_PORT is not None:
+            self.metrics_server = MetricsHttpServer(
+                metrics=self.metrics,
+                interface=settings.METRICS_SERVER_INTERFACE,
+                port=settings.METRICS_SERVER_PORT,
+                namespace=settings.SERVICE)
 
 
     def start(self):
         """Start handler."""
         super(NotificationServiceHandler, self).start()
-        self.thread_pool.start()
-        self.job_monitor.start()
+
+        # Create service owned tables (dead letters, etc.)
+        db_session = self.get_database_session()
+        try:
+            create_tables(db_session.bind)
+        finally:
+            db_session.close()
+
+        if self.group_committer is not None:
+            self.group_committer.start()
+        if self.journal is not None:
+            self.journal.start()
+        if self.processor is not None:
+            self.processor.start()
+        if self.metrics_server is not None:
+            self.metrics_server.start()
 
     def stop(self):
         """Stop handler."""
-        self.job_monitor.stop()
-        self.thread_pool.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.group_committer is not None:
+            self.group_committer.stop()
+        if self.journal is not None:
+            self.journal.stop()
+        if self.processor is not None:
+            self.processor.stop()
+        if self.workers is not None:
+            self.workers.stop()
         super(NotificationServiceHandler, self).stop()
 
     def join(self, timeout=None):
         """Join handler."""
-        join([self.thread_pool, self.job_monitor, super(NotificationServiceHandler, self)], timeout)
+        threads = []
+        if self.group_committer is not None:
+            threads.append(self.group_committer)
+        if self.journal is not None:
+            threads.append(self.journal)
+        if self.processor is not None:
+            threads.append(self.processor)
+        if self.workers is not None:
+            threads.append(self.workers)
+        if self.metrics_server is not None:
+            threads.append(self.metrics_server)
+        join(threads + [super(NotificationServiceHandler, self)], timeout)
+
+    def getCounter(self, requestContext, key):
+        """Get counter value.
+
+        Service metrics are checked first, falling back
+        to the base service handler counters.
+        """
+        value = self.metrics.get(key)
+        if value is not None:
+            return value
+        return super(NotificationServiceHandler, self).getCounter(requestContext, key)
+
+    def getCounters(self, requestContext):
+        """Get all counters, including service metrics."""
+        counters = super(NotificationServiceHandler, self).getCounters(requestContext)
+        counters.update(self.metrics.as_dict())
+        return counters
 
 
     def _validate_template_strings(self, notification):
@@ -152,10 +269,206 @@ class NotificationServiceHandler(TNotificationService.Iface, ServiceHandler):
             for user_id in notification.recipientUserIds:
                 user = db_session.query(User).filter(User.id==user_id).one()
                 users.append(user)
+        except DATABASE_UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             raise InvalidNotificationException('Invalid user')
 
 
+    def _write_notification(self, db_session, context, notification, users, priority, express, claimed, created=None):
+        """Add a notification and its jobs to a db session.
+
+        If express is True, the jobs are created claimed, and
+        are flushed and leased for the express lane.
+
+        Args:
+            db_session: sqlalchemy db session, which is not committed
+            context: String to identify calling context
+            notification: validated Thrift Notification object
+            users: list of recipient Users, possibly loaded
+                in another session.
+            priority: notification priority value
+            express: True if the jobs should be expressed
+            claimed: list the ids of leased express jobs are
+                appended to, to be discarded on rollback.
+            created: optional UTC DateTime the notification was
+                received; defaults to now.
+        Returns:
+            list of (id, notification_id, recipient_id, priority)
+            tuples of the express jobs, to be passed to
+            NotificationProcessor.express() once committed.
+        """
+        # Create Notification Model
+        notification_model = NotificationModel(
+            created=created if created is not None else func.current_timestamp(),
+            token=notification.token,
+            context=context,
+            priority=priority,
+            recipients=[db_session.merge(user, load=False) for user in users],
+            subject=notification.subject,
+            html_text=notification.htmlText,
+            plain_text=notification.plainText
+        )
+        db_session.add(notification_model)
+
+        # Written with the notification, so the token's primary
+        # key rejects a duplicate notification.
+        db_session.add(NotificationToken(
+            token=notification.token,
+            created=created if created is not None else func.current_timestamp()))
+
+        # Flush to assign the notification's id, which keys its status.
+        db_session.flush()
+        create_status(db_session, notification_model.id, notification.token,
+                len(notification.recipientUserIds), created)
+
+        # If notification specified a start-processing-time
+        # convert it to UTC DateTime object.
+        if notification.notBefore is not None:
+            processing_start_time = tz.timestamp_to_utc(notification.notBefore)
+        else:
+            processing_start_time = func.current_timestamp()
+
+        # Create NotificationJobs
+        jobs = []
+        for user_id in notification.recipientUserIds:
+            job = NotificationJobModel(
+                created=func.current_timestamp(),
+                not_before=processing_start_time,
+                notification=notification_model,
+                recipient_id=user_id,
+                priority=priority,
+                retries_remaining=settings.NOTIFIER_JOB_MAX_RETRY_ATTEMPTS
+            )
+            if express:
+                job.owner = settings.SERVICE
+                job.start = func.current_timestamp()
+            db_session.add(job)
+            jobs.append(job)
+
+        if not express:
+            return []
+
+        # Flush to assign the job ids, and lease the jobs in
+        # the same transaction, so they are reclaimed if this
+        # process dies before they are processed.
+        db_session.flush()
+        expressed = [(job_model.id, job_model.notification_id,
+                      job_model.recipient_id, job_model.priority)
+                     for job_model in jobs]
+        job_ids = [job_model.id for job_model in jobs]
+        claimed.extend(job_ids)
+        self.processor.express_claim(db_session, job_ids)
+        return expressed
+
+    def _discard_claimed(self, claimed):
+        """Discard the leases of express jobs which were rolled back."""
+        if claimed:
+            self.processor.express_discard(claimed)
+            del claimed[:]
+
+    def _load_notification(self, db_session, token):
+        """Load a committed notification by token.
+
+        Args:
+            db_session: sqlalchemy db session
+            token: notification token
+        Returns:
+            Thrift Notification object, or None if no
+            notification has the token.
+        """
+        notification_model = db_session.query(NotificationModel).\
+            filter(NotificationModel.token==token).\
+            first()
+        if notification_model is None:
+            return None
+
+        priority = [name for name, value in NOTIFICATION_PRIORITY_VALUES.items()
+                    if value == notification_model.priority][0]
+        return Notification(
+            token=notification_model.token,
+            priority=NotificationPriority._NAMES_TO_VALUES[priority],
+            recipientUserIds=[user.id for user in notification_model.recipients],
+            subject=notification_model.subject,
+            htmlText=notification_model.html_text,
+            plainText=notification_model.plain_text)
+
+    def _journal_notification(self, context, notification, intake):
+        """Journal a validated notification to replay later.
+
+        Args:
+            context: String to identify calling context
+            notification: Thrift Notification object, whose
+                token is generated if missing.
+            intake: time notify() was invoked, in seconds
+        """
+        if not notification.token:
+            notification.token = uuid.uuid4().hex
+        self.journal.append({
+            "created": intake,
+            "context": context,
+            "token": notification.token,
+            "notBefore": notification.notBefore,
+            "priority": notification.priority,
+            "recipientUserIds": notification.recipientUserIds,
+            "subject": notification.subject,
+            "htmlText": notification.htmlText,
+            "plainText": notification.plainText
+        })
+
+    def _replay_journal(self, records):
+        """Commit journaled notifications to the database.
+
+        Notifications whose token was already committed (i.e.
+        replayed before the process died) are skipped, and
+        notifications with recipients which don't exist are
+        dropped, since recipients can't be validated while the
+        database is unavailable.
+
+        Args:
+            records: list of journal records
+        """
+        db_session = self.get_database_session()
+        try:
+            tokens = [record["token"] for record in records]
+            existing = set(token for (token,) in db_session.query(NotificationModel.token).\
+                filter(NotificationModel.token.in_(tokens)))
+            user_ids = set(user_id for record in records for user_id in record["recipientUserIds"])
+            users = dict((user.id, user) for user in db_session.query(User).\
+                filter(User.id.in_(user_ids)))
+
+            for record in records:
+                if record["token"] in existing:
+                    continue
+                missing = [user_id for user_id in record["recipientUserIds"] if user_id not in users]
+                if missing:
+                    self.log.error("Dropping journaled notification token=%s, invalid users: %s" \
+                            % (record["token"], missing))
+                    self.metrics.increment("notifier_journal_rejected")
+                    continue
+
+                notification = Notification(
+                    token=record["token"],
+                    notBefore=record["notBefore"],
+                    priority=record["priority"],
+                    recipientUserIds=record["recipientUserIds"],
+                    subject=record["subject"],
+                    htmlText=record["htmlText"],
+                    plainText=record["plainText"])
+                priority = NOTIFICATION_PRIORITY_VALUES[
+                        NotificationPriority._VALUES_TO_NAMES[notification.priority]]
+                self._write_notification(db_session, record["context"], notification,
+                        [users[user_id] for user_id in notification.recipientUserIds],
+                        priority, False, [], created=tz.timestamp_to_utc(record["created"]))
+                existing.add(record["token"])
+
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
     def notify(self, context, notification):
         """Send notification
 
@@ -185,65 +498,168 @@ class NotificationServiceHandler(TNotificationService.Iface, ServiceHandler):
             Thrift Notification object.
             If no 'token' attribute was provided in the input
             notification object, the returned object will
-            specify one.
+            specify one. If a notification with the same token
+            was already committed (i.e. the call is a retry),
+            the original notification is returned and no new
+            notification is created.
         Raises:
             InvalidNotificationException if input Notification
             object is invalid.
             UnavailableException for any other unexpected error.
         """
 
+        intake = time.time()
         try:
 
             # Get a db session
             db_session = self.get_database_session()
 
-            # Validate inputs
-            # During validation of recipients, populate a list of Users.
-            users = []
-            self._validate_notify_params(db_session, users, context, notification)
+            # Return the original notification of a recent retry
+            if notification.token:
+                original = self.token_index.get(notification.token)
+                if original is not None:
+                    self.metrics.increment("notifier_duplicate_notifications")
+                    return original
+
+            try:
+                # Validate inputs
+                # During validation of recipients, populate a list of Users.
+                users = []
+                self._validate_notify_params(db_session, users, context, notification)
+
+                # If input notification doesn't specify a
+                # unique token, then generate one.
+                if not notification.token:
+                    notification.token = uuid.uuid4().hex
+
+                priority = NOTIFICATION_PRIORITY_VALUES[
+                        NotificationPriority._VALUES_TO_NAMES[notification.priority]]
+
+                # HIGH_PRIORITY jobs which are due now are claimed in
+                # this transaction and handed directly to idle worker
+                # threads, if there's capacity for all of them.
+                express = settings.NOTIFIER_EXPRESS_LANE and \
+                    self.processor is not None and \
+                    notification.priority == NotificationPriority.HIGH_PRIORITY and \
+                    notification.notBefore is None and \
+                    self.processor.express_capacity(notification.recipientUserIds)
+
+                claimed = []
+                def write(write_session):
+                    return self._write_notification(write_session, context,
+                            notification, users, priority, express, claimed)
+                def rollback():
+                    self._discard_claimed(claimed)
+
+                # Commit with other concurrent notifications if group
+                # commit is enabled, otherwise in this session.
+                if self.group_committer is not None:
+                    # Release the validation session's connection
+                    # while waiting; the detached users are merged
+                    # into the committer's session.
+                    db_session.close()
+                    expressed = self.group_committer.submit(write, rollback)
+                else:
+                    try:
+                        expressed = write(db_session)
+                        db_session.commit()
+                    except Exception:
+                        rollback()
+                        raise
+
+            except IntegrityError:
+                # The token was committed by an earlier call, or
+                # concurrently, so return the original notification.
+                db_session.rollback()
+                original = self._load_notification(db_session, notification.token)
+                if original is None:
+                    raise
+                self.token_index.add(original.token, original)
+                self.metrics.increment("notifier_duplicate_notifications")
+                return original
+
+            except DATABASE_UNAVAILABLE_ERRORS as error:
+                # Inputs which don't require the database are
+                # validated before it's accessed, so journal the
+                # notification to replay once the database is back.
+                if self.journal is None:
+                    raise
+                self.log.warning("Database unavailable, journaling notification: %s" % error)
+                self._journal_notification(context, notification, intake)
+                self.token_index.add(notification.token, notification)
+                return notification
+
+            self.token_index.add(notification.token, notification)
+            if expressed:
+                self.processor.express(expressed)
+            self.tracer.record_commit(priority, intake)
 
-            # If input notification doesn't specify a
-            # unique token, then generate one.
-            if not notification.token:
-                notification.token = uuid.uuid4().hex
+            return notification
 
-            # Create Notification Model
-            notification_model = NotificationModel(
-                created=func.current_timestamp(),
-                token=notification.token,
-                context=context,
-                priority=NOTIFICATION_PRIORITY_VALUES[
-                         NotificationPriority._VALUES_TO_NAMES[notification.priority]],
-                recipients=users,
-                subject=notification.subject,
-                html_text=notification.htmlText,
-                plain_text=notification.plainText
-            )
-            db_session.add(notification_model)
+        except InvalidNotificationException as error:
+            self.log.exception(error)
+            raise InvalidNotificationException()
+        except Exception as error:
+            self.log.exception(error)
+            raise UnavailableException(str(error))
 
-            # If notification specified a start-processing-time
-            # convert it to UTC DateTime object.
-            if notification.notBefore is not None:
-                processing_start_time = tz.timestamp_to_utc(notification.notBefore)
-            else:
-                processing_start_time = func.current_timestamp()
+        finally:
+            db_session.close()
 
-            # Create NotificationJobs
-            for user_id in notification.recipientUserIds:
-                job = NotificationJobModel(
-                    created=func.current_timestamp(),
-                    not_before=processing_start_time,
-                    notification=notification_model,
-                    recipient_id=user_id,
-                    priority=NOTIFICATION_PRIORITY_VALUES[
-                             NotificationPriority._VALUES_TO_NAMES[notification.priority]],
-                    retries_remaining=settings.NOTIFIER_JOB_MAX_RETRY_ATTEMPTS
-                )
-                db_session.add(job)
+    def cancel(self, token, context):
+        """Cancel notification
 
-            db_session.commit()
+        The notification's jobs which haven't been claimed are
+        ended as cancelled with a single bulk update, so they
+        will not be processed, and processors drop jobs of the
+        notification which are already queued in memory or
+        claimed before rendering them. Jobs which were already
+        sent are unaffected. Cancelling a notification which
+        was already cancelled has no further effect.
 
-            return notification
+        Args:
+            token: token of the notification to cancel
+            context: String to identify calling context
+        Raises:
+            InvalidNotificationException if no notification
+            has the token, or the context is invalid.
+            UnavailableException for any other unexpected error.
+        """
+        try:
+
+            # Get a db session
+            db_session = self.get_database_session()
+
+            if not context:
+                raise InvalidNotificationException('Invalid context')
+
+            if not token:
+                raise InvalidNotificationException('Invalid token')
+
+            notification_id = db_session.query(NotificationModel.id).\
+                filter(NotificationModel.token==token).\
+                first()
+            if notification_id is None:
+                raise InvalidNotificationException('Invalid token')
+            notification_id = notification_id[0]
+
+            # A concurrent cancel may commit the notification's
+            # cancellation first, failing this one's insert, in
+            # which case the transaction is retried once and
+            # finds the cancellation.
+            for attempt in range(2):
+                try:
+                    cancelled_jobs = self._cancel_jobs(db_session, notification_id, context)
+                    db_session.commit()
+                    break
+                except IntegrityError:
+                    db_session.rollback()
+                    if attempt:
+                        raise
+
+            self.metrics.increment("notifier_cancelled_jobs", cancelled_jobs)
+            if self.processor is not None:
+                self.processor.cancellations.add(notification_id)
 
         except InvalidNotificationException as error:
             self.log.exception(error)
@@ -254,3 +670,121 @@ class NotificationServiceHandler(TNotificationService.Iface, ServiceHandler):
 
         finally:
             db_session.close()
+
+    def _cancel_jobs(self, db_session, notification_id, context):
+        """Record a notification's cancellation and end its jobs.
+
+        Args:
+            db_session: sqlalchemy db session; the changes are
+                not committed.
+            notification_id: id of the notification to cancel
+            context: String to identify calling context
+        Returns:
+            number of jobs cancelled
+        """
+        cancelled = db_session.query(NotificationCancellation.id).\
+            filter(NotificationCancellation.notification_id==notification_id).\
+            first()
+        if cancelled is None:
+            db_session.add(NotificationCancellation(
+                created=func.current_timestamp(),
+                notification_id=notification_id,
+                context=context))
+            db_session.flush()
+
+        # End the outstanding jobs, including any retries
+        # created since a previous cancel.
+        table = NotificationJobModel.__table__
+        result = db_session.execute(table.update().\
+            where(table.c.notification_id==notification_id).\
+            where(table.c.owner==None).\
+            values(owner=CANCELLED_JOB_OWNER,
+                   start=func.current_timestamp(),
+                   end=func.current_timestamp(),
+                   successful=False))
+        if result.rowcount:
+            update_status(db_session, notification_id,
+                    pending=-result.rowcount, cancelled=result.rowcount)
+        return result.rowcount
+
+    def _load_statuses(self, tokens):
+        """Load notification statuses.
+
+        Args:
+            tokens: list of notification tokens
+        Returns:
+            dict of token to Thrift NotificationStatus object;
+            tokens without a notification are omitted.
+        """
+        db_session = self.get_database_session()
+        try:
+            statuses = load_statuses(db_session, tokens)
+        finally:
+            db_session.close()
+
+        result = {}
+        for token, (pending, sent, failed, cancelled, unknown, created, updated, last_sent) \
+                in statuses.items():
+            result[token] = NotificationStatus(
+                token=token,
+                pending=pending,
+                sent=sent,
+                failed=failed,
+                cancelled=cancelled,
+                unknown=unknown,
+                created=to_timestamp(created),
+                updated=to_timestamp(updated),
+                lastSent=to_timestamp(last_sent) if last_sent is not None else None)
+        return result
+
+    def getNotificationStatus(self, token):
+        """Get notification status
+
+        The status is read from the notification's job count
+        aggregates, which are updated as its jobs are processed,
+        so jobs aren't counted on each call.
+
+        Args:
+            token: notification token
+        Returns:
+            Thrift NotificationStatus object with the number
+            of pending, sent, failed, cancelled and unknown jobs.
+        Raises:
+            InvalidNotificationException if no notification
+            has the token.
+            UnavailableException for any other unexpected error.
+        """
+        try:
+            if not token:
+                raise InvalidNotificationException('Invalid token')
+
+            statuses = self._load_statuses([token])
+            if token not in statuses:
+                raise InvalidNotificationException('Invalid token')
+            return statuses[token]
+
+        except InvalidNotificationException as error:
+            self.log.exception(error)
+            raise InvalidNotificationException()
+        except Exception as error:
+            self.log.exception(error)
+            raise UnavailableException(str(error))
+
+    def getNotificationStatuses(self, tokens):
+        """Get the statuses of several notifications
+
+        Statuses are read with a single query.
+
+        Args:
+            tokens: list of notification tokens
+        Returns:
+            dict of token to Thrift NotificationStatus object.
+            Tokens without a notification are omitted.
+        Raises:
+            UnavailableException for any unexpected error.
+        """
+        try:
+            return self._load_statuses(tokens or [])
+        except Exception as error:
+            self.log.exception(error)
+            raise UnavailableException(str(error))
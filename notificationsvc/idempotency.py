@@ -0,0 +1,154 @@
+
+import collections
+import logging
+import threading
+import time
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import exists
+
+from trsvcscore.db.models import Notification as NotificationModel
+
+from models import NotificationToken
+
+
+log = logging.getLogger(__name__)
+
+
+class RecentTokenIndex(object):
+    """Bounded, time-windowed index of recent notification tokens.
+
+    Maps the tokens of notifications committed in the last ttl
+    seconds to their notifications, so a client retrying
+    notify() (i.e. after a timeout) gets the original
+    notification back without a database query. At most size
+    tokens are kept, evicting the oldest.
+
+    The index is only a fast path: tokens which aren't in the
+    index are made unique by the notification_token table's
+    primary key. Notifications created before the table was
+    added have no token row until backfill_tokens() is run.
+    """
+    def __init__(self, size=10000, ttl=600, clock=time.time):
+        """RecentTokenIndex constructor.
+
+        Args:
+            size: maximum number of tokens
+            ttl: seconds a token is kept
+            clock: callable returning current time in seconds
+        """
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _expire(self, now):
+        """Remove expired and excess entries. Caller must hold lock."""
+        while self.entries:
+            token, (expires, notification) = next(self.entries.iteritems())
+            if expires > now and len(self.entries) <= self.size:
+                break
+            del self.entries[token]
+
+    def get(self, token):
+        """Get the notification committed with a token.
+
+        Args:
+            token: notification token
+        Returns:
+            Thrift Notification object, or None if the token
+            isn't in the index.
+        """
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            expires, notification = entry
+            if expires <= self.clock():
+                del self.entries[token]
+                return None
+            self.hits += 1
+            return notification
+
+    def add(self, token, notification):
+        """Add a committed notification's token.
+
+        Args:
+            token: notification token
+            notification: Thrift Notification object to
+                return for the token.
+        """
+        with self.lock:
+            now = self.clock()
+            self.entries.pop(token, None)
+            self.entries[token] = (now + self.ttl, notification)
+            self._expire(now)
+
+
+def backfill_tokens(db_session_factory, chunk_size=500):
+    """Create the token rows of notifications which have none.
+
+    Notifications created before the notification_token table
+    was added, or by instances which don't write it, have
+    no token row, so a notify() retried with their token would
+    create a duplicate notification. Run this once every
+    instance writes token rows.
+
+    Notifications are scanned by id in chunks, each in its own
+    transaction, so the backfill can be safely restarted. If
+    notify() commits one of a chunk's tokens concurrently,
+    the chunk is retried.
+
+    Args:
+        db_session_factory: callable returning a new sqlalchemy db session
+        chunk_size: number of notifications scanned per transaction
+    Returns:
+        number of token rows created
+    """
+    created = 0
+    last_id = 0
+    while True:
+        db_session = db_session_factory()
+        try:
+            rows = db_session.query(NotificationModel.id).\
+                filter(NotificationModel.id>last_id).\
+                order_by(NotificationModel.id).\
+                limit(chunk_size).\
+                all()
+            if not rows:
+                break
+            end_id = rows[-1].id
+
+            # The earliest notification of a token is its original
+            tokens = {}
+            for token, notification_created in db_session.query(
+                    NotificationModel.token, NotificationModel.created).\
+                    filter(NotificationModel.id>last_id).\
+                    filter(NotificationModel.id<=end_id).\
+                    filter(~exists().where(NotificationToken.token==NotificationModel.token)):
+                if token not in tokens or notification_created < tokens[token]:
+                    tokens[token] = notification_created
+
+            if tokens:
+                db_session.execute(NotificationToken.__table__.insert(), [
+                    {"token": token, "created": notification_created}
+                    for token, notification_created in tokens.items()])
+            db_session.commit()
+            created += len(tokens)
+            last_id = end_id
+
+        except IntegrityError:
+            db_session.rollback()
+            log.warning("Token committed concurrently, retrying chunk after id=%d" % last_id)
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+    return created
@@ -1,12 +1,14 @@
 
 import logging
 import threading
+import time
 
 from trpycore.thread.util import join
 from trpycore.thread.threadpool import ThreadPool
-from trsvcscore.db.models import NotificationJob
-from trsvcscore.db.job import DatabaseJob, DatabaseJobQueue, JobOwned, QueueEmpty, QueueStopped
+from trsvcscore.db.job import QueueEmpty, QueueStopped
 
+from jobqueue import NotificationJobQueue
+from tracing import TRACE_DEQUEUED
 
 
 class NotificationThreadPool(ThreadPool):
@@ -14,19 +16,62 @@ class NotificationThreadPool(ThreadPool):
 
     Given a work item (job), this class will process the
     job and delegate the work to send a notification.
+
+    Each delivery channel (email, sms, etc.) has its own
+    NotificationThreadPool and notifier pool, so a slow
+    provider only backs up the jobs for its own channel.
     """
-    def __init__(self, num_threads, notifier_pool):
+    def __init__(self, num_threads, notifier_pool, name=None, max_queue_size=None, metrics=None):
         """Constructor.
 
         Arguments:
             num_threads: number of worker threads
             notifier_pool: pool of Notifier objects responsible for
                 sending notifications
+            name: optional pool name, i.e. the channel name
+            max_queue_size: optional maximum number of jobs waiting
+                for a worker thread before the pool is full.
+            metrics: optional MetricRegistry recording notifier
+                pool checkouts and checkout wait times.
         """
         super(NotificationThreadPool, self).__init__(num_threads)
         self.log = logging.getLogger(__name__)
         self.notifier_pool = notifier_pool
+        self.name = name
+        self.num_threads = num_threads
+        self.max_queue_size = max_queue_size
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.busy = 0
+
+    def put(self, database_job):
+        """Put job on the queue for a worker thread.
+
+        Args:
+            database_job: DatabaseJob object, or objected derived from DatabaseJob
+        """
+        with self.lock:
+            self.queued += 1
+        super(NotificationThreadPool, self).put(database_job)
+
+    def is_full(self):
+        """Check if the number of waiting jobs has reached max_queue_size."""
+        return self.max_queue_size is not None and \
+            self.queued >= self.max_queue_size
+
+    def depth(self):
+        """Number of jobs waiting for a worker thread."""
+        return self.queued
 
+    def idle(self):
+        """Number of worker threads free to take a job immediately."""
+        with self.lock:
+            return max(0, self.num_threads - self.busy - self.queued)
+
+    def utilization(self):
+        """Percentage of worker threads currently processing a job."""
+        return 100 * self.busy / max(1, self.num_threads)
 
     def process(self, database_job):
         """Worker thread process method.
@@ -37,38 +82,66 @@ class NotificationThreadPool(ThreadPool):
         Args:
             database_job: DatabaseJob object, or objected derived from DatabaseJob
         """
+        database_job.trace.setdefault(TRACE_DEQUEUED, time.time())
+        with self.lock:
+            self.queued -= 1
+            self.busy += 1
+
         try:
+            start = time.time()
             with self.notifier_pool.get() as notifier:
+                if self.metrics is not None:
+                    self.metrics.increment("notifier_pool_%s_checkouts" % self.name)
+                    self.metrics.observe("notifier_pool_%s_checkout_wait_ms" % self.name,
+                            (time.time() - start) * 1000)
                 notifier.send(database_job)
 
         except Exception as e:
             self.log.exception(e)
 
+        finally:
+            with self.lock:
+                self.busy -= 1
+
 
 
 class NotificationJobMonitor(object):
     """Notification Job monitor
 
     This class monitors for new notification jobs,
-    and delegates work items to a thread pool.
+    and delegates work items to the thread pool for
+    the job's delivery channel.
     """
-    def __init__(self, db_session_factory, thread_pool, poll_seconds=60):
+    def __init__(self, db_session_factory, thread_pools, router, poll_seconds=60, prefetch=None, partition=None, shard=None, leases=None):
         """Constructor.
 
         Arguments:
             db_session_factory: callable returning a new sqlalchemy db session
-            thread_pool: pool of worker threads
+            thread_pools: dict of channel name to NotificationThreadPool
+            router: callable taking a NotificationDatabaseJob and
+                returning the channel name of the pool to process it.
             poll_seconds: number of seconds between db queries to detect
                 new jobs.
+            prefetch: optional callable taking the list of recipient
+                ids read by each poll, i.e. to warm the router's cache.
+            partition: optional (index, count) tuple restricting
+                the jobs monitored to a partition of the job ids.
+            shard: optional ShardCoordinator restricting the jobs
+                monitored to the shard buckets it owns.
+            leases: optional JobLeaseManager leasing claimed jobs
         """
         self.log = logging.getLogger(__name__)
-        self.thread_pool = thread_pool
+        self.thread_pools = thread_pools
+        self.router = router
 
-        self.db_job_queue = DatabaseJobQueue(
+        self.db_job_queue = NotificationJobQueue(
             owner='notificationsvc',
-            model_class=NotificationJob,
             db_session_factory=db_session_factory,
             poll_seconds=poll_seconds,
+            prefetch=prefetch,
+            partition=partition,
+            shard=shard,
+            leases=leases
         )
 
         self.monitor_thread = None
@@ -84,16 +157,42 @@ class NotificationJobMonitor(object):
             self.monitor_thread.start()
 
 
+    def dispatch(self, job):
+        """Route job to the thread pool for its channel.
+
+        If the pool is full the job is released, leaving it
+        unclaimed in the database to be picked up by a later
+        poll, so a stalled channel can't exhaust memory.
+
+        Args:
+            job: NotificationDatabaseJob
+        Returns:
+            True if the job was put on a pool, False otherwise.
+        """
+        channel = self.router(job)
+        thread_pool = self.thread_pools.get(channel)
+        if thread_pool is None:
+            self.log.error("No thread pool for channel '%s' (notification_job_id=%s)" \
+                    % (channel, job.id))
+            job.release()
+            return False
+
+        if thread_pool.is_full():
+            job.release()
+            return False
+
+        thread_pool.put(job)
+        return True
+
+
     def run(self):
         """Monitor thread run method."""
         while self.running:
             try:
-                self.log.info("NotificationJobMonitor is checking for new jobs to process...")
-
                 # Grab jobs as they arrive and delegate
                 # jobs to threadpool for processing
                 job = self.db_job_queue.get()
-                self.thread_pool.put(job)
+                self.dispatch(job)
 
             except QueueEmpty:
                 pass
@@ -0,0 +1,439 @@
+
+import logging
+import Queue
+import threading
+import time
+
+from sqlalchemy.sql import func
+
+from trpycore.timezone import tz
+from trsvcscore.db.models import NotificationJob
+from trsvcscore.db.job import JobOwned, QueueEmpty, QueueStopped
+
+from constants import CANCELLED_JOB_OWNER
+from status import update_status
+from tracing import TRACE_CLAIMED
+
+
+class JobCancelled(Exception):
+    """ Job Cancelled Exception class.
+
+    Raised while processing a job whose notification was
+    cancelled, so the job is ended as cancelled and not retried.
+    """
+    pass
+
+
+class JobDeferred(Exception):
+    """ Job Deferred Exception class.
+
+    Raised while processing a job which can't be attempted
+    now (i.e. its provider's circuit breaker is open), so the
+    job is unclaimed, rather than ended, and isn't counted as
+    an attempt.
+    """
+    pass
+
+
+class JobOutcomeUnknown(Exception):
+    """ Job Outcome Unknown Exception class.
+
+    Raised while processing a job whose send timed out after
+    its request was made, so the job is ended with an unknown
+    outcome, and not retried, which could deliver it twice.
+    """
+    pass
+
+
+class JobForwarded(Exception):
+    """ Job Forwarded Exception class.
+
+    Raised while processing a job which was delivered on some
+    of its channels, and is handed to the pool of another of
+    its channels, so the job's deliveries are committed but
+    the job remains claimed.
+    """
+    pass
+
+
+class NotificationDatabaseJob(object):
+    """Notification database job context manager.
+
+    Unlike the generic DatabaseJob, the routing attributes of the
+    job (recipient, priority, etc.) are available before the job
+    is claimed, so jobs can be routed without a database query.
+
+    Entering the context claims the job, returning the
+    NotificationJob model; JobOwned is raised if the job was
+    already claimed. Exiting the context marks the job as ended,
+    and successful if no exception was raised. If JobCancelled
+    was raised, the job is ended as cancelled, and if
+    JobOutcomeUnknown was raised, it's ended with successful
+    left NULL. If JobDeferred was raised the job wasn't
+    attempted, so it's unclaimed rather than ended, to be
+    picked up again by a later poll. If JobForwarded was
+    raised the job is left claimed, and entering the context
+    again only loads the model.
+
+    The job's trace dict collects pipeline timestamps as the
+    job is processed, for latency tracing.
+
+    If a JobLeaseManager is given, a lease is written with the
+    claim and deleted when the job ends, so the job is
+    reclaimed if this process dies while processing it.
+
+    The job is only ended if it's still claimed by owner and
+    its lease wasn't reaped; otherwise JobOwned is raised
+    when the context exits, and the job is left to whoever
+    reclaimed it.
+
+    If claimed is True the job was already claimed by its
+    creator (i.e. the express lane of notify()), and entering
+    the context only loads the model.
+    """
+    def __init__(
+            self,
+            owner,
+            db_session_factory,
+            id,
+            notification_id,
+            recipient_id,
+            priority,
+            not_before,
+            queue=None,
+            leases=None,
+            claimed=False):
+        """Constructor.
+
+        Args:
+            owner: job owner string
+            db_session_factory: callable returning a new sqlalchemy db session
+            id: NotificationJob id
+            notification_id: Notification id
+            recipient_id: recipient User id
+            priority: job priority
+            not_before: UTC DateTime job becomes due
+            queue: optional NotificationJobQueue the job came from
+            leases: optional JobLeaseManager
+            claimed: True if the job is already claimed by owner,
+                with its lease acquired if leases is given.
+        """
+        self.owner = owner
+        self.db_session_factory = db_session_factory
+        self.id = id
+        self.notification_id = notification_id
+        self.recipient_id = recipient_id
+        self.priority = priority
+        self.not_before = not_before
+        self.queue = queue
+        self.leases = leases
+        self.claimed = claimed
+        self.lease_token = None
+        self.db_session = None
+        self.model = None
+        self.trace = {}
+
+        # Delivery state of a job handed between channel pools:
+        # the channels it's delivered on, once routed, and the
+        # first error, unavailable provider and unknown outcome
+        # of its deliveries.
+        self.channels = None
+        self.error = None
+        self.unavailable = None
+        self.unknown = None
+
+    def __enter__(self):
+        table = NotificationJob.__table__
+        self.db_session = self.db_session_factory()
+        try:
+            if not self.claimed:
+                result = self.db_session.execute(table.update().\
+                    where(table.c.id==self.id).\
+                    where(table.c.owner==None).\
+                    values(owner=self.owner, start=func.current_timestamp()))
+                if result.rowcount != 1:
+                    raise JobOwned()
+                if self.leases is not None:
+                    self.lease_token = self.leases.acquire(self.db_session, self.id)
+                self.db_session.commit()
+            elif self.leases is not None and self.lease_token is None:
+                self.lease_token = self.leases.token(self.id)
+            self.trace.setdefault(TRACE_CLAIMED, time.time())
+
+            self.model = self.db_session.query(NotificationJob).get(self.id)
+            return self.model
+
+        except:
+            if self.lease_token is not None:
+                self.leases.discard(self.id, self.lease_token)
+            self.db_session.rollback()
+            self.db_session.close()
+            self.db_session = None
+            self.release()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        table = NotificationJob.__table__
+        values = dict(end=func.current_timestamp(), successful=False)
+        status = dict(pending=-1, failed=1)
+        if exc_type is None:
+            values["successful"] = True
+            status = dict(pending=-1, sent=1)
+        elif issubclass(exc_type, JobCancelled):
+            values["owner"] = CANCELLED_JOB_OWNER
+            status = dict(pending=-1, cancelled=1)
+        elif issubclass(exc_type, JobOutcomeUnknown):
+            values["successful"] = None
+            status = dict(pending=-1, unknown=1)
+        elif issubclass(exc_type, JobDeferred):
+            # Deferred jobs are still pending
+            values = dict(owner=None, start=None)
+            status = None
+        elif issubclass(exc_type, JobForwarded):
+            # Forwarded jobs are still claimed
+            values = None
+            status = None
+        try:
+            if values is None:
+                self.db_session.expunge(self.model)
+                self.db_session.commit()
+                self.claimed = True
+                return False
+
+            result = self.db_session.execute(table.update().\
+                where(table.c.id==self.id).\
+                where(table.c.owner==self.owner).\
+                where(table.c.end==None).\
+                values(**values))
+            if result.rowcount != 1:
+                raise JobOwned()
+            if self.leases is not None and \
+               not self.leases.release(self.db_session, self.id, self.lease_token):
+                raise JobOwned()
+            if status is not None:
+                update_status(self.db_session, self.notification_id, **status)
+
+            # Detach the model so its loaded attributes remain
+            # accessible after the session is committed and closed.
+            self.db_session.expunge(self.model)
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            # Stop renewing the lease, so the job is reclaimed
+            # once it expires rather than left claimed.
+            if self.lease_token is not None:
+                self.leases.discard(self.id, self.lease_token)
+            raise
+        finally:
+            self.db_session.close()
+            self.db_session = None
+            self.release()
+        return False
+
+    def release(self):
+        """Release the job back to its queue.
+
+        This must be invoked if the job is dropped without
+        entering the context (i.e. it was deferred), so the
+        queue will return it again on a later poll. This is
+        invoked automatically when the context exits.
+        """
+        if self.queue is not None:
+            self.queue.release(self)
+
+
+class NotificationJobQueue(threading.Thread):
+    """Notification job queue.
+
+    Polls the database for unclaimed NotificationJobs which are
+    due, and makes them available in priority order through get().
+    Jobs returned by get() will not be returned again until they
+    are released, so jobs waiting in memory are not duplicated by
+    subsequent polls.
+    """
+    def __init__(
+            self,
+            owner,
+            db_session_factory,
+            poll_seconds=60,
+            batch_size=1000,
+            prefetch=None,
+            partition=None,
+            shard=None,
+            leases=None):
+        """Constructor.
+
+        Args:
+            owner: job owner string
+            db_session_factory: callable returning a new sqlalchemy db session
+            poll_seconds: number of seconds between db queries
+            batch_size: maximum number of jobs to read per poll
+            prefetch: optional callable taking the list of recipient
+                ids read by each poll, i.e. to warm a cache of
+                recipient data with a single query.
+            partition: optional (index, count) tuple; if given
+                only jobs whose id modulo count equals index are
+                returned, so several processes polling the same
+                table don't contend to claim the same jobs.
+            shard: optional ShardCoordinator; if given only jobs
+                in the buckets it owns are returned.
+            leases: optional JobLeaseManager leasing claimed jobs
+        """
+        super(NotificationJobQueue, self).__init__()
+        self.log = logging.getLogger(__name__)
+        self.owner = owner
+        self.db_session_factory = db_session_factory
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.partition = partition
+        self.shard = shard
+        self.leases = leases
+        self.queue = Queue.PriorityQueue()
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.running = False
+        self.wake_event = threading.Event()
+        self.daemon = True
+
+    def start(self):
+        """Start job queue."""
+        if not self.running:
+            self.running = True
+            super(NotificationJobQueue, self).start()
+
+    def run(self):
+        """Poll thread run method."""
+        while self.running:
+            try:
+                self.poll()
+            except Exception as error:
+                self.log.exception(error)
+
+            self.wake_event.wait(self.poll_seconds)
+            self.wake_event.clear()
+
+    def stop(self):
+        """Stop job queue."""
+        if self.running:
+            self.running = False
+            self.wake_event.set()
+            self.queue.put((None, None, None, None))
+
+    def wake(self):
+        """Wake the poll thread to poll immediately."""
+        self.wake_event.set()
+
+    def size(self):
+        """Number of jobs in the queue or being processed."""
+        with self.lock:
+            return len(self.pending)
+
+    def _query(self, db_session, buckets=None):
+        """Build the query for unclaimed jobs which are due.
+
+        Args:
+            db_session: sqlalchemy db session
+            buckets: optional list of shard buckets to
+                restrict jobs to.
+        Returns:
+            sqlalchemy Query of NotificationJob column tuples
+        """
+        query = db_session.query(
+                NotificationJob.id,
+                NotificationJob.notification_id,
+                NotificationJob.recipient_id,
+                NotificationJob.priority,
+                NotificationJob.not_before).\
+            filter(NotificationJob.owner==None).\
+            filter(NotificationJob.not_before<=tz.utcnow())
+
+        if self.partition is not None:
+            index, count = self.partition
+            query = query.filter(NotificationJob.id % count == index)
+
+        if buckets is not None:
+            query = query.filter(
+                (NotificationJob.recipient_id % self.shard.bucket_count).in_(buckets))
+
+        return query.\
+            order_by(NotificationJob.priority, NotificationJob.not_before).\
+            limit(self.batch_size)
+
+    def poll(self):
+        """Query database for jobs which are due and queue them.
+
+        Returns:
+            number of new jobs queued
+        """
+        buckets = self.shard.buckets() if self.shard is not None else None
+        if buckets is not None and not buckets:
+            return 0
+
+        db_session = self.db_session_factory()
+        try:
+            rows = self._query(db_session, buckets).all()
+        finally:
+            db_session.close()
+
+        if self.prefetch is not None and rows:
+            try:
+                self.prefetch([row.recipient_id for row in rows])
+            except Exception as error:
+                self.log.exception(error)
+
+        count = 0
+        for row in rows:
+            job = NotificationDatabaseJob(
+                owner=self.owner,
+                db_session_factory=self.db_session_factory,
+                id=row.id,
+                notification_id=row.notification_id,
+                recipient_id=row.recipient_id,
+                priority=row.priority,
+                not_before=row.not_before,
+                queue=self,
+                leases=self.leases)
+            if self.put(job):
+                count += 1
+        return count
+
+    def put(self, job):
+        """Put job in the queue if it is not already pending.
+
+        Returns:
+            True if the job was queued, False otherwise.
+        """
+        with self.lock:
+            if job.id in self.pending:
+                return False
+            self.pending.add(job.id)
+        self.queue.put((job.priority, job.not_before, job.id, job))
+        return True
+
+    def release(self, job):
+        """Release job so it may be returned by a future poll."""
+        with self.lock:
+            self.pending.discard(job.id)
+
+    def get(self, block=True, timeout=None):
+        """Get next job.
+
+        Args:
+            block: if True block until a job is available
+            timeout: optional number of seconds to block
+        Returns:
+            NotificationDatabaseJob
+        Raises:
+            QueueEmpty if no job is available.
+            QueueStopped if the queue has been stopped.
+        """
+        if not self.running:
+            raise QueueStopped()
+        try:
+            priority, not_before, id, job = self.queue.get(block, timeout)
+        except Queue.Empty:
+            raise QueueEmpty()
+        if job is None:
+            raise QueueStopped()
+        return job
@@ -0,0 +1,260 @@
+
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import zlib
+
+
+class NotificationJournal(object):
+    """Local append-only journal of notifications.
+
+    Accepts notifications while the database is unavailable,
+    and replays them into the database once it recovers.
+
+    Records are JSON objects, appended to segment files in the
+    journal directory, each framed by a header of its length
+    and crc32:
+
+        <length: 4 bytes><crc32: 4 bytes><json>
+
+    A segment is sealed once it reaches segment_bytes, and a new
+    segment started. A torn record at the end of a segment (i.e.
+    the process died mid-write) fails its length or crc check
+    and is ignored, along with anything after it.
+
+    append() returns once the record has been fsynced. Callers
+    appending concurrently share fsyncs: each fsync covers every
+    record written before it, so a caller whose record was
+    covered by another caller's fsync doesn't fsync again.
+
+    The replay thread calls apply(records) with batches of up to
+    batch_size records, oldest first, every replay_seconds while
+    the journal isn't empty. apply must commit the records to the
+    database, and should skip records which were already
+    committed (i.e. by token), since a batch is replayed again if
+    the process dies after it was committed but before its
+    segment was deleted. Segments are deleted once all of their
+    records are applied. If apply raises (i.e. the database is
+    still down), the replay is retried later.
+    """
+
+    SEGMENT_PATTERN = re.compile(r"^journal-(\d+)\.log$")
+    HEADER = struct.Struct(">II")
+
+    def __init__(
+            self,
+            directory,
+            apply,
+            segment_bytes=64 * 1024 * 1024,
+            batch_size=500,
+            replay_seconds=10,
+            metrics=None):
+        """NotificationJournal constructor.
+
+        Args:
+            directory: journal directory, created if needed
+            apply: callable taking a list of records and
+                committing them to the database
+            segment_bytes: segment size after which a new
+                segment is started
+            batch_size: maximum records per apply call
+            replay_seconds: seconds between replay attempts
+            metrics: optional MetricRegistry
+        """
+        self.log = logging.getLogger(__name__)
+        self.directory = directory
+        self.apply = apply
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.replay_seconds = replay_seconds
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.replay_lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.exit_event = threading.Event()
+
+        # Segment being appended to, and the positions (total
+        # bytes appended) written and fsynced.
+        self.segment = None
+        self.file = None
+        self.written = 0
+        self.synced = 0
+
+        # Sealed segments and replay progress (records applied)
+        # of the oldest segment.
+        self.sealed = []
+        self.applied = 0
+        self.records = 0
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        for segment in self._segments():
+            self.sealed.append(segment)
+            self.records += len(list(self._read(segment)))
+        if self.records:
+            self.log.warning("Journal has %d notifications to replay" % self.records)
+
+        if self.metrics is not None:
+            self.metrics.register_gauge("notifier_journal_depth", self.depth)
+            self.metrics.register_gauge("notifier_journal_segments",
+                lambda: len(self.sealed) + (1 if self.segment is not None else 0))
+
+    def _segments(self):
+        """Sorted list of segment numbers in the journal directory."""
+        segments = []
+        for name in os.listdir(self.directory):
+            match = self.SEGMENT_PATTERN.match(name)
+            if match:
+                segments.append(int(match.group(1)))
+        return sorted(segments)
+
+    def _path(self, segment):
+        return os.path.join(self.directory, "journal-%020d.log" % segment)
+
+    def _read(self, segment):
+        """Generate the records of a segment."""
+        with open(self._path(segment), "rb") as input:
+            while True:
+                header = input.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    break
+                length, crc = self.HEADER.unpack(header)
+                data = input.read(length)
+                if len(data) < length or zlib.crc32(data) & 0xffffffff != crc:
+                    self.log.error("Ignoring torn record in journal segment %d" % segment)
+                    break
+                yield json.loads(data)
+
+    def depth(self):
+        """Number of records waiting to be replayed."""
+        return self.records
+
+    def _seal(self):
+        """Seal the current segment. Caller must hold lock."""
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.sealed.append(self.segment)
+            self.segment = None
+            self.file = None
+
+    def append(self, record):
+        """Append a record, returning once it is fsynced.
+
+        Args:
+            record: JSON serializable dict
+        """
+        data = json.dumps(record, separators=(",", ":"))
+        frame = self.HEADER.pack(len(data), zlib.crc32(data) & 0xffffffff) + data
+
+        with self.lock:
+            if self.file is not None and self.file.tell() >= self.segment_bytes:
+                self._seal()
+            if self.file is None:
+                segments = self.sealed or self._segments()
+                self.segment = (max(segments) if segments else 0) + 1
+                self.file = open(self._path(self.segment), "ab")
+            self.file.write(frame)
+            self.written += len(frame)
+            position = self.written
+            self.records += 1
+        self._sync(position)
+
+        if self.metrics is not None:
+            self.metrics.increment("notifier_journal_appends")
+
+    def _sync(self, position):
+        """Fsync the journal up to at least position."""
+        with self.sync_lock:
+            if self.synced >= position:
+                return
+            with self.lock:
+                file = self.file
+                written = self.written
+                if file is not None:
+                    file.flush()
+            try:
+                if file is not None:
+                    os.fsync(file.fileno())
+            except (OSError, ValueError):
+                # Sealed concurrently, which fsyncs the segment
+                if not file.closed:
+                    raise
+            self.synced = written
+
+    def start(self):
+        """Start the replay thread."""
+        if not self.running:
+            self.running = True
+            self.exit_event.clear()
+            self.thread = threading.Thread(target=self.run, name="NotificationJournal")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        """Replay thread run method."""
+        while self.running:
+            if self.records:
+                try:
+                    self.replay()
+                except Exception as error:
+                    self.log.warning("Journal replay failed: %s" % error)
+            self.exit_event.wait(self.replay_seconds)
+
+    def stop(self):
+        """Stop the replay thread and close the current segment."""
+        if self.running:
+            self.running = False
+            self.exit_event.set()
+        with self.lock:
+            self._seal()
+
+    def join(self, timeout=None):
+        """Join the replay thread."""
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def replay(self):
+        """Apply journaled records to the database.
+
+        Returns:
+            number of records applied
+        Raises:
+            Exception raised by apply, i.e. if the database is
+            still unavailable.
+        """
+        with self.replay_lock:
+            # Seal the current segment so new appends, which
+            # only happen while the database is unavailable,
+            # go to a new segment.
+            with self.lock:
+                self._seal()
+                segments = list(self.sealed)
+
+            count = 0
+            for segment in segments:
+                records = list(self._read(segment))
+                for index in range(self.applied, len(records), self.batch_size):
+                    batch = records[index:index + self.batch_size]
+                    self.apply(batch)
+                    self.applied = index + len(batch)
+                    count += len(batch)
+                    with self.lock:
+                        self.records -= len(batch)
+                    if self.metrics is not None:
+                        self.metrics.increment("notifier_journal_replayed", len(batch))
+
+                os.remove(self._path(segment))
+                with self.lock:
+                    self.sealed.remove(segment)
+                    self.applied = 0
+
+            if count:
+                self.log.info("Replayed %d journaled notifications" % count)
+            return count
@@ -0,0 +1,318 @@
+
+import datetime
+import logging
+import threading
+import time
+import uuid
+
+from sqlalchemy.sql import exists, select
+
+from trpycore.timezone import tz
+from trsvcscore.db.models import NotificationJob
+
+from models import NotificationJobLease
+
+
+class JobLeaseManager(object):
+    """Leases on claimed notification jobs.
+
+    A lease is written in the same transaction which claims
+    a job, and deleted in the transaction which ends it. While
+    jobs are being processed, their leases are renewed with
+    one batched update every heartbeat_seconds.
+
+    The manager also reaps expired leases, every reap_seconds:
+    jobs whose lease expired, because the process holding
+    them died or hung, are unclaimed so they're picked up
+    again by the next poll. Any process may reap, and
+    reaping is idempotent, so every instance runs a reaper.
+    If orphan_seconds is set, jobs claimed by the owner without
+    a lease, i.e. claimed before leases were introduced, are
+    unclaimed once they have been running for orphan_seconds.
+    Only set it once every instance claims jobs with leases:
+    jobs in flight on an instance without leases look orphaned,
+    and would be reclaimed and sent again.
+
+    Each claim's lease has a unique token. A job is only
+    ended if its claim's lease still exists, so a job which
+    was reaped and reclaimed, even by the same process,
+    isn't also ended by its original claimant.
+
+    Leases are renewed from the holder's clock and expired
+    from the reaper's, so hosts' clocks should be synchronized
+    to well within lease_seconds.
+    """
+    def __init__(
+            self,
+            db_session_factory,
+            holder,
+            owner,
+            lease_seconds=30,
+            heartbeat_seconds=5,
+            reap_seconds=5,
+            orphan_seconds=None,
+            batch_size=500,
+            metrics=None):
+        """JobLeaseManager constructor.
+
+        Args:
+            db_session_factory: callable returning a new sqlalchemy db session
+            holder: unique name of this process, i.e. '<hostname>-<pid>'
+            owner: NotificationJob owner string of claimed jobs
+            lease_seconds: seconds a lease is valid without renewal
+            heartbeat_seconds: seconds between lease renewals
+            reap_seconds: seconds between checks for expired leases
+            orphan_seconds: optional seconds after which a job
+                claimed without a lease is unclaimed; if None,
+                these jobs are never unclaimed.
+            batch_size: maximum number of leases per statement
+            metrics: optional MetricRegistry
+        """
+        self.log = logging.getLogger(__name__)
+        self.db_session_factory = db_session_factory
+        self.holder = holder
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.reap_seconds = reap_seconds
+        self.orphan_seconds = orphan_seconds
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.held = {}
+        self.last_reap = 0
+        self.last_orphan_reap = 0
+        self.running = False
+        self.thread = None
+        self.exit_event = threading.Event()
+
+        if self.metrics is not None:
+            self.metrics.register_gauge("notifier_leases_held", lambda: len(self.held))
+
+    def _expires(self):
+        return tz.utcnow() + datetime.timedelta(seconds=self.lease_seconds)
+
+    def acquire(self, db_session, job_id):
+        """Write the lease for a job being claimed.
+
+        Args:
+            db_session: sqlalchemy db session of the claim; the
+                lease is written but not committed.
+            job_id: NotificationJob id
+        Returns:
+            the lease's token
+        """
+        token = uuid.uuid4().hex
+        db_session.execute(NotificationJobLease.__table__.insert().values(
+            job_id=job_id, holder=self.holder, token=token, expires=self._expires()))
+        with self.lock:
+            self.held[job_id] = token
+        return token
+
+    def token(self, job_id):
+        """Token of the lease held for a job, or None."""
+        with self.lock:
+            return self.held.get(job_id)
+
+    def release(self, db_session, job_id, token):
+        """Delete the lease for a job being ended.
+
+        Args:
+            db_session: sqlalchemy db session ending the job;
+                the lease is deleted but not committed.
+            job_id: NotificationJob id
+            token: token of the lease, returned by acquire()
+        Returns:
+            True if the lease was deleted, False if it was
+            reaped, in which case the job may have been
+            reclaimed and must not be ended.
+        """
+        table = NotificationJobLease.__table__
+        result = db_session.execute(table.delete().\
+            where(table.c.job_id==job_id).\
+            where(table.c.token==token))
+        self.discard(job_id, token)
+        return result.rowcount == 1
+
+    def discard(self, job_id, token=None):
+        """Stop renewing a job's lease, i.e. if the claim failed.
+
+        Args:
+            job_id: NotificationJob id
+            token: optional token of the lease, returned by
+                acquire(); if given, a later lease of the job
+                is left as is.
+        """
+        with self.lock:
+            if token is None or self.held.get(job_id) == token:
+                self.held.pop(job_id, None)
+
+    def start(self):
+        """Start the heartbeat and reaper thread."""
+        if not self.running:
+            self.running = True
+            self.exit_event.clear()
+            self.thread = threading.Thread(target=self.run, name="JobLeaseManager")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        """Heartbeat and reaper thread run method."""
+        while self.running:
+            try:
+                self.heartbeat()
+            except Exception as error:
+                self.log.exception(error)
+
+            now = time.time()
+            try:
+                if now - self.last_reap >= self.reap_seconds:
+                    self.last_reap = now
+                    self.reap()
+                if self.orphan_seconds is not None and \
+                        now - self.last_orphan_reap >= self.orphan_seconds:
+                    self.last_orphan_reap = now
+                    self.reap_orphans()
+            except Exception as error:
+                self.log.exception(error)
+
+            self.exit_event.wait(min(self.heartbeat_seconds, self.reap_seconds))
+
+    def stop(self):
+        """Stop the heartbeat and reaper thread."""
+        if self.running:
+            self.running = False
+            self.exit_event.set()
+
+    def join(self, timeout=None):
+        """Join the heartbeat and reaper thread."""
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _batches(self, ids):
+        ids = list(ids)
+        for index in range(0, len(ids), self.batch_size):
+            yield ids[index:index + self.batch_size]
+
+    def heartbeat(self):
+        """Renew the leases of all held jobs.
+
+        Returns:
+            number of leases renewed
+        """
+        with self.lock:
+            held = list(self.held)
+        if not held:
+            return 0
+
+        table = NotificationJobLease.__table__
+        expires = self._expires()
+        renewed = 0
+        db_session = self.db_session_factory()
+        try:
+            for job_ids in self._batches(held):
+                result = db_session.execute(table.update().\
+                    where(table.c.job_id.in_(job_ids)).\
+                    where(table.c.holder==self.holder).\
+                    values(expires=expires))
+                renewed += result.rowcount
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+        # Leases of jobs which ended since the snapshot are
+        # gone, so only report leases which are still held.
+        with self.lock:
+            lost = len([job_id for job_id in held if job_id in self.held]) - renewed
+        if lost > 0:
+            self.log.warning("%d job leases were reaped before renewal" % lost)
+            if self.metrics is not None:
+                self.metrics.increment("notifier_leases_lost", lost)
+        return renewed
+
+    def _unclaim(self, db_session, job_ids):
+        """Unclaim unfinished jobs.
+
+        Returns:
+            number of jobs unclaimed
+        """
+        table = NotificationJob.__table__
+        result = db_session.execute(table.update().\
+            where(table.c.id.in_(job_ids)).\
+            where(table.c.owner==self.owner).\
+            where(table.c.end==None).\
+            values(owner=None, start=None))
+        return result.rowcount
+
+    def reap(self):
+        """Unclaim jobs whose leases expired.
+
+        Returns:
+            number of jobs unclaimed
+        """
+        table = NotificationJobLease.__table__
+        now = tz.utcnow()
+        reaped = 0
+        db_session = self.db_session_factory()
+        try:
+            while True:
+                job_ids = [row.job_id for row in db_session.execute(
+                    select([table.c.job_id]).\
+                    where(table.c.expires<now).\
+                    limit(self.batch_size))]
+                if not job_ids:
+                    break
+
+                reaped += self._unclaim(db_session, job_ids)
+                db_session.execute(table.delete().\
+                    where(table.c.job_id.in_(job_ids)).\
+                    where(table.c.expires<now))
+                db_session.commit()
+                if len(job_ids) < self.batch_size:
+                    break
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+        if reaped:
+            self.log.warning("Unclaimed %d jobs with expired leases" % reaped)
+            if self.metrics is not None:
+                self.metrics.increment("notifier_leases_reaped", reaped)
+        return reaped
+
+    def reap_orphans(self):
+        """Unclaim unfinished jobs which were claimed without a lease.
+
+        Returns:
+            number of jobs unclaimed
+        """
+        jobs = NotificationJob.__table__
+        leases = NotificationJobLease.__table__
+        started_before = tz.utcnow() - datetime.timedelta(seconds=self.orphan_seconds)
+        db_session = self.db_session_factory()
+        try:
+            job_ids = [row.id for row in db_session.execute(
+                select([jobs.c.id]).\
+                where(jobs.c.owner==self.owner).\
+                where(jobs.c.end==None).\
+                where(jobs.c.start<started_before).\
+                where(~exists().where(leases.c.job_id==jobs.c.id)).\
+                limit(self.batch_size))]
+            reaped = self._unclaim(db_session, job_ids) if job_ids else 0
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+        if reaped:
+            self.log.warning("Unclaimed %d jobs claimed without a lease" % reaped)
+            if self.metrics is not None:
+                self.metrics.increment("notifier_leases_orphans_reaped", reaped)
+        return reaped
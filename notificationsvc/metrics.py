@@ -0,0 +1,444 @@
+
+import bisect
+import logging
+import threading
+import time
+
+
+class Histogram(object):
+    """Fixed bucket histogram of observed values.
+
+    Values are counted in buckets with the given upper bounds,
+    plus an overflow bucket, so observing a value is cheap and
+    memory is constant. Percentiles are estimated as the upper
+    bound of the bucket containing the percentile.
+    """
+
+    # Default bucket upper bounds, in milliseconds
+    DEFAULT_BOUNDS = (1, 2, 5, 10, 25, 50, 100, 250, 500,
+                      1000, 2500, 5000, 10000, 30000, 60000,
+                      300000, 900000, 3600000)
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        """Histogram constructor.
+
+        Args:
+            bounds: sorted bucket upper bounds
+        """
+        self.lock = threading.Lock()
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        """Record a value."""
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, p):
+        """Estimate the p-th percentile.
+
+        Returns:
+            upper bound of the bucket containing the percentile,
+            the maximum observed value for the overflow bucket,
+            or 0 if no values have been observed.
+        """
+        with self.lock:
+            if self.count == 0:
+                return 0
+            rank = p / 100.0 * self.count
+            seen = 0
+            for index, count in enumerate(self.buckets):
+                seen += count
+                if count and seen >= rank:
+                    if index < len(self.bounds):
+                        return min(self.bounds[index], self.max)
+                    return self.max
+            return self.max
+
+    def snapshot(self):
+        """Get a consistent copy of the histogram state.
+
+        Returns:
+            (buckets, count, sum) tuple, where buckets is a list
+            of (upper bound, count) tuples, with None as the upper
+            bound of the overflow bucket.
+        """
+        with self.lock:
+            buckets = zip(self.bounds + (None,), self.buckets)
+            return buckets, self.count, self.sum
+
+    def export(self):
+        """Get the histogram state, i.e. to merge in another process.
+
+        Returns:
+            picklable (bounds, buckets, count, sum, max) tuple
+        """
+        with self.lock:
+            return self.bounds, list(self.buckets), self.count, self.sum, self.max
+
+    def merge(self, state):
+        """Add the values of another histogram's exported state.
+
+        Args:
+            state: Histogram.export() result, with the same bounds
+        """
+        bounds, buckets, count, sum, max = state
+        if tuple(bounds) != self.bounds:
+            raise ValueError("Cannot merge histograms with different bounds")
+        with self.lock:
+            for index, bucket_count in enumerate(buckets):
+                self.buckets[index] += bucket_count
+            self.count += count
+            self.sum += sum
+            self.max = max if max > self.max else self.max
+
+    def as_dict(self, name):
+        """Get summary values.
+
+        Args:
+            name: histogram name, used as the prefix for values
+        Returns:
+            dict of '<name>_count', '<name>_sum', '<name>_max',
+            '<name>_p50', '<name>_p90' and '<name>_p99' to
+            integer values.
+        """
+        result = {}
+        for p in (50, 90, 99):
+            result["%s_p%d" % (name, p)] = int(self.percentile(p))
+        with self.lock:
+            result["%s_count" % name] = self.count
+            result["%s_sum" % name] = int(self.sum)
+            result["%s_max" % name] = int(self.max)
+        return result
+
+
+class Meter(object):
+    """Rate of events over a sliding window.
+
+    Events are counted in one second buckets, so marking an
+    event is cheap and memory is bounded by the window size.
+    """
+
+    def __init__(self, window=60, clock=time.time):
+        """Meter constructor.
+
+        Args:
+            window: sliding window size in seconds
+            clock: callable returning the current time in seconds
+        """
+        self.lock = threading.Lock()
+        self.window = window
+        self.clock = clock
+        self.buckets = {}
+        self.total = 0
+
+    def _expire(self, now):
+        oldest = now - self.window
+        for second in [second for second in self.buckets if second <= oldest]:
+            del self.buckets[second]
+
+    def mark(self, count=1):
+        """Record count events."""
+        now = int(self.clock())
+        with self.lock:
+            self.buckets[now] = self.buckets.get(now, 0) + count
+            self.total += count
+            if len(self.buckets) > self.window:
+                self._expire(now)
+
+    def count(self):
+        """Number of events within the window."""
+        now = int(self.clock())
+        with self.lock:
+            self._expire(now)
+            return sum(self.buckets.values())
+
+    def rate(self):
+        """Events per second over the window."""
+        return self.count() / float(self.window)
+
+    def export(self):
+        """Get the meter state, i.e. to merge in another process.
+
+        Returns:
+            picklable (buckets, total) tuple
+        """
+        with self.lock:
+            return dict(self.buckets), self.total
+
+    def merge(self, state):
+        """Add the events of another meter's exported state.
+
+        Args:
+            state: Meter.export() result
+        """
+        buckets, total = state
+        with self.lock:
+            for second, count in buckets.items():
+                self.buckets[second] = self.buckets.get(second, 0) + count
+            self.total += total
+
+    def as_dict(self, name):
+        """Get summary values.
+
+        Args:
+            name: meter name, used as the prefix for values
+        Returns:
+            dict of '<name>_total', '<name>_per_min' (events in
+            the last minute, scaled to the window) and
+            '<name>_per_sec' to integer values.
+        """
+        count = self.count()
+        return {
+            "%s_total" % name: self.total,
+            "%s_per_min" % name: int(round(count * 60.0 / self.window)),
+            "%s_per_sec" % name: int(round(count / float(self.window)))
+        }
+
+
+class MetricRegistry(object):
+    """Thread-safe registry of service metrics.
+
+    Metrics are integer counters which are incremented
+    or set by the service components, gauges, which
+    are callables evaluated when the metrics are read,
+    and histograms and meters, which are exported as a
+    set of summary counters. Metrics are exposed through the
+    service counter interface (getCounter/getCounters).
+
+    Sources, i.e. the registries of worker processes, may be
+    registered; their exported metrics are merged into this
+    registry's when it is read, summing counters and gauges
+    and combining histograms and meters.
+
+    Histograms and meters have their own locks and are
+    looked up without taking the registry lock once created,
+    so recording values on the hot path doesn't contend
+    across metrics.
+    """
+    def __init__(self):
+        self.log = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.meters = {}
+        self.sources = []
+
+    def increment(self, name, value=1):
+        """Increment counter.
+
+        Args:
+            name: counter name
+            value: amount to increment counter by
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """Set counter to value.
+
+        Args:
+            name: counter name
+            value: counter value
+        """
+        with self.lock:
+            self.counters[name] = value
+
+    def register_gauge(self, name, callable):
+        """Register gauge.
+
+        Args:
+            name: gauge name
+            callable: callable taking no arguments returning
+                the current integer value of the gauge.
+        """
+        with self.lock:
+            self.gauges[name] = callable
+
+    def histogram(self, name):
+        """Get histogram, creating it if needed.
+
+        Args:
+            name: histogram name
+        Returns:
+            Histogram
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name, value):
+        """Record a value in a histogram.
+
+        Args:
+            name: histogram name
+            value: value to record
+        """
+        self.histogram(name).observe(value)
+
+    def meter(self, name):
+        """Get meter, creating it if needed.
+
+        Args:
+            name: meter name
+        Returns:
+            Meter
+        """
+        meter = self.meters.get(name)
+        if meter is None:
+            with self.lock:
+                meter = self.meters.setdefault(name, Meter())
+        return meter
+
+    def mark(self, name, count=1):
+        """Record events in a meter.
+
+        Args:
+            name: meter name
+            count: number of events
+        """
+        self.meter(name).mark(count)
+
+    def register_source(self, callable):
+        """Register a source of metrics to merge.
+
+        Args:
+            callable: callable returning a list of
+                MetricRegistry.export() results
+        """
+        with self.lock:
+            self.sources.append(callable)
+
+    def export(self):
+        """Get all metrics, i.e. to merge in another process.
+
+        Returns:
+            picklable dict with 'counters' and 'gauges' dicts
+            of name to integer value, and 'histograms' and
+            'meters' dicts of name to exported state.
+        """
+        counters, gauges, histograms, meters = self.collect()
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": dict((name, histogram.export())
+                               for name, histogram in histograms.items()),
+            "meters": dict((name, meter.export()) for name, meter in meters.items())
+        }
+
+    def get(self, name, default=None):
+        """Get counter, gauge or summary value.
+
+        Args:
+            name: counter, gauge, or histogram or meter summary name
+            default: value to return if metric does not exist
+        Returns:
+            metric value or default
+        """
+        if self.sources:
+            return self.as_dict().get(name, default)
+
+        with self.lock:
+            if name in self.counters:
+                return self.counters[name]
+            gauge = self.gauges.get(name)
+        if gauge is not None:
+            value = self._read_gauge(gauge)
+            return default if value is None else value
+
+        # Histogram and meter summary values are suffixed
+        # with one or two words, i.e. '_p99' or '_per_sec'.
+        for prefix in (name.rpartition("_")[0], name.rsplit("_", 2)[0]):
+            with self.lock:
+                summary = self.histograms.get(prefix) or self.meters.get(prefix)
+            if summary is not None:
+                values = summary.as_dict(prefix)
+                if name in values:
+                    return values[name]
+        return default
+
+    def collect(self):
+        """Get all metrics, i.e. for export.
+
+        Returns:
+            (counters, gauges, histograms, meters) tuple, where
+            counters and gauges are dicts of metric name to
+            integer value, and histograms and meters are dicts
+            of name to Histogram and Meter. Gauges which fail
+            to read are logged and omitted.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = self.gauges.items()
+            histograms = dict(self.histograms)
+            meters = dict(self.meters)
+            sources = list(self.sources)
+        values = {}
+        for name, gauge in gauges:
+            value = self._read_gauge(gauge)
+            if value is not None:
+                values[name] = value
+        gauges = values
+
+        states = []
+        for source in sources:
+            try:
+                states.extend(source())
+            except Exception as error:
+                self.log.exception(error)
+        if not states:
+            return counters, gauges, histograms, meters
+
+        # Merge into copies, so the local metrics are unchanged
+        histograms = dict((name, self._copy(Histogram(histogram.bounds), histogram))
+                          for name, histogram in histograms.items())
+        meters = dict((name, self._copy(Meter(meter.window, meter.clock), meter))
+                      for name, meter in meters.items())
+        for state in states:
+            for name, value in state["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+            for name, value in state["gauges"].items():
+                gauges[name] = gauges.get(name, 0) + value
+            for name, histogram_state in state["histograms"].items():
+                if name not in histograms:
+                    histograms[name] = Histogram(histogram_state[0])
+                histograms[name].merge(histogram_state)
+            for name, meter_state in state["meters"].items():
+                meters.setdefault(name, Meter()).merge(meter_state)
+        return counters, gauges, histograms, meters
+
+    def _read_gauge(self, gauge):
+        """Read a gauge's value, or None if it fails."""
+        try:
+            return int(gauge())
+        except Exception as error:
+            self.log.exception(error)
+            return None
+
+    def _copy(self, target, source):
+        target.merge(source.export())
+        return target
+
+    def as_dict(self):
+        """Get all counters, gauges, histogram and meter summaries.
+
+        Returns:
+            dict of metric name to integer value
+        """
+        counters, gauges, histograms, meters = self.collect()
+        result = counters
+        result.update(gauges)
+        for name, summary in histograms.items() + meters.items():
+            result.update(summary.as_dict(name))
+        return result
@@ -0,0 +1,188 @@
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text
+from sqlalchemy import UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+
+
+# Models owned by the notification service. The shared
+# Notification and NotificationJob models live in trsvcscore,
+# so these use a separate declarative base and reference
+# the shared tables by id only.
+Base = declarative_base()
+
+
+def create_tables(engine):
+    """Create service owned tables if they do not already exist.
+
+    Args:
+        engine: sqlalchemy engine or connection
+    """
+    Base.metadata.create_all(bind=engine, checkfirst=True)
+
+
+class NotificationDeadLetter(Base):
+    """Notification job which exhausted all of its retries.
+
+    Attributes:
+        created: time the dead letter was recorded
+        job_id: id of the final failed NotificationJob
+        notification_id: id of the Notification
+        recipient_id: id of the recipient User
+        priority: notification priority
+        context: notification context
+        error_class: class name of the last error
+        error_message: message of the last error
+        attempts: JSON encoded list of attempts with the
+            job id, not_before, start and end times.
+        replayed: time the dead letter was replayed, or None
+    """
+    __tablename__ = "notification_dead_letter"
+
+    id = Column(Integer, primary_key=True)
+    created = Column(DateTime(timezone=True), nullable=False)
+    job_id = Column(Integer, nullable=False)
+    notification_id = Column(Integer, nullable=False, index=True)
+    recipient_id = Column(Integer, nullable=False)
+    priority = Column(Integer, nullable=False)
+    context = Column(String(1024), index=True)
+    error_class = Column(String(256), index=True)
+    error_message = Column(Text)
+    attempts = Column(Text)
+    replayed = Column(DateTime(timezone=True), index=True)
+
+
+class NotificationChannelPreference(Base):
+    """User's address and preference for a delivery channel.
+
+    Attributes:
+        user_id: id of the User
+        channel: channel name, i.e. 'sms'
+        address: user's address on the channel, i.e. phone number
+        enabled: True if the user wants notifications on the channel
+    """
+    __tablename__ = "notification_channel_preference"
+    __table_args__ = (UniqueConstraint("user_id", "channel"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    channel = Column(String(32), nullable=False)
+    address = Column(String(1024))
+    enabled = Column(Boolean, nullable=False, default=True)
+
+
+class NotificationChannelDelivery(Base):
+    """Successful delivery of a notification to a recipient on a channel.
+
+    Recorded when a job fans out to several channels, so a
+    retry after a partial failure only resends on the channels
+    which failed.
+
+    Attributes:
+        created: time of the delivery
+        notification_id: id of the Notification
+        recipient_id: id of the recipient User
+        channel: channel name
+    """
+    __tablename__ = "notification_channel_delivery"
+    __table_args__ = (UniqueConstraint("notification_id", "recipient_id", "channel"),)
+
+    id = Column(Integer, primary_key=True)
+    created = Column(DateTime(timezone=True), nullable=False)
+    notification_id = Column(Integer, nullable=False)
+    recipient_id = Column(Integer, nullable=False)
+    channel = Column(String(32), nullable=False)
+
+
+class NotificationJobLease(Base):
+    """Lease on a claimed NotificationJob.
+
+    Written when a job is claimed and deleted when it ends.
+    The process holding the lease renews it with heartbeats;
+    once a lease expires its holder is presumed dead and the
+    job is returned to the queue.
+
+    Attributes:
+        job_id: id of the claimed NotificationJob
+        holder: process holding the lease, i.e. '<hostname>-<pid>'
+        token: unique token of the claim holding the lease
+        expires: time the lease expires unless renewed
+    """
+    __tablename__ = "notification_job_lease"
+
+    job_id = Column(Integer, primary_key=True, autoincrement=False)
+    holder = Column(String(256), nullable=False)
+    token = Column(String(32), nullable=False)
+    expires = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class NotificationToken(Base):
+    """Token of a Notification.
+
+    Written in the same transaction as the Notification, so
+    the primary key makes tokens unique, and a notify() retried
+    with the same token can't create a duplicate notification.
+
+    Attributes:
+        token: notification token
+        created: time the notification was created
+    """
+    __tablename__ = "notification_token"
+
+    token = Column(String(1024), primary_key=True)
+    created = Column(DateTime(timezone=True), nullable=False)
+
+
+class NotificationCancellation(Base):
+    """Cancellation of a Notification.
+
+    Processors load new cancellations incrementally, by id,
+    to drop jobs of cancelled notifications which are
+    already queued in memory.
+
+    Attributes:
+        created: time the notification was cancelled
+        notification_id: id of the cancelled Notification
+        context: cancel() calling context
+    """
+    __tablename__ = "notification_cancellation"
+
+    id = Column(Integer, primary_key=True)
+    created = Column(DateTime(timezone=True), nullable=False)
+    notification_id = Column(Integer, nullable=False, unique=True)
+    context = Column(String(1024))
+
+
+class NotificationStatus(Base):
+    """Aggregate job counts of a Notification.
+
+    Created with the notification, and updated in the same
+    transaction as each change to the notification's jobs,
+    so the status of a notification can be read without
+    counting its jobs.
+
+    Attributes:
+        token: notification token
+        notification_id: Notification id
+        created: time the notification was created
+        updated: time of the last change to the counts
+        last_sent: time a job was last sent, or None
+        pending: number of jobs which haven't ended
+        sent: number of jobs sent successfully
+        failed: number of jobs which failed (failed attempts
+            which are retried create new pending jobs)
+        cancelled: number of jobs cancelled
+        unknown: number of jobs whose send timed out after
+            its request was made, which may have been sent.
+    """
+    __tablename__ = "notification_status"
+
+    token = Column(String(1024), primary_key=True)
+    notification_id = Column(Integer, nullable=False, unique=True)
+    created = Column(DateTime(timezone=True), nullable=False)
+    updated = Column(DateTime(timezone=True), nullable=False)
+    last_sent = Column(DateTime(timezone=True))
+    pending = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    cancelled = Column(Integer, nullable=False, default=0)
+    unknown = Column(Integer, nullable=False, default=0)
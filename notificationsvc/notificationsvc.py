@@ -20,13 +20,16 @@ from trsvcscore.service.server.default import ThriftServer
 from trnotificationsvc.gen import TNotificationService
 
 from handler import NotificationServiceHandler
+from processor import create_worker
+from profiler import SamplingProfiler
+from workers import WorkerSupervisor
 
 
 
 class NotificationService(DefaultService):
-    def __init__(self):
+    def __init__(self, workers=None):
 
-        handler = NotificationServiceHandler(self)
+        handler = NotificationServiceHandler(self, workers)
 
         server = ThriftServer(
             name="%s-thrift" % settings.SERVICE,
@@ -34,7 +37,7 @@ class NotificationService(DefaultService):
             port=settings.THRIFT_SERVER_PORT,
             handler=handler,
             processor=TNotificationService.Processor(handler),
-            threads=1)
+            threads=settings.THRIFT_SERVER_THREADS)
 
         super(NotificationService, self).__init__(
             name=settings.SERVICE,
@@ -52,15 +55,45 @@ def main(argv):
         with pidfile(settings.SERVICE_PID_FILE, create_directory=True):
 
             
+            #Create profiler toggled on PROFILER_SIGNAL. The
+            #signal is forwarded to worker processes, if any,
+            #which inherit the handler and profile themselves.
+            profiler = SamplingProfiler(
+                output_directory=settings.PROFILER_OUTPUT_DIRECTORY,
+                interval=settings.PROFILER_INTERVAL,
+                duration=settings.PROFILER_DURATION,
+                prefix=settings.SERVICE)
+            workers = None
+            service_pid = os.getpid()
+
+            def profiler_handler(signum, stack_frame):
+                profiler.toggle()
+                if workers is not None and os.getpid() == service_pid:
+                    workers.signal(signum)
+
+            if settings.PROFILER_SIGNAL is not None:
+                signal.signal(settings.PROFILER_SIGNAL, profiler_handler)
+
+            #Start prefork worker processes, which claim and
+            #deliver jobs, before any service threads exist.
+            if settings.NOTIFIER_WORKER_PROCESSES > 0:
+                workers = WorkerSupervisor(
+                    num_processes=settings.NOTIFIER_WORKER_PROCESSES,
+                    factory=create_worker,
+                    metrics_seconds=settings.NOTIFIER_WORKER_METRICS_SECONDS,
+                    restart_seconds=settings.NOTIFIER_WORKER_RESTART_SECONDS,
+                    stop_timeout=settings.NOTIFIER_WORKER_STOP_TIMEOUT)
+                workers.start()
+
             #Create service
-            service = NotificationService()
+            service = NotificationService(workers)
             
             #Register signal handlers
             def sigterm_handler(signum, stack_frame):
                 service.stop()
 
             signal.signal(signal.SIGTERM, sigterm_handler);
-            
+
             #Start service
             service.start()
             
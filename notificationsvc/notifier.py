@@ -1,14 +1,25 @@
 
 import datetime
 import logging
+import time
 from string import Template
 
+from sqlalchemy.orm import object_session
 from sqlalchemy.sql import func
 
 from trpycore.timezone import tz
 from trsvcscore.db.models import NotificationJob
 from trsvcscore.db.job import JobOwned
 
+from constants import EMAIL_CHANNEL, SMS_CHANNEL, WEBHOOK_CHANNEL
+from deadletter import create_dead_letter
+from jobqueue import JobCancelled, JobDeferred, JobForwarded, JobOutcomeUnknown
+from status import update_status
+from models import NotificationChannelDelivery, NotificationChannelPreference
+from providers.exceptions import CircuitOpenException, InvalidParameterException, \
+        OutcomeUnknownException
+from tracing import TRACE_ACCEPTED, TRACE_RENDERED
+
 
 
 
@@ -17,32 +28,86 @@ class Notifier(object):
 
     Args:
         db_session_factory: callable returning a new sqlalchemy db session
-        email_provider: Concrete object derived from EmailProvider
+        providers: dict of channel name to concrete object derived
+            from NotificationProvider (i.e. EmailProvider, SmsProvider)
         job_retry_seconds: number of seconds delay between job retries
+        channel: channel this notifier delivers jobs on
+        watchdog: optional SendWatchdog used to detect and abort
+            provider sends which exceed their deadline.
+        metrics: optional MetricRegistry
+        limiter: optional AdaptiveConcurrencyLimiter, shared by
+            all notifiers, bounding the number of concurrent email sends.
+        router: optional ChannelRouter choosing the channels to
+            deliver each job on. Without a router jobs are delivered
+            on the notifier's channel only.
+        tracer: optional LatencyTracer recording the latencies
+            of jobs accepted by a provider.
+        cancellations: optional CancellationSet of cancelled
+            notifications, whose jobs are dropped before rendering.
+        dispatch: optional callable(channel, database_job) handing
+            a claimed job to the pool of another channel. With a
+            dispatch, a job routed to several channels is delivered
+            on each by its own channel's pool, so a slow provider
+            only ties up its own pool's threads. Without one, the
+            notifier delivers jobs on all their channels.
     """
 
     def __init__(
             self,
             db_session_factory,
-            email_provider,
-            job_retry_seconds
+            providers,
+            job_retry_seconds,
+            channel=EMAIL_CHANNEL,
+            watchdog=None,
+            metrics=None,
+            limiter=None,
+            router=None,
+            tracer=None,
+            cancellations=None,
+            dispatch=None
     ):
         self.log = logging.getLogger(__name__)
         self.db_session_factory = db_session_factory
-        self.email_provider = email_provider
+        self.providers = providers
         self.job_retry_seconds = job_retry_seconds
+        self.channel = channel
+        self.watchdog = watchdog
+        self.metrics = metrics
+        self.limiter = limiter
+        self.router = router
+        self.tracer = tracer
+        self.cancellations = cancellations
+        self.dispatch = dispatch
+
+    def _is_cancelled(self, notification_id):
+        """Check if a notification is in the cancellation set."""
+        return self.cancellations is not None and notification_id in self.cancellations
 
-    def _retry_job(self, failed_job):
+    def _retry_job(self, failed_job, error=None):
         """Create a new NotificationJob from a failed job.
 
         This method creates a new Notification Job from a
-        job that failed to process successfully.
+        job that failed to process successfully. If the
+        job has no retries remaining, a dead letter is
+        recorded instead so the job can be replayed later.
+
+        Args:
+            failed_job: NotificationJob model which failed
+            error: exception which caused the failure, or None
         """
         try:
             db_session = None
 
+            # Don't retry jobs of cancelled notifications
+            if self._is_cancelled(failed_job.notification_id):
+                self.log.info("Notification cancelled, not retrying notification_job_id=%s" \
+                        % (failed_job.id))
+                return
+
+            retries_remaining = failed_job.retries_remaining - 1
+
             #create new job in db to retry.
-            if failed_job.retries_remaining > 0:
+            if retries_remaining >= 0:
                 not_before = tz.utcnow() + datetime.timedelta(seconds=self.job_retry_seconds)
                 new_job = NotificationJob(
                     created=func.current_timestamp(),
@@ -50,17 +115,23 @@ class Notifier(object):
                     notification_id=failed_job.notification_id,
                     recipient_id=failed_job.recipient_id,
                     priority=failed_job.priority,
-                    retries_remaining=failed_job.retries_remaining-1
+                    retries_remaining=retries_remaining
                 )
                 # Add job to db
                 db_session = self.db_session_factory()
                 db_session.add(new_job)
+                update_status(db_session, failed_job.notification_id, pending=1)
                 db_session.commit()
             else:
                 self.log.info("No retries remaining for job for notification_job_id=%s"\
                               % (failed_job.id))
                 self.log.error("Job for notification_job_id=%s failed!"\
                                % (failed_job.id))
+
+                # Record dead letter for replay
+                db_session = self.db_session_factory()
+                create_dead_letter(db_session, failed_job, error)
+                db_session.commit()
         except Exception as e:
             self.log.exception(e)
             if db_session:
@@ -90,12 +161,343 @@ class Notifier(object):
         return template.substitute(template_dict)
 
 
+    def _get_address(self, job, channel):
+        """Get the recipient's address (phone number, etc.) for a channel.
+
+        Args:
+            job: NotificationJob model
+            channel: channel name
+        Returns:
+            address string
+        Raises:
+            InvalidParameterException if the recipient has
+            no address for the channel.
+        """
+        if self.router is not None:
+            address = self.router.address(job.recipient_id, channel)
+            if not address:
+                raise InvalidParameterException("No %s address for user_id=%s" \
+                        % (channel, job.recipient_id))
+            return address
+
+        address = object_session(job).query(NotificationChannelPreference.address).\
+            filter(NotificationChannelPreference.user_id==job.recipient_id).\
+            filter(NotificationChannelPreference.channel==channel).\
+            scalar()
+        if not address:
+            raise InvalidParameterException("No %s address for user_id=%s" \
+                    % (channel, job.recipient_id))
+        return address
+
+
+    def _deliver(self, job, channel, template_dict, trace=None):
+        """Deliver notification on a channel.
+
+        The notification is rendered with the template values
+        before sending, unless the provider supports
+        substitutions, in which case the unrendered templates
+        and values are passed through so the provider can
+        render them remotely.
+
+        Args:
+            job: NotificationJob model
+            channel: channel name
+            template_dict: template values
+            trace: optional job trace dict
+        Returns:
+            provider send() result
+        """
+        provider = self.providers[channel]
+        notification = job.notification
+
+        if channel == EMAIL_CHANNEL:
+            if provider.supports_substitutions:
+                return self._send(
+                    job,
+                    channel,
+                    trace,
+                    recipient=job.recipient.email,
+                    subject=notification.subject,
+                    plain_text=notification.plain_text,
+                    html_text=notification.html_text,
+                    substitutions=template_dict
+                )
+            return self._send(
+                job,
+                channel,
+                trace,
+                recipient=job.recipient.email,
+                subject=self._substitute(notification.subject, template_dict),
+                plain_text=self._substitute(notification.plain_text, template_dict),
+                html_text=self._substitute(notification.html_text, template_dict)
+                #job.notification.attachments in future
+            )
+        elif channel == SMS_CHANNEL:
+            return self._send(
+                job,
+                channel,
+                trace,
+                recipient=self._get_address(job, SMS_CHANNEL),
+                text=self._substitute(notification.plain_text or notification.subject, template_dict)
+            )
+        elif channel == WEBHOOK_CHANNEL:
+            return self._send(
+                job,
+                channel,
+                trace,
+                context=notification.context,
+                event={
+                    "id": job.id,
+                    "token": notification.token,
+                    "context": notification.context,
+                    "recipient_id": job.recipient_id,
+                    "priority": notification.priority,
+                    "subject": self._substitute(notification.subject, template_dict),
+                    "plain_text": self._substitute(notification.plain_text, template_dict),
+                    "html_text": self._substitute(notification.html_text, template_dict)
+                }
+            )
+        else:
+            raise InvalidParameterException("Unsupported channel '%s'" % channel)
+
+
+    def _delivered(self, job):
+        """Get the channels a job's recipient was already notified on."""
+        db_session = object_session(job)
+        return set(row.channel for row in db_session.query(NotificationChannelDelivery.channel).\
+            filter(NotificationChannelDelivery.notification_id==job.notification_id).\
+            filter(NotificationChannelDelivery.recipient_id==job.recipient_id))
+
+    def _deliver_recorded(self, job, channel, template_dict, trace=None):
+        """Deliver notification on one of several channels.
+
+        A successful delivery is recorded in the job's session,
+        which is committed when the job finishes or is forwarded,
+        so the channel is skipped if the job is processed again.
+        A delivery whose outcome is unknown is recorded too, so
+        it isn't resent.
+
+        Returns:
+            OutcomeUnknownException if the delivery's outcome is
+            unknown, None otherwise.
+        Raises:
+            provider send() exception if the delivery failed.
+        """
+        unknown = None
+        try:
+            self._deliver(job, channel, template_dict, trace)
+        except OutcomeUnknownException as e:
+            self.log.warning("Delivery on %s unknown for notification_job_id=%s: %s" \
+                    % (channel, job.id, e))
+            unknown = e
+        object_session(job).add(NotificationChannelDelivery(
+            created=func.current_timestamp(),
+            notification_id=job.notification_id,
+            recipient_id=job.recipient_id,
+            channel=channel))
+        return unknown
+
+    def _fan_out(self, job, channels, template_dict, trace=None):
+        """Deliver notification on several channels.
+
+        Channels which already have a delivery recorded are
+        skipped. If any channel fails the first error is raised
+        after trying the remaining channels, so the retried job
+        only resends on the channels which failed. Channels
+        whose provider is unavailable are skipped, and
+        CircuitOpenException is raised if no channel failed, so
+        the job is deferred until they recover. Otherwise
+        OutcomeUnknownException is raised if any channel's
+        outcome is unknown.
+
+        Args:
+            job: NotificationJob model
+            channels: list of channel names
+            template_dict: template values
+            trace: optional job trace dict
+        """
+        delivered = self._delivered(job)
+
+        error = None
+        unavailable = None
+        unknown = None
+        for channel in channels:
+            if channel in delivered:
+                continue
+            if not self.providers[channel].is_available():
+                unavailable = CircuitOpenException(channel)
+                continue
+            try:
+                unknown = self._deliver_recorded(job, channel, template_dict, trace) or unknown
+            except CircuitOpenException as e:
+                unavailable = e
+            except Exception as e:
+                self.log.warning("Delivery on %s failed for notification_job_id=%s: %s" \
+                        % (channel, job.id, e))
+                if error is None:
+                    error = e
+
+        if error is not None:
+            raise error
+        if unavailable is not None:
+            raise unavailable
+        if unknown is not None:
+            raise unknown
+
+    def _deliver_step(self, database_job, job, template_dict):
+        """Deliver notification on this notifier's channel, for a job
+        delivered on several channels by their own pools.
+
+        The job is delivered on this notifier's channel, unless
+        a delivery is already recorded or the channel's provider
+        is unavailable, and the next of its channels is returned,
+        to forward the job to. Failures, unavailable providers
+        and unknown outcomes are kept in the database job, and
+        raised by the pool of its last channel once every channel
+        has been tried, in the same order as _fan_out().
+
+        Args:
+            database_job: NotificationDatabaseJob
+            job: NotificationJob model
+            template_dict: template values
+        Returns:
+            channel to forward the job to, or None if this is
+            the job's last channel.
+        """
+        channels = database_job.channels
+        if self.channel in channels:
+            if self.channel in self._delivered(job):
+                pass
+            elif not self.providers[self.channel].is_available():
+                database_job.unavailable = CircuitOpenException(self.channel)
+            else:
+                try:
+                    unknown = self._deliver_recorded(job, self.channel,
+                            template_dict, database_job.trace)
+                    database_job.unknown = database_job.unknown or unknown
+                except CircuitOpenException as e:
+                    database_job.unavailable = e
+                except Exception as e:
+                    self.log.warning("Delivery on %s failed for notification_job_id=%s: %s" \
+                            % (self.channel, job.id, e))
+                    if database_job.error is None:
+                        database_job.error = e
+            remaining = channels[channels.index(self.channel) + 1:]
+        else:
+            remaining = channels
+
+        if remaining:
+            return remaining[0]
+        if database_job.error is not None:
+            raise database_job.error
+        if database_job.unavailable is not None:
+            raise database_job.unavailable
+        if database_job.unknown is not None:
+            raise database_job.unknown
+        return None
+
+
+    def _send(self, job, channel, trace=None, **kwargs):
+        """Send through a channel's provider.
+
+        If a concurrency limiter is configured a slot is held
+        for the duration of each email send, and the send latency
+        and outcome are reported to the limiter. If a watchdog is
+        configured the send is tracked and aborted if it
+        exceeds its deadline. Sends and failures are recorded
+        in the 'notifier_<channel>_sends' and
+        'notifier_<channel>_send_failures' meters. If a trace
+        is given, the time rendering completed (the first send
+        started) and the time the provider accepted the send
+        are recorded.
+
+        Args:
+            job: NotificationJob model
+            channel: channel name
+            trace: optional job trace dict
+            kwargs: provider send() arguments
+        Returns:
+            provider send() result
+        """
+        provider = self.providers[channel]
+        slot = None
+        if self.limiter is not None and channel == EMAIL_CHANNEL:
+            slot = self.limiter.acquire()
+
+        start = time.time()
+        if trace is not None:
+            trace.setdefault(TRACE_RENDERED, start)
+        try:
+            if self.watchdog is None:
+                result = provider.send(**kwargs)
+            else:
+                description = "notification_job_id=%s" % job.id
+                with self.watchdog.watch(description, provider.abort):
+                    result = provider.send(**kwargs)
+
+            end = time.time()
+            if slot is not None:
+                slot.record(end - start)
+            if trace is not None:
+                trace[TRACE_ACCEPTED] = end
+            if self.metrics is not None:
+                self.metrics.mark("notifier_%s_sends" % channel)
+            return result
+
+        except CircuitOpenException:
+            raise
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.mark("notifier_%s_send_failures" % channel)
+            if slot is not None:
+                slot.record(
+                    time.time() - start,
+                    failed=True,
+                    throttled=provider.is_throttle_error(e))
+            raise
+        finally:
+            if slot is not None:
+                self.limiter.release(slot)
+
+
     def send(self, database_job):
         """ Send the notification specified by the input job.
 
         Args:
-            database_job: DatabaseJob object, or objected derived from DatabaseJob
+            database_job: NotificationDatabaseJob object
         """
+        # Route the job to the recipient's channels, once, when
+        # it's first processed.
+        if database_job.channels is None:
+            if self.router is None:
+                database_job.channels = [self.channel]
+            else:
+                database_job.channels = self.router.route(database_job.recipient_id)
+        channels = database_job.channels
+
+        # If the provider is unavailable (circuit breaker open)
+        # leave the job unclaimed so it will be picked up again
+        # once the provider recovers, without using an attempt.
+        # Jobs which are already claimed (i.e. expressed) are
+        # unclaimed once entered below, which also discards their
+        # lease. Jobs delivered on several channels only skip the
+        # unavailable ones.
+        available = len(channels) > 1 or self.providers[self.channel].is_available()
+        if not available and not database_job.claimed:
+            if self.metrics is not None:
+                self.metrics.increment("notifier_jobs_deferred")
+            database_job.release()
+            return
+
+        # Unclaimed jobs of cancelled notifications were ended by
+        # cancel(), so drop them without attempting to claim them.
+        if not database_job.claimed and self._is_cancelled(database_job.notification_id):
+            if self.metrics is not None:
+                self.metrics.increment("notifier_jobs_cancelled")
+            database_job.release()
+            return
+
+        forward = None
         try:
             with database_job as job:
 
@@ -105,36 +507,75 @@ class Notifier(object):
                 # manager returns 'job' as a NotificationJob
                 # db model object.
 
-                # This is where the logic that controls which
-                # provider to use will live (e.g. email, sms, etc).
-                # For now, we only have an email provider so
-                # there's no logic needed.
+                # Drop the job, ending it as cancelled, if its
+                # notification was cancelled before rendering.
+                if self._is_cancelled(job.notification_id):
+                    raise JobCancelled()
+                if not available:
+                    raise JobDeferred()
 
                 # Fill in template values, if provided
                 template_dict = {
                     'first_name': job.recipient.first_name,
                     'last_name': job.recipient.last_name}
-                subject = self._substitute(job.notification.subject, template_dict)
-                plain_text = self._substitute(job.notification.plain_text, template_dict)
-                html_text = self._substitute(job.notification.html_text, template_dict)
 
-                # Call into email service wrapper
+                # Call into providers for the recipient's channels
                 # TODO return async object
-                result = self.email_provider.send(
-                    recipient=job.recipient.email,
-                    subject=subject,
-                    plain_text=plain_text,
-                    html_text=html_text
-                    #job.notification.attachments in future
-                )
+                try:
+                    if not channels:
+                        self.log.info("No enabled channels for user_id=%s, skipping notification_job_id=%s" \
+                                % (job.recipient_id, job.id))
+                    elif len(channels) == 1:
+                        self._deliver(job, channels[0], template_dict, database_job.trace)
+                    elif self.dispatch is None:
+                        self._fan_out(job, channels, template_dict, database_job.trace)
+                    else:
+                        forward = self._deliver_step(database_job, job, template_dict)
+                        if forward is not None:
+                            raise JobForwarded()
+                except CircuitOpenException:
+                    # The breaker opened after the job was claimed,
+                    # so the send was never attempted. Unclaim the
+                    # job rather than ending it as failed.
+                    raise JobDeferred()
+                except OutcomeUnknownException:
+                    # The send timed out after its request was made,
+                    # so it may have been delivered. End the job
+                    # with an unknown outcome rather than retrying.
+                    raise JobOutcomeUnknown()
 
+        except JobForwarded:
+            # The job's deliveries on this channel were committed,
+            # and it's still claimed; its next channel's pool
+            # delivers it on that channel.
+            self.dispatch(forward, database_job)
+        except JobCancelled:
+            self.log.info("Notification cancelled, dropped notification_job_id=%d" % database_job.id)
+            if self.metrics is not None:
+                self.metrics.increment("notifier_jobs_cancelled")
         except JobOwned:
             # This means that the NotificationJob was claimed just before
-            # this thread claimed it. Stop processing the job. There's
-            # no need to abort the job since no processing of the job
-            # has occurred.
-            self.log.warning("Notification job with job_id=%d already claimed. Stopping processing." % job.id)
+            # this thread claimed it, or its lease was reaped and it was
+            # reclaimed while this thread processed it. Stop processing
+            # the job; it's ended by whoever holds the claim.
+            self.log.warning("Notification job with job_id=%d already claimed. Stopping processing." % database_job.id)
+        except JobOutcomeUnknown:
+            self.log.error("Send outcome unknown for notification_job_id=%d, not retrying." % database_job.id)
+            if self.metrics is not None:
+                self.metrics.increment("notifier_jobs_unknown")
+        except JobDeferred:
+            # The job was unclaimed, so it's picked up again once
+            # the provider recovers, without using an attempt.
+            self.log.warning("Provider unavailable for notification_job_id=%d, deferring." % database_job.id)
+            if self.metrics is not None:
+                self.metrics.increment("notifier_jobs_deferred")
         except Exception as e:
             #failure during processing.
             self.log.exception(e)
-            self._retry_job(job)
+            self._retry_job(job, e)
+        else:
+            if self.tracer is not None and TRACE_ACCEPTED in database_job.trace:
+                try:
+                    self.tracer.record(job, database_job.trace)
+                except Exception as e:
+                    self.log.exception(e)
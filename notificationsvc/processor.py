@@ -0,0 +1,418 @@
+
+import logging
+import os
+import smtplib
+import socket
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from trpycore.factory.base import Factory
+from trpycore.pool.queue import QueuePool
+from trpycore.thread.util import join
+from trpycore.zookeeper.client import ZookeeperClient
+
+import settings
+
+from constants import EMAIL_CHANNEL, SMS_CHANNEL, WEBHOOK_CHANNEL
+from cancellation import CancellationSet
+from concurrency import AdaptiveConcurrencyLimiter
+from jobmonitor import NotificationJobMonitor, NotificationThreadPool
+from jobqueue import NotificationDatabaseJob
+from leases import JobLeaseManager
+from metrics import MetricRegistry
+from models import create_tables
+from notifier import Notifier
+from providers.breaker import CircuitBreaker, CircuitBreakerProvider
+from providers.exceptions import InvalidParameterException
+from routing import ChannelPreferenceCache, ChannelRouter
+from sharding import ShardCoordinator
+from tracing import LatencyTracer
+from watchdog import SendWatchdog
+
+
+class NotificationProcessor(object):
+    """Notification processor.
+
+    Claims due notification jobs from the database and
+    delivers them: owns the job monitor, the per-channel
+    thread pools and notifier pools, and the components
+    they share (providers' circuit breakers, the concurrency
+    limiter, the channel router, and the send watchdog).
+
+    The processor runs inside the service process, or in
+    each worker process when the service runs in prefork
+    mode, so it has no dependency on the service handler.
+
+    If NOTIFIER_SHARDING is enabled, each processor registers
+    in Zookeeper as a shard member and only processes the
+    jobs of the shard buckets it owns, so jobs are split
+    across all processes of all service instances.
+
+    The processor also provides an express lane, through
+    which notify() hands the jobs it has claimed itself
+    directly to idle worker threads (see express()).
+    """
+    def __init__(self, db_session_factory, metrics, tracer=None, partition=None):
+        """NotificationProcessor constructor.
+
+        Args:
+            db_session_factory: callable returning a new sqlalchemy db session
+            metrics: MetricRegistry
+            tracer: optional LatencyTracer
+            partition: optional (index, count) tuple; if given
+                only jobs whose id modulo count equals index are
+                processed, i.e. by each of count worker processes.
+                Ignored if sharding is enabled, since the shard
+                coordinator splits jobs across all processes.
+        """
+        self.log = logging.getLogger(__name__)
+        self.db_session_factory = db_session_factory
+        self.metrics = metrics
+        self.tracer = tracer
+
+        # Create shard coordinator splitting jobs across
+        # service instances and worker processes.
+        self.zookeeper_client = None
+        self.shard = None
+        if settings.NOTIFIER_SHARDING:
+            self.zookeeper_client = ZookeeperClient(settings.ZOOKEEPER_HOSTS)
+            self.shard = ShardCoordinator(
+                zookeeper_client=self.zookeeper_client,
+                path=settings.NOTIFIER_SHARD_PATH,
+                member="%s-%d" % (socket.gethostname(), os.getpid()),
+                bucket_count=settings.NOTIFIER_SHARD_BUCKETS,
+                replicas=settings.NOTIFIER_SHARD_REPLICAS,
+                refresh_seconds=settings.NOTIFIER_SHARD_REFRESH_SECONDS,
+                metrics=self.metrics)
+            partition = None
+
+        # Create lease manager renewing the leases of claimed
+        # jobs, and reclaiming jobs of processes which died.
+        self.leases = None
+        if settings.NOTIFIER_LEASES:
+            self.leases = JobLeaseManager(
+                db_session_factory=self.db_session_factory,
+                holder="%s-%d" % (socket.gethostname(), os.getpid()),
+                owner=settings.SERVICE,
+                lease_seconds=settings.NOTIFIER_LEASE_SECONDS,
+                heartbeat_seconds=settings.NOTIFIER_LEASE_HEARTBEAT_SECONDS,
+                reap_seconds=settings.NOTIFIER_LEASE_REAP_SECONDS,
+                orphan_seconds=settings.NOTIFIER_LEASE_ORPHAN_SECONDS,
+                metrics=self.metrics)
+
+        # Create set of recently cancelled notifications, whose
+        # jobs queued in memory are dropped before rendering.
+        self.cancellations = CancellationSet(
+            db_session_factory=self.db_session_factory,
+            refresh_seconds=settings.NOTIFIER_CANCELLATION_REFRESH_SECONDS,
+            retention_seconds=settings.NOTIFIER_CANCELLATION_RETENTION_SECONDS)
+        self.metrics.register_gauge("notifier_cancellations",
+            lambda: len(self.cancellations))
+
+        # Create watchdog to detect and abort hung sends
+        self.watchdog = SendWatchdog(
+            timeout=settings.NOTIFIER_SEND_TIMEOUT,
+            poll_seconds=settings.NOTIFIER_WATCHDOG_POLL_SECONDS,
+            metrics=self.metrics)
+
+        # Provider factories and the exceptions which should not
+        # trip the channel's circuit breaker, for each channel.
+        self.provider_factories = {
+            EMAIL_CHANNEL: settings.EMAIL_PROVIDER_FACTORY,
+            SMS_CHANNEL: settings.SMS_PROVIDER_FACTORY,
+            WEBHOOK_CHANNEL: settings.WEBHOOK_PROVIDER_FACTORY
+        }
+        self.provider_ignore_exceptions = {
+            EMAIL_CHANNEL: (InvalidParameterException, smtplib.SMTPRecipientsRefused),
+            SMS_CHANNEL: (InvalidParameterException,),
+            WEBHOOK_CHANNEL: (InvalidParameterException,)
+        }
+
+        # Create circuit breakers shared by all providers for a channel
+        self.breakers = {
+            EMAIL_CHANNEL: CircuitBreaker(
+                name=EMAIL_CHANNEL,
+                failure_threshold=settings.EMAIL_PROVIDER_BREAKER_FAILURE_THRESHOLD,
+                reset_seconds=settings.EMAIL_PROVIDER_BREAKER_RESET_SECONDS),
+            SMS_CHANNEL: CircuitBreaker(
+                name=SMS_CHANNEL,
+                failure_threshold=settings.SMS_PROVIDER_BREAKER_FAILURE_THRESHOLD,
+                reset_seconds=settings.SMS_PROVIDER_BREAKER_RESET_SECONDS),
+            WEBHOOK_CHANNEL: CircuitBreaker(
+                name=WEBHOOK_CHANNEL,
+                failure_threshold=settings.WEBHOOK_PROVIDER_BREAKER_FAILURE_THRESHOLD,
+                reset_seconds=settings.WEBHOOK_PROVIDER_BREAKER_RESET_SECONDS)
+        }
+        for channel, breaker in self.breakers.items():
+            self.metrics.register_gauge("%s_provider_breaker_state" % channel,
+                lambda breaker=breaker: breaker.state)
+
+        # Create adaptive limiter to bound concurrent email sends
+        email_pool_config = settings.NOTIFIER_POOLS.get(EMAIL_CHANNEL, {})
+        self.limiter = None
+        if settings.NOTIFIER_ADAPTIVE_CONCURRENCY:
+            self.limiter = AdaptiveConcurrencyLimiter(
+                min_limit=settings.NOTIFIER_CONCURRENCY_MIN,
+                max_limit=min(settings.NOTIFIER_CONCURRENCY_MAX,
+                              email_pool_config.get("threads", settings.NOTIFIER_THREADS),
+                              email_pool_config.get("pool_size", settings.NOTIFIER_POOL_SIZE)),
+                latency_target=settings.NOTIFIER_CONCURRENCY_LATENCY_TARGET,
+                decrease_factor=settings.NOTIFIER_CONCURRENCY_DECREASE_FACTOR,
+                error_threshold=settings.NOTIFIER_CONCURRENCY_ERROR_THRESHOLD)
+            self.metrics.register_gauge("notifier_concurrency_limit",
+                lambda: self.limiter.limit)
+            self.metrics.register_gauge("notifier_concurrency_in_use",
+                lambda: self.limiter.in_use)
+
+        # Create router choosing each recipient's channels from
+        # their cached channel preferences.
+        self.preference_cache = ChannelPreferenceCache(
+            db_session_factory=self.db_session_factory,
+            size=settings.NOTIFIER_PREFERENCE_CACHE_SIZE,
+            ttl=settings.NOTIFIER_PREFERENCE_CACHE_TTL)
+        self.router = ChannelRouter(
+            cache=self.preference_cache,
+            channels=[channel for channel in settings.NOTIFIER_ROUTING_CHANNELS
+                      if channel in settings.NOTIFIER_POOLS],
+            default_channel=EMAIL_CHANNEL)
+        self.metrics.register_gauge("notifier_preference_cache_hits",
+            lambda: self.preference_cache.hits)
+        self.metrics.register_gauge("notifier_preference_cache_misses",
+            lambda: self.preference_cache.misses)
+
+        # Create a pool of Notifier objects, which do the actual
+        # work of sending notifications, and a pool of threads to
+        # manage the work, for each channel. Channels are isolated
+        # so a stalled provider only backs up its own queue.
+        self.notifier_pools = {}
+        self.thread_pools = {}
+        for channel, config in settings.NOTIFIER_POOLS.items():
+            self._create_pools(channel, config)
+
+        # Create job monitor which scans for new jobs
+        # to process and delegates to the thread pools
+        self.job_monitor = NotificationJobMonitor(
+            db_session_factory=self.db_session_factory,
+            thread_pools=self.thread_pools,
+            router=self.router,
+            poll_seconds=settings.NOTIFIER_POLL_SECONDS,
+            prefetch=self.router.prefetch,
+            partition=partition,
+            shard=self.shard,
+            leases=self.leases)
+        self.metrics.register_gauge("notifier_job_queue_size",
+            self.job_monitor.db_job_queue.size)
+
+
+    def _create_provider(self, channel):
+        """Create provider for a channel guarded by the channel's breaker."""
+        return CircuitBreakerProvider(
+            provider=self.provider_factories[channel](),
+            breaker=self.breakers[channel],
+            ignore_exceptions=self.provider_ignore_exceptions[channel])
+
+    def _notifier_factory(self, channel):
+        """Get factory creating Notifiers for a channel.
+
+        Jobs are dispatched to the pool for the recipient's
+        primary channel, and forwarded to the pools of the
+        recipient's other channels by _dispatch(), so each
+        channel is delivered by its own pool's threads.
+
+        Args:
+            channel: channel name
+        Returns:
+            callable returning a new Notifier
+        """
+        def factory():
+            return Notifier(
+                db_session_factory=self.db_session_factory,
+                providers=dict((name, self._create_provider(name))
+                               for name in settings.NOTIFIER_POOLS),
+                job_retry_seconds=settings.NOTIFIER_JOB_RETRY_SECONDS,
+                channel=channel,
+                watchdog=self.watchdog,
+                metrics=self.metrics,
+                limiter=self.limiter,
+                router=self.router,
+                tracer=self.tracer,
+                cancellations=self.cancellations,
+                dispatch=self._dispatch
+            )
+        return factory
+
+    def _dispatch(self, channel, database_job):
+        """Hand a claimed job to the pool of another of its channels.
+
+        Args:
+            channel: channel name
+            database_job: NotificationDatabaseJob
+        """
+        self.thread_pools[channel].put(database_job)
+
+    def _create_pools(self, channel, config):
+        """Create notifier pool and thread pool for a channel.
+
+        Args:
+            channel: channel name
+            config: dict of pool settings with optional 'threads',
+                'pool_size', and 'max_queue_size' keys.
+        """
+        notifier_pool = QueuePool(
+            size=config.get("pool_size", settings.NOTIFIER_POOL_SIZE),
+            factory=Factory(self._notifier_factory(channel)))
+
+        thread_pool = NotificationThreadPool(
+            num_threads=config.get("threads", settings.NOTIFIER_THREADS),
+            notifier_pool=notifier_pool,
+            name=channel,
+            max_queue_size=config.get("max_queue_size", settings.NOTIFIER_POOL_MAX_QUEUE_SIZE),
+            metrics=self.metrics)
+
+        self.notifier_pools[channel] = notifier_pool
+        self.thread_pools[channel] = thread_pool
+
+        self.metrics.register_gauge("notifier_pool_%s_depth" % channel, thread_pool.depth)
+        self.metrics.register_gauge("notifier_pool_%s_busy" % channel, lambda: thread_pool.busy)
+        self.metrics.register_gauge("notifier_pool_%s_utilization" % channel, thread_pool.utilization)
+
+    def express_capacity(self, recipient_ids):
+        """Check if jobs for recipients can be expressed.
+
+        Jobs can be expressed if there are at most
+        NOTIFIER_EXPRESS_MAX_RECIPIENTS of them, and the pool
+        for each recipient's primary channel has an idle worker
+        thread for each of its jobs, and its provider's circuit
+        breaker is available. Otherwise the jobs should be queued
+        in the database as usual, and the fallback is counted.
+
+        Args:
+            recipient_ids: list of recipient user ids
+        Returns:
+            True if the jobs can be expressed, False otherwise.
+        """
+        if len(recipient_ids) > settings.NOTIFIER_EXPRESS_MAX_RECIPIENTS:
+            self.metrics.increment("notifier_express_fallbacks")
+            return False
+
+        self.router.prefetch(recipient_ids)
+        demand = {}
+        for recipient_id in recipient_ids:
+            channel = self.router.primary(recipient_id)
+            demand[channel] = demand.get(channel, 0) + 1
+
+        for channel, count in demand.items():
+            thread_pool = self.thread_pools.get(channel)
+            if thread_pool is None or thread_pool.idle() < count or \
+               not self.breakers[channel].available():
+                self.metrics.increment("notifier_express_fallbacks")
+                return False
+        return True
+
+    def express_claim(self, db_session, job_ids):
+        """Lease jobs claimed in notify()'s transaction.
+
+        The jobs must have been created with owner set to
+        settings.SERVICE and start set, and flushed, so their
+        ids are assigned. The leases are written but not
+        committed; if the transaction fails, express_discard()
+        must be invoked.
+
+        Args:
+            db_session: sqlalchemy db session creating the jobs
+            job_ids: list of NotificationJob ids
+        """
+        if self.leases is not None:
+            for job_id in job_ids:
+                self.leases.acquire(db_session, job_id)
+
+    def express_discard(self, job_ids):
+        """Stop renewing the leases of jobs whose creation failed."""
+        if self.leases is not None:
+            for job_id in job_ids:
+                self.leases.discard(job_id)
+
+    def express(self, jobs):
+        """Hand jobs claimed by notify() to the worker threads.
+
+        Jobs are put directly on the pool for their recipient's
+        primary channel, skipping the job queue's poll and claim.
+
+        Args:
+            jobs: list of (id, notification_id, recipient_id,
+                priority) tuples of committed, claimed jobs.
+        """
+        for id, notification_id, recipient_id, priority in jobs:
+            job = NotificationDatabaseJob(
+                owner=settings.SERVICE,
+                db_session_factory=self.db_session_factory,
+                id=id,
+                notification_id=notification_id,
+                recipient_id=recipient_id,
+                priority=priority,
+                not_before=None,
+                leases=self.leases,
+                claimed=True)
+            self.thread_pools[self.router(job)].put(job)
+            self.metrics.increment("notifier_express_jobs")
+
+
+    def start(self):
+        """Start processing jobs."""
+        if self.shard is not None:
+            self.zookeeper_client.start()
+            self.shard.start()
+        if self.leases is not None:
+            self.leases.start()
+        self.cancellations.start()
+        self.watchdog.start()
+        for thread_pool in self.thread_pools.values():
+            thread_pool.start()
+        self.job_monitor.start()
+
+    def stop(self):
+        """Stop processing jobs."""
+        self.job_monitor.stop()
+        for thread_pool in self.thread_pools.values():
+            thread_pool.stop()
+        self.watchdog.stop()
+        self.cancellations.stop()
+        if self.leases is not None:
+            self.leases.stop()
+        if self.shard is not None:
+            self.shard.stop()
+            self.zookeeper_client.stop()
+
+    def join(self, timeout=None):
+        """Join all threads."""
+        threads = self.thread_pools.values() + [self.job_monitor, self.watchdog, self.cancellations]
+        if self.leases is not None:
+            threads.append(self.leases)
+        if self.shard is not None:
+            threads.extend([self.shard, self.zookeeper_client])
+        join(threads, timeout)
+
+
+def create_worker(index, count):
+    """Create the NotificationProcessor for a prefork worker process.
+
+    Each worker has its own database engine and metrics, and
+    processes the partition of jobs for its index.
+
+    Args:
+        index: worker index
+        count: number of workers
+    Returns:
+        NotificationProcessor
+    """
+    engine = create_engine(settings.DATABASE_CONNECTION)
+    create_tables(engine)
+    metrics = MetricRegistry()
+    return NotificationProcessor(
+        db_session_factory=sessionmaker(bind=engine),
+        metrics=metrics,
+        tracer=LatencyTracer(
+            metrics=metrics,
+            sample_rate=settings.NOTIFIER_TRACE_SAMPLE_RATE),
+        partition=(index, count))
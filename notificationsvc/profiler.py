@@ -0,0 +1,140 @@
+
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+
+class SamplingProfiler(object):
+    """Sampling profiler which can be toggled at runtime.
+
+    While running, a background thread periodically samples the
+    stacks of all other threads (worker threads, the job
+    monitor, etc.), and counts identical stacks. Once the
+    window has elapsed, or the profiler is stopped, the counts
+    are written in the collapsed stack format used by
+    flamegraph.pl and speedscope, one stack per line:
+
+        <thread>;<frame>;<frame>... <count>
+
+    Threads are named by their thread name with any numeric
+    suffix removed, so identical worker threads are merged.
+    Frames are '<function> (<file>:<first line>)'.
+
+    No thread is running and nothing is instrumented while the
+    profiler is stopped, so it costs nothing when off.
+    """
+    def __init__(self, output_directory, interval=0.01, duration=60, prefix="profile"):
+        """SamplingProfiler constructor.
+
+        Args:
+            output_directory: directory profiles are written to
+            interval: seconds between samples
+            duration: maximum seconds to sample for, bounding the
+                window if the profiler isn't stopped.
+            prefix: profile file name prefix
+        """
+        self.log = logging.getLogger(__name__)
+        self.output_directory = output_directory
+        self.interval = interval
+        self.duration = duration
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.thread = None
+        self.exit_event = threading.Event()
+        self.stacks = {}
+        self.samples = 0
+        self.path = None
+
+    def is_running(self):
+        """Check if the profiler is sampling."""
+        with self.lock:
+            return self.thread is not None
+
+    def start(self, duration=None):
+        """Start sampling.
+
+        Args:
+            duration: optional seconds to sample for, overriding
+                the default window.
+        Returns:
+            True if the profiler was started, False if it was
+            already running.
+        """
+        with self.lock:
+            if self.thread is not None:
+                return False
+            self.exit_event.clear()
+            self.stacks = {}
+            self.samples = 0
+            self.thread = threading.Thread(target=self.run,
+                    args=(duration or self.duration,), name="SamplingProfiler")
+            self.thread.daemon = True
+            self.thread.start()
+            self.log.info("Sampling profiler started")
+            return True
+
+    def stop(self):
+        """Stop sampling early and write the profile."""
+        self.exit_event.set()
+
+    def toggle(self):
+        """Start the profiler if stopped, otherwise stop it."""
+        if not self.start():
+            self.stop()
+
+    def join(self, timeout=None):
+        """Join the sampling thread."""
+        with self.lock:
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def run(self, duration):
+        """Sampling thread run method."""
+        try:
+            deadline = time.time() + duration
+            while time.time() < deadline and not self.exit_event.is_set():
+                self.sample()
+                self.exit_event.wait(self.interval)
+            self.path = self.write()
+            self.log.info("Sampling profiler wrote %d samples to %s" % (self.samples, self.path))
+        except Exception as error:
+            self.log.exception(error)
+        finally:
+            with self.lock:
+                self.thread = None
+
+    def sample(self):
+        """Sample the stacks of all other threads."""
+        names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+        current = threading.current_thread().ident
+        for ident, frame in sys._current_frames().items():
+            if ident == current:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append("%s (%s:%d)" % (
+                    code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            name = re.sub(r"[-_]?\d+$", "", names.get(ident, "unknown"))
+            frames.append(name.replace(";", "_").replace(" ", "_"))
+            stack = ";".join(reversed(frames))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+
+    def write(self):
+        """Write the collapsed stacks.
+
+        Returns:
+            path of the profile file
+        """
+        path = os.path.join(self.output_directory, "%s.%d.%s.collapsed" % (
+            self.prefix, os.getpid(), time.strftime("%Y%m%d%H%M%S")))
+        with open(path, "w") as output:
+            for stack, count in sorted(self.stacks.items()):
+                output.write("%s %d\n" % (stack, count))
+        return path
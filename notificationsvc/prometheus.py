@@ -0,0 +1,156 @@
+
+import BaseHTTPServer
+import logging
+import re
+import SocketServer
+import threading
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metric_name(namespace, name):
+    """Get a valid Prometheus metric name.
+
+    Args:
+        namespace: metric name prefix, i.e. the service name
+        name: registry metric name
+    Returns:
+        '<namespace>_<name>' with invalid characters replaced
+    """
+    name = "%s_%s" % (namespace, name) if namespace else name
+    name = re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+    if name[0].isdigit():
+        name = "_" + name
+    return name
+
+
+def format_bound(bound):
+    """Format a histogram bucket upper bound as an 'le' label."""
+    if bound is None:
+        return "+Inf"
+    return "%g" % bound
+
+
+def format_metrics(metrics, namespace=None):
+    """Format metrics in the Prometheus text exposition format.
+
+    Counters are exported as counters and gauges as gauges.
+    Histograms are exported as cumulative histograms, and
+    meters as '<name>_total' counters, leaving rates to be
+    computed by the monitoring system.
+
+    Args:
+        metrics: MetricRegistry
+        namespace: optional metric name prefix
+    Returns:
+        exposition format string
+    """
+    counters, gauges, histograms, meters = metrics.collect()
+    lines = []
+
+    def family(name, type):
+        lines.append("# TYPE %s %s" % (name, type))
+
+    for name, value in sorted(counters.items()):
+        name = metric_name(namespace, name)
+        family(name, "counter")
+        lines.append("%s %d" % (name, value))
+
+    for name, value in sorted(gauges.items()):
+        name = metric_name(namespace, name)
+        family(name, "gauge")
+        lines.append("%s %d" % (name, value))
+
+    for name, meter in sorted(meters.items()):
+        name = metric_name(namespace, "%s_total" % name)
+        family(name, "counter")
+        lines.append("%s %d" % (name, meter.total))
+
+    for name, histogram in sorted(histograms.items()):
+        name = metric_name(namespace, name)
+        buckets, count, sum = histogram.snapshot()
+        family(name, "histogram")
+        cumulative = 0
+        for bound, bucket_count in buckets:
+            cumulative += bucket_count
+            lines.append('%s_bucket{le="%s"} %d' % (name, format_bound(bound), cumulative))
+        lines.append("%s_sum %r" % (name, float(sum)))
+        lines.append("%s_count %d" % (name, count))
+
+    lines.append("")
+    return "\n".join(lines)
+
+
+class MetricsHttpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Lightweight HTTP server exporting metrics to Prometheus.
+
+    Serves the MetricRegistry in the Prometheus text exposition
+    format at /metrics from a background thread. Metrics are
+    read only when scraped, so the server adds no cost to
+    recording metrics.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, metrics, interface="0.0.0.0", port=0, namespace=None):
+        """MetricsHttpServer constructor.
+
+        Args:
+            metrics: MetricRegistry to export
+            interface: interface to listen on
+            port: port to listen on; 0 picks a free port.
+            namespace: optional metric name prefix
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, (interface, port), _MetricsRequestHandler)
+        self.log = logging.getLogger(__name__)
+        self.metrics = metrics
+        self.namespace = namespace
+        self.port = self.server_address[1]
+        self.thread = None
+
+    def start(self):
+        """Start serving in a background thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.serve_forever)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        """Stop serving."""
+        if self.thread is not None:
+            self.shutdown()
+            self.server_close()
+
+    def join(self, timeout=None):
+        """Join the server thread."""
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def is_alive(self):
+        """Check if the server thread is running."""
+        return self.thread is not None and self.thread.is_alive()
+
+
+class _MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.partition("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        try:
+            body = format_metrics(self.server.metrics, self.server.namespace)
+        except Exception as error:
+            self.server.log.exception(error)
+            self.send_error(500)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.log.debug(format % args)
@@ -9,6 +9,10 @@ class NotificationProvider(object):
     """
     __metaclass__ = abc.ABCMeta
 
+    # True if send() accepts unrendered templates along with a
+    # substitutions dict of template values, rendering them itself.
+    supports_substitutions = False
+
     def __init__(self, name):
         """NotificationProvider constructor.
 
@@ -17,6 +21,35 @@ class NotificationProvider(object):
         """
         self.name = name
 
+    def is_available(self):
+        """Check if the provider will currently accept sends.
+
+        Returns:
+            True by default. Providers guarded by a circuit
+            breaker return False while the breaker is open.
+        """
+        return True
+
+    def is_throttle_error(self, error):
+        """Check if a send error indicates throttling or overload.
+
+        Args:
+            error: exception raised by send()
+        Returns:
+            True if the error indicates the provider is
+            throttling or overloaded, False otherwise.
+        """
+        return False
+
+    def abort(self):
+        """Abort in-progress send.
+
+        Invoked from another thread when a send exceeds its
+        deadline. Providers holding a network connection
+        should close it so the blocked send fails promptly.
+        """
+        return
+
 
 
 class EmailProvider(NotificationProvider):
@@ -58,4 +91,12 @@ class SmsProvider(NotificationProvider):
         Args:
             name: string for the name of the provider
         """
-        super(SmsProvider, self).__init__(name)
\ No newline at end of file
+        super(SmsProvider, self).__init__(name)
+
+    def send(self, recipient, text):
+        """Send SMS.
+        Args:
+            recipient: recipient phone number
+            text: message text
+        """
+        return
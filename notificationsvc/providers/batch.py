@@ -0,0 +1,221 @@
+
+import logging
+import threading
+import time
+
+from exceptions import OutcomeUnknownException
+
+
+class BatchTimeoutException(Exception):
+    """ Batch Timeout Exception class.
+
+    Raised when a submitted item is not sent within the timeout.
+    The item is cancelled, so it will not be sent.
+    """
+    pass
+
+
+class BatchItem(object):
+    """Item submitted to a RequestBatcher.
+
+    The submitting thread waits on the item until the batch
+    containing it has been sent.
+    """
+    def __init__(self, batcher, key, item):
+        self.batcher = batcher
+        self.key = key
+        self.item = item
+        self.created = time.time()
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        """Wait for the item to be sent.
+
+        If the timeout expires before the item's batch is sent,
+        the item is cancelled. If the batch is already being
+        sent, whether the item was delivered is unknown.
+
+        Args:
+            timeout: optional number of seconds to wait
+        Returns:
+            per-item result returned from send_batch
+        Raises:
+            BatchTimeoutException if the timeout expired and the
+            item was cancelled, OutcomeUnknownException if the
+            timeout expired while the item was being sent, or
+            the per-item exception if the item was not sent.
+        """
+        if not self.event.wait(timeout):
+            if self.batcher.cancel(self):
+                raise BatchTimeoutException()
+            raise OutcomeUnknownException("Timed out waiting for batch result")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class RequestBatcher(object):
+    """Coalesces concurrent single-item sends into batched requests.
+
+    Worker threads submit items and block until the batch
+    containing the item is sent. A batch is sent as soon as
+    max_batch_size items with the same key are waiting, or
+    max_delay seconds after the first item in the batch was
+    submitted. Sender threads are started on first use.
+
+    send_batch is invoked with the batch key and the list of
+    items, and must return a list of per-item results aligned
+    with the items. A result which is an Exception instance is
+    raised to the submitter of that item; an exception raised
+    by send_batch is raised to every submitter in the batch.
+    """
+    def __init__(self, send_batch, max_batch_size, max_delay, threads=1):
+        """RequestBatcher constructor.
+
+        Args:
+            send_batch: callable(key, items) returning list of results
+            max_batch_size: maximum number of items per batch
+            max_delay: maximum seconds to wait for a batch to fill
+            threads: number of sender threads, bounding the number
+                of batches sent concurrently.
+        """
+        self.log = logging.getLogger(__name__)
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.num_threads = threads
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.threads = []
+        self.running = False
+        self.batches_sent = 0
+
+    def start(self):
+        """Start sender threads."""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+            for i in range(self.num_threads):
+                thread = threading.Thread(target=self.run)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self):
+        """Stop sender threads after sending any pending items."""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def join(self, timeout=None):
+        """Join sender threads."""
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def depth(self):
+        """Number of items waiting to be sent."""
+        with self.condition:
+            return sum(len(items) for items in self.pending.values())
+
+    def submit(self, item, key=None):
+        """Submit item for sending.
+
+        Args:
+            item: item to send
+            key: optional batch key; only items with the same
+                key are sent in the same batch.
+        Returns:
+            BatchItem to wait on for the result.
+        """
+        if not self.running:
+            self.start()
+
+        batch_item = BatchItem(self, key, item)
+        with self.condition:
+            self.pending.setdefault(key, []).append(batch_item)
+            self.condition.notify()
+        return batch_item
+
+    def cancel(self, batch_item):
+        """Cancel item if it is still waiting to be sent.
+
+        Args:
+            batch_item: BatchItem returned by submit()
+        Returns:
+            True if the item was cancelled, False if its
+            batch was already taken by a sender thread.
+        """
+        with self.condition:
+            items = self.pending.get(batch_item.key)
+            if items is None or batch_item not in items:
+                return False
+            items.remove(batch_item)
+            if not items:
+                del self.pending[batch_item.key]
+            return True
+
+    def _next_batch(self):
+        """Wait for the next ready batch.
+
+        Returns:
+            (key, list of BatchItem), or None if stopped
+            with nothing pending.
+        """
+        with self.condition:
+            while True:
+                now = time.time()
+                deadline = None
+                for key, items in self.pending.items():
+                    age = now - items[0].created
+                    if not self.running or \
+                       len(items) >= self.max_batch_size or \
+                       age >= self.max_delay:
+                        batch = items[:self.max_batch_size]
+                        remaining = items[self.max_batch_size:]
+                        if remaining:
+                            self.pending[key] = remaining
+                            self.condition.notify()
+                        else:
+                            del self.pending[key]
+                        return key, batch
+                    item_deadline = items[0].created + self.max_delay
+                    if deadline is None or item_deadline < deadline:
+                        deadline = item_deadline
+
+                if not self.running:
+                    return None
+
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    self.condition.wait(max(0, deadline - now))
+
+    def run(self):
+        """Sender thread run method."""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+
+            key, batch_items = batch
+            try:
+                results = self.send_batch(key, [batch_item.item for batch_item in batch_items])
+                if len(results) != len(batch_items):
+                    raise ValueError("send_batch returned %d results for %d items" \
+                            % (len(results), len(batch_items)))
+                for batch_item, result in zip(batch_items, results):
+                    if isinstance(result, Exception):
+                        batch_item.error = result
+                    else:
+                        batch_item.result = result
+            except Exception as error:
+                self.log.exception(error)
+                for batch_item in batch_items:
+                    batch_item.error = error
+            finally:
+                self.batches_sent += 1
+                for batch_item in batch_items:
+                    batch_item.event.set()
@@ -0,0 +1,208 @@
+
+import logging
+import threading
+import time
+
+from base import NotificationProvider
+from exceptions import CircuitOpenException
+
+
+class CircuitBreaker(object):
+    """Circuit breaker.
+
+    The breaker starts closed, allowing all requests. After
+    failure_threshold consecutive failures it opens, rejecting
+    all requests. Once reset_seconds have elapsed it becomes
+    half-open and allows a single probe request through. If the
+    probe succeeds the breaker closes, otherwise it reopens.
+
+    The breaker is thread-safe and is intended to be shared by
+    all providers talking to the same service.
+    """
+
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+    STATE_NAMES = {
+        CLOSED: "closed",
+        OPEN: "open",
+        HALF_OPEN: "half-open"
+    }
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=30, clock=time.time):
+        """CircuitBreaker constructor.
+
+        Args:
+            name: breaker name, used for logging
+            failure_threshold: number of consecutive failures
+                before the breaker opens.
+            reset_seconds: number of seconds the breaker remains
+                open before allowing a probe request.
+            clock: callable returning the current time in seconds
+        """
+        self.log = logging.getLogger(__name__)
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self._state = self.CLOSED
+        self.failures = 0
+        self.opened = None
+        self.probe_started = None
+
+    @property
+    def state(self):
+        """Current breaker state."""
+        with self.lock:
+            return self._current_state(self.clock())
+
+    def _current_state(self, now):
+        if self._state == self.OPEN and now - self.opened >= self.reset_seconds:
+            return self.HALF_OPEN
+        return self._state
+
+    def _transition(self, state, now):
+        if state != self._state:
+            self.log.warning("Circuit breaker %s is %s" % (self.name, self.STATE_NAMES[state]))
+        self._state = state
+        if state == self.OPEN:
+            self.opened = now
+            self.probe_started = None
+        elif state == self.CLOSED:
+            self.failures = 0
+            self.opened = None
+            self.probe_started = None
+
+    def available(self):
+        """Check if a request would be allowed, without consuming a probe.
+
+        Returns:
+            True if the breaker is closed, or half-open with
+            no probe in flight.
+        """
+        with self.lock:
+            now = self.clock()
+            state = self._current_state(now)
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN:
+                return not self._probe_in_flight(now)
+            return False
+
+    def _probe_in_flight(self, now):
+        # A probe which never reported back (i.e. its thread died)
+        # is abandoned after reset_seconds so the breaker can't
+        # remain half-open forever.
+        return self.probe_started is not None and \
+            now - self.probe_started < self.reset_seconds
+
+    def allow(self):
+        """Request permission to make a request.
+
+        In the half-open state only a single caller is
+        granted permission to make the probe request.
+
+        Returns:
+            True if the request is allowed, False otherwise.
+        """
+        with self.lock:
+            now = self.clock()
+            state = self._current_state(now)
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight(now):
+                self._state = self.HALF_OPEN
+                self.probe_started = now
+                return True
+            return False
+
+    def record_success(self):
+        """Record successful request."""
+        with self.lock:
+            self._transition(self.CLOSED, self.clock())
+
+    def record_ignored(self):
+        """Record request which neither succeeded nor failed.
+
+        The request says nothing about the health of the
+        service (i.e. it was rejected for invalid parameters),
+        so the breaker's state and failure count are unchanged.
+        If the request was the half-open probe, the probe slot
+        is released so another request may probe.
+        """
+        with self.lock:
+            if self._state == self.HALF_OPEN:
+                self.probe_started = None
+
+    def record_failure(self):
+        """Record failed request."""
+        with self.lock:
+            now = self.clock()
+            if self._current_state(now) == self.HALF_OPEN:
+                self._transition(self.OPEN, now)
+            else:
+                self.failures += 1
+                if self.failures >= self.failure_threshold:
+                    self._transition(self.OPEN, now)
+
+
+class CircuitBreakerProvider(NotificationProvider):
+    """CircuitBreakerProvider wraps a NotificationProvider with a CircuitBreaker.
+
+    While the breaker is open, send() raises CircuitOpenException
+    without contacting the wrapped provider.
+    """
+
+    def __init__(self, provider, breaker, ignore_exceptions=None):
+        """CircuitBreakerProvider constructor.
+
+        Args:
+            provider: NotificationProvider to wrap
+            breaker: CircuitBreaker, typically shared by
+                all providers for the same service.
+            ignore_exceptions: optional tuple of exception
+                classes which should not count as failures,
+                i.e. invalid parameters or rejected recipients.
+        """
+        super(CircuitBreakerProvider, self).__init__(provider.name)
+        self.provider = provider
+        self.breaker = breaker
+        self.ignore_exceptions = ignore_exceptions or ()
+        self.supports_substitutions = provider.supports_substitutions
+
+    def is_available(self):
+        """Check if the provider will currently accept sends."""
+        return self.breaker.available()
+
+    def is_throttle_error(self, error):
+        """Check if a send error indicates throttling or overload."""
+        return self.provider.is_throttle_error(error)
+
+    def abort(self):
+        """Abort in-progress send."""
+        self.provider.abort()
+
+    def send(self, **kwargs):
+        """Send through the wrapped provider.
+
+        Args:
+            kwargs: wrapped provider send() arguments
+        Raises:
+            CircuitOpenException if the breaker is open.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenException(self.breaker.name)
+
+        try:
+            result = self.provider.send(**kwargs)
+        except self.ignore_exceptions:
+            self.breaker.record_ignored()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        return result
@@ -0,0 +1,277 @@
+
+import gzip
+import json
+import logging
+import uuid
+from cStringIO import StringIO
+from email.utils import parseaddr
+from string import Template
+
+from base import EmailProvider
+from batch import RequestBatcher
+from exceptions import InvalidParameterException, ProviderRequestException
+
+
+class EmailApiClient(object):
+    """Client for a SendGrid-style HTTP batch email API.
+
+    A single POST delivers one message to many recipients, each
+    with their own substitution values:
+
+        {"from": {"email": "...", "name": "..."},
+         "subject": "Hello -first_name-",
+         "content": [{"type": "text/plain", "value": "..."},
+                     {"type": "text/html", "value": "..."}],
+         "personalizations": [
+            {"to": [{"email": "..."}],
+             "substitutions": {"-first_name-": "..."},
+             "custom_args": {"id": "..."}}]}
+
+    and the API responds with a result per personalization:
+
+        {"results": [{"id": "...", "status": "accepted", "messageId": "..."},
+                     {"id": "...", "status": "rejected", "error": "..."}]}
+
+    Requests are made over a shared keep-alive HttpConnectionPool,
+    optionally gzip compressed. Concurrent sends of the same message
+    (same subject and bodies) are coalesced into a single request
+    by a RequestBatcher.
+
+    The client is thread-safe and is intended to be shared by
+    all HttpEmailApiProviders.
+    """
+
+    # HTTP status codes indicating the API is throttling
+    THROTTLE_STATUS_CODES = (429, 503)
+
+    def __init__(
+            self,
+            connection_pool,
+            path,
+            from_email,
+            api_key=None,
+            max_batch_size=100,
+            max_batch_delay=0.05,
+            batch_threads=1,
+            compress=True,
+            timeout=None):
+        """EmailApiClient constructor.
+
+        Args:
+            connection_pool: HttpConnectionPool for the API host
+            path: send API path, i.e. '/v3/mail/send'
+            from_email: sender's email address, optionally
+                with a name, i.e. 'Name <address>'.
+            api_key: optional bearer API key
+            max_batch_size: maximum recipients per API call
+            max_batch_delay: maximum seconds to wait for a batch
+                to fill before sending it.
+            batch_threads: number of threads sending batches
+            compress: boolean to indicate to gzip request bodies
+            timeout: optional seconds to wait for a batched send
+        """
+        self.log = logging.getLogger(__name__)
+        self.connection_pool = connection_pool
+        self.path = path
+        name, address = parseaddr(from_email)
+        self.sender = {"email": address}
+        if name:
+            self.sender["name"] = name
+        self.api_key = api_key
+        self.compress = compress
+        self.timeout = timeout
+        self.batcher = RequestBatcher(
+            send_batch=self._send_batch,
+            max_batch_size=max_batch_size,
+            max_delay=max_batch_delay,
+            threads=batch_threads)
+
+    def _encode(self, data):
+        body = json.dumps(data)
+        if not self.compress:
+            return body
+        buffer = StringIO()
+        gzip_file = gzip.GzipFile(fileobj=buffer, mode="wb")
+        gzip_file.write(body)
+        gzip_file.close()
+        return buffer.getvalue()
+
+    def _send_batch(self, key, recipients):
+        """Send message to recipients in a single API call.
+
+        Args:
+            key: (subject, plain_text, html_text) tuple
+            recipients: list of recipient dicts with 'id',
+                'email' and 'substitutions' keys.
+        Returns:
+            list of API message ids, or ProviderRequestException
+            for rejected recipients, aligned with recipients.
+        Raises:
+            ProviderRequestException if the request failed.
+        """
+        subject, plain_text, html_text = key
+
+        content = []
+        if plain_text:
+            content.append({"type": "text/plain", "value": plain_text})
+        if html_text:
+            content.append({"type": "text/html", "value": html_text})
+
+        personalizations = []
+        for recipient in recipients:
+            personalization = {
+                "to": [{"email": recipient["email"]}],
+                "custom_args": {"id": recipient["id"]}
+            }
+            if recipient["substitutions"]:
+                personalization["substitutions"] = recipient["substitutions"]
+            personalizations.append(personalization)
+
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        }
+        if self.compress:
+            headers["Content-Encoding"] = "gzip"
+        if self.api_key:
+            headers["Authorization"] = "Bearer %s" % self.api_key
+
+        response = self.connection_pool.request(
+            "POST",
+            self.path,
+            self._encode({
+                "from": self.sender,
+                "subject": subject,
+                "content": content,
+                "personalizations": personalizations
+            }),
+            headers)
+
+        if response.status in EmailApiClient.THROTTLE_STATUS_CODES:
+            raise ProviderRequestException(
+                "Email API throttled request: %d %s" % (response.status, response.reason),
+                status=response.status,
+                throttled=True)
+        if response.status < 200 or response.status >= 300:
+            raise ProviderRequestException(
+                "Email API request failed: %d %s" % (response.status, response.reason),
+                status=response.status)
+
+        results = dict((result["id"], result)
+                for result in json.loads(response.body).get("results", []))
+
+        output = []
+        for recipient in recipients:
+            result = results.get(recipient["id"])
+            if result is None:
+                output.append(ProviderRequestException(
+                    "Email API returned no result for recipient"))
+            elif result.get("status") != "accepted":
+                output.append(ProviderRequestException(
+                    "Email API rejected recipient: %s" % result.get("error"),
+                    status=result.get("status"),
+                    throttled=result.get("status") == "throttled"))
+            else:
+                output.append(result.get("messageId"))
+        return output
+
+    def send(self, recipient, subject, plain_text, html_text, substitutions=None):
+        """Send email to a single recipient.
+
+        Args:
+            recipient: recipient email address
+            subject: subject, with API substitution tags
+            plain_text: plain text body, with API substitution tags
+            html_text: html text body, with API substitution tags
+            substitutions: optional dict of API substitution tag
+                to value for this recipient.
+        Returns:
+            API message id
+        Raises:
+            ProviderRequestException if the recipient was not accepted.
+        """
+        item = {
+            "id": uuid.uuid4().hex,
+            "email": recipient,
+            "substitutions": substitutions
+        }
+        key = (subject, plain_text, html_text)
+        return self.batcher.submit(item, key).wait(self.timeout)
+
+    def close(self):
+        """Stop batcher and close idle connections."""
+        self.batcher.stop()
+        self.connection_pool.close()
+
+
+class HttpEmailApiProvider(EmailProvider):
+    """HttpEmailApiProvider implements the EmailProvider
+    abstract base class.
+
+    This EmailProvider delivers through an HTTP batch email API
+    using a shared EmailApiClient. It supports substitutions, so
+    the Notifier passes it unrendered templates and per-recipient
+    values; all recipients of a notification then share the same
+    message and are batched into a single API call.
+    """
+
+    # Format of the API substitution tag for a template name
+    SUBSTITUTION_TAG = "-%s-"
+
+    supports_substitutions = True
+
+    def __init__(self, client):
+        """HttpEmailApiProvider constructor.
+
+        Args:
+            client: EmailApiClient, shared by all providers
+        """
+        super(HttpEmailApiProvider, self).__init__('HttpEmailApiProvider')
+        self.client = client
+
+    def _to_api_template(self, text, names):
+        """Convert string.Template placeholders to API substitution tags."""
+        if not text:
+            return text
+        tags = dict((name, HttpEmailApiProvider.SUBSTITUTION_TAG % name) for name in names)
+        return Template(text).safe_substitute(tags)
+
+    def is_throttle_error(self, error):
+        """Check if a send error indicates throttling or overload."""
+        return isinstance(error, ProviderRequestException) and error.throttled
+
+    def send(self, recipient, subject, plain_text, html_text, substitutions=None):
+        """
+        Send an email.
+        Args:
+            recipient: recipient's email address
+            subject: message subject
+            plain_text: plain text message body
+            html_text: html text message body
+            substitutions: optional dict of template values. If
+                provided, subject and bodies are string.Template
+                templates which are rendered by the API.
+        Returns:
+            API message id
+        Raises:
+            InvalidParameterException if any of the
+                input parameters are invalid
+        """
+        if not recipient or not subject or (not plain_text and not html_text):
+            raise InvalidParameterException()
+
+        api_substitutions = None
+        if substitutions:
+            names = substitutions.keys()
+            subject = self._to_api_template(subject, names)
+            plain_text = self._to_api_template(plain_text, names)
+            html_text = self._to_api_template(html_text, names)
+            api_substitutions = dict((HttpEmailApiProvider.SUBSTITUTION_TAG % name, value)
+                    for name, value in substitutions.items())
+
+        return self.client.send(
+            recipient=recipient,
+            subject=subject,
+            plain_text=plain_text,
+            html_text=html_text,
+            substitutions=api_substitutions)
@@ -4,3 +4,39 @@
 class InvalidParameterException(Exception):
     """ Invalid Parameter Exception class"""
     pass
+
+
+class CircuitOpenException(Exception):
+    """ Circuit Open Exception class.
+
+    Raised when a provider's circuit breaker is open
+    and the send was not attempted.
+    """
+    pass
+
+
+class OutcomeUnknownException(Exception):
+    """ Outcome Unknown Exception class.
+
+    Raised when a send timed out after its request was made,
+    so whether the message was delivered is unknown. The send
+    should not be retried, which could deliver it twice.
+    """
+    pass
+
+
+class ProviderRequestException(Exception):
+    """ Provider Request Exception class.
+
+    Raised when a provider's remote API rejects a request
+    or a message.
+
+    Attributes:
+        status: optional HTTP status or API error code
+        throttled: True if the request was rejected due to
+            throttling or overload and may be retried.
+    """
+    def __init__(self, message, status=None, throttled=False):
+        super(ProviderRequestException, self).__init__(message)
+        self.status = status
+        self.throttled = throttled
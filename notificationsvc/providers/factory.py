@@ -1,7 +1,33 @@
+import threading
 
 import settings
 from providers.console import ConsoleEmailProvider
+from providers.emailapi import EmailApiClient, HttpEmailApiProvider
+from providers.http import HttpConnectionPool
+from providers.sink import SinkProvider, SinkStats
+from providers.sms import HttpSmsProvider, SmsGatewayClient
 from providers.smtp import SmtpProvider
+from providers.webhook import WebhookClient, WebhookProvider
+
+
+# Stats shared by all SinkProviders, so sends
+# are counted across notifiers.
+sink_stats = SinkStats()
+
+# Email API client shared by all HttpEmailApiProviders,
+# so connections and batches are shared across notifiers.
+_email_api_client = None
+_email_api_client_lock = threading.Lock()
+
+# SMS gateway client shared by all HttpSmsProviders,
+# so connections and batches are shared across notifiers.
+_sms_gateway_client = None
+_sms_gateway_client_lock = threading.Lock()
+
+# Webhook client shared by all WebhookProviders,
+# so connections and batches are shared across notifiers.
+_webhook_client = None
+_webhook_client_lock = threading.Lock()
 
 
 def smtp_provider_factory():
@@ -17,7 +43,9 @@ def smtp_provider_factory():
         host=settings.SMTP_HOST,
         port=settings.SMTP_PORT,
         from_email=settings.EMAIL_PROVIDER_FROM_EMAIL,
-        use_tls=settings.SMTP_USE_TLS
+        use_tls=settings.SMTP_USE_TLS,
+        connect_timeout=settings.SMTP_CONNECT_TIMEOUT,
+        read_timeout=settings.SMTP_READ_TIMEOUT
     )
 
 def console_email_provider_factory():
@@ -31,17 +59,115 @@ def console_email_provider_factory():
         from_email=settings.EMAIL_PROVIDER_FROM_EMAIL,
     )
 
-def send_grid_smtp_provider_factory():
-    """ TODO in the future, if needed.
-
-    return SendGridSmtpProvider(
-       username=settings.SEND_GRID_USERNAME,
-       password=settings.SEND_GRID_PASSWORD,
-       server=settings.SEND_GRID_SERVER,
-       port=settings.SEND_GRID_PORT,
-       custom_headers=SEND_GRID_CUSTOM_HEADERS,
-       filter_settings=SEND_GRID_FILTERS,
-       unique_arguments=SEND_GRID_UNIQUE_ARGS,
+def sink_provider_factory():
+    """Returns a Sink Provider object.
+
+    This factory returns a provider which discards
+    notifications on any channel, recording counts
+    and timings in the shared sink_stats. It is
+    intended for load testing the service.
+    """
+    return SinkProvider(
+        stats=sink_stats,
+        latency=settings.SINK_PROVIDER_LATENCY
     )
+
+def _get_email_api_client():
+    """Returns the shared EmailApiClient, creating it if needed."""
+    global _email_api_client
+    with _email_api_client_lock:
+        if _email_api_client is None:
+            connection_pool = HttpConnectionPool(
+                host=settings.EMAIL_API_HOST,
+                port=settings.EMAIL_API_PORT,
+                use_ssl=settings.EMAIL_API_USE_SSL,
+                size=settings.EMAIL_API_POOL_SIZE,
+                timeout=settings.EMAIL_API_TIMEOUT)
+            _email_api_client = EmailApiClient(
+                connection_pool=connection_pool,
+                path=settings.EMAIL_API_PATH,
+                from_email=settings.EMAIL_PROVIDER_FROM_EMAIL,
+                api_key=settings.EMAIL_API_KEY,
+                max_batch_size=settings.EMAIL_API_MAX_BATCH_SIZE,
+                max_batch_delay=settings.EMAIL_API_MAX_BATCH_DELAY,
+                batch_threads=settings.EMAIL_API_POOL_SIZE,
+                compress=settings.EMAIL_API_COMPRESS,
+                timeout=settings.EMAIL_API_TIMEOUT)
+        return _email_api_client
+
+def email_api_provider_factory():
+    """Returns an HTTP Email API Provider object.
+
+    This factory returns a SendGrid-style HTTP
+    batch email API provider whose attributes are
+    derived from the notification settings. All
+    providers share a single API client and
+    connection pool.
     """
-    pass
\ No newline at end of file
+    return HttpEmailApiProvider(
+        client=_get_email_api_client()
+    )
+
+
+def _get_sms_gateway_client():
+    """Returns the shared SmsGatewayClient, creating it if needed."""
+    global _sms_gateway_client
+    with _sms_gateway_client_lock:
+        if _sms_gateway_client is None:
+            connection_pool = HttpConnectionPool(
+                host=settings.SMS_GATEWAY_HOST,
+                port=settings.SMS_GATEWAY_PORT,
+                use_ssl=settings.SMS_GATEWAY_USE_SSL,
+                size=settings.SMS_GATEWAY_POOL_SIZE,
+                timeout=settings.SMS_GATEWAY_TIMEOUT)
+            _sms_gateway_client = SmsGatewayClient(
+                connection_pool=connection_pool,
+                path=settings.SMS_GATEWAY_PATH,
+                auth_token=settings.SMS_GATEWAY_AUTH_TOKEN,
+                max_batch_size=settings.SMS_GATEWAY_MAX_BATCH_SIZE,
+                max_batch_delay=settings.SMS_GATEWAY_MAX_BATCH_DELAY,
+                batch_threads=settings.SMS_GATEWAY_POOL_SIZE,
+                timeout=settings.SMS_GATEWAY_TIMEOUT)
+        return _sms_gateway_client
+
+def http_sms_provider_factory():
+    """Returns an HTTP SMS Provider object.
+
+    This factory returns an HTTP SMS Provider
+    whose attributes are derived from the
+    notification settings. All providers share
+    a single gateway client and connection pool.
+    """
+    return HttpSmsProvider(
+        client=_get_sms_gateway_client(),
+        from_number=settings.SMS_PROVIDER_FROM_NUMBER
+    )
+
+
+def _get_webhook_client():
+    """Returns the shared WebhookClient, creating it if needed."""
+    global _webhook_client
+    with _webhook_client_lock:
+        if _webhook_client is None:
+            _webhook_client = WebhookClient(
+                secret=settings.WEBHOOK_SECRET,
+                pool_size=settings.WEBHOOK_POOL_SIZE,
+                max_batch_size=settings.WEBHOOK_MAX_BATCH_SIZE,
+                max_batch_delay=settings.WEBHOOK_MAX_BATCH_DELAY,
+                batch_threads=settings.WEBHOOK_POOL_SIZE,
+                timeout=settings.WEBHOOK_TIMEOUT)
+        return _webhook_client
+
+def webhook_provider_factory():
+    """Returns a Webhook Provider object.
+
+    This factory returns a Webhook Provider
+    whose endpoints are derived from the
+    notification settings. All providers share
+    a single webhook client and connection pools.
+    """
+    return WebhookProvider(
+        client=_get_webhook_client(),
+        urls=settings.WEBHOOK_URLS,
+        default_url=settings.WEBHOOK_DEFAULT_URL
+    )
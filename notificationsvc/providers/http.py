@@ -0,0 +1,180 @@
+
+import httplib
+import logging
+import Queue
+import select
+import socket
+import threading
+
+from exceptions import OutcomeUnknownException
+
+
+class HttpResponse(object):
+    """HTTP response returned by HttpConnectionPool.
+
+    Attributes:
+        status: HTTP status code
+        reason: HTTP reason phrase
+        headers: dict of lower-cased header names to values
+        body: response body string
+    """
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+
+class HttpConnectionPool(object):
+    """Pool of keep-alive HTTP connections to a single host.
+
+    Connections are reused across requests, avoiding a TCP
+    (and TLS) handshake per request. At most size requests
+    are made concurrently; additional callers block until a
+    connection is available. Idle connections closed by the
+    server are detected on reuse and replaced transparently.
+
+    Requests are only retried when they provably never reached
+    the server: when a reused connection fails to send, or the
+    server closed it without sending any of the response.
+    Requests are never retried after a timeout, since the
+    server may still process them, and a retried POST would be
+    sent twice. Failures after a request was sent are raised as
+    OutcomeUnknownException, so callers don't retry them either.
+
+    The pool is thread-safe and is intended to be shared by
+    all providers talking to the same host.
+    """
+    def __init__(self, host, port=None, use_ssl=False, size=4, timeout=None):
+        """HttpConnectionPool constructor.
+
+        Args:
+            host: server host
+            port: optional server port
+            use_ssl: boolean to indicate to use HTTPS
+            size: maximum number of connections
+            timeout: optional socket timeout in seconds
+        """
+        self.log = logging.getLogger(__name__)
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.size = size
+        self.timeout = timeout
+        self.idle = Queue.LifoQueue()
+        self.semaphore = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.connections_created = 0
+        self.requests = 0
+
+    def _connect(self):
+        with self.lock:
+            self.connections_created += 1
+        if self.use_ssl:
+            return httplib.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _is_dropped(self, connection):
+        """Check if an idle connection was closed by the server.
+
+        An idle keep-alive connection should have nothing to
+        read, so a readable socket means the server closed it
+        (or sent something unexpected).
+        """
+        if connection.sock is None:
+            return True
+        try:
+            return bool(select.select([connection.sock], [], [], 0)[0])
+        except (select.error, socket.error, ValueError):
+            return True
+
+    def _get_connection(self):
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except Queue.Empty:
+                return self._connect(), False
+            if not self._is_dropped(connection):
+                return connection, True
+            connection.close()
+
+    def _no_response(self, error):
+        """Check if BadStatusLine was raised for an empty response,
+        i.e. the server closed the connection without responding."""
+        line = error.line
+        return not line or line == "''" or line.startswith("No status line received")
+
+    def request(self, method, path, body=None, headers=None):
+        """Make HTTP request.
+
+        Args:
+            method: HTTP method, i.e. 'POST'
+            path: request path
+            body: optional request body string
+            headers: optional dict of request headers
+        Returns:
+            HttpResponse
+        Raises:
+            httplib.HTTPException or socket.error if the request
+            failed to send, or OutcomeUnknownException if it
+            failed after it was sent (i.e. the response timed out).
+        """
+        headers = headers or {}
+        self.semaphore.acquire()
+        try:
+            with self.lock:
+                self.requests += 1
+
+            while True:
+                connection, reused = self._get_connection()
+
+                # A reused connection may have been closed by the
+                # server while idle, in which case the request fails
+                # to send, or the server closes it without responding.
+                # Only these are retried, on a new connection. Any
+                # other failure after the request was sent (i.e. a
+                # timeout) may have been processed by the server.
+                try:
+                    connection.request(method, path, body, headers)
+                except socket.timeout:
+                    connection.close()
+                    raise
+                except (httplib.CannotSendRequest, socket.error):
+                    connection.close()
+                    if reused:
+                        continue
+                    raise
+                except Exception:
+                    connection.close()
+                    raise
+
+                try:
+                    response = connection.getresponse()
+                    data = response.read()
+                except httplib.BadStatusLine as error:
+                    connection.close()
+                    if reused and self._no_response(error):
+                        continue
+                    raise OutcomeUnknownException("Bad response: %r" % error.line)
+                except Exception as error:
+                    connection.close()
+                    raise OutcomeUnknownException("%s: %s" % (error.__class__.__name__, error))
+
+                response_headers = dict((name.lower(), value)
+                        for name, value in response.getheaders())
+                if response.will_close:
+                    connection.close()
+                else:
+                    self.idle.put(connection)
+
+                return HttpResponse(response.status, response.reason, response_headers, data)
+        finally:
+            self.semaphore.release()
+
+    def close(self):
+        """Close all idle connections."""
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                break
@@ -0,0 +1,80 @@
+
+import threading
+import time
+
+from base import NotificationProvider
+
+
+class SinkStats(object):
+    """Counts and timings of sends accepted by SinkProviders.
+
+    Thread-safe, and typically shared by all SinkProviders
+    so the totals cover every notifier.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all recorded sends."""
+        with self.lock:
+            self.count = 0
+            self.first = None
+            self.last = None
+            self.durations = []
+
+    def record(self, start, end):
+        """Record a send.
+
+        Args:
+            start: send start time in seconds
+            end: send end time in seconds
+        """
+        with self.lock:
+            self.count += 1
+            if self.first is None or start < self.first:
+                self.first = start
+            if self.last is None or end > self.last:
+                self.last = end
+            self.durations.append(end - start)
+
+    def rate(self):
+        """Sends per second between the first and last send."""
+        with self.lock:
+            if self.count < 2 or self.last <= self.first:
+                return 0.0
+            return self.count / (self.last - self.first)
+
+
+class SinkProvider(NotificationProvider):
+    """SinkProvider accepts and discards notifications on any channel.
+
+    This provider is to be used for load testing and benchmarks,
+    where printing or delivering messages would dominate the
+    cost of processing a job. Each send is recorded in a
+    SinkStats, and may optionally be delayed to simulate
+    provider latency.
+    """
+
+    def __init__(self, stats, latency=0):
+        """SinkProvider constructor.
+
+        Args:
+            stats: SinkStats recording sends
+            latency: optional seconds to sleep per send
+        """
+        super(SinkProvider, self).__init__('SinkProvider')
+        self.stats = stats
+        self.latency = latency
+
+    def send(self, **kwargs):
+        """
+        Discard a notification.
+        Args:
+            kwargs: channel specific send() arguments,
+                i.e. recipient, subject, plain_text, html_text
+        """
+        start = time.time()
+        if self.latency:
+            time.sleep(self.latency)
+        self.stats.record(start, time.time())
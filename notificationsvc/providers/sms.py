@@ -0,0 +1,195 @@
+
+import json
+import logging
+import uuid
+
+from base import SmsProvider
+from batch import RequestBatcher
+from exceptions import InvalidParameterException, ProviderRequestException
+
+
+class SmsGatewayClient(object):
+    """Client for an HTTP SMS gateway API.
+
+    Messages are POSTed as JSON to the gateway's messages path:
+
+        {"messages": [{"id": "...", "from": "...", "to": "...", "text": "..."}]}
+
+    and the gateway responds with a result per message:
+
+        {"results": [{"id": "...", "status": "accepted", "messageId": "..."},
+                     {"id": "...", "status": "rejected", "error": "..."}]}
+
+    Requests are made over a shared keep-alive HttpConnectionPool.
+    When max_batch_size is greater than one, concurrent sends are
+    coalesced into a single API call by a RequestBatcher.
+
+    The client is thread-safe and is intended to be shared by
+    all HttpSmsProviders talking to the same gateway.
+    """
+
+    # HTTP status codes indicating the gateway is throttling
+    THROTTLE_STATUS_CODES = (429, 503)
+
+    def __init__(
+            self,
+            connection_pool,
+            path,
+            auth_token=None,
+            max_batch_size=1,
+            max_batch_delay=0.05,
+            batch_threads=1,
+            timeout=None):
+        """SmsGatewayClient constructor.
+
+        Args:
+            connection_pool: HttpConnectionPool for the gateway host
+            path: messages API path, i.e. '/v1/messages'
+            auth_token: optional bearer token
+            max_batch_size: maximum messages per API call; 1
+                disables batching.
+            max_batch_delay: maximum seconds to wait for a batch
+                to fill before sending it.
+            batch_threads: number of threads sending batches
+            timeout: optional seconds to wait for a batched send
+        """
+        self.log = logging.getLogger(__name__)
+        self.connection_pool = connection_pool
+        self.path = path
+        self.auth_token = auth_token
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self.batcher = None
+        if max_batch_size > 1:
+            self.batcher = RequestBatcher(
+                send_batch=self._send_batch,
+                max_batch_size=max_batch_size,
+                max_delay=max_batch_delay,
+                threads=batch_threads)
+
+    def _send_batch(self, key, messages):
+        """Send messages in a single API call.
+
+        Args:
+            key: batch key (unused)
+            messages: list of message dicts
+        Returns:
+            list of gateway message ids, or ProviderRequestException
+            for rejected messages, aligned with messages.
+        Raises:
+            ProviderRequestException if the request failed.
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        }
+        if self.auth_token:
+            headers["Authorization"] = "Bearer %s" % self.auth_token
+
+        response = self.connection_pool.request(
+            "POST",
+            self.path,
+            json.dumps({"messages": messages}),
+            headers)
+
+        if response.status in SmsGatewayClient.THROTTLE_STATUS_CODES:
+            raise ProviderRequestException(
+                "SMS gateway throttled request: %d %s" % (response.status, response.reason),
+                status=response.status,
+                throttled=True)
+        if response.status < 200 or response.status >= 300:
+            raise ProviderRequestException(
+                "SMS gateway request failed: %d %s" % (response.status, response.reason),
+                status=response.status)
+
+        results = dict((result["id"], result)
+                for result in json.loads(response.body).get("results", []))
+
+        output = []
+        for message in messages:
+            result = results.get(message["id"])
+            if result is None:
+                output.append(ProviderRequestException(
+                    "SMS gateway returned no result for message"))
+            elif result.get("status") != "accepted":
+                output.append(ProviderRequestException(
+                    "SMS gateway rejected message: %s" % result.get("error"),
+                    status=result.get("status"),
+                    throttled=result.get("status") == "throttled"))
+            else:
+                output.append(result.get("messageId"))
+        return output
+
+    def send(self, sender, recipient, text):
+        """Send SMS message.
+
+        Args:
+            sender: sender phone number
+            recipient: recipient phone number
+            text: message text
+        Returns:
+            gateway message id
+        Raises:
+            ProviderRequestException if the message was not accepted.
+        """
+        message = {
+            "id": uuid.uuid4().hex,
+            "from": sender,
+            "to": recipient,
+            "text": text
+        }
+
+        if self.batcher is None:
+            result = self._send_batch(None, [message])[0]
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        return self.batcher.submit(message).wait(self.timeout)
+
+    def close(self):
+        """Stop batcher and close idle connections."""
+        if self.batcher is not None:
+            self.batcher.stop()
+        self.connection_pool.close()
+
+
+class HttpSmsProvider(SmsProvider):
+    """HttpSmsProvider implements the SmsProvider
+    abstract base class.
+
+    This SmsProvider sends messages through an HTTP SMS
+    gateway using a shared SmsGatewayClient.
+    """
+
+    def __init__(self, client, from_number):
+        """HttpSmsProvider constructor.
+
+        Args:
+            client: SmsGatewayClient, shared by all providers
+            from_number: sender's phone number
+        """
+        super(HttpSmsProvider, self).__init__('HttpSmsProvider')
+        self.client = client
+        self.from_number = from_number
+
+    def is_throttle_error(self, error):
+        """Check if a send error indicates throttling or overload."""
+        return isinstance(error, ProviderRequestException) and error.throttled
+
+    def send(self, recipient, text):
+        """
+        Send an SMS.
+        Args:
+            recipient: recipient's phone number
+            text: message text
+        Returns:
+            gateway message id
+        Raises:
+            InvalidParameterException if any of the
+                input parameters are invalid
+        """
+        if not recipient or not text:
+            raise InvalidParameterException()
+
+        return self.client.send(self.from_number, recipient, text)
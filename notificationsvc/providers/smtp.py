@@ -1,6 +1,7 @@
 
 import logging
 import smtplib
+import socket
 
 from cStringIO import StringIO
 from email.header import Header
@@ -9,7 +10,7 @@ from email.mime.text import MIMEText
 from email.generator import Generator
 
 from base import EmailProvider
-from exceptions import InvalidParameterException
+from exceptions import InvalidParameterException, OutcomeUnknownException
 
 
 
@@ -25,11 +26,21 @@ class SmtpProvider(EmailProvider):
     At present, this class opens and closes a connection
     to the SMTP host for each message sent.  In the future,
     this may have to change.
+
+    Once the message body has been sent the server may accept
+    it, even if the send then fails waiting for its reply (i.e.
+    the reply times out, or the send is aborted by a watchdog).
+    These failures are raised as OutcomeUnknownException, so
+    callers don't retry them and deliver the message twice.
     """
 
     # Hard code UTF-8 in one place
     UTF8 = 'utf-8'
 
+    # SMTP reply codes indicating the server is throttling
+    # or temporarily unable to handle the message.
+    THROTTLE_CODES = (421, 450, 451, 452)
+
 
     def __init__(
             self,
@@ -38,7 +49,9 @@ class SmtpProvider(EmailProvider):
             host,
             port,
             from_email,
-            use_tls=True
+            use_tls=True,
+            connect_timeout=None,
+            read_timeout=None
     ):
         """SmtpProvider constructor.
 
@@ -49,6 +62,10 @@ class SmtpProvider(EmailProvider):
             port: SMTP port
             from_email: sender's email address
             use_tls: boolean to indicate to use TLS
+            connect_timeout: optional socket timeout in seconds
+                for establishing the connection.
+            read_timeout: optional socket timeout in seconds
+                for each subsequent socket operation.
         """
         super(SmtpProvider, self).__init__('SmtpEmailProvider')
         self.username = username
@@ -57,6 +74,8 @@ class SmtpProvider(EmailProvider):
         self.port = port
         self.use_tls = use_tls
         self.from_email = from_email
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
         self.connection = None
 
 
@@ -118,10 +137,22 @@ class SmtpProvider(EmailProvider):
         """
         if self.connection is None:
 
-            self.connection = smtplib.SMTP(
-                host=self.host,
-                port=self.port
-            )
+            if self.connect_timeout is not None:
+                self.connection = smtplib.SMTP(
+                    host=self.host,
+                    port=self.port,
+                    timeout=self.connect_timeout
+                )
+            else:
+                self.connection = smtplib.SMTP(
+                    host=self.host,
+                    port=self.port
+                )
+
+            # Bound each read/write once connected so a relay
+            # which stalls mid-conversation can't hang the send.
+            if self.read_timeout is not None:
+                self.connection.sock.settimeout(self.read_timeout)
 
             if self.use_tls:
                 self.connection.ehlo()
@@ -144,6 +175,86 @@ class SmtpProvider(EmailProvider):
         self.connection = None
 
 
+    def abort(self):
+        """Abort in-progress send.
+
+        Shuts down the connection socket, causing any
+        blocked socket operation in the sending thread
+        to fail immediately.
+        """
+        connection = self.connection
+        sock = connection.sock if connection else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except Exception as e:
+                logging.exception(e)
+
+
+    def is_throttle_error(self, error):
+        """Check if a send error indicates throttling or overload.
+
+        Args:
+            error: exception raised by send()
+        Returns:
+            True for transient SMTP replies (421, 450, 451, 452),
+            socket timeouts, and dropped connections.
+        """
+        if isinstance(error, smtplib.SMTPResponseException):
+            return error.smtp_code in SmtpProvider.THROTTLE_CODES
+        return isinstance(error, (socket.timeout, smtplib.SMTPServerDisconnected))
+
+
+    def _sendmail(self, recipient, msg):
+        """Send a message over the open connection.
+
+        Equivalent to smtplib's sendmail(), but the end of
+        the DATA command is handled here, so that failures after
+        the message body was sent can be told apart from
+        failures before it.
+
+        Args:
+            recipient: recipient email address
+            msg: flattened message string
+        Raises:
+            smtplib.SMTPException or socket.error if the message
+            wasn't sent, or OutcomeUnknownException if the send
+            failed waiting for the server's reply to the message.
+        """
+        connection = self.connection
+        connection.ehlo_or_helo_if_needed()
+
+        (code, response) = connection.mail(self.from_email)
+        if code != 250:
+            connection.rset()
+            raise smtplib.SMTPSenderRefused(code, response, self.from_email)
+
+        (code, response) = connection.rcpt(recipient)
+        if code not in (250, 251):
+            connection.rset()
+            raise smtplib.SMTPRecipientsRefused({recipient: (code, response)})
+
+        (code, response) = connection.docmd("data")
+        if code != 354:
+            connection.rset()
+            raise smtplib.SMTPDataError(code, response)
+
+        data = smtplib.quotedata(msg)
+        if data[-2:] != smtplib.CRLF:
+            data += smtplib.CRLF
+        connection.send(data + "." + smtplib.CRLF)
+
+        # The server has the complete message, and may accept it
+        # even if its reply is never received.
+        try:
+            (code, response) = connection.getreply()
+        except Exception as e:
+            raise OutcomeUnknownException("%s: %s" % (e.__class__.__name__, e))
+        if code != 250:
+            connection.rset()
+            raise smtplib.SMTPDataError(code, response)
+
+
     def _validate_send_params(self, recipient, subject, plain_text, html_text):
         """ Encapsulating logic that validates inputs of the send() method.
 
@@ -175,17 +286,15 @@ class SmtpProvider(EmailProvider):
         Raises:
             InvalidParameterException if any of the
                 input parameters are invalid
+            OutcomeUnknownException if the send failed
+                after the message was sent
 
         """
         try:
             self._validate_send_params(recipient, subject, plain_text, html_text)
             msg = self._build_message(recipient, subject, plain_text, html_text)
             self._open()
-            self.connection.sendmail(
-                self.from_email,
-                recipient,
-                msg
-            )
+            self._sendmail(recipient, msg)
 
         except InvalidParameterException as e:
             raise e
@@ -0,0 +1,207 @@
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+import urlparse
+
+from base import NotificationProvider
+from batch import RequestBatcher
+from exceptions import InvalidParameterException, ProviderRequestException
+from http import HttpConnectionPool
+
+
+class WebhookClient(object):
+    """Client POSTing notification events to webhook endpoints.
+
+    Events for the same endpoint URL are coalesced by a
+    RequestBatcher into a single request:
+
+        {"events": [{"id": ..., "context": ..., "subject": ...}, ...]}
+
+    If a secret is configured each request is signed with
+    HMAC-SHA256 over the timestamp and the body, so endpoints
+    can verify the sender and reject replays:
+
+        X-Notification-Timestamp: <unix seconds>
+        X-Notification-Signature: sha256=<hex hmac of "<timestamp>.<body>">
+
+    Any 2xx response acknowledges every event in the batch.
+
+    Keep-alive connections are pooled per endpoint host. The
+    client is thread-safe and is intended to be shared by all
+    WebhookProviders.
+    """
+
+    # HTTP status codes indicating the endpoint is throttling
+    THROTTLE_STATUS_CODES = (429, 503)
+
+    def __init__(
+            self,
+            secret=None,
+            pool_size=4,
+            max_batch_size=50,
+            max_batch_delay=0.05,
+            batch_threads=4,
+            timeout=None,
+            clock=time.time):
+        """WebhookClient constructor.
+
+        Args:
+            secret: optional shared secret used to sign requests
+            pool_size: maximum connections per endpoint host
+            max_batch_size: maximum events per request
+            max_batch_delay: maximum seconds to wait for a batch
+                to fill before sending it.
+            batch_threads: number of threads sending batches
+            timeout: optional socket and send timeout in seconds
+            clock: callable returning current time in seconds
+        """
+        self.log = logging.getLogger(__name__)
+        self.secret = secret
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.connection_pools = {}
+        self.batcher = RequestBatcher(
+            send_batch=self._send_batch,
+            max_batch_size=max_batch_size,
+            max_delay=max_batch_delay,
+            threads=batch_threads)
+
+    def _get_connection_pool(self, scheme, netloc):
+        """Returns the connection pool for an endpoint host."""
+        key = (scheme, netloc)
+        with self.lock:
+            connection_pool = self.connection_pools.get(key)
+            if connection_pool is None:
+                host, _, port = netloc.partition(":")
+                connection_pool = HttpConnectionPool(
+                    host=host,
+                    port=int(port) if port else None,
+                    use_ssl=scheme == "https",
+                    size=self.pool_size,
+                    timeout=self.timeout)
+                self.connection_pools[key] = connection_pool
+            return connection_pool
+
+    def sign(self, timestamp, body):
+        """Compute request signature.
+
+        Args:
+            timestamp: timestamp string sent with the request
+            body: request body string
+        Returns:
+            signature header value
+        """
+        digest = hmac.new(self.secret, "%s.%s" % (timestamp, body), hashlib.sha256)
+        return "sha256=%s" % digest.hexdigest()
+
+    def _send_batch(self, url, events):
+        """POST events to url in a single request.
+
+        Args:
+            url: endpoint URL
+            events: list of event dicts
+        Returns:
+            list of None results, aligned with events.
+        Raises:
+            ProviderRequestException if the request failed.
+        """
+        parsed = urlparse.urlsplit(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = "%s?%s" % (path, parsed.query)
+
+        body = json.dumps({"events": events})
+        headers = {
+            "Content-Type": "application/json"
+        }
+        if self.secret:
+            timestamp = str(int(self.clock()))
+            headers["X-Notification-Timestamp"] = timestamp
+            headers["X-Notification-Signature"] = self.sign(timestamp, body)
+
+        connection_pool = self._get_connection_pool(parsed.scheme, parsed.netloc)
+        response = connection_pool.request("POST", path, body, headers)
+
+        if response.status in WebhookClient.THROTTLE_STATUS_CODES:
+            raise ProviderRequestException(
+                "Webhook throttled request: %d %s" % (response.status, response.reason),
+                status=response.status,
+                throttled=True)
+        if response.status < 200 or response.status >= 300:
+            raise ProviderRequestException(
+                "Webhook request failed: %d %s" % (response.status, response.reason),
+                status=response.status)
+
+        return [None] * len(events)
+
+    def send(self, url, event):
+        """Send event to a webhook endpoint.
+
+        Args:
+            url: endpoint URL
+            event: JSON serializable event dict
+        Raises:
+            ProviderRequestException if the event was not acknowledged.
+        """
+        return self.batcher.submit(event, url).wait(self.timeout)
+
+    def close(self):
+        """Stop batcher and close idle connections."""
+        self.batcher.stop()
+        with self.lock:
+            for connection_pool in self.connection_pools.values():
+                connection_pool.close()
+
+
+class WebhookProvider(NotificationProvider):
+    """WebhookProvider delivers notifications to HTTP endpoints.
+
+    Rendered notifications are POSTed as events to the endpoint
+    configured for the notification's context, through a shared
+    WebhookClient.
+    """
+
+    def __init__(self, client, urls, default_url=None):
+        """WebhookProvider constructor.
+
+        Args:
+            client: WebhookClient, shared by all providers
+            urls: dict of notification context to endpoint URL
+            default_url: optional endpoint URL for contexts
+                without an entry in urls.
+        """
+        super(WebhookProvider, self).__init__('WebhookProvider')
+        self.client = client
+        self.urls = urls
+        self.default_url = default_url
+
+    def is_throttle_error(self, error):
+        """Check if a send error indicates throttling or overload."""
+        return isinstance(error, ProviderRequestException) and error.throttled
+
+    def send(self, context, event):
+        """
+        Send a webhook event.
+        Args:
+            context: notification context, used to select
+                the endpoint URL.
+            event: JSON serializable event dict
+        Raises:
+            InvalidParameterException if any of the
+                input parameters are invalid, or no
+                endpoint is configured for the context.
+        """
+        if not event:
+            raise InvalidParameterException()
+
+        url = self.urls.get(context, self.default_url)
+        if not url:
+            raise InvalidParameterException("No webhook URL for context '%s'" % context)
+
+        return self.client.send(url, event)
@@ -0,0 +1,126 @@
+
+import logging
+import threading
+import time
+
+from sqlalchemy.sql import case, func
+
+from trsvcscore.db.models import NotificationJob
+
+from constants import NOTIFICATION_PRIORITY_VALUES
+from tracing import to_timestamp
+
+
+class JobQueueStats(object):
+    """Cached aggregate statistics of unclaimed notification jobs.
+
+    A single aggregate query, grouped by priority, counts the
+    unclaimed jobs and the unclaimed jobs which are due, and
+    finds the oldest due job. Results are cached for
+    cache_seconds, so reading the statistics through the
+    service counters doesn't scan the job table on every call.
+    """
+    def __init__(self, db_session_factory, cache_seconds=10, clock=time.time):
+        """JobQueueStats constructor.
+
+        Args:
+            db_session_factory: callable returning a new sqlalchemy db session
+            cache_seconds: seconds before the statistics are reloaded
+            clock: callable returning current time in seconds
+        """
+        self.log = logging.getLogger(__name__)
+        self.db_session_factory = db_session_factory
+        self.cache_seconds = cache_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.loaded = None
+        self.stats = {}
+        self.priority_names = dict((value, name.replace("_PRIORITY", "").lower())
+                for name, value in NOTIFICATION_PRIORITY_VALUES.items())
+
+    def _load(self):
+        """Load statistics from the database.
+
+        Returns:
+            dict of priority value to (pending, due, oldest due
+            not_before) tuples.
+        """
+        due = NotificationJob.not_before <= func.current_timestamp()
+        db_session = self.db_session_factory()
+        try:
+            rows = db_session.query(
+                    NotificationJob.priority,
+                    func.count(NotificationJob.id),
+                    func.sum(case([(due, 1)], else_=0)),
+                    func.min(case([(due, NotificationJob.not_before)]))).\
+                filter(NotificationJob.owner==None).\
+                group_by(NotificationJob.priority).\
+                all()
+        finally:
+            db_session.close()
+
+        return dict((priority, (pending, due or 0, oldest))
+                    for priority, pending, due, oldest in rows)
+
+    def _get(self):
+        """Get cached statistics, reloading them if stale."""
+        with self.lock:
+            now = self.clock()
+            if self.loaded is None or now - self.loaded >= self.cache_seconds:
+                try:
+                    self.stats = self._load()
+                except Exception as error:
+                    self.log.exception(error)
+                # Don't retry a failed load on every read
+                self.loaded = now
+            return self.stats
+
+    def pending(self, priority=None):
+        """Number of unclaimed jobs.
+
+        Args:
+            priority: optional priority value; all priorities
+                if None.
+        """
+        stats = self._get()
+        return sum(pending for key, (pending, due, oldest) in stats.items()
+                   if priority is None or key == priority)
+
+    def due(self, priority=None):
+        """Number of unclaimed jobs which are due.
+
+        Args:
+            priority: optional priority value; all priorities
+                if None.
+        """
+        stats = self._get()
+        return sum(due for key, (pending, due, oldest) in stats.items()
+                   if priority is None or key == priority)
+
+    def oldest_due_age(self):
+        """Seconds since the oldest unclaimed job became due, or 0."""
+        oldest = [oldest for pending, due, oldest in self._get().values()
+                  if oldest is not None]
+        if not oldest:
+            return 0
+        return max(0, time.time() - to_timestamp(min(oldest)))
+
+    def register(self, metrics):
+        """Register statistics as gauges.
+
+        Registers 'notifier_jobs_pending', 'notifier_jobs_due',
+        their per-priority variants, i.e.
+        'notifier_jobs_pending_high', and
+        'notifier_oldest_due_job_age_seconds'.
+
+        Args:
+            metrics: MetricRegistry
+        """
+        metrics.register_gauge("notifier_jobs_pending", self.pending)
+        metrics.register_gauge("notifier_jobs_due", self.due)
+        for priority, name in self.priority_names.items():
+            metrics.register_gauge("notifier_jobs_pending_%s" % name,
+                lambda priority=priority: self.pending(priority))
+            metrics.register_gauge("notifier_jobs_due_%s" % name,
+                lambda priority=priority: self.due(priority))
+        metrics.register_gauge("notifier_oldest_due_job_age_seconds", self.oldest_due_age)
@@ -0,0 +1,205 @@
+
+import collections
+import logging
+import threading
+import time
+
+from constants import EMAIL_CHANNEL
+from models import NotificationChannelPreference
+
+
+class ChannelPreferenceCache(object):
+    """LRU cache of users' channel preferences with a TTL.
+
+    Maps a user id to a dict of channel name to
+    (enabled, address) tuples, loaded from the
+    notification_channel_preference table. Entries expire
+    ttl seconds after they are loaded, so preference changes
+    are picked up without a per-job database query.
+    """
+    def __init__(self, db_session_factory, size=10000, ttl=300, clock=time.time):
+        """ChannelPreferenceCache constructor.
+
+        Args:
+            db_session_factory: callable returning a new sqlalchemy db session
+            size: maximum number of users to cache
+            ttl: seconds before a cached entry is reloaded
+            clock: callable returning current time in seconds
+        """
+        self.log = logging.getLogger(__name__)
+        self.db_session_factory = db_session_factory
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, user_ids):
+        """Load preferences for users from the database.
+
+        Returns:
+            dict of user id to dict of channel preferences
+        """
+        preferences = dict((user_id, {}) for user_id in user_ids)
+        db_session = self.db_session_factory()
+        try:
+            rows = db_session.query(
+                    NotificationChannelPreference.user_id,
+                    NotificationChannelPreference.channel,
+                    NotificationChannelPreference.enabled,
+                    NotificationChannelPreference.address).\
+                filter(NotificationChannelPreference.user_id.in_(user_ids)).\
+                all()
+        finally:
+            db_session.close()
+
+        for row in rows:
+            preferences[row.user_id][row.channel] = (row.enabled, row.address)
+        return preferences
+
+    def _lookup(self, user_id, now):
+        """Returns cached preferences or None. Caller must hold lock."""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        expires, preferences = entry
+        if expires <= now:
+            del self.entries[user_id]
+            return None
+        # Move to most recently used position
+        del self.entries[user_id]
+        self.entries[user_id] = entry
+        return preferences
+
+    def _store(self, user_id, preferences, now):
+        """Cache preferences, evicting the LRU entry. Caller must hold lock."""
+        self.entries.pop(user_id, None)
+        self.entries[user_id] = (now + self.ttl, preferences)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def get_many(self, user_ids):
+        """Get channel preferences for users.
+
+        Users which are not cached are loaded with a
+        single database query.
+
+        Args:
+            user_ids: iterable of user ids
+        Returns:
+            dict of user id to dict of channel name to
+            (enabled, address) tuples.
+        """
+        now = self.clock()
+        result = {}
+        missing = []
+        with self.lock:
+            for user_id in set(user_ids):
+                preferences = self._lookup(user_id, now)
+                if preferences is None:
+                    missing.append(user_id)
+                else:
+                    result[user_id] = preferences
+            self.hits += len(result)
+            self.misses += len(missing)
+
+        if missing:
+            loaded = self._load(missing)
+            with self.lock:
+                for user_id, preferences in loaded.items():
+                    self._store(user_id, preferences, now)
+            result.update(loaded)
+        return result
+
+    def get(self, user_id):
+        """Get channel preferences for a user.
+
+        Args:
+            user_id: user id
+        Returns:
+            dict of channel name to (enabled, address) tuples
+        """
+        return self.get_many([user_id])[user_id]
+
+    def invalidate(self, user_id=None):
+        """Remove a user's cached preferences, or all if user_id is None."""
+        with self.lock:
+            if user_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(user_id, None)
+
+
+class ChannelRouter(object):
+    """Chooses the delivery channels for a notification recipient.
+
+    Recipients are notified on every channel they have enabled,
+    in the router's channel order. Email is the default channel:
+    it is used unless the recipient has disabled it, and needs
+    no address since it is read from the user record. Other
+    channels require an enabled preference.
+
+    The router is callable with a NotificationDatabaseJob,
+    returning the job's primary channel, so it can be used as
+    the NotificationJobMonitor router.
+    """
+    def __init__(self, cache, channels, default_channel=EMAIL_CHANNEL):
+        """ChannelRouter constructor.
+
+        Args:
+            cache: ChannelPreferenceCache
+            channels: ordered list of channels which may be
+                routed to; the first routed channel is the
+                recipient's primary channel.
+            default_channel: channel used without a preference
+        """
+        self.cache = cache
+        self.channels = channels
+        self.default_channel = default_channel
+
+    def route(self, user_id):
+        """Get the channels to notify a user on.
+
+        Args:
+            user_id: recipient user id
+        Returns:
+            ordered list of channel names, possibly empty
+            if the user has disabled all channels.
+        """
+        preferences = self.cache.get(user_id)
+        channels = []
+        for channel in self.channels:
+            enabled, address = preferences.get(channel, (None, None))
+            if enabled is None:
+                if channel == self.default_channel:
+                    channels.append(channel)
+            elif enabled:
+                channels.append(channel)
+        return channels
+
+    def address(self, user_id, channel):
+        """Get a user's cached address on a channel, or None."""
+        enabled, address = self.cache.get(user_id).get(channel, (None, None))
+        return address
+
+    def prefetch(self, user_ids):
+        """Load preferences for users which are not cached."""
+        self.cache.get_many(user_ids)
+
+    def primary(self, user_id):
+        """Get a user's primary channel.
+
+        Users with no enabled channels are routed to the
+        default channel, where the notifier completes their
+        jobs without sending.
+        """
+        channels = self.route(user_id)
+        if channels:
+            return channels[0]
+        return self.default_channel
+
+    def __call__(self, job):
+        """Get the primary channel for a NotificationDatabaseJob."""
+        return self.primary(job.recipient_id)
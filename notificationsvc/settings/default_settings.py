@@ -1,7 +1,9 @@
 import os
+import signal
 import socket
 
 import providers.factory
+from constants import EMAIL_CHANNEL, SMS_CHANNEL, WEBHOOK_CHANNEL
 
 
 ENV = os.getenv("SERVICE_ENV", "default")
@@ -15,6 +17,23 @@ SERVICE_JOIN_TIMEOUT = 1
 THRIFT_SERVER_ADDRESS = socket.gethostname()
 THRIFT_SERVER_INTERFACE = "0.0.0.0"
 THRIFT_SERVER_PORT = 9095
+THRIFT_SERVER_THREADS = 1
+
+#Metrics server settings
+#Port of the HTTP server exporting metrics to Prometheus
+#at /metrics, or None to disable it.
+METRICS_SERVER_INTERFACE = "0.0.0.0"
+METRICS_SERVER_PORT = None
+
+#Profiler settings
+#Sending PROFILER_SIGNAL to the service toggles a sampling
+#profiler, which writes collapsed stacks (for flamegraphs)
+#to PROFILER_OUTPUT_DIRECTORY after at most PROFILER_DURATION
+#seconds, or when the signal is sent again.
+PROFILER_SIGNAL = signal.SIGUSR1
+PROFILER_INTERVAL = 0.01
+PROFILER_DURATION = 60
+PROFILER_OUTPUT_DIRECTORY = "/tmp"
 
 #Database settings
 DATABASE_HOST = "localdev"
@@ -26,17 +45,161 @@ DATABASE_CONNECTION = "postgresql+psycopg2://%s:%s@/%s?host=%s" % (DATABASE_USER
 #Zookeeper settings
 ZOOKEEPER_HOSTS = ["localdev:2181"]
 
+#Sharding settings
+#If enabled, each job processing process registers under
+#NOTIFIER_SHARD_PATH in Zookeeper, and jobs are split across
+#them by recipient id bucket with consistent hashing.
+NOTIFIER_SHARDING = False
+NOTIFIER_SHARD_PATH = "/notificationsvc/shards"
+NOTIFIER_SHARD_BUCKETS = 1024
+NOTIFIER_SHARD_REPLICAS = 64
+NOTIFIER_SHARD_REFRESH_SECONDS = 30
+
 #Notification svc settings
 NOTIFIER_THREADS = 1
 NOTIFIER_POOL_SIZE = 1
 NOTIFIER_POLL_SECONDS = 60
 NOTIFIER_JOB_RETRY_SECONDS = 300
 NOTIFIER_JOB_MAX_RETRY_ATTEMPTS = 3
+NOTIFIER_POOL_MAX_QUEUE_SIZE = 1000
+
+# Jobs which exhaust their retries are recorded as dead letters.
+# 'manager.py deadletter replay' requeues them in transactions of
+# NOTIFIER_DEAD_LETTER_REPLAY_CHUNK_SIZE, spreading not_before
+# so at most NOTIFIER_DEAD_LETTER_REPLAY_RATE jobs per second
+# become due (None requeues them all at once).
+NOTIFIER_DEAD_LETTER_REPLAY_CHUNK_SIZE = 500
+NOTIFIER_DEAD_LETTER_REPLAY_RATE = 20
+
+# Sends taking longer than NOTIFIER_SEND_TIMEOUT seconds are
+# aborted by the watchdog, which checks for hung sends every
+# NOTIFIER_WATCHDOG_POLL_SECONDS.
+NOTIFIER_SEND_TIMEOUT = 120
+NOTIFIER_WATCHDOG_POLL_SECONDS = 5
+
+# If enabled, concurrent email sends are bounded by an AIMD
+# limiter between NOTIFIER_CONCURRENCY_MIN and
+# NOTIFIER_CONCURRENCY_MAX (also capped by the email pool size).
+# The limit is multiplied by NOTIFIER_CONCURRENCY_DECREASE_FACTOR
+# when send latency exceeds NOTIFIER_CONCURRENCY_LATENCY_TARGET
+# seconds, or the weighted send error rate exceeds
+# NOTIFIER_CONCURRENCY_ERROR_THRESHOLD.
+NOTIFIER_ADAPTIVE_CONCURRENCY = True
+NOTIFIER_CONCURRENCY_MIN = 1
+NOTIFIER_CONCURRENCY_MAX = 16
+NOTIFIER_CONCURRENCY_LATENCY_TARGET = 5.0
+NOTIFIER_CONCURRENCY_DECREASE_FACTOR = 0.5
+NOTIFIER_CONCURRENCY_ERROR_THRESHOLD = 0.5
+
+# Number of prefork worker processes which claim and deliver
+# jobs, each processing a partition of the jobs. If 0, jobs
+# are processed by the service process. Set by
+# 'manager.py start --workers N'.
+NOTIFIER_WORKER_PROCESSES = int(os.getenv("NOTIFIER_WORKER_PROCESSES", 0))
+NOTIFIER_WORKER_METRICS_SECONDS = 5
+NOTIFIER_WORKER_RESTART_SECONDS = 5
+NOTIFIER_WORKER_STOP_TIMEOUT = 30
+
+# If enabled, concurrent notify() calls are committed together
+# in one transaction: writes are gathered for up to
+# NOTIFIER_GROUP_COMMIT_MAX_WAIT seconds after the first, or
+# until NOTIFIER_GROUP_COMMIT_MAX_BATCH are waiting. Each call
+# returns once its transaction is committed.
+NOTIFIER_GROUP_COMMIT = False
+NOTIFIER_GROUP_COMMIT_MAX_WAIT = 0.005
+NOTIFIER_GROUP_COMMIT_MAX_BATCH = 100
+
+# Notification tokens are unique. Tokens committed in the last
+# NOTIFIER_TOKEN_INDEX_TTL seconds are kept in memory, up to
+# NOTIFIER_TOKEN_INDEX_SIZE, so retried notify() calls are
+# answered without a database query. Tokens of notifications
+# created before upgrading are only unique once backfilled with
+# 'manager.py tokens backfill'.
+NOTIFIER_TOKEN_INDEX_SIZE = 10000
+NOTIFIER_TOKEN_INDEX_TTL = 600
+
+# Cancellations are loaded every NOTIFIER_CANCELLATION_REFRESH_SECONDS
+# to drop jobs of cancelled notifications which are queued in
+# memory, and kept for NOTIFIER_CANCELLATION_RETENTION_SECONDS.
+NOTIFIER_CANCELLATION_REFRESH_SECONDS = 5
+NOTIFIER_CANCELLATION_RETENTION_SECONDS = 3600
+
+# If enabled, notifications received while the database is
+# unavailable are appended to a local journal in
+# NOTIFIER_JOURNAL_DIRECTORY, and replayed into the database in
+# batches of NOTIFIER_JOURNAL_REPLAY_BATCH_SIZE once it recovers.
+NOTIFIER_JOURNAL = False
+NOTIFIER_JOURNAL_DIRECTORY = "%s.%s.journal" % (SERVICE, ENV)
+NOTIFIER_JOURNAL_SEGMENT_BYTES = 64 * 1024 * 1024
+NOTIFIER_JOURNAL_REPLAY_BATCH_SIZE = 500
+NOTIFIER_JOURNAL_REPLAY_SECONDS = 10
+
+# If enabled, notify() claims the jobs of HIGH_PRIORITY
+# notifications with at most NOTIFIER_EXPRESS_MAX_RECIPIENTS
+# recipients in its own transaction and hands them directly to
+# idle worker threads, skipping the poll. If the channel pools
+# are busy the jobs are queued as usual. Only applies when jobs
+# are processed by the service process (no worker processes).
+NOTIFIER_EXPRESS_LANE = False
+NOTIFIER_EXPRESS_MAX_RECIPIENTS = 10
+
+# If enabled, claimed jobs are leased, and the leases renewed
+# every NOTIFIER_LEASE_HEARTBEAT_SECONDS while the job is
+# processed. Jobs whose lease expired (the process died) are
+# unclaimed and picked up again. If NOTIFIER_LEASE_ORPHAN_SECONDS
+# is set, jobs claimed without a lease are unclaimed after that
+# many seconds. Only set it once every instance runs with
+# leases, or jobs in flight on instances without leases, i.e.
+# during a rolling deploy, are reclaimed and sent twice.
+NOTIFIER_LEASES = False
+NOTIFIER_LEASE_SECONDS = 30
+NOTIFIER_LEASE_HEARTBEAT_SECONDS = 5
+NOTIFIER_LEASE_REAP_SECONDS = 5
+NOTIFIER_LEASE_ORPHAN_SECONDS = None
+
+# Per-channel pool settings. Each channel has its own worker
+# threads and notifier pool; 'threads' and 'pool_size' default
+# to NOTIFIER_THREADS and NOTIFIER_POOL_SIZE, and
+# 'max_queue_size' defaults to NOTIFIER_POOL_MAX_QUEUE_SIZE.
+NOTIFIER_POOLS = {
+    EMAIL_CHANNEL: {},
+    SMS_CHANNEL: {},
+    WEBHOOK_CHANNEL: {}
+}
+
+# Channels recipients may be notified on, in routing order.
+# A recipient's first enabled channel is their primary channel,
+# whose pool processes the job first; jobs for recipients with
+# more than one enabled channel are then forwarded to the pools
+# of their other channels.
+NOTIFIER_ROUTING_CHANNELS = [EMAIL_CHANNEL, SMS_CHANNEL, WEBHOOK_CHANNEL]
+NOTIFIER_PREFERENCE_CACHE_SIZE = 10000
+NOTIFIER_PREFERENCE_CACHE_TTL = 300
+
+# Fraction of jobs, between 0 and 1, whose full latency
+# trace is logged. Latency histograms cover all jobs.
+NOTIFIER_TRACE_SAMPLE_RATE = 0
+
+# Seconds job queue statistics (pending jobs, oldest due job age)
+# are cached for, bounding the cost of reading service counters.
+NOTIFIER_QUEUE_STATS_CACHE_SECONDS = 10
 
 
 # Provider Factory settings
 EMAIL_PROVIDER_FACTORY = providers.factory.console_email_provider_factory
 EMAIL_PROVIDER_FROM_EMAIL = 'Tech Residents Support <support@techresidents.com>'
+EMAIL_PROVIDER_BREAKER_FAILURE_THRESHOLD = 5
+EMAIL_PROVIDER_BREAKER_RESET_SECONDS = 30
+SMS_PROVIDER_FACTORY = providers.factory.http_sms_provider_factory
+SMS_PROVIDER_FROM_NUMBER = '+15555550100'
+SMS_PROVIDER_BREAKER_FAILURE_THRESHOLD = 5
+SMS_PROVIDER_BREAKER_RESET_SECONDS = 30
+WEBHOOK_PROVIDER_FACTORY = providers.factory.webhook_provider_factory
+WEBHOOK_PROVIDER_BREAKER_FAILURE_THRESHOLD = 5
+WEBHOOK_PROVIDER_BREAKER_RESET_SECONDS = 30
+
+# Sink provider settings (load testing)
+SINK_PROVIDER_LATENCY = 0
 
 # SMTP settings
 SMTP_USERNAME = None
@@ -44,6 +207,42 @@ SMTP_PASSWORD = None
 SMTP_HOST = 'localhost'
 SMTP_PORT = 25
 SMTP_USE_TLS = False
+SMTP_CONNECT_TIMEOUT = 10
+SMTP_READ_TIMEOUT = 60
+
+# SMS gateway settings
+SMS_GATEWAY_HOST = 'localhost'
+SMS_GATEWAY_PORT = 8025
+SMS_GATEWAY_USE_SSL = False
+SMS_GATEWAY_PATH = '/v1/messages'
+SMS_GATEWAY_AUTH_TOKEN = None
+SMS_GATEWAY_POOL_SIZE = 4
+SMS_GATEWAY_TIMEOUT = 30
+SMS_GATEWAY_MAX_BATCH_SIZE = 50
+SMS_GATEWAY_MAX_BATCH_DELAY = 0.05
+
+# Email API settings (SendGrid-style HTTP batch API)
+EMAIL_API_HOST = 'api.sendgrid.com'
+EMAIL_API_PORT = 443
+EMAIL_API_USE_SSL = True
+EMAIL_API_PATH = '/v3/mail/send'
+EMAIL_API_KEY = None
+EMAIL_API_POOL_SIZE = 4
+EMAIL_API_TIMEOUT = 30
+EMAIL_API_MAX_BATCH_SIZE = 1000
+EMAIL_API_MAX_BATCH_DELAY = 0.05
+EMAIL_API_COMPRESS = True
+
+# Webhook settings
+# Map of notification context to endpoint URL. Contexts
+# without an entry are sent to WEBHOOK_DEFAULT_URL.
+WEBHOOK_URLS = {}
+WEBHOOK_DEFAULT_URL = None
+WEBHOOK_SECRET = None
+WEBHOOK_POOL_SIZE = 4
+WEBHOOK_TIMEOUT = 30
+WEBHOOK_MAX_BATCH_SIZE = 50
+WEBHOOK_MAX_BATCH_DELAY = 0.05
 
 
 
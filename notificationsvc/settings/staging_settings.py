@@ -13,6 +13,7 @@ SERVER_PORT = 9095
 
 #Service Settings
 SERVICE_PID_FILE = "/opt/tr/data/%s/pid/%s.%s.pid" % (SERVICE, SERVICE, ENV)
+NOTIFIER_JOURNAL_DIRECTORY = "/opt/tr/data/%s/journal" % SERVICE
 SERVICE_JOIN_TIMEOUT = 1
 
 #Database settings
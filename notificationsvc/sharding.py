@@ -0,0 +1,220 @@
+
+import bisect
+import hashlib
+import logging
+import threading
+
+
+def hash_key(value):
+    """Hash a string to a position on the ring."""
+    return int(hashlib.md5(value).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """Consistent hash ring.
+
+    Each member is placed on the ring at 'replicas' points,
+    and a key is owned by the member at the first point
+    following the key's hash. Adding or removing a member
+    only moves the keys between it and its neighbors, about
+    1/N of the keys, and the virtual points keep the share
+    of each member close to even.
+    """
+    def __init__(self, members, replicas=64):
+        """HashRing constructor.
+
+        Args:
+            members: list of member names
+            replicas: number of points per member
+        """
+        self.members = sorted(set(members))
+        points = []
+        for member in self.members:
+            for replica in range(replicas):
+                points.append((hash_key("%s-%d" % (member, replica)), member))
+        points.sort()
+        self.hashes = [point for point, member in points]
+        self.owners = [member for point, member in points]
+
+    def owner(self, key):
+        """Get the member owning a key.
+
+        Args:
+            key: string key
+        Returns:
+            member name, or None if the ring is empty.
+        """
+        if not self.owners:
+            return None
+        index = bisect.bisect(self.hashes, hash_key(key)) % len(self.hashes)
+        return self.owners[index]
+
+
+class ShardCoordinator(object):
+    """Splits notification jobs across service instances.
+
+    Jobs are assigned to one of bucket_count buckets by
+    recipient id (recipient_id % bucket_count), which can be
+    evaluated in the job query, and buckets are assigned to
+    the live members with a consistent HashRing.
+
+    Each member registers an ephemeral node under path in
+    Zookeeper and watches the path's children; whenever
+    membership changes, the buckets are reassigned. The
+    membership is also refreshed every refresh_seconds, which
+    re-registers the member if its session expired and
+    covers missed watches.
+
+    Until the member has registered, buckets() returns None
+    and the member processes all jobs, as without sharding.
+    During a rebalance members may briefly disagree, so a
+    bucket can be polled by two members (claims are atomic,
+    so jobs are still delivered once) or by none (until the
+    watch fires).
+
+    The zookeeper_client must provide exists(path),
+    create(path, data, ephemeral=False), delete(path) and
+    get_children(path, watcher), where watcher is invoked
+    with a single event argument once the children change.
+    """
+    def __init__(
+            self,
+            zookeeper_client,
+            path,
+            member,
+            bucket_count=1024,
+            replicas=64,
+            refresh_seconds=30,
+            metrics=None):
+        """ShardCoordinator constructor.
+
+        Args:
+            zookeeper_client: zookeeper client
+            path: zookeeper path members register under
+            member: unique member name, i.e. '<hostname>-<pid>'
+            bucket_count: number of job buckets
+            replicas: ring points per member
+            refresh_seconds: seconds between membership refreshes
+            metrics: optional MetricRegistry
+        """
+        self.log = logging.getLogger(__name__)
+        self.zookeeper_client = zookeeper_client
+        self.path = path.rstrip("/")
+        self.member = member
+        self.bucket_count = bucket_count
+        self.replicas = replicas
+        self.refresh_seconds = refresh_seconds
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.members = []
+        self.owned = None
+        self.rebalances = 0
+        self.running = False
+        self.thread = None
+        self.wake_event = threading.Event()
+
+        if self.metrics is not None:
+            self.metrics.register_gauge("notifier_shard_members", lambda: len(self.members))
+            self.metrics.register_gauge("notifier_shard_buckets_owned",
+                lambda: self.bucket_count if self.owned is None else len(self.owned))
+            self.metrics.register_gauge("notifier_shard_rebalances", lambda: self.rebalances)
+
+    def start(self):
+        """Start the membership thread."""
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self.run, name="ShardCoordinator")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        """Membership thread run method."""
+        while self.running:
+            self.wake_event.clear()
+            try:
+                self.refresh()
+            except Exception as error:
+                self.log.exception(error)
+            self.wake_event.wait(self.refresh_seconds)
+
+    def stop(self):
+        """Stop the membership thread and unregister the member."""
+        if self.running:
+            self.running = False
+            self.wake_event.set()
+            try:
+                member_path = "%s/%s" % (self.path, self.member)
+                if self.zookeeper_client.exists(member_path):
+                    self.zookeeper_client.delete(member_path)
+            except Exception as error:
+                self.log.exception(error)
+
+    def join(self, timeout=None):
+        """Join the membership thread."""
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _watch(self, event):
+        self.wake_event.set()
+
+    def _ensure_path(self, path):
+        """Create path and its parents if they don't exist."""
+        parts = path.strip("/").split("/")
+        for index in range(len(parts)):
+            partial = "/" + "/".join(parts[:index + 1])
+            if not self.zookeeper_client.exists(partial):
+                try:
+                    self.zookeeper_client.create(partial, "")
+                except Exception:
+                    # Created concurrently by another member
+                    if not self.zookeeper_client.exists(partial):
+                        raise
+
+    def refresh(self):
+        """Register the member if needed and reassign buckets."""
+        member_path = "%s/%s" % (self.path, self.member)
+        if not self.zookeeper_client.exists(member_path):
+            self._ensure_path(self.path)
+            self.zookeeper_client.create(member_path, self.member, ephemeral=True)
+            self.log.info("Registered shard member %s" % member_path)
+
+        members = self.zookeeper_client.get_children(self.path, self._watch)
+        self.update(members)
+
+    def update(self, members):
+        """Reassign buckets for a membership.
+
+        Args:
+            members: list of member names
+        """
+        members = sorted(members)
+        if self.member not in members:
+            # Not registered (yet); don't take other members' buckets away
+            return
+
+        with self.lock:
+            if members == self.members and self.owned is not None:
+                return
+            ring = HashRing(members, self.replicas)
+            owned = frozenset(bucket for bucket in range(self.bucket_count)
+                              if ring.owner(str(bucket)) == self.member)
+            self.log.info("Shard rebalance: %d members, %d of %d buckets owned" \
+                    % (len(members), len(owned), self.bucket_count))
+            self.members = members
+            self.owned = owned
+            self.rebalances += 1
+
+    def buckets(self):
+        """Get the buckets owned by this member.
+
+        Returns:
+            sorted list of bucket numbers, or None if the member
+            has not registered yet and should process all jobs.
+        """
+        owned = self.owned
+        return None if owned is None else sorted(owned)
+
+    def owns(self, recipient_id):
+        """Check if a recipient's jobs belong to this member."""
+        owned = self.owned
+        return owned is None or recipient_id % self.bucket_count in owned
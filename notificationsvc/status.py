@@ -0,0 +1,130 @@
+
+from sqlalchemy.sql import and_, case, func
+
+from trsvcscore.db.models import Notification as NotificationModel
+from trsvcscore.db.models import NotificationJob as NotificationJobModel
+
+from constants import CANCELLED_JOB_OWNER
+from models import NotificationStatus
+
+
+def create_status(db_session, notification_id, token, pending, created=None):
+    """Add the status aggregate of a new notification.
+
+    Args:
+        db_session: sqlalchemy db session creating the
+            notification; the status is added but not committed.
+        notification_id: Notification id
+        token: notification token
+        pending: number of jobs created for the notification
+        created: optional UTC DateTime the notification was
+            created; defaults to now.
+    """
+    created = created if created is not None else func.current_timestamp()
+    db_session.add(NotificationStatus(
+        token=token,
+        notification_id=notification_id,
+        created=created,
+        updated=created,
+        pending=pending,
+        sent=0,
+        failed=0,
+        cancelled=0,
+        unknown=0))
+
+
+def update_status(db_session, notification_id, pending=0, sent=0, failed=0, cancelled=0, unknown=0):
+    """Adjust the job counts of a notification's status aggregate.
+
+    The counts are incremented in place, in the caller's
+    transaction, so the aggregate changes atomically with the
+    jobs. The status is keyed by the notification's id, so
+    no query is needed to look it up.
+    Notifications created before status aggregates were
+    introduced have no status, and are left as is.
+
+    Args:
+        db_session: sqlalchemy db session; the update is
+            executed but not committed.
+        notification_id: Notification id
+        pending: change in the number of outstanding jobs
+        sent: change in the number of sent jobs
+        failed: change in the number of failed jobs
+        cancelled: change in the number of cancelled jobs
+        unknown: change in the number of jobs with an unknown outcome
+    """
+    table = NotificationStatus.__table__
+    values = {"updated": func.current_timestamp()}
+    for column, delta in (("pending", pending), ("sent", sent), ("failed", failed),
+                          ("cancelled", cancelled), ("unknown", unknown)):
+        if delta:
+            values[column] = table.c[column] + delta
+    if sent > 0:
+        values["last_sent"] = func.current_timestamp()
+
+    db_session.execute(table.update().\
+        where(table.c.notification_id==notification_id).\
+        values(**values))
+
+
+def _aggregate_statuses(db_session, tokens):
+    """Compute statuses of notifications without an aggregate.
+
+    Returns:
+        dict of token to (pending, sent, failed, cancelled,
+        unknown, created, updated, last_sent) tuples
+    """
+    job = NotificationJobModel
+    cancelled = job.owner==CANCELLED_JOB_OWNER
+    rows = db_session.query(
+            NotificationModel.token,
+            func.sum(case([(job.end==None, 1)], else_=0)),
+            func.sum(case([(job.successful==True, 1)], else_=0)),
+            func.sum(case([(and_(job.end!=None, job.successful==False, ~cancelled), 1)], else_=0)),
+            func.sum(case([(cancelled, 1)], else_=0)),
+            func.sum(case([(and_(job.end!=None, job.successful==None), 1)], else_=0)),
+            func.min(NotificationModel.created),
+            func.max(job.end),
+            func.max(case([(job.successful==True, job.end)]))).\
+        join(job, job.notification_id==NotificationModel.id).\
+        filter(NotificationModel.token.in_(tokens)).\
+        group_by(NotificationModel.token).\
+        all()
+
+    statuses = {}
+    for token, pending, sent, failed, cancelled, unknown, created, updated, last_sent in rows:
+        statuses[token] = (pending or 0, sent or 0, failed or 0, cancelled or 0,
+                           unknown or 0, created, updated or created, last_sent)
+    return statuses
+
+
+def load_statuses(db_session, tokens):
+    """Load the statuses of notifications.
+
+    Statuses are read from the notifications' aggregates with
+    a single query. Notifications created before aggregates
+    were introduced have their jobs counted instead.
+
+    Args:
+        db_session: sqlalchemy db session
+        tokens: list of notification tokens
+    Returns:
+        dict of token to (pending, sent, failed, cancelled,
+        unknown, created, updated, last_sent) tuples; tokens
+        without a notification are omitted.
+    """
+    tokens = list(set(tokens))
+    if not tokens:
+        return {}
+
+    statuses = {}
+    for status in db_session.query(NotificationStatus).\
+            filter(NotificationStatus.token.in_(tokens)):
+        statuses[status.token] = (status.pending, status.sent, status.failed,
+                status.cancelled, status.unknown, status.created, status.updated,
+                status.last_sent)
+
+    missing = [token for token in tokens if token not in statuses]
+    if missing:
+        statuses.update(_aggregate_statuses(db_session, missing))
+    return statuses
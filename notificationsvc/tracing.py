@@ -0,0 +1,117 @@
+
+import calendar
+import logging
+import random
+import time
+
+from constants import NOTIFICATION_PRIORITY_VALUES
+
+
+# Timestamps recorded on a job's trace as it moves through
+# the pipeline, in order.
+TRACE_DEQUEUED = "dequeued"
+TRACE_CLAIMED = "claimed"
+TRACE_RENDERED = "rendered"
+TRACE_ACCEPTED = "accepted"
+
+
+def to_timestamp(value):
+    """Convert a datetime to seconds since the epoch.
+
+    Naive datetimes are assumed to be UTC.
+    """
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1000000.0
+
+
+class LatencyTracer(object):
+    """Aggregates notification latencies into per-priority histograms.
+
+    Each job carries a trace dict of pipeline timestamps which is
+    filled in as it is processed. The job's ready time is the
+    later of the notification's intake (its created time) and the
+    job's not_before, so scheduled notifications and retries are
+    measured from when they became due. Once the job is accepted
+    by a provider, the following stages are recorded in histograms
+    named 'latency_<priority>_<stage>_ms':
+
+        queued: ready until dequeued by a worker thread
+        claim: dequeued until the job was claimed
+        render: claimed until rendering completed
+        send: rendering completed until accepted by the provider
+        total: ready until accepted by the provider
+
+    The intake to commit latency of notify() is recorded in
+    'latency_<priority>_commit_ms'.
+
+    Ready times come from the database clock and the other
+    timestamps from the worker's clock, so hosts' clocks should
+    be synchronized.
+    """
+
+    STAGES = (
+        ("queued", None, TRACE_DEQUEUED),
+        ("claim", TRACE_DEQUEUED, TRACE_CLAIMED),
+        ("render", TRACE_CLAIMED, TRACE_RENDERED),
+        ("send", TRACE_RENDERED, TRACE_ACCEPTED),
+        ("total", None, TRACE_ACCEPTED)
+    )
+
+    def __init__(self, metrics, sample_rate=0, random=random.random):
+        """LatencyTracer constructor.
+
+        Args:
+            metrics: MetricRegistry to record histograms in
+            sample_rate: fraction of jobs, between 0 and 1, for
+                which the full trace is logged.
+            random: callable returning a float in [0, 1)
+        """
+        self.log = logging.getLogger(__name__)
+        self.metrics = metrics
+        self.sample_rate = sample_rate
+        self.random = random
+        self.priority_names = dict((value, name.replace("_PRIORITY", "").lower())
+                for name, value in NOTIFICATION_PRIORITY_VALUES.items())
+
+    def _priority_name(self, priority):
+        return self.priority_names.get(priority, str(priority))
+
+    def _observe(self, priority, stage, seconds):
+        name = "latency_%s_%s_ms" % (self._priority_name(priority), stage)
+        self.metrics.observe(name, max(0, seconds * 1000))
+
+    def record_commit(self, priority, intake, committed=None):
+        """Record notify() intake to commit latency.
+
+        Args:
+            priority: notification priority value
+            intake: time notify() was invoked, in seconds
+            committed: time the notification was committed,
+                in seconds; defaults to now.
+        """
+        committed = committed if committed is not None else time.time()
+        self._observe(priority, "commit", committed - intake)
+
+    def record(self, job, trace):
+        """Record latencies for a job accepted by a provider.
+
+        Args:
+            job: NotificationJob model, with its notification loaded
+            trace: dict of trace stage to timestamp in seconds
+        """
+        ready = to_timestamp(job.notification.created)
+        if job.not_before is not None:
+            ready = max(ready, to_timestamp(job.not_before))
+
+        durations = []
+        for stage, start, end in LatencyTracer.STAGES:
+            start_time = ready if start is None else trace.get(start)
+            end_time = trace.get(end)
+            if start_time is None or end_time is None:
+                continue
+            self._observe(job.priority, stage, end_time - start_time)
+            durations.append("%s=%.1fms" % (stage, (end_time - start_time) * 1000))
+
+        if self.sample_rate and self.random() < self.sample_rate:
+            self.log.info("trace notification_job_id=%s notification_id=%s priority=%s %s" \
+                    % (job.id, job.notification_id, self._priority_name(job.priority),
+                       " ".join(durations)))
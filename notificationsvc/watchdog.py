@@ -0,0 +1,153 @@
+
+import logging
+import threading
+import time
+
+
+class SendWatchdog(object):
+    """Send watchdog
+
+    This class tracks in-flight provider sends and detects
+    sends which exceed their deadline. When a send is
+    overdue the watchdog logs it, increments the
+    'notifier_send_timeouts' metric, and invokes the abort
+    callback registered with the send, which should unblock
+    the worker thread (i.e. by closing the provider socket).
+    """
+    def __init__(self, timeout, poll_seconds=1, metrics=None):
+        """Constructor.
+
+        Arguments:
+            timeout: number of seconds a send may take before
+                it is considered hung.
+            poll_seconds: number of seconds between checks
+                for overdue sends.
+            metrics: optional MetricRegistry
+        """
+        self.log = logging.getLogger(__name__)
+        self.timeout = timeout
+        self.poll_seconds = poll_seconds
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.sends = {}
+        self.next_id = 0
+        self.watchdog_thread = None
+        self.running = False
+        self.exit_event = threading.Event()
+
+        if self.metrics is not None:
+            self.metrics.register_gauge("notifier_sends_in_flight", self.in_flight)
+
+    def start(self):
+        """Start watchdog."""
+        if not self.running:
+            self.running = True
+            self.exit_event.clear()
+            self.watchdog_thread = threading.Thread(target=self.run)
+            self.watchdog_thread.daemon = True
+            self.watchdog_thread.start()
+
+    def run(self):
+        """Watchdog thread run method."""
+        while self.running:
+            try:
+                self.check()
+            except Exception as error:
+                self.log.exception(error)
+            self.exit_event.wait(self.poll_seconds)
+
+    def stop(self):
+        """Stop watchdog."""
+        if self.running:
+            self.running = False
+            self.exit_event.set()
+
+    def join(self, timeout=None):
+        """Join watchdog thread."""
+        if self.watchdog_thread is not None:
+            self.watchdog_thread.join(timeout)
+
+    def in_flight(self):
+        """Get number of in-flight sends."""
+        with self.lock:
+            return len(self.sends)
+
+    def check(self, now=None):
+        """Check for overdue sends.
+
+        Args:
+            now: optional current time, defaults to time.time()
+        Returns:
+            list of descriptions of sends which became overdue
+        """
+        now = now or time.time()
+        overdue = []
+        with self.lock:
+            for send in self.sends.values():
+                if not send["expired"] and now > send["deadline"]:
+                    send["expired"] = True
+                    overdue.append(send)
+
+        for send in overdue:
+            self.log.error("Send for %s exceeded %ss deadline (thread=%s)" \
+                    % (send["description"], self.timeout, send["thread"]))
+            if self.metrics is not None:
+                self.metrics.increment("notifier_send_timeouts")
+            if send["abort"] is not None:
+                try:
+                    send["abort"]()
+                except Exception as error:
+                    self.log.exception(error)
+
+        return [send["description"] for send in overdue]
+
+    def watch(self, description, abort=None):
+        """Watch a send.
+
+        Usage:
+            with watchdog.watch("notification_job_id=1", provider.abort):
+                provider.send(...)
+
+        Args:
+            description: string describing the send for logging
+            abort: optional callable invoked from the watchdog
+                thread if the send exceeds its deadline.
+        Returns:
+            context manager which tracks the send while entered
+        """
+        return _WatchedSend(self, description, abort)
+
+    def _register(self, description, abort):
+        with self.lock:
+            self.next_id += 1
+            self.sends[self.next_id] = {
+                "description": description,
+                "abort": abort,
+                "deadline": time.time() + self.timeout,
+                "thread": threading.current_thread().name,
+                "expired": False
+            }
+            return self.next_id
+
+    def _unregister(self, send_id):
+        with self.lock:
+            send = self.sends.pop(send_id, None)
+        return send is not None and send["expired"]
+
+
+class _WatchedSend(object):
+    """Context manager tracking a single send."""
+    def __init__(self, watchdog, description, abort):
+        self.watchdog = watchdog
+        self.description = description
+        self.abort = abort
+        self.send_id = None
+        self.expired = False
+
+    def __enter__(self):
+        self.send_id = self.watchdog._register(self.description, self.abort)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.expired = self.watchdog._unregister(self.send_id)
+        return False
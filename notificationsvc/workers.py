@@ -0,0 +1,393 @@
+import logging
+import multiprocessing
+import os
+import select
+import signal
+import threading
+import time
+
+
+def _worker_main(factory, index, count, connection, parent_pid, metrics_seconds,
+                 stop_timeout, ready, inherited):
+    """Worker process main.
+
+    Creates the worker, runs it until SIGTERM is received or
+    the parent process exits, and sends the worker's metrics
+    to the parent every metrics_seconds.
+    """
+    log = logging.getLogger(__name__)
+    exit_event = threading.Event()
+
+    # Signal handlers are inherited from the parent, so
+    # replace them: SIGTERM stops the worker, and SIGINT
+    # (i.e. ctrl-c to the process group) is left to the
+    # parent, which stops the workers. The parent doesn't
+    # send SIGTERM until ready is set.
+    signal.signal(signal.SIGTERM, lambda signum, stack_frame: exit_event.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ready.set()
+
+    # Close the parent's connections inherited by the fork,
+    # so the parent's peers see them close when it exits.
+    for inherited_connection in inherited:
+        inherited_connection.close()
+
+    worker = factory(index, count)
+    worker.start()
+    try:
+        while not exit_event.is_set():
+            if os.getppid() != parent_pid:
+                log.error("Parent process exited, stopping worker %d" % index)
+                break
+            connection.send(worker.metrics.export())
+            exit_event.wait(metrics_seconds)
+    finally:
+        worker.stop()
+        worker.join(stop_timeout)
+        try:
+            connection.send(worker.metrics.export())
+        except Exception:
+            pass
+        connection.close()
+
+
+def _zygote_main(factory, num_processes, connection, parent_connection, parent_pid,
+                 metrics_seconds, restart_seconds, stop_timeout, poll_seconds):
+    """Zygote process main.
+
+    Runs a WorkerZygote until the supervisor stops it or the
+    supervisor's process exits.
+    """
+    zygote = WorkerZygote(
+        factory=factory,
+        num_processes=num_processes,
+        connection=connection,
+        parent_pid=parent_pid,
+        metrics_seconds=metrics_seconds,
+        restart_seconds=restart_seconds,
+        stop_timeout=stop_timeout,
+        poll_seconds=poll_seconds)
+
+    signal.signal(signal.SIGTERM, lambda signum, stack_frame: zygote.stop())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    parent_connection.close()
+    zygote.run()
+
+
+class WorkerZygote(object):
+    """Single-threaded process which forks and restarts workers.
+
+    Forking a process with threads is unsafe, since only the
+    forking thread exists in the child, and locks held by the
+    others are never released. The zygote is forked by the
+    WorkerSupervisor before the service starts any threads, and
+    never starts any itself, so it can fork workers, and restart
+    them when they exit, at any time.
+
+    The zygote reports to the supervisor over connection with
+    ("started", index, pid, restarted), ("metrics", index, state)
+    and ("exited", index, pid, exitcode) messages, and accepts
+    ("signal", signum) and ("stop",) commands.
+    """
+    def __init__(
+            self,
+            factory,
+            num_processes,
+            connection,
+            parent_pid,
+            metrics_seconds,
+            restart_seconds,
+            stop_timeout,
+            poll_seconds):
+        self.log = logging.getLogger(__name__)
+        self.factory = factory
+        self.num_processes = num_processes
+        self.connection = connection
+        self.parent_pid = parent_pid
+        self.metrics_seconds = metrics_seconds
+        self.restart_seconds = restart_seconds
+        self.stop_timeout = stop_timeout
+        self.poll_seconds = poll_seconds
+        self.processes = {}
+        self.connections = {}
+        self.ready = {}
+        self.started = {}
+        self.exited = set()
+        self.running = True
+
+    def _send(self, message):
+        try:
+            self.connection.send(message)
+        except (IOError, OSError):
+            # The supervisor exited; the run loop stops
+            # once it notices the new parent.
+            pass
+
+    def _spawn(self, index, restarted=False):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        ready = multiprocessing.Event()
+        process = multiprocessing.Process(
+            target=_worker_main,
+            name="worker-%d" % index,
+            args=(self.factory, index, self.num_processes, writer, os.getpid(),
+                  self.metrics_seconds, self.stop_timeout, ready,
+                  [self.connection] + self.connections.values()))
+        process.daemon = False
+        process.start()
+        writer.close()
+        self.processes[index] = process
+        self.connections[index] = reader
+        self.ready[index] = ready
+        self.started[index] = time.time()
+        self.exited.discard(index)
+        self.log.info("Started worker %d (pid=%d)" % (index, process.pid))
+        self._send(("started", index, process.pid, restarted))
+
+    def _receive(self, index):
+        """Forward pending metrics from a worker."""
+        connection = self.connections[index]
+        try:
+            while connection.poll():
+                self._send(("metrics", index, connection.recv()))
+        except (EOFError, IOError):
+            pass
+
+    def _command(self):
+        """Handle pending commands from the supervisor."""
+        try:
+            while self.connection.poll():
+                command = self.connection.recv()
+                if command[0] == "stop":
+                    self.stop()
+                elif command[0] == "signal":
+                    for process in self.processes.values():
+                        if process.is_alive():
+                            os.kill(process.pid, command[1])
+        except (EOFError, IOError):
+            self.stop()
+
+    def _check(self):
+        """Report exited workers and restart them."""
+        for index, process in self.processes.items():
+            if process.is_alive():
+                continue
+            if index not in self.exited:
+                self.exited.add(index)
+                self._receive(index)
+                self._send(("exited", index, process.pid, process.exitcode))
+            if not self.running or \
+               time.time() - self.started[index] < self.restart_seconds:
+                continue
+            self.log.error("Worker %d (pid=%d) exited with %s, restarting" \
+                    % (index, process.pid, process.exitcode))
+            self.connections[index].close()
+            self._spawn(index, restarted=True)
+
+    def run(self):
+        """Start the workers and supervise them until stopped."""
+        for index in range(self.num_processes):
+            self._spawn(index)
+
+        while self.running:
+            try:
+                if os.getppid() != self.parent_pid:
+                    self.log.error("Supervisor process exited, stopping workers")
+                    break
+                # Exited workers' connections are always readable
+                connections = [self.connection] + [connection for index, connection
+                        in self.connections.items() if index not in self.exited]
+                try:
+                    readable = select.select(connections, [], [], self.poll_seconds)[0]
+                except select.error:
+                    # Interrupted by a signal
+                    readable = []
+                if self.connection in readable:
+                    self._command()
+                for index, connection in self.connections.items():
+                    if connection in readable:
+                        self._receive(index)
+                self._check()
+            except Exception as error:
+                self.log.exception(error)
+
+        self._shutdown()
+
+    def _shutdown(self):
+        """Stop the workers, killing them after stop_timeout."""
+        deadline = time.time() + self.stop_timeout
+        for index, process in self.processes.items():
+            # A worker which hasn't installed its SIGTERM
+            # handler yet would be killed by the signal.
+            if self.ready[index].wait(max(0, deadline - time.time())) and process.is_alive():
+                process.terminate()
+        for index, process in self.processes.items():
+            process.join(max(0, deadline - time.time()))
+            if process.is_alive():
+                self.log.error("Worker %d (pid=%d) did not exit, killing" % (index, process.pid))
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
+        self._check()
+        self.connection.close()
+
+    def stop(self):
+        """Stop the zygote, after stopping the workers."""
+        self.running = False
+
+
+class WorkerSupervisor(object):
+    """Supervisor of prefork worker processes.
+
+    Runs num_processes worker processes, each created in the
+    child by factory(index, count), which must return an object
+    with start(), stop(), join(timeout) methods and a 'metrics'
+    MetricRegistry, i.e. a NotificationProcessor claiming
+    the partition of jobs for its index.
+
+    The workers are forked by a WorkerZygote process, which is
+    forked by start(), and restarted by the zygote when they
+    exit, at most once every restart_seconds per worker. Since
+    the zygote has no threads, workers are never forked from a
+    process with threads, so start() must be invoked before
+    the service starts any threads.
+
+    Workers send their exported metrics to the supervisor
+    every metrics_seconds; metrics() returns the latest from
+    each worker, to be registered as a MetricRegistry source
+    in the parent.
+
+    stop() stops the workers, each of which stops processing
+    and finishes its in-flight jobs; workers still running
+    after stop_timeout seconds are killed.
+    """
+    def __init__(
+            self,
+            num_processes,
+            factory,
+            metrics_seconds=5,
+            restart_seconds=5,
+            stop_timeout=30,
+            poll_seconds=0.5):
+        """WorkerSupervisor constructor.
+
+        Args:
+            num_processes: number of worker processes
+            factory: callable(index, count) creating a worker
+                in the worker process
+            metrics_seconds: seconds between worker metrics updates
+            restart_seconds: minimum seconds between restarts of
+                a worker
+            stop_timeout: seconds to wait for workers to exit
+                after SIGTERM before killing them
+            poll_seconds: seconds between checks of the workers
+        """
+        self.log = logging.getLogger(__name__)
+        self.num_processes = num_processes
+        self.factory = factory
+        self.metrics_seconds = metrics_seconds
+        self.restart_seconds = restart_seconds
+        self.stop_timeout = stop_timeout
+        self.poll_seconds = poll_seconds
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.zygote = None
+        self.connection = None
+        self.pids = {}
+        self.exitcodes = {}
+        self.states = {}
+        self.restarts = 0
+        self.running = False
+        self.monitor_thread = None
+
+    def start(self):
+        """Start the zygote, which starts the workers, and the monitor thread."""
+        if not self.running:
+            self.running = True
+            self.connection, zygote_connection = multiprocessing.Pipe()
+            self.zygote = multiprocessing.Process(
+                target=_zygote_main,
+                name="worker-zygote",
+                args=(self.factory, self.num_processes, zygote_connection,
+                      self.connection, os.getpid(), self.metrics_seconds,
+                      self.restart_seconds, self.stop_timeout, self.poll_seconds))
+            self.zygote.daemon = False
+            self.zygote.start()
+            zygote_connection.close()
+            self.monitor_thread = threading.Thread(target=self.run, name="WorkerSupervisor")
+            self.monitor_thread.daemon = True
+            self.monitor_thread.start()
+
+    def _handle(self, message):
+        """Handle a message from the zygote."""
+        with self.lock:
+            if message[0] == "metrics":
+                self.states[message[1]] = message[2]
+            elif message[0] == "started":
+                index, pid, restarted = message[1:]
+                self.pids[index] = pid
+                self.exitcodes.pop(index, None)
+                if restarted:
+                    self.restarts += 1
+            elif message[0] == "exited":
+                index, pid, exitcode = message[1:]
+                if self.pids.get(index) == pid:
+                    del self.pids[index]
+                self.exitcodes[index] = exitcode
+
+    def run(self):
+        """Monitor thread run method."""
+        while True:
+            try:
+                message = self.connection.recv()
+            except (EOFError, IOError):
+                break
+            try:
+                self._handle(message)
+            except Exception as error:
+                self.log.exception(error)
+
+        if self.running:
+            self.log.error("Worker zygote (pid=%d) exited" % self.zygote.pid)
+        with self.lock:
+            self.pids.clear()
+        self.zygote.join()
+
+    def _command(self, command):
+        """Send a command to the zygote."""
+        with self.send_lock:
+            try:
+                self.connection.send(command)
+            except (IOError, OSError) as error:
+                self.log.error("Unable to send %s to worker zygote: %s" % (command[0], error))
+
+    def stop(self):
+        """Stop the workers."""
+        if self.running:
+            self.running = False
+            self._command(("stop",))
+
+    def join(self, timeout=None):
+        """Join the monitor thread, which exits once all workers have."""
+        if self.monitor_thread is not None:
+            self.monitor_thread.join(timeout)
+
+    def signal(self, signum):
+        """Send a signal to every worker.
+
+        Args:
+            signum: signal number
+        """
+        self._command(("signal", signum))
+
+    def alive(self):
+        """Number of worker processes running."""
+        with self.lock:
+            return len(self.pids)
+
+    def metrics(self):
+        """Latest exported metrics of each worker.
+
+        Returns:
+            list of MetricRegistry.export() results
+        """
+        with self.lock:
+            return self.states.values()
@@ -0,0 +1,74 @@
+import os
+import sys
+import threading
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from providers.batch import BatchTimeoutException, RequestBatcher
+from providers.exceptions import OutcomeUnknownException
+
+
+class RequestBatcherTest(unittest.TestCase):
+    """
+        Test the RequestBatcher.
+    """
+
+    def setUp(self):
+        self.batches = []
+        self.sending = threading.Event()
+        self.unblock = threading.Event()
+        self.unblock.set()
+
+    def tearDown(self):
+        self.unblock.set()
+        self.batcher.stop()
+        self.batcher.join(5)
+
+    def _send_batch(self, key, items):
+        self.sending.set()
+        self.unblock.wait(5)
+        self.batches.append(items)
+        return ["result-%s" % item for item in items]
+
+    def _create_batcher(self, max_batch_size=10, max_delay=0.05):
+        self.batcher = RequestBatcher(self._send_batch, max_batch_size, max_delay)
+        return self.batcher
+
+    def test_batching(self):
+        batcher = self._create_batcher(max_batch_size=3, max_delay=5)
+        items = [batcher.submit(i) for i in range(3)]
+        self.assertEqual([item.wait(5) for item in items],
+                         ["result-0", "result-1", "result-2"])
+        self.assertEqual(self.batches, [[0, 1, 2]])
+
+    def test_timeout_cancels_pending(self):
+        batcher = self._create_batcher(max_delay=0.5)
+        item = batcher.submit(1)
+        with self.assertRaises(BatchTimeoutException):
+            item.wait(0.05)
+        self.assertEqual(batcher.depth(), 0)
+
+        # The cancelled item isn't sent with later items
+        self.assertEqual(batcher.submit(2).wait(5), "result-2")
+        self.assertEqual(self.batches, [[2]])
+
+    def test_timeout_in_flight(self):
+        batcher = self._create_batcher(max_batch_size=1)
+        self.unblock.clear()
+        item = batcher.submit(1)
+        self.assertTrue(self.sending.wait(5))
+        with self.assertRaises(OutcomeUnknownException):
+            item.wait(0.05)
+
+        self.unblock.set()
+        batcher.stop()
+        batcher.join(5)
+        self.assertEqual(self.batches, [[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from providers.base import EmailProvider
+from providers.breaker import CircuitBreaker, CircuitBreakerProvider
+from providers.exceptions import CircuitOpenException, InvalidParameterException
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FailingEmailProvider(EmailProvider):
+    def __init__(self):
+        super(FailingEmailProvider, self).__init__('FailingEmailProvider')
+        self.error = None
+        self.sends = 0
+
+    def send(self, recipient, subject, plain_text, html_text):
+        self.sends += 1
+        if self.error is not None:
+            raise self.error
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    """
+        Test the CircuitBreaker and CircuitBreakerProvider.
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30, clock=self.clock)
+        self.provider = FailingEmailProvider()
+        self.breaker_provider = CircuitBreakerProvider(
+            self.provider, self.breaker, ignore_exceptions=(InvalidParameterException,))
+
+    def _send(self):
+        self.breaker_provider.send(
+            recipient="test@techresidents.com",
+            subject="subject",
+            plain_text="plain",
+            html_text=None)
+
+    def test_opens_after_threshold(self):
+        self.provider.error = IOError("relay down")
+        for i in range(3):
+            self.assertTrue(self.breaker_provider.is_available())
+            with self.assertRaises(IOError):
+                self._send()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker_provider.is_available())
+        with self.assertRaises(CircuitOpenException):
+            self._send()
+        self.assertEqual(self.provider.sends, 3)
+
+    def test_success_resets_failures(self):
+        self.provider.error = IOError("relay down")
+        for i in range(2):
+            with self.assertRaises(IOError):
+                self._send()
+        self.provider.error = None
+        self._send()
+        self.assertEqual(self.breaker.failures, 0)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_ignored_exceptions(self):
+        self.provider.error = InvalidParameterException()
+        for i in range(5):
+            with self.assertRaises(InvalidParameterException):
+                self._send()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_ignored_exceptions_keep_failures(self):
+        self.provider.error = IOError("relay down")
+        for i in range(2):
+            with self.assertRaises(IOError):
+                self._send()
+        self.provider.error = InvalidParameterException()
+        with self.assertRaises(InvalidParameterException):
+            self._send()
+        self.assertEqual(self.breaker.failures, 2)
+
+    def test_ignored_exception_releases_probe(self):
+        for i in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 30
+
+        # An ignored probe neither closes nor reopens the breaker,
+        # but lets another request probe.
+        self.provider.error = InvalidParameterException()
+        with self.assertRaises(InvalidParameterException):
+            self._send()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.available())
+
+        self.provider.error = IOError("relay down")
+        with self.assertRaises(IOError):
+            self._send()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_half_open_single_probe(self):
+        for i in range(3):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.clock.now += 30
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.available())
+        self.assertTrue(self.breaker.allow())
+
+        # Only one probe allowed
+        self.assertFalse(self.breaker.available())
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_half_open_probe_failure_reopens(self):
+        for i in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_abandoned_probe(self):
+        for i in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import datetime
+import os
+import sys
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from cancellation import CancellationSet
+from models import create_tables, NotificationCancellation
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CancellationSetTest(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        create_tables(engine)
+        self.db_session_factory = sessionmaker(bind=engine)
+        self.clock = Clock()
+        self.cancellations = CancellationSet(
+            db_session_factory=self.db_session_factory,
+            retention_seconds=60,
+            clock=self.clock)
+
+    def _cancel(self, notification_id):
+        db_session = self.db_session_factory()
+        try:
+            db_session.add(NotificationCancellation(
+                created=datetime.datetime.utcnow(),
+                notification_id=notification_id,
+                context="test"))
+            db_session.commit()
+        finally:
+            db_session.close()
+
+    def test_starts_at_latest(self):
+        self._cancel(1)
+        self.assertEqual(self.cancellations.refresh(), 0)
+        self.assertFalse(1 in self.cancellations)
+
+    def test_incremental_refresh(self):
+        self.cancellations.refresh()
+        self._cancel(1)
+        self._cancel(2)
+        self.assertEqual(self.cancellations.refresh(), 2)
+        self.assertTrue(1 in self.cancellations)
+        self.assertTrue(2 in self.cancellations)
+        self.assertEqual(self.cancellations.refresh(), 0)
+
+        self._cancel(3)
+        self.assertEqual(self.cancellations.refresh(), 1)
+        self.assertEqual(len(self.cancellations), 3)
+
+    def test_add(self):
+        self.cancellations.add(5)
+        self.assertTrue(5 in self.cancellations)
+        self.assertFalse(6 in self.cancellations)
+
+    def test_retention(self):
+        self.cancellations.refresh()
+        self._cancel(1)
+        self.cancellations.refresh()
+        self.clock.now += 30
+        self.cancellations.add(2)
+        self.clock.now += 30
+        self.cancellations.refresh()
+        self.assertFalse(1 in self.cancellations)
+        self.assertTrue(2 in self.cancellations)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from concurrency import AdaptiveConcurrencyLimiter
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class AdaptiveConcurrencyLimiterTest(unittest.TestCase):
+    """
+        Test the AdaptiveConcurrencyLimiter.
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = AdaptiveConcurrencyLimiter(
+            min_limit=1,
+            max_limit=8,
+            latency_target=1.0,
+            initial_limit=4,
+            clock=self.clock)
+
+    def _send(self, latency, failed=False, throttled=False):
+        slot = self.limiter.acquire()
+        self.clock.now += latency
+        slot.record(latency, failed=failed, throttled=throttled)
+        self.limiter.release(slot)
+
+    def test_acquire_bounded_by_limit(self):
+        slots = [self.limiter.acquire() for i in range(4)]
+        self.assertIsNone(self.limiter.acquire(timeout=0))
+        self.limiter.release(slots.pop())
+        self.assertIsNotNone(self.limiter.acquire(timeout=0))
+
+    def test_additive_increase(self):
+        for i in range(100):
+            self._send(0.1)
+        self.assertEqual(self.limiter.limit, 8)
+
+    def test_multiplicative_decrease_on_throttle(self):
+        self._send(0.1, throttled=True)
+        self.assertEqual(self.limiter.limit, 2)
+        self._send(0.1, throttled=True)
+        self.assertEqual(self.limiter.limit, 1)
+        self._send(0.1, throttled=True)
+        self.assertEqual(self.limiter.limit, 1)
+
+    def test_decrease_on_latency(self):
+        self._send(2.0)
+        self.assertEqual(self.limiter.limit, 2)
+
+    def test_single_decrease_per_round(self):
+        slots = [self.limiter.acquire() for i in range(4)]
+        self.clock.now += 0.1
+        for slot in slots:
+            slot.record(0.1, throttled=True)
+            self.limiter.release(slot)
+        self.assertEqual(self.limiter.limit, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import datetime
+import json
+import os
+import sys
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trsvcscore.db.models import Notification as NotificationModel
+from trsvcscore.db.models import NotificationJob as NotificationJobModel
+
+from deadletter import create_dead_letter, query_dead_letters, replay_dead_letters
+from models import create_tables, NotificationDeadLetter
+
+
+class DeadLetterTest(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        NotificationJobModel.metadata.create_all(bind=engine, checkfirst=True)
+        create_tables(engine)
+        self.db_session_factory = sessionmaker(bind=engine)
+        self.db_session = self.db_session_factory()
+        self.now = datetime.datetime.utcnow()
+        self.notifications = 0
+
+    def tearDown(self):
+        self.db_session.close()
+
+    def _notification(self, context="test"):
+        self.notifications += 1
+        notification = NotificationModel(
+            created=self.now,
+            token="token%d" % self.notifications,
+            context=context,
+            priority=50,
+            subject="subject",
+            plain_text="text",
+            html_text="html")
+        self.db_session.add(notification)
+        self.db_session.flush()
+        return notification
+
+    def _job(self, notification, recipient_id, successful=False, retries_remaining=0):
+        job = NotificationJobModel(
+            created=self.now,
+            not_before=self.now,
+            notification_id=notification.id,
+            recipient_id=recipient_id,
+            priority=notification.priority,
+            retries_remaining=retries_remaining,
+            owner="notificationsvc",
+            start=self.now,
+            end=self.now,
+            successful=successful)
+        self.db_session.add(job)
+        self.db_session.flush()
+        return job
+
+    def _dead_letter(self, context="test", recipient_id=1, error=None):
+        notification = self._notification(context)
+        job = self._job(notification, recipient_id)
+        dead_letter = create_dead_letter(self.db_session, job, error or RuntimeError("failed"))
+        self.db_session.commit()
+        return dead_letter
+
+    def _jobs(self, notification_id):
+        return self.db_session.query(NotificationJobModel).\
+            filter(NotificationJobModel.notification_id==notification_id).\
+            filter(NotificationJobModel.owner==None).\
+            order_by(NotificationJobModel.id).\
+            all()
+
+    def test_create(self):
+        notification = self._notification()
+        self._job(notification, 1, retries_remaining=1)
+        self._job(notification, 2)
+        failed_job = self._job(notification, 1)
+
+        dead_letter = create_dead_letter(self.db_session, failed_job, ValueError("bounced"))
+        self.db_session.commit()
+
+        self.assertEqual(dead_letter.job_id, failed_job.id)
+        self.assertEqual(dead_letter.notification_id, notification.id)
+        self.assertEqual(dead_letter.recipient_id, 1)
+        self.assertEqual(dead_letter.context, "test")
+        self.assertEqual(dead_letter.error_class, "ValueError")
+        self.assertEqual(dead_letter.error_message, "bounced")
+        self.assertIsNone(dead_letter.replayed)
+
+        # Attempts only include jobs for the same recipient
+        attempts = json.loads(dead_letter.attempts)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(attempts[-1]["job_id"], failed_job.id)
+        self.assertFalse(attempts[-1]["successful"])
+
+    def test_query(self):
+        first = self._dead_letter(context="a", error=ValueError())
+        second = self._dead_letter(context="b", error=KeyError())
+        third = self._dead_letter(context="a", error=KeyError())
+
+        def ids(**kwargs):
+            return [dead_letter.id for dead_letter in
+                    query_dead_letters(self.db_session, **kwargs)]
+
+        self.assertEqual(ids(), [first.id, second.id, third.id])
+        self.assertEqual(ids(context="a"), [first.id, third.id])
+        self.assertEqual(ids(error_class="KeyError"), [second.id, third.id])
+        self.assertEqual(ids(context="a", error_class="KeyError"), [third.id])
+        self.assertEqual(ids(until=self.now - datetime.timedelta(hours=1)), [])
+
+        second.replayed = self.now
+        self.db_session.commit()
+        self.assertEqual(ids(), [first.id, third.id])
+        self.assertEqual(ids(include_replayed=True), [first.id, second.id, third.id])
+
+    def test_replay(self):
+        dead_letters = [self._dead_letter(context="replay", recipient_id=index)
+                        for index in range(5)]
+        skipped = self._dead_letter(context="other")
+        notification_ids = [dead_letter.notification_id for dead_letter in dead_letters]
+
+        replayed = replay_dead_letters(
+            self.db_session_factory,
+            retries_remaining=2,
+            context="replay",
+            chunk_size=2,
+            rate=4)
+        self.assertEqual(replayed, 5)
+        self.db_session.expire_all()
+
+        # One new, unclaimed job per dead letter, for its recipient
+        jobs = []
+        for index, notification_id in enumerate(notification_ids):
+            notification_jobs = self._jobs(notification_id)
+            self.assertEqual(len(notification_jobs), 1)
+            job = notification_jobs[0]
+            self.assertEqual(job.recipient_id, index)
+            self.assertEqual(job.retries_remaining, 2)
+            self.assertIsNone(job.end)
+            jobs.append(job)
+        self.assertEqual(self._jobs(skipped.notification_id), [])
+
+        # not_before is staggered by 1/rate seconds, across chunks
+        for previous, job in zip(jobs, jobs[1:]):
+            spacing = (job.not_before - previous.not_before).total_seconds()
+            self.assertAlmostEqual(spacing, 0.25, delta=0.01)
+
+        # Replayed dead letters are marked, and not replayed again
+        self.assertEqual(
+            query_dead_letters(self.db_session, context="replay").count(), 0)
+        self.assertEqual(replay_dead_letters(
+            self.db_session_factory, retries_remaining=2, context="replay"), 0)
+
+    def test_replay_limit(self):
+        for index in range(3):
+            self._dead_letter(recipient_id=index)
+
+        self.assertEqual(replay_dead_letters(
+            self.db_session_factory, retries_remaining=0, limit=2, chunk_size=1), 2)
+        self.assertEqual(query_dead_letters(self.db_session).count(), 1)
+        self.assertEqual(self.db_session.query(NotificationDeadLetter).\
+            filter(NotificationDeadLetter.replayed!=None).count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import sys
+import threading
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from providers.emailapi import EmailApiClient, HttpEmailApiProvider
+from providers.exceptions import InvalidParameterException, ProviderRequestException
+from providers.http import HttpConnectionPool
+
+from fakehttp import FakeEmailApi
+
+
+class EmailApiProviderTest(unittest.TestCase):
+    """
+        Test the HttpEmailApiProvider against a local FakeEmailApi.
+    """
+
+    def setUp(self):
+        self.api = FakeEmailApi()
+        self.api.start()
+        self.connection_pool = HttpConnectionPool(
+            host=self.api.host,
+            port=self.api.port,
+            size=4,
+            timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        self.api.stop()
+
+    def _create_provider(self, max_batch_size=100, max_batch_delay=0.01, compress=True):
+        self.client = EmailApiClient(
+            connection_pool=self.connection_pool,
+            path=self.api.path,
+            from_email="Support <support@techresidents.com>",
+            max_batch_size=max_batch_size,
+            max_batch_delay=max_batch_delay,
+            compress=compress,
+            timeout=5)
+        return HttpEmailApiProvider(self.client)
+
+    def test_send(self):
+        provider = self._create_provider()
+        message_id = provider.send(
+            recipient="user@techresidents.com",
+            subject="subject",
+            plain_text="plain text",
+            html_text="<p>html text</p>")
+        self.assertIsNotNone(message_id)
+        self.assertEqual(self.api.emails, [{
+            "to": "user@techresidents.com",
+            "subject": "subject",
+            "plain_text": "plain text",
+            "html_text": "<p>html text</p>"
+        }])
+
+    def test_send_uncompressed(self):
+        provider = self._create_provider(compress=False)
+        provider.send(
+            recipient="user@techresidents.com",
+            subject="subject",
+            plain_text="plain text",
+            html_text=None)
+        self.assertEqual(len(self.api.emails), 1)
+        self.assertEqual(self.api.emails[0]["plain_text"], "plain text")
+        self.assertIsNone(self.api.emails[0]["html_text"])
+
+    def test_send_invalid(self):
+        provider = self._create_provider()
+        with self.assertRaises(InvalidParameterException):
+            provider.send(recipient=None, subject="subject", plain_text="text", html_text=None)
+        with self.assertRaises(InvalidParameterException):
+            provider.send(recipient="user@techresidents.com", subject="subject",
+                    plain_text=None, html_text=None)
+
+    def test_substitutions(self):
+        provider = self._create_provider()
+        provider.send(
+            recipient="user@techresidents.com",
+            subject="Hi $first_name",
+            plain_text="Dear ${first_name} $last_name, costs $$5",
+            html_text=None,
+            substitutions={"first_name": "Jane", "last_name": "Doe"})
+        self.assertEqual(self.api.emails[0]["subject"], "Hi Jane")
+        self.assertEqual(self.api.emails[0]["plain_text"], "Dear Jane Doe, costs $5")
+
+    def test_rejected(self):
+        provider = self._create_provider()
+        self.api.rejected_emails.add("bad@techresidents.com")
+        with self.assertRaises(ProviderRequestException) as context:
+            provider.send(recipient="bad@techresidents.com", subject="subject",
+                    plain_text="text", html_text=None)
+        self.assertFalse(provider.is_throttle_error(context.exception))
+
+    def test_throttled(self):
+        provider = self._create_provider()
+        self.api.throttle_requests = 1
+        with self.assertRaises(ProviderRequestException) as context:
+            provider.send(recipient="user@techresidents.com", subject="subject",
+                    plain_text="text", html_text=None)
+        self.assertTrue(provider.is_throttle_error(context.exception))
+
+    def test_batching(self):
+        provider = self._create_provider(max_batch_size=10, max_batch_delay=0.5)
+        self.api.rejected_emails.add("user9@techresidents.com")
+        errors = []
+
+        def send(index):
+            try:
+                provider.send(
+                    recipient="user%d@techresidents.com" % index,
+                    subject="Hi $first_name",
+                    plain_text="text",
+                    html_text=None,
+                    substitutions={"first_name": "user%d" % index, "last_name": ""})
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.api.requests), 1)
+        self.assertEqual(len(self.api.emails), 9)
+        for email in self.api.emails:
+            self.assertEqual(email["subject"], "Hi %s" % email["to"].split("@")[0])
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], ProviderRequestException)
+
+
+if __name__ == '__main__':
+    unittest.main()
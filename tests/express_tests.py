@@ -0,0 +1,139 @@
+import datetime
+import os
+import sys
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trsvcscore.db.models import Notification as NotificationModel
+from trsvcscore.db.models import NotificationJob as NotificationJobModel
+
+import settings
+
+from constants import EMAIL_CHANNEL, SMS_CHANNEL
+from metrics import MetricRegistry
+from models import create_tables, NotificationChannelPreference, NotificationJobLease
+from processor import NotificationProcessor
+
+
+class ExpressLaneTest(unittest.TestCase):
+    """
+        Test the NotificationProcessor's express lane.
+
+        The processor isn't started, so expressed jobs stay
+        queued on their channel's thread pool.
+    """
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        NotificationJobModel.metadata.create_all(bind=engine, checkfirst=True)
+        create_tables(engine)
+        self.db_session_factory = sessionmaker(bind=engine)
+        self.db_session = self.db_session_factory()
+        self.now = datetime.datetime.utcnow()
+
+        # Recipient 2's primary channel is sms
+        self.db_session.add_all([
+            NotificationChannelPreference(user_id=2, channel=EMAIL_CHANNEL, enabled=False),
+            NotificationChannelPreference(user_id=2, channel=SMS_CHANNEL, address="+15555550102", enabled=True)
+        ])
+        self.db_session.commit()
+
+        # Expressed jobs are leased if leases are enabled
+        self.leases_setting = settings.NOTIFIER_LEASES
+        settings.NOTIFIER_LEASES = True
+
+        self.metrics = MetricRegistry()
+        self.processor = NotificationProcessor(
+            db_session_factory=self.db_session_factory,
+            metrics=self.metrics)
+
+    def tearDown(self):
+        settings.NOTIFIER_LEASES = self.leases_setting
+        self.db_session.close()
+
+    def _fallbacks(self):
+        return self.metrics.get("notifier_express_fallbacks", 0)
+
+    def _claimed_job(self, recipient_id):
+        notification = NotificationModel(
+            created=self.now,
+            token="token%d" % recipient_id,
+            context="test",
+            priority=10,
+            subject="subject",
+            plain_text="text",
+            html_text="html")
+        self.db_session.add(notification)
+        self.db_session.flush()
+        job = NotificationJobModel(
+            created=self.now,
+            not_before=self.now,
+            notification_id=notification.id,
+            recipient_id=recipient_id,
+            priority=notification.priority,
+            retries_remaining=0,
+            owner=settings.SERVICE,
+            start=self.now)
+        self.db_session.add(job)
+        self.db_session.flush()
+        return (job.id, job.notification_id, job.recipient_id, job.priority)
+
+    def test_express(self):
+        # Each channel pool has an idle thread
+        self.assertTrue(self.processor.express_capacity([1, 2]))
+        self.assertEqual(self._fallbacks(), 0)
+
+        jobs = [self._claimed_job(1), self._claimed_job(2)]
+        job_ids = [job[0] for job in jobs]
+        self.processor.express_claim(self.db_session, job_ids)
+        self.db_session.commit()
+        self.processor.express(jobs)
+
+        self.assertEqual(self.processor.thread_pools[EMAIL_CHANNEL].depth(), 1)
+        self.assertEqual(self.processor.thread_pools[SMS_CHANNEL].depth(), 1)
+        self.assertEqual(self.metrics.get("notifier_express_jobs"), 2)
+        self.assertEqual(self.db_session.query(NotificationJobLease).\
+            filter(NotificationJobLease.job_id.in_(job_ids)).count(), 2)
+        for job_id in job_ids:
+            self.assertIsNotNone(self.processor.leases.token(job_id))
+
+    def test_fallback_too_many_recipients(self):
+        recipient_ids = range(100, 101 + settings.NOTIFIER_EXPRESS_MAX_RECIPIENTS)
+        self.assertFalse(self.processor.express_capacity(recipient_ids))
+        self.assertEqual(self._fallbacks(), 1)
+
+    def test_fallback_busy_pool(self):
+        # The email pool has one idle thread, for one recipient
+        self.assertFalse(self.processor.express_capacity([1, 3]))
+        self.assertEqual(self._fallbacks(), 1)
+
+        # Expressed jobs waiting for a thread use the pool's capacity
+        job = self._claimed_job(1)
+        self.db_session.commit()
+        self.processor.express([job])
+        self.assertFalse(self.processor.express_capacity([3]))
+        self.assertEqual(self._fallbacks(), 2)
+        self.assertTrue(self.processor.express_capacity([2]))
+        self.assertEqual(self._fallbacks(), 2)
+
+    def test_fallback_open_breaker(self):
+        breaker = self.processor.breakers[EMAIL_CHANNEL]
+        for i in range(settings.EMAIL_PROVIDER_BREAKER_FAILURE_THRESHOLD):
+            breaker.record_failure()
+        self.assertFalse(self.processor.express_capacity([1]))
+        self.assertEqual(self._fallbacks(), 1)
+
+        # Recipients on other channels are unaffected
+        self.assertTrue(self.processor.express_capacity([2]))
+        self.assertEqual(self._fallbacks(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,263 @@
+
+import BaseHTTPServer
+import gzip
+import json
+import SocketServer
+import threading
+import time
+import uuid
+from cStringIO import StringIO
+
+
+class FakeHttpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """In-process HTTP/1.1 keep-alive server for tests and benchmarks.
+
+    Subclasses implement respond() to produce a response.
+    The server records the number of connections and requests so
+    tests can verify connection reuse and batching. If
+    close_connections is set, connections are closed after each
+    response without a 'Connection: close' header, as a server
+    closing idle keep-alive connections would.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="localhost", port=0, latency=0):
+        """Constructor.
+
+        Args:
+            host: interface to listen on
+            port: port to listen on; 0 picks a free port.
+            latency: seconds to delay each response
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), _FakeHttpRequestHandler)
+        self.host, self.port = self.server_address
+        self.latency = latency
+        self.close_connections = False
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.thread = None
+
+    def start(self):
+        """Start serving in a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop serving."""
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def respond(self, method, path, headers, body):
+        """Handle request.
+
+        Args:
+            method: HTTP method
+            path: request path
+            headers: request headers (mimetools.Message)
+            body: request body string
+        Returns:
+            (status, body string, dict of headers)
+        """
+        return 200, "", {}
+
+
+class _FakeHttpRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Buffer the response so it is written in a single send,
+    # avoiding Nagle / delayed ACK stalls on keep-alive connections.
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        length = int(self.headers.getheader("content-length") or 0)
+        body = self.rfile.read(length) if length else ""
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, body))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        status, response_body, headers = self.server.respond(
+                self.command, self.path, self.headers, body)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+        if self.server.close_connections:
+            self.close_connection = 1
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class FakeSmsGateway(FakeHttpServer):
+    """Stand-in for an HTTP SMS gateway API.
+
+    Accepts batched messages in the format used by
+    SmsGatewayClient and returns a result per message.
+
+    Attributes:
+        messages: list of accepted message dicts
+        rejected_numbers: set of recipient numbers to reject
+        throttle_requests: number of upcoming requests to
+            reject with HTTP 429.
+    """
+    def __init__(self, host="localhost", port=0, latency=0, path="/v1/messages"):
+        FakeHttpServer.__init__(self, host, port, latency)
+        self.path = path
+        self.messages = []
+        self.rejected_numbers = set()
+        self.throttle_requests = 0
+
+    def respond(self, method, path, headers, body):
+        if method != "POST" or path != self.path:
+            return 404, "", {}
+
+        with self.lock:
+            if self.throttle_requests > 0:
+                self.throttle_requests -= 1
+                return 429, "", {}
+
+        results = []
+        for message in json.loads(body)["messages"]:
+            if message["to"] in self.rejected_numbers:
+                results.append({
+                    "id": message["id"],
+                    "status": "rejected",
+                    "error": "invalid number"
+                })
+            else:
+                with self.lock:
+                    self.messages.append(message)
+                results.append({
+                    "id": message["id"],
+                    "status": "accepted",
+                    "messageId": uuid.uuid4().hex
+                })
+
+        return 200, json.dumps({"results": results}), {"Content-Type": "application/json"}
+
+
+class FakeEmailApi(FakeHttpServer):
+    """Stand-in for a SendGrid-style HTTP batch email API.
+
+    Accepts optionally gzip compressed messages in the format
+    used by EmailApiClient, renders substitutions for each
+    personalization, and returns a result per personalization.
+
+    Attributes:
+        emails: list of delivered email dicts with 'to',
+            'subject', 'plain_text' and 'html_text' keys.
+        rejected_emails: set of recipient addresses to reject
+        throttle_requests: number of upcoming requests to
+            reject with HTTP 429.
+    """
+    def __init__(self, host="localhost", port=0, latency=0, path="/v3/mail/send"):
+        FakeHttpServer.__init__(self, host, port, latency)
+        self.path = path
+        self.emails = []
+        self.rejected_emails = set()
+        self.throttle_requests = 0
+
+    def _render(self, text, substitutions):
+        if text is None:
+            return None
+        for tag, value in substitutions.items():
+            text = text.replace(tag, value)
+        return text
+
+    def respond(self, method, path, headers, body):
+        if method != "POST" or path != self.path:
+            return 404, "", {}
+
+        with self.lock:
+            if self.throttle_requests > 0:
+                self.throttle_requests -= 1
+                return 429, "", {}
+
+        if headers.getheader("content-encoding") == "gzip":
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+        message = json.loads(body)
+        content = dict((item["type"], item["value"]) for item in message["content"])
+
+        results = []
+        for personalization in message["personalizations"]:
+            id = personalization["custom_args"]["id"]
+            to = personalization["to"][0]["email"]
+            if to in self.rejected_emails:
+                results.append({
+                    "id": id,
+                    "status": "rejected",
+                    "error": "invalid address"
+                })
+                continue
+
+            substitutions = personalization.get("substitutions", {})
+            with self.lock:
+                self.emails.append({
+                    "to": to,
+                    "subject": self._render(message["subject"], substitutions),
+                    "plain_text": self._render(content.get("text/plain"), substitutions),
+                    "html_text": self._render(content.get("text/html"), substitutions)
+                })
+            results.append({
+                "id": id,
+                "status": "accepted",
+                "messageId": uuid.uuid4().hex
+            })
+
+        return 200, json.dumps({"results": results}), {"Content-Type": "application/json"}
+
+
+class FakeWebhookEndpoint(FakeHttpServer):
+    """Stand-in for webhook endpoints.
+
+    Accepts batched events POSTed by WebhookClient to any path,
+    recording the events and signature headers per path.
+
+    Attributes:
+        events: dict of path to list of received event dicts
+        signatures: list of (timestamp, signature, body) tuples
+        fail_requests: number of upcoming requests to
+            reject with HTTP 500.
+    """
+    def __init__(self, host="localhost", port=0, latency=0):
+        FakeHttpServer.__init__(self, host, port, latency)
+        self.events = {}
+        self.signatures = []
+        self.fail_requests = 0
+
+    def url(self, path):
+        """Returns the endpoint URL for a path."""
+        return "http://%s:%d%s" % (self.host, self.port, path)
+
+    def respond(self, method, path, headers, body):
+        if method != "POST":
+            return 405, "", {}
+
+        with self.lock:
+            if self.fail_requests > 0:
+                self.fail_requests -= 1
+                return 500, "", {}
+
+            self.signatures.append((
+                headers.getheader("x-notification-timestamp"),
+                headers.getheader("x-notification-signature"),
+                body))
+            self.events.setdefault(path, []).extend(json.loads(body)["events"])
+
+        return 204, "", {}
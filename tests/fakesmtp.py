@@ -0,0 +1,316 @@
+
+import base64
+import random
+import SocketServer
+import threading
+import time
+
+
+class FakeSmtpMessage(object):
+    """Message accepted by FakeSmtpServer."""
+    def __init__(self, mail_from, rcpt_tos, data):
+        self.mail_from = mail_from
+        self.rcpt_tos = rcpt_tos
+        self.data = data
+
+
+class FakeSmtpServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """In-process SMTP server for tests and benchmarks.
+
+    Supports HELO/EHLO, AUTH PLAIN/LOGIN, PIPELINING (commands are
+    read and answered in order, so pipelined clients just work),
+    MAIL, RCPT, DATA, RSET, NOOP and QUIT. STARTTLS is not offered.
+
+    Faults are injected deterministically from a seeded random
+    generator, so benchmarks of pooling, pipelining and retry
+    behavior are repeatable:
+
+        latency: dict of command ('CONNECT', 'EHLO', 'MAIL', 'RCPT',
+            'DATA', ...) to seconds to delay the reply. 'DATA'
+            delays the reply after the message body is received.
+        transient_error_rate: probability of replying 451 to a
+            MAIL, RCPT or end of DATA.
+        permanent_error_rate: probability of replying 550 instead.
+        disconnect_rate: probability of closing the connection
+            without replying, for any command.
+        max_messages_per_second: throughput cap; messages over the
+            cap are rejected with 421 and the connection is closed.
+
+    Attributes:
+        messages: list of accepted FakeSmtpMessages
+        connections: number of connections accepted
+        commands: dict of command to number received
+        errors: number of injected errors and disconnects
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(
+            self,
+            host="localhost",
+            port=0,
+            latency=None,
+            transient_error_rate=0,
+            permanent_error_rate=0,
+            disconnect_rate=0,
+            max_messages_per_second=None,
+            username=None,
+            password=None,
+            seed=0):
+        """Constructor.
+
+        Args:
+            host: interface to listen on
+            port: port to listen on; 0 picks a free port.
+            latency: optional dict of command to reply delay seconds
+            transient_error_rate: probability of 451 replies
+            permanent_error_rate: probability of 550 replies
+            disconnect_rate: probability of dropping the connection
+            max_messages_per_second: optional throughput cap
+            username: optional username required by AUTH
+            password: optional password required by AUTH
+            seed: random seed for fault injection
+        """
+        SocketServer.TCPServer.__init__(self, (host, port), _FakeSmtpRequestHandler)
+        self.host, self.port = self.server_address
+        self.latency = latency or {}
+        self.transient_error_rate = transient_error_rate
+        self.permanent_error_rate = permanent_error_rate
+        self.disconnect_rate = disconnect_rate
+        self.max_messages_per_second = max_messages_per_second
+        self.username = username
+        self.password = password
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self.commands = {}
+        self.errors = 0
+        self.window_start = time.time()
+        self.window_messages = 0
+        self.thread = None
+
+    def start(self):
+        """Start serving in a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop serving."""
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def delay(self, command):
+        """Sleep for the configured latency of command."""
+        seconds = self.latency.get(command)
+        if seconds:
+            time.sleep(seconds)
+
+    def fault(self, command):
+        """Choose an injected fault for a command.
+
+        Returns:
+            None, 'disconnect', or an SMTP error reply line.
+        """
+        with self.lock:
+            self.commands[command] = self.commands.get(command, 0) + 1
+            value = self.random.random()
+            if value < self.disconnect_rate:
+                self.errors += 1
+                return "disconnect"
+            if command not in ("MAIL", "RCPT", "DATA"):
+                return None
+            value -= self.disconnect_rate
+            if value < self.transient_error_rate:
+                self.errors += 1
+                return "451 4.3.0 Temporary failure"
+            value -= self.transient_error_rate
+            if value < self.permanent_error_rate:
+                self.errors += 1
+                return "550 5.7.1 Rejected"
+        return None
+
+    def admit(self):
+        """Check the throughput cap for a new message.
+
+        Returns:
+            True if the message is within the cap.
+        """
+        if self.max_messages_per_second is None:
+            return True
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= 1.0:
+                self.window_start = now
+                self.window_messages = 0
+            if self.window_messages >= self.max_messages_per_second:
+                self.errors += 1
+                return False
+            self.window_messages += 1
+            return True
+
+
+class _Disconnect(Exception):
+    pass
+
+
+class _FakeSmtpRequestHandler(SocketServer.StreamRequestHandler):
+
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+        self.reset()
+        self.authenticated = self.server.username is None
+
+    def reset(self):
+        self.mail_from = None
+        self.rcpt_tos = []
+
+    def reply(self, line):
+        self.wfile.write(line + "\r\n")
+        self.wfile.flush()
+
+    def readline(self):
+        line = self.rfile.readline()
+        if not line:
+            raise _Disconnect()
+        return line.rstrip("\r\n")
+
+    def check_fault(self, command):
+        fault = self.server.fault(command)
+        if fault == "disconnect":
+            raise _Disconnect()
+        return fault
+
+    def handle(self):
+        try:
+            self.server.delay("CONNECT")
+            self.check_fault("CONNECT")
+            self.reply("220 localhost ESMTP FakeSmtpServer")
+            while True:
+                line = self.readline()
+                command, _, argument = line.partition(" ")
+                command = command.upper()
+                if command != "DATA":
+                    self.server.delay(command)
+                handler = getattr(self, "smtp_%s" % command, None)
+                if handler is None:
+                    self.check_fault(command)
+                    self.reply("502 5.5.2 Command not recognized")
+                elif handler(argument) is False:
+                    return
+        except _Disconnect:
+            return
+
+    def smtp_HELO(self, argument):
+        self.check_fault("HELO")
+        self.reply("250 localhost")
+
+    def smtp_EHLO(self, argument):
+        self.check_fault("EHLO")
+        lines = ["localhost", "PIPELINING", "8BITMIME"]
+        if self.server.username is not None:
+            lines.append("AUTH PLAIN LOGIN")
+        for line in lines[:-1]:
+            self.wfile.write("250-%s\r\n" % line)
+        self.reply("250 %s" % lines[-1])
+
+    def smtp_AUTH(self, argument):
+        self.check_fault("AUTH")
+        mechanism, _, initial = argument.partition(" ")
+        mechanism = mechanism.upper()
+        if mechanism == "PLAIN":
+            if not initial:
+                self.reply("334 ")
+                initial = self.readline()
+            try:
+                _, username, password = base64.b64decode(initial).split("\0")
+            except Exception:
+                self.reply("501 5.5.2 Invalid credentials encoding")
+                return
+        elif mechanism == "LOGIN":
+            if initial:
+                username = base64.b64decode(initial)
+            else:
+                self.reply("334 %s" % base64.b64encode("Username:"))
+                username = base64.b64decode(self.readline())
+            self.reply("334 %s" % base64.b64encode("Password:"))
+            password = base64.b64decode(self.readline())
+        else:
+            self.reply("504 5.5.4 Unrecognized authentication type")
+            return
+
+        if username == self.server.username and password == self.server.password:
+            self.authenticated = True
+            self.reply("235 2.7.0 Authentication successful")
+        else:
+            self.reply("535 5.7.8 Authentication credentials invalid")
+
+    def smtp_MAIL(self, argument):
+        fault = self.check_fault("MAIL")
+        if not self.authenticated:
+            self.reply("530 5.7.0 Authentication required")
+        elif fault:
+            self.reply(fault)
+        elif not self.server.admit():
+            self.reply("421 4.7.0 Rate limit exceeded, closing connection")
+            return False
+        else:
+            self.reset()
+            self.mail_from = argument.partition(":")[2].strip()
+            self.reply("250 2.1.0 OK")
+
+    def smtp_RCPT(self, argument):
+        fault = self.check_fault("RCPT")
+        if self.mail_from is None:
+            self.reply("503 5.5.1 Need MAIL command")
+        elif fault:
+            self.reply(fault)
+        else:
+            self.rcpt_tos.append(argument.partition(":")[2].strip())
+            self.reply("250 2.1.5 OK")
+
+    def smtp_DATA(self, argument):
+        if not self.rcpt_tos:
+            self.check_fault("DATA")
+            self.reply("503 5.5.1 Need RCPT command")
+            return
+
+        self.reply("354 End data with <CR><LF>.<CR><LF>")
+        lines = []
+        while True:
+            line = self.readline()
+            if line == ".":
+                break
+            if line.startswith("."):
+                line = line[1:]
+            lines.append(line)
+
+        self.server.delay("DATA")
+        fault = self.check_fault("DATA")
+        if fault:
+            self.reply(fault)
+        else:
+            with self.server.lock:
+                self.server.messages.append(
+                    FakeSmtpMessage(self.mail_from, self.rcpt_tos, "\r\n".join(lines)))
+            self.reply("250 2.0.0 OK")
+        self.reset()
+
+    def smtp_RSET(self, argument):
+        self.check_fault("RSET")
+        self.reset()
+        self.reply("250 2.0.0 OK")
+
+    def smtp_NOOP(self, argument):
+        self.check_fault("NOOP")
+        self.reply("250 2.0.0 OK")
+
+    def smtp_QUIT(self, argument):
+        self.reply("221 2.0.0 Bye")
+        return False
@@ -0,0 +1,112 @@
+
+import threading
+
+
+class NodeExistsException(Exception):
+    pass
+
+
+class NoNodeException(Exception):
+    pass
+
+
+class FakeZookeeper(object):
+    """In-process Zookeeper ensemble for tests.
+
+    Holds a tree of nodes shared by any number of
+    FakeZookeeperClients, each of which is a session.
+    Ephemeral nodes are deleted when their session is
+    stopped or expired, and one-shot child watches fire
+    when a node's children change, as with Zookeeper.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.nodes = {"/": (None, None)}
+        self.watches = {}
+
+    def client(self):
+        """Create a client with a new session."""
+        return FakeZookeeperClient(self)
+
+    def _parent(self, path):
+        return path.rsplit("/", 1)[0] or "/"
+
+    def _fire(self, path):
+        watchers = self.watches.pop(path, [])
+        for watcher in watchers:
+            watcher(("child", path))
+
+    def create(self, session, path, data, ephemeral):
+        with self.lock:
+            if path in self.nodes:
+                raise NodeExistsException(path)
+            if self._parent(path) not in self.nodes:
+                raise NoNodeException(self._parent(path))
+            self.nodes[path] = (data, session if ephemeral else None)
+        self._fire(self._parent(path))
+        return path
+
+    def delete(self, path):
+        with self.lock:
+            if path not in self.nodes:
+                raise NoNodeException(path)
+            del self.nodes[path]
+        self._fire(self._parent(path))
+
+    def children(self, path, watcher):
+        with self.lock:
+            if path not in self.nodes:
+                raise NoNodeException(path)
+            if watcher is not None:
+                self.watches.setdefault(path, []).append(watcher)
+            prefix = path.rstrip("/") + "/"
+            return [node[len(prefix):] for node in self.nodes
+                    if node.startswith(prefix) and "/" not in node[len(prefix):]]
+
+    def expire(self, session):
+        """Expire a session, deleting its ephemeral nodes."""
+        with self.lock:
+            paths = [path for path, (data, owner) in self.nodes.items() if owner is session]
+        for path in paths:
+            self.delete(path)
+
+
+class FakeZookeeperClient(object):
+    """Zookeeper client session of a FakeZookeeper."""
+    def __init__(self, zookeeper):
+        self.zookeeper = zookeeper
+        self.connected = False
+
+    def start(self):
+        self.connected = True
+
+    def stop(self):
+        self.connected = False
+        self.zookeeper.expire(self)
+
+    def join(self, timeout=None):
+        pass
+
+    def _check(self):
+        if not self.connected:
+            raise IOError("Not connected")
+
+    def exists(self, path, watcher=None):
+        self._check()
+        return path in self.zookeeper.nodes
+
+    def create(self, path, data=None, acl=None, sequence=False, ephemeral=False):
+        self._check()
+        return self.zookeeper.create(self, path, data, ephemeral)
+
+    def delete(self, path, version=-1):
+        self._check()
+        self.zookeeper.delete(path)
+
+    def get_children(self, path, watcher=None):
+        self._check()
+        return self.zookeeper.children(path, watcher)
+
+    def expire(self):
+        """Expire this client's session."""
+        self.zookeeper.expire(self)
@@ -0,0 +1,116 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from sqlalchemy import create_engine, Column, Integer, MetaData, Table
+from sqlalchemy.orm import sessionmaker
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from groupcommit import GroupCommitter, GroupCommitStopped
+from metrics import MetricRegistry
+
+
+metadata = MetaData()
+value_table = Table("value", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("value", Integer, nullable=False))
+
+
+class GroupCommitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        engine = create_engine("sqlite:///%s" % os.path.join(self.directory, "test.db"),
+                connect_args={"check_same_thread": False})
+        metadata.create_all(engine)
+        self.db_session_factory = sessionmaker(bind=engine)
+        self.metrics = MetricRegistry()
+        self.committer = GroupCommitter(
+            db_session_factory=self.db_session_factory,
+            max_wait=0.05,
+            max_batch=100,
+            metrics=self.metrics)
+        self.committer.start()
+
+    def tearDown(self):
+        self.committer.stop()
+        self.committer.join(5)
+        shutil.rmtree(self.directory)
+
+    def _values(self):
+        db_session = self.db_session_factory()
+        try:
+            return sorted(row.value for row in db_session.execute(value_table.select()))
+        finally:
+            db_session.close()
+
+    def _insert(self, value):
+        def write(db_session):
+            db_session.execute(value_table.insert().values(value=value))
+            return value
+        return write
+
+    def _submit_concurrently(self, writes):
+        results = {}
+        errors = {}
+        def submit(index, write, rollback):
+            try:
+                results[index] = self.committer.submit(write, rollback)
+            except Exception as error:
+                errors[index] = error
+        threads = [threading.Thread(target=submit, args=(index, write, rollback))
+                   for index, (write, rollback) in enumerate(writes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return results, errors
+
+    def test_submit(self):
+        self.assertEqual(self.committer.submit(self._insert(7)), 7)
+        self.assertEqual(self._values(), [7])
+
+    def test_group_commit(self):
+        results, errors = self._submit_concurrently(
+            [(self._insert(value), None) for value in range(20)])
+        self.assertEqual(errors, {})
+        self.assertEqual(sorted(results.values()), range(20))
+        self.assertEqual(self._values(), range(20))
+
+        commits = self.metrics.get("notifier_group_commits")
+        self.assertTrue(commits < 20)
+        self.assertEqual(self.metrics.get("notifier_group_commit_writes"), 20)
+
+    def test_failed_write(self):
+        rollbacks = []
+        def fail(db_session):
+            raise ValueError("bad write")
+
+        writes = [(self._insert(value), lambda value=value: rollbacks.append(value))
+                  for value in range(5)]
+        writes.append((fail, lambda: rollbacks.append("fail")))
+        results, errors = self._submit_concurrently(writes)
+
+        # Only the failed write's caller sees the error
+        self.assertEqual(errors.keys(), [5])
+        self.assertTrue(isinstance(errors[5], ValueError))
+        self.assertEqual(sorted(results.values()), range(5))
+        self.assertEqual(self._values(), range(5))
+        self.assertTrue("fail" in rollbacks)
+
+    def test_stop(self):
+        self.committer.stop()
+        self.committer.join(5)
+        self.assertRaises(GroupCommitStopped, self.committer.submit, self._insert(1))
+        self.assertEqual(self._values(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from providers.exceptions import OutcomeUnknownException
+from providers.http import HttpConnectionPool
+
+from fakehttp import FakeHttpServer
+
+
+class HttpConnectionPoolTest(unittest.TestCase):
+    """
+        Test the HttpConnectionPool against a local FakeHttpServer.
+    """
+
+    def setUp(self):
+        self.server = FakeHttpServer()
+        self.server.start()
+        self.connection_pool = HttpConnectionPool(
+            host=self.server.host,
+            port=self.server.port,
+            size=1,
+            timeout=0.5)
+
+    def tearDown(self):
+        self.connection_pool.close()
+        self.server.stop()
+
+    def _post(self):
+        return self.connection_pool.request("POST", "/", "body")
+
+    def test_connection_reuse(self):
+        for i in range(5):
+            self.assertEqual(self._post().status, 200)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.connection_pool.connections_created, 1)
+
+    def test_dropped_connection_replaced(self):
+        self.server.close_connections = True
+        for i in range(3):
+            self.assertEqual(self._post().status, 200)
+            # Wait for the server to close the idle connection
+            time.sleep(0.05)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.connection_pool.connections_created, 3)
+
+    def test_timeout_not_retried(self):
+        self._post()
+        self.server.latency = 1
+        with self.assertRaises(OutcomeUnknownException):
+            self._post()
+
+        # The request was made once, on the reused connection
+        time.sleep(1)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.connection_pool.connections_created, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
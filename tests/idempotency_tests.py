@@ -0,0 +1,88 @@
+import datetime
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from idempotency import backfill_tokens, RecentTokenIndex
+from models import NotificationToken
+
+from jobqueue_tests import JobQueueTestCase
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecentTokenIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.index = RecentTokenIndex(size=3, ttl=60, clock=self.clock)
+
+    def test_get(self):
+        self.assertIsNone(self.index.get("token1"))
+        self.index.add("token1", "notification1")
+        self.assertEqual(self.index.get("token1"), "notification1")
+        self.assertEqual(self.index.hits, 1)
+
+    def test_ttl(self):
+        self.index.add("token1", "notification1")
+        self.clock.now += 59
+        self.assertEqual(self.index.get("token1"), "notification1")
+        self.clock.now += 1
+        self.assertIsNone(self.index.get("token1"))
+        self.assertEqual(len(self.index), 0)
+
+    def test_expire_on_add(self):
+        self.index.add("token1", "notification1")
+        self.clock.now += 30
+        self.index.add("token2", "notification2")
+        self.clock.now += 30
+        self.index.add("token3", "notification3")
+        self.assertEqual(len(self.index), 2)
+        self.assertIsNone(self.index.get("token1"))
+
+    def test_size(self):
+        for index in range(5):
+            self.index.add("token%d" % index, "notification%d" % index)
+        self.assertEqual(len(self.index), 3)
+        self.assertIsNone(self.index.get("token0"))
+        self.assertIsNone(self.index.get("token1"))
+        self.assertEqual(self.index.get("token4"), "notification4")
+
+
+class BackfillTokensTest(JobQueueTestCase):
+
+    def _tokens(self):
+        self.db_session.expire_all()
+        return dict(self.db_session.query(NotificationToken.token, NotificationToken.created))
+
+    def test_backfill(self):
+        # Created before tokens were written
+        later = self.now + datetime.timedelta(seconds=1)
+        for token in ["token1", "token2", "token3"]:
+            self._notification(token=token)
+        self.db_session.add(NotificationToken(token="token3", created=later))
+        self.db_session.commit()
+
+        self.assertEqual(backfill_tokens(self.db_session_factory, chunk_size=2), 3)
+        tokens = self._tokens()
+        self.assertEqual(sorted(tokens), ["token", "token1", "token2", "token3"])
+        self.assertEqual(tokens["token2"], self.now)
+        self.assertEqual(tokens["token3"], later)
+
+        # Backfilling again creates nothing
+        self.assertEqual(backfill_tokens(self.db_session_factory), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+import datetime
+import os
+import sys
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trsvcscore.db.models import Notification as NotificationModel
+from trsvcscore.db.models import NotificationJob as NotificationJobModel
+from trsvcscore.db.job import JobOwned, QueueEmpty
+
+from constants import CANCELLED_JOB_OWNER
+from jobqueue import JobCancelled, JobDeferred, JobOutcomeUnknown, \
+        NotificationDatabaseJob, NotificationJobQueue
+from models import create_tables, NotificationStatus
+from status import create_status
+
+
+OWNER = "notificationsvc"
+
+
+class JobQueueTestCase(unittest.TestCase):
+    """Base class for tests using a sqlite job table.
+
+    The database is a temporary file, rather than in memory,
+    so the queue's poll thread sees the same database.
+    """
+
+    def setUp(self):
+        fd, self.database_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        engine = create_engine("sqlite:///%s" % self.database_path)
+        NotificationJobModel.metadata.create_all(bind=engine, checkfirst=True)
+        create_tables(engine)
+        self.db_session_factory = sessionmaker(bind=engine)
+        self.db_session = self.db_session_factory()
+        self.now = datetime.datetime.utcnow()
+        self.notification = self._notification()
+
+    def tearDown(self):
+        self.db_session.close()
+        os.remove(self.database_path)
+
+    def _notification(self, token="token"):
+        notification = NotificationModel(
+            created=self.now,
+            token=token,
+            context="test",
+            priority=50,
+            subject="subject",
+            plain_text="text",
+            html_text="html")
+        self.db_session.add(notification)
+        self.db_session.flush()
+        create_status(self.db_session, notification.id, token, pending=0, created=self.now)
+        self.db_session.commit()
+        return notification
+
+    def _job(self, priority=50, not_before=None, owner=None, recipient_id=1):
+        job = NotificationJobModel(
+            created=self.now,
+            not_before=not_before or self.now - datetime.timedelta(seconds=1),
+            notification_id=self.notification.id,
+            recipient_id=recipient_id,
+            priority=priority,
+            retries_remaining=0,
+            owner=owner)
+        self.db_session.add(job)
+        self.db_session.query(NotificationStatus).\
+            filter(NotificationStatus.token==self.notification.token).\
+            update({NotificationStatus.pending: NotificationStatus.pending + 1},
+                   synchronize_session=False)
+        self.db_session.commit()
+        return job.id
+
+    def _database_job(self, id, queue=None):
+        return NotificationDatabaseJob(
+            owner=OWNER,
+            db_session_factory=self.db_session_factory,
+            id=id,
+            notification_id=self.notification.id,
+            recipient_id=1,
+            priority=50,
+            not_before=self.now,
+            queue=queue)
+
+    def _load(self, id):
+        self.db_session.expire_all()
+        return self.db_session.query(NotificationJobModel).get(id)
+
+    def _status(self):
+        self.db_session.expire_all()
+        status = self.db_session.query(NotificationStatus).get(self.notification.token)
+        return (status.pending, status.sent, status.failed, status.cancelled, status.unknown)
+
+
+class NotificationJobQueueTest(JobQueueTestCase):
+
+    def setUp(self):
+        super(NotificationJobQueueTest, self).setUp()
+        self.queue = NotificationJobQueue(
+            owner=OWNER,
+            db_session_factory=self.db_session_factory,
+            poll_seconds=60)
+
+    def tearDown(self):
+        self.queue.stop()
+        if self.queue.is_alive():
+            self.queue.join(5)
+        super(NotificationJobQueueTest, self).tearDown()
+
+    def test_priority_order(self):
+        low = self._job(priority=100)
+        late = self._job(priority=10)
+        early = self._job(priority=10, not_before=self.now - datetime.timedelta(minutes=1))
+        default = self._job(priority=50)
+
+        self.queue.start()
+        ids = [self.queue.get(timeout=5).id for i in range(4)]
+        self.assertEqual(ids, [early, late, default, low])
+
+    def test_not_before(self):
+        due = self._job()
+        future = self._job(not_before=self.now + datetime.timedelta(hours=1))
+
+        self.queue.start()
+        self.assertEqual(self.queue.get(timeout=5).id, due)
+        with self.assertRaises(QueueEmpty):
+            self.queue.get(timeout=0.1)
+
+        self.db_session.query(NotificationJobModel).\
+            filter(NotificationJobModel.id==future).\
+            update({NotificationJobModel.not_before: self.now})
+        self.db_session.commit()
+        self.assertEqual(self.queue.poll(), 1)
+        self.assertEqual(self.queue.get(timeout=5).id, future)
+
+    def test_poll_skips_claimed(self):
+        self._job(owner=OWNER)
+        self._job(owner=CANCELLED_JOB_OWNER)
+        self.assertEqual(self.queue.poll(), 0)
+
+    def test_pending_until_released(self):
+        id = self._job()
+        self.assertEqual(self.queue.poll(), 1)
+        self.assertEqual(self.queue.poll(), 0)
+        self.assertEqual(self.queue.size(), 1)
+
+        self.queue.start()
+        job = self.queue.get(timeout=5)
+        self.assertEqual(job.id, id)
+        self.assertEqual(self.queue.poll(), 0)
+
+        # Jobs dropped without claiming are returned by the next poll
+        job.release()
+        self.queue.poll()
+        self.assertEqual(self.queue.size(), 1)
+        self.assertEqual(self.queue.get(timeout=5).id, id)
+
+    def test_released_on_exit(self):
+        self._job()
+        self.queue.start()
+        job = self.queue.get(timeout=5)
+        with job:
+            self.assertEqual(self.queue.size(), 1)
+        self.assertEqual(self.queue.size(), 0)
+
+        # Ended jobs aren't returned again
+        self.assertEqual(self.queue.poll(), 0)
+
+    def test_partition(self):
+        ids = [self._job() for i in range(4)]
+        self.queue.partition = (1, 2)
+        self.assertEqual(self.queue.poll(), 2)
+        self.queue.start()
+        polled = sorted([self.queue.get(timeout=5).id, self.queue.get(timeout=5).id])
+        self.assertEqual(polled, [id for id in ids if id % 2 == 1])
+
+
+class NotificationDatabaseJobTest(JobQueueTestCase):
+
+    def test_claim(self):
+        id = self._job()
+        with self._database_job(id) as model:
+            self.assertEqual(model.id, id)
+            self.assertEqual(self._load(id).owner, OWNER)
+            self.assertIsNotNone(self._load(id).start)
+
+            # Jobs can only be claimed once
+            with self.assertRaises(JobOwned):
+                with self._database_job(id):
+                    pass
+
+        job = self._load(id)
+        self.assertIsNotNone(job.end)
+        self.assertTrue(job.successful)
+        self.assertEqual(self._status(), (0, 1, 0, 0, 0))
+
+    def test_failed(self):
+        id = self._job()
+        with self.assertRaises(RuntimeError):
+            with self._database_job(id):
+                raise RuntimeError()
+
+        job = self._load(id)
+        self.assertIsNotNone(job.end)
+        self.assertFalse(job.successful)
+        self.assertEqual(job.owner, OWNER)
+        self.assertEqual(self._status(), (0, 0, 1, 0, 0))
+
+    def test_cancelled(self):
+        id = self._job()
+        with self.assertRaises(JobCancelled):
+            with self._database_job(id):
+                raise JobCancelled()
+
+        job = self._load(id)
+        self.assertIsNotNone(job.end)
+        self.assertFalse(job.successful)
+        self.assertEqual(job.owner, CANCELLED_JOB_OWNER)
+        self.assertEqual(self._status(), (0, 0, 0, 1, 0))
+
+    def test_outcome_unknown(self):
+        id = self._job()
+        with self.assertRaises(JobOutcomeUnknown):
+            with self._database_job(id):
+                raise JobOutcomeUnknown()
+
+        job = self._load(id)
+        self.assertIsNotNone(job.end)
+        self.assertIsNone(job.successful)
+        self.assertEqual(self._status(), (0, 0, 0, 0, 1))
+
+    def test_deferred(self):
+        id = self._job()
+        with self.assertRaises(JobDeferred):
+            with self._database_job(id):
+                raise JobDeferred()
+
+        # Deferred jobs are unclaimed, not ended or counted as failed
+        job = self._load(id)
+        self.assertIsNone(job.owner)
+        self.assertIsNone(job.start)
+        self.assertIsNone(job.end)
+        self.assertEqual(self._status(), (1, 0, 0, 0, 0))
+
+        with self._database_job(id):
+            pass
+        self.assertTrue(self._load(id).successful)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from journal import NotificationJournal
+from metrics import MetricRegistry
+
+
+class Database(object):
+    """Fake database applying journal records."""
+    def __init__(self):
+        self.records = []
+        self.available = True
+
+    def apply(self, records):
+        if not self.available:
+            raise IOError("database unavailable")
+        self.records.extend(records)
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = Database()
+        self.metrics = MetricRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _journal(self, **kwargs):
+        return NotificationJournal(
+            directory=os.path.join(self.directory, "journal"),
+            apply=self.database.apply,
+            metrics=self.metrics,
+            **kwargs)
+
+    def _segments(self):
+        return sorted(os.listdir(os.path.join(self.directory, "journal")))
+
+    def test_replay(self):
+        journal = self._journal(batch_size=2)
+        for index in range(5):
+            journal.append({"token": "token%d" % index})
+        self.assertEqual(journal.depth(), 5)
+        self.assertEqual(self.metrics.get("notifier_journal_depth"), 5)
+
+        self.assertEqual(journal.replay(), 5)
+        self.assertEqual([record["token"] for record in self.database.records],
+                         ["token%d" % index for index in range(5)])
+        self.assertEqual(journal.depth(), 0)
+        self.assertEqual(self._segments(), [])
+
+    def test_replay_failure(self):
+        journal = self._journal()
+        journal.append({"token": "token"})
+        self.database.available = False
+        self.assertRaises(IOError, journal.replay)
+        self.assertEqual(journal.depth(), 1)
+
+        self.database.available = True
+        self.assertEqual(journal.replay(), 1)
+        self.assertEqual(journal.depth(), 0)
+
+    def test_reopen(self):
+        journal = self._journal()
+        journal.append({"token": "token1"})
+        journal.append({"token": "token2"})
+        journal.stop()
+
+        journal = self._journal()
+        self.assertEqual(journal.depth(), 2)
+        journal.append({"token": "token3"})
+        self.assertEqual(journal.replay(), 3)
+        self.assertEqual([record["token"] for record in self.database.records],
+                         ["token1", "token2", "token3"])
+
+    def test_torn_record(self):
+        journal = self._journal()
+        journal.append({"token": "token1"})
+        journal.append({"token": "token2"})
+        journal.stop()
+
+        # Truncate the last record, as if the process died mid-write
+        path = os.path.join(self.directory, "journal", self._segments()[0])
+        with open(path, "r+b") as output:
+            output.truncate(os.path.getsize(path) - 3)
+
+        journal = self._journal()
+        self.assertEqual(journal.depth(), 1)
+        self.assertEqual(journal.replay(), 1)
+        self.assertEqual([record["token"] for record in self.database.records], ["token1"])
+
+    def test_segments(self):
+        journal = self._journal(segment_bytes=64)
+        for index in range(10):
+            journal.append({"token": "token%d" % index})
+        self.assertTrue(len(self._segments()) > 1)
+        self.assertEqual(journal.replay(), 10)
+        self.assertEqual([record["token"] for record in self.database.records],
+                         ["token%d" % index for index in range(10)])
+
+    def test_concurrent_append(self):
+        journal = self._journal()
+        threads = [threading.Thread(target=journal.append, args=({"token": "token%d" % index},))
+                   for index in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(journal.depth(), 20)
+        self.assertEqual(journal.synced, journal.written)
+        self.assertEqual(journal.replay(), 20)
+        self.assertEqual(sorted(record["token"] for record in self.database.records),
+                         sorted("token%d" % index for index in range(20)))
+
+    def test_replay_thread(self):
+        journal = self._journal(replay_seconds=0.01)
+        journal.append({"token": "token"})
+        journal.start()
+        try:
+            for i in range(100):
+                if not journal.depth():
+                    break
+                threading.Event().wait(0.01)
+        finally:
+            journal.stop()
+            journal.join(5)
+        self.assertEqual(journal.depth(), 0)
+        self.assertEqual(len(self.database.records), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import datetime
+import os
+import sys
+import time
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trsvcscore.db.models import NotificationJob as NotificationJobModel
+from trsvcscore.db.job import JobOwned
+
+from jobqueue import NotificationDatabaseJob
+from leases import JobLeaseManager
+from models import NotificationJobLease
+
+from jobqueue_tests import JobQueueTestCase, OWNER
+
+
+class JobLeaseManagerTest(JobQueueTestCase):
+
+    def setUp(self):
+        super(JobLeaseManagerTest, self).setUp()
+        self.leases = JobLeaseManager(
+            db_session_factory=self.db_session_factory,
+            holder="host-1",
+            owner=OWNER,
+            lease_seconds=30,
+            orphan_seconds=60)
+
+    def _database_job(self, id, queue=None):
+        return NotificationDatabaseJob(
+            owner=OWNER,
+            db_session_factory=self.db_session_factory,
+            id=id,
+            notification_id=self.notification.id,
+            recipient_id=1,
+            priority=50,
+            not_before=self.now,
+            queue=queue,
+            leases=self.leases)
+
+    def _lease(self, job_id):
+        self.db_session.expire_all()
+        return self.db_session.query(NotificationJobLease).get(job_id)
+
+    def _expire(self, job_id, seconds=1):
+        self.db_session.query(NotificationJobLease).\
+            filter(NotificationJobLease.job_id==job_id).\
+            update({NotificationJobLease.expires:
+                    datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds)},
+                   synchronize_session=False)
+        self.db_session.commit()
+
+    def test_claim_acquires_lease(self):
+        job_id = self._job()
+        database_job = self._database_job(job_id)
+        with database_job:
+            lease = self._lease(job_id)
+            self.assertEqual(lease.holder, "host-1")
+            self.assertEqual(lease.token, database_job.lease_token)
+            self.assertEqual(self.leases.token(job_id), lease.token)
+
+        self.assertIsNone(self._lease(job_id))
+        self.assertIsNone(self.leases.token(job_id))
+        self.assertTrue(self._load(job_id).successful)
+
+    def test_claim_after_expired_lease(self):
+        job_id = self._job()
+        database_job = self._database_job(job_id)
+        database_job.__enter__()
+        first_token = database_job.lease_token
+        self._expire(job_id)
+        self.assertEqual(self.leases.reap(), 1)
+
+        # The reaped job is claimed again, with a new lease
+        with self._database_job(job_id) as job:
+            self.assertEqual(job.owner, OWNER)
+            self.assertNotEqual(self._lease(job_id).token, first_token)
+        self.assertTrue(self._load(job_id).successful)
+
+    def test_heartbeat_extends_lease(self):
+        job_id = self._job()
+        with self._database_job(job_id):
+            self._expire(job_id, seconds=-1)
+            before = self._lease(job_id).expires
+            self.assertEqual(self.leases.heartbeat(), 1)
+            expires = self._lease(job_id).expires
+            self.assertGreater(expires, before + datetime.timedelta(seconds=20))
+
+            # A renewed lease isn't reaped
+            self.assertEqual(self.leases.reap(), 0)
+
+    def test_heartbeat_after_reap(self):
+        job_id = self._job()
+        with self.assertRaises(JobOwned):
+            with self._database_job(job_id):
+                self._expire(job_id)
+                self.leases.reap()
+                self.assertEqual(self.leases.heartbeat(), 0)
+
+    def test_reap(self):
+        expired_id = self._job()
+        held_id = self._job()
+        expired = self._database_job(expired_id)
+        held = self._database_job(held_id)
+        expired.__enter__()
+        held.__enter__()
+        self._expire(expired_id)
+
+        self.assertEqual(self.leases.reap(), 1)
+        job = self._load(expired_id)
+        self.assertIsNone(job.owner)
+        self.assertIsNone(job.start)
+        self.assertIsNone(self._lease(expired_id))
+
+        self.assertEqual(self._load(held_id).owner, OWNER)
+        self.assertIsNotNone(self._lease(held_id))
+        held.__exit__(None, None, None)
+
+    def test_reap_orphans(self):
+        orphan_id = self._job()
+        recent_id = self._job()
+        self.db_session.query(NotificationJobModel).\
+            filter_by(id=orphan_id).\
+            update({"owner": OWNER, "start": self.now - datetime.timedelta(hours=1)},
+                   synchronize_session=False)
+        self.db_session.query(NotificationJobModel).\
+            filter_by(id=recent_id).\
+            update({"owner": OWNER, "start": self.now}, synchronize_session=False)
+        self.db_session.commit()
+
+        self.assertEqual(self.leases.reap_orphans(), 1)
+        self.assertIsNone(self._load(orphan_id).owner)
+        self.assertEqual(self._load(recent_id).owner, OWNER)
+
+    def test_orphans_kept_by_default(self):
+        orphan_id = self._job()
+        self.db_session.query(NotificationJobModel).\
+            filter_by(id=orphan_id).\
+            update({"owner": OWNER, "start": self.now - datetime.timedelta(hours=1)},
+                   synchronize_session=False)
+        self.db_session.commit()
+
+        # Jobs claimed by instances without leases aren't reclaimed
+        leases = JobLeaseManager(
+            db_session_factory=self.db_session_factory,
+            holder="host-1",
+            owner=OWNER,
+            heartbeat_seconds=0.01,
+            reap_seconds=0.01)
+        leases.start()
+        try:
+            time.sleep(0.1)
+        finally:
+            leases.stop()
+            leases.thread.join()
+        self.assertEqual(self._load(orphan_id).owner, OWNER)
+
+    def test_reaped_job_not_ended(self):
+        job_id = self._job()
+        with self.assertRaises(JobOwned):
+            with self._database_job(job_id):
+                self._expire(job_id)
+                self.leases.reap()
+
+        # The job is left unclaimed, and still pending
+        job = self._load(job_id)
+        self.assertIsNone(job.owner)
+        self.assertIsNone(job.end)
+        self.assertEqual(self._status(), (1, 0, 0, 0, 0))
+
+    def test_reclaimed_job_not_double_completed(self):
+        job_id = self._job()
+        stale = self._database_job(job_id)
+        stale.__enter__()
+        self._expire(job_id)
+        self.leases.reap()
+
+        # Reclaimed by the same process, so the owner and
+        # holder match, but the stale claim's lease is gone.
+        reclaimed = self._database_job(job_id)
+        reclaimed.__enter__()
+        with self.assertRaises(JobOwned):
+            stale.__exit__(None, None, None)
+        self.assertIsNone(self._load(job_id).end)
+        self.assertEqual(self._status(), (1, 0, 0, 0, 0))
+
+        # The stale claim doesn't stop the new lease's renewal
+        self.assertEqual(self.leases.token(job_id), reclaimed.lease_token)
+        self.assertEqual(self.leases.heartbeat(), 1)
+
+        reclaimed.__exit__(None, None, None)
+        self.assertTrue(self._load(job_id).successful)
+        self.assertEqual(self._status(), (0, 1, 0, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
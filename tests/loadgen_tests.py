@@ -0,0 +1,101 @@
+import os
+import sys
+import threading
+import unittest
+
+BENCHMARKS_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", "benchmarks"))
+sys.path.insert(0, BENCHMARKS_ROOT)
+
+from notify_loadgen import parse_args, run
+
+
+class FakeHandlerError(Exception):
+    pass
+
+
+class FakeHandler(object):
+    """Records notify() calls, failing every fail_every'th call."""
+    def __init__(self, fail_every=None):
+        self.fail_every = fail_every
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.notifications = []
+        self.connections = 0
+
+    def notify(self, context, notification):
+        with self.lock:
+            self.calls += 1
+            if self.fail_every and self.calls % self.fail_every == 0:
+                raise FakeHandlerError()
+            self.notifications.append((context, notification))
+
+
+class FakeConnection(object):
+    """Connection to a FakeHandler, closed by a failed call."""
+    def __init__(self, handler):
+        self.handler = handler
+        self.open = True
+        with handler.lock:
+            handler.connections += 1
+
+    def notify(self, context, notification):
+        try:
+            self.handler.notify(context, notification)
+        except FakeHandlerError:
+            self.open = False
+            raise
+
+    def is_open(self):
+        return self.open
+
+    def close(self):
+        self.open = False
+
+
+class NotifyLoadGeneratorTest(unittest.TestCase):
+    """
+        Smoke test the notify() load generator against a fake handler.
+    """
+
+    def _run(self, argv, handler):
+        return run(parse_args(argv), connect=lambda args: FakeConnection(handler))
+
+    def test_run(self):
+        handler = FakeHandler()
+        result = self._run([
+            "--clients", "4",
+            "--requests", "200",
+            "--recipients", "uniform:1-5",
+            "--priorities", "high=1,low=1",
+            "--user-ids", "1-10"], handler)
+
+        self.assertEqual(handler.connections, 4)
+        self.assertEqual(len(handler.notifications), 200)
+        self.assertEqual(len(result["latencies"]), 200)
+        self.assertEqual(result["errors"], {})
+        self.assertIsNone(result["written"])
+        self.assertEqual(result["recipients"],
+                         sum(len(n["recipient_ids"]) for c, n in handler.notifications))
+
+        for context, notification in handler.notifications:
+            self.assertEqual(context, "loadgen")
+            self.assertIn(notification["priority"], ("high", "low"))
+            self.assertTrue(1 <= len(notification["recipient_ids"]) <= 5)
+            self.assertTrue(set(notification["recipient_ids"]) <= set(range(1, 11)))
+        self.assertEqual(len(set(n["token"] for c, n in handler.notifications)), 200)
+
+    def test_errors_reconnect(self):
+        handler = FakeHandler(fail_every=10)
+        result = self._run(["--clients", "2", "--requests", "100"], handler)
+
+        self.assertEqual(result["errors"], {"FakeHandlerError": 10})
+        self.assertEqual(len(result["latencies"]), 90)
+        self.assertEqual(handler.connections, 12)
+
+    def test_invalid_priority(self):
+        with self.assertRaises(ValueError):
+            self._run(["--priorities", "urgent=1"], FakeHandler())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from metrics import Meter, MetricRegistry
+
+
+class Clock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class MeterTest(unittest.TestCase):
+    """
+        Test the Meter.
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.meter = Meter(window=10, clock=self.clock)
+
+    def test_rate(self):
+        for i in range(10):
+            self.clock.now += 1
+            self.meter.mark(5)
+        self.assertEqual(self.meter.count(), 50)
+        self.assertEqual(self.meter.rate(), 5.0)
+        self.assertEqual(self.meter.total, 50)
+
+    def test_expire(self):
+        self.meter.mark(100)
+        self.clock.now += 5
+        self.meter.mark(10)
+        self.assertEqual(self.meter.count(), 110)
+        self.clock.now += 5
+        self.assertEqual(self.meter.count(), 10)
+        self.clock.now += 5
+        self.assertEqual(self.meter.count(), 0)
+        self.assertEqual(self.meter.total, 110)
+
+    def test_bounded(self):
+        for i in range(1000):
+            self.meter.mark()
+            self.clock.now += 1
+        self.assertTrue(len(self.meter.buckets) <= 11)
+
+    def test_as_dict(self):
+        self.meter.mark(20)
+        self.assertEqual(self.meter.as_dict("sends"), {
+            "sends_total": 20,
+            "sends_per_min": 120,
+            "sends_per_sec": 2
+        })
+
+
+class MetricRegistryTest(unittest.TestCase):
+    """
+        Test the MetricRegistry.
+    """
+
+    def test_counters_and_gauges(self):
+        metrics = MetricRegistry()
+        metrics.increment("jobs")
+        metrics.increment("jobs", 2)
+        metrics.register_gauge("depth", lambda: 7)
+        self.assertEqual(metrics.get("jobs"), 3)
+        self.assertEqual(metrics.get("depth"), 7)
+        self.assertEqual(metrics.get("missing", 0), 0)
+
+    def test_failing_gauge(self):
+        def fail():
+            raise RuntimeError("gauge failed")
+        metrics = MetricRegistry()
+        metrics.increment("jobs")
+        metrics.register_gauge("depth", lambda: 7)
+        metrics.register_gauge("broken", fail)
+        metrics.register_gauge("invalid", lambda: None)
+
+        # Failing gauges are skipped, and the rest still collected
+        counters, gauges, histograms, meters = metrics.collect()
+        self.assertEqual(counters, {"jobs": 1})
+        self.assertEqual(gauges, {"depth": 7})
+        self.assertIsNone(metrics.get("broken"))
+        self.assertEqual(metrics.get("invalid", 0), 0)
+
+    def test_meter(self):
+        metrics = MetricRegistry()
+        metrics.mark("notifier_email_sends", 3)
+        self.assertEqual(metrics.get("notifier_email_sends_total"), 3)
+        self.assertEqual(metrics.get("notifier_email_sends_per_min"), 3)
+        self.assertEqual(metrics.get("notifier_email_sends_per_sec"), 0)
+        self.assertIsNone(metrics.get("notifier_email_sends_p50"))
+        counters = metrics.as_dict()
+        self.assertEqual(counters["notifier_email_sends_total"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
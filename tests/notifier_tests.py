@@ -0,0 +1,199 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trsvcscore.db.models import NotificationJob as NotificationJobModel
+from trsvcscore.db.models import User
+
+from constants import EMAIL_CHANNEL, SMS_CHANNEL
+from models import NotificationChannelDelivery, NotificationChannelPreference, \
+        NotificationJobLease
+from notifier import Notifier
+from providers.base import NotificationProvider
+from routing import ChannelPreferenceCache, ChannelRouter
+
+from jobqueue import NotificationDatabaseJob
+from leases import JobLeaseManager
+from jobqueue_tests import JobQueueTestCase, OWNER
+
+
+class FakeProvider(NotificationProvider):
+    def __init__(self, name):
+        super(FakeProvider, self).__init__(name)
+        self.available = True
+        self.error = None
+        self.sends = []
+
+    def is_available(self):
+        return self.available
+
+    def send(self, **kwargs):
+        if self.error is not None:
+            raise self.error
+        self.sends.append(kwargs)
+
+
+class NotifierTest(JobQueueTestCase):
+    """
+        Test Notifier delivery of jobs routed to several channels.
+    """
+
+    def setUp(self):
+        super(NotifierTest, self).setUp()
+        self.db_session.add_all([
+            User(id=1, first_name="first", last_name="last", email="user@localhost"),
+            NotificationChannelPreference(user_id=1, channel=SMS_CHANNEL, address="+15555550101", enabled=True)
+        ])
+        self.db_session.commit()
+
+        self.router = ChannelRouter(
+            cache=ChannelPreferenceCache(self.db_session_factory, size=10, ttl=60),
+            channels=[EMAIL_CHANNEL, SMS_CHANNEL])
+        self.providers = {
+            EMAIL_CHANNEL: FakeProvider("email"),
+            SMS_CHANNEL: FakeProvider("sms")
+        }
+        self.dispatched = []
+        self.notifiers = dict((channel, self._notifier(channel, self._dispatch))
+                              for channel in self.providers)
+
+    def _notifier(self, channel, dispatch=None):
+        return Notifier(
+            db_session_factory=self.db_session_factory,
+            providers=self.providers,
+            job_retry_seconds=60,
+            channel=channel,
+            router=self.router,
+            dispatch=dispatch)
+
+    def _dispatch(self, channel, database_job):
+        self.dispatched.append((channel, database_job))
+
+    def _deliveries(self):
+        self.db_session.expire_all()
+        return sorted(row.channel for row in
+                      self.db_session.query(NotificationChannelDelivery.channel))
+
+    def _process(self, database_job):
+        """Send a job through its channels' pools."""
+        self.notifiers[self.router(database_job)].send(database_job)
+        while self.dispatched:
+            channel, database_job = self.dispatched.pop(0)
+            self.notifiers[channel].send(database_job)
+
+    def _retries(self, job_id):
+        return self.db_session.query(NotificationJobModel).\
+            filter(NotificationJobModel.id!=job_id).\
+            filter(NotificationJobModel.end==None).\
+            count()
+
+    def test_forward(self):
+        job_id = self._job()
+        database_job = self._database_job(job_id)
+        self.notifiers[EMAIL_CHANNEL].send(database_job)
+
+        # Delivered on email, and forwarded to the sms pool still claimed
+        self.assertEqual(len(self.providers[EMAIL_CHANNEL].sends), 1)
+        self.assertEqual(self.dispatched, [(SMS_CHANNEL, database_job)])
+        job = self._load(job_id)
+        self.assertEqual(job.owner, OWNER)
+        self.assertIsNone(job.end)
+        self.assertEqual(self._deliveries(), [EMAIL_CHANNEL])
+
+        channel, database_job = self.dispatched.pop()
+        self.notifiers[channel].send(database_job)
+        self.assertEqual(self.providers[SMS_CHANNEL].sends[0]["recipient"], "+15555550101")
+        self.assertEqual(self.dispatched, [])
+        self.assertTrue(self._load(job_id).successful)
+        self.assertEqual(self._deliveries(), [EMAIL_CHANNEL, SMS_CHANNEL])
+        self.assertEqual(self._status(), (0, 1, 0, 0, 0))
+
+    def test_forward_after_failure(self):
+        job_id = self._job()
+        self._load(job_id).retries_remaining = 1
+        self.db_session.commit()
+        self.providers[EMAIL_CHANNEL].error = RuntimeError("failed")
+        self._process(self._database_job(job_id))
+
+        # The other channel is still delivered, then the job
+        # fails and its retry only resends on the failed channel.
+        self.assertEqual(len(self.providers[SMS_CHANNEL].sends), 1)
+        self.assertFalse(self._load(job_id).successful)
+        self.assertEqual(self._deliveries(), [SMS_CHANNEL])
+        self.assertEqual(self._retries(job_id), 1)
+        self.assertEqual(self._status(), (1, 0, 1, 0, 0))
+
+    def test_unavailable_channel_deferred(self):
+        job_id = self._job()
+        self.providers[SMS_CHANNEL].available = False
+        self._process(self._database_job(job_id))
+
+        # Email is delivered, and the job is unclaimed for sms
+        self.assertEqual(len(self.providers[EMAIL_CHANNEL].sends), 1)
+        job = self._load(job_id)
+        self.assertIsNone(job.owner)
+        self.assertIsNone(job.end)
+        self.assertEqual(self._deliveries(), [EMAIL_CHANNEL])
+        self.assertEqual(self._status(), (1, 0, 0, 0, 0))
+
+        self.providers[SMS_CHANNEL].available = True
+        self._process(self._database_job(job_id))
+        self.assertEqual(len(self.providers[EMAIL_CHANNEL].sends), 1)
+        self.assertEqual(len(self.providers[SMS_CHANNEL].sends), 1)
+        self.assertTrue(self._load(job_id).successful)
+        self.assertEqual(self._status(), (0, 1, 0, 0, 0))
+
+    def test_unavailable_primary_channel(self):
+        job_id = self._job()
+        self.providers[EMAIL_CHANNEL].available = False
+        self._process(self._database_job(job_id))
+
+        # Sms is delivered, and the job is unclaimed for email
+        self.assertEqual(len(self.providers[SMS_CHANNEL].sends), 1)
+        self.assertIsNone(self._load(job_id).owner)
+        self.assertEqual(self._deliveries(), [SMS_CHANNEL])
+
+    def test_fan_out_without_dispatch(self):
+        job_id = self._job()
+        self.providers[SMS_CHANNEL].available = False
+        self._notifier(EMAIL_CHANNEL).send(self._database_job(job_id))
+
+        self.assertEqual(self.dispatched, [])
+        self.assertEqual(len(self.providers[EMAIL_CHANNEL].sends), 1)
+        self.assertIsNone(self._load(job_id).owner)
+        self.assertEqual(self._deliveries(), [EMAIL_CHANNEL])
+
+    def test_claimed_job_deferred(self):
+        # An expressed job, claimed and leased by notify()
+        leases = JobLeaseManager(self.db_session_factory, holder="host-1", owner=OWNER)
+        job_id = self._job(owner=OWNER, recipient_id=2)
+        leases.acquire(self.db_session, job_id)
+        self.db_session.commit()
+        database_job = NotificationDatabaseJob(
+            owner=OWNER,
+            db_session_factory=self.db_session_factory,
+            id=job_id,
+            notification_id=self.notification.id,
+            recipient_id=2,
+            priority=50,
+            not_before=None,
+            leases=leases,
+            claimed=True)
+
+        self.providers[EMAIL_CHANNEL].available = False
+        self.notifiers[EMAIL_CHANNEL].send(database_job)
+
+        # The job is unclaimed and its lease discarded
+        self.assertIsNone(self._load(job_id).owner)
+        self.assertIsNone(leases.token(job_id))
+        self.assertEqual(self.db_session.query(NotificationJobLease).count(), 0)
+        self.assertEqual(self._status(), (1, 0, 0, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
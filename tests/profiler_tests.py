@@ -0,0 +1,68 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from profiler import SamplingProfiler
+
+
+def busy_work(event):
+    while not event.is_set():
+        sum(range(1000))
+
+
+class SamplingProfilerTest(unittest.TestCase):
+    """
+        Test the SamplingProfiler.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = SamplingProfiler(self.directory, interval=0.005, duration=0.2, prefix="test")
+        self.exit_event = threading.Event()
+        self.worker = threading.Thread(target=busy_work, args=(self.exit_event,), name="Worker-12")
+        self.worker.start()
+
+    def tearDown(self):
+        self.exit_event.set()
+        self.worker.join()
+        shutil.rmtree(self.directory)
+
+    def read(self):
+        with open(self.profiler.path) as input:
+            return [line.rsplit(" ", 1) for line in input.read().splitlines()]
+
+    def test_window(self):
+        self.assertTrue(self.profiler.start())
+        self.assertTrue(self.profiler.is_running())
+        self.profiler.join(5)
+        self.assertFalse(self.profiler.is_running())
+        self.assertTrue(self.profiler.samples > 0)
+
+        stacks = self.read()
+        worker = [(stack, int(count)) for stack, count in stacks if stack.startswith("Worker;")]
+        self.assertTrue(worker)
+        self.assertTrue(all("busy_work (profiler_tests.py:" in stack for stack, count in worker))
+        self.assertFalse([stack for stack, count in stacks if "SamplingProfiler" in stack])
+        self.assertEqual(sum(count for stack, count in worker), self.profiler.samples)
+
+    def test_toggle(self):
+        self.profiler.duration = 60
+        self.profiler.toggle()
+        self.assertTrue(self.profiler.is_running())
+        self.assertFalse(self.profiler.start())
+        self.profiler.toggle()
+        self.profiler.join(5)
+        self.assertFalse(self.profiler.is_running())
+        self.assertTrue(os.path.exists(self.profiler.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import sys
+import unittest
+import urllib2
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from metrics import MetricRegistry
+from prometheus import CONTENT_TYPE, MetricsHttpServer, format_metrics, metric_name
+
+
+class PrometheusFormatTest(unittest.TestCase):
+    """
+        Test the Prometheus exposition format.
+    """
+
+    def test_metric_name(self):
+        self.assertEqual(metric_name("svc", "jobs"), "svc_jobs")
+        self.assertEqual(metric_name(None, "pool.email-depth"), "pool_email_depth")
+        self.assertEqual(metric_name(None, "9lives"), "_9lives")
+
+    def test_format(self):
+        metrics = MetricRegistry()
+        metrics.increment("notifier_jobs_deferred", 2)
+        metrics.register_gauge("notifier_pool_email_depth", lambda: 7)
+        metrics.mark("notifier_email_sends", 3)
+        for value in (1, 4, 4, 2000):
+            metrics.observe("latency_high_send_ms", value)
+
+        lines = format_metrics(metrics, "notificationsvc").splitlines()
+        self.assertIn("# TYPE notificationsvc_notifier_jobs_deferred counter", lines)
+        self.assertIn("notificationsvc_notifier_jobs_deferred 2", lines)
+        self.assertIn("# TYPE notificationsvc_notifier_pool_email_depth gauge", lines)
+        self.assertIn("notificationsvc_notifier_pool_email_depth 7", lines)
+        self.assertIn("# TYPE notificationsvc_notifier_email_sends_total counter", lines)
+        self.assertIn("notificationsvc_notifier_email_sends_total 3", lines)
+
+        name = "notificationsvc_latency_high_send_ms"
+        self.assertIn("# TYPE %s histogram" % name, lines)
+        self.assertIn('%s_bucket{le="1"} 1' % name, lines)
+        self.assertIn('%s_bucket{le="2"} 1' % name, lines)
+        self.assertIn('%s_bucket{le="5"} 3' % name, lines)
+        self.assertIn('%s_bucket{le="1000"} 3' % name, lines)
+        self.assertIn('%s_bucket{le="2500"} 4' % name, lines)
+        self.assertIn('%s_bucket{le="+Inf"} 4' % name, lines)
+        self.assertIn("%s_sum 2009.0" % name, lines)
+        self.assertIn("%s_count 4" % name, lines)
+
+
+class MetricsHttpServerTest(unittest.TestCase):
+    """
+        Test the MetricsHttpServer.
+    """
+
+    def setUp(self):
+        self.metrics = MetricRegistry()
+        self.server = MetricsHttpServer(self.metrics, interface="localhost", namespace="svc")
+        self.server.start()
+        self.url = "http://localhost:%d" % self.server.port
+
+    def tearDown(self):
+        self.server.stop()
+        self.server.join(5)
+
+    def test_scrape(self):
+        self.metrics.increment("jobs", 5)
+        response = urllib2.urlopen("%s/metrics" % self.url)
+        self.assertEqual(response.info()["Content-Type"], CONTENT_TYPE)
+        self.assertIn("svc_jobs 5", response.read().splitlines())
+
+    def test_not_found(self):
+        with self.assertRaises(urllib2.HTTPError) as context:
+            urllib2.urlopen("%s/other" % self.url)
+        self.assertEqual(context.exception.code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from constants import EMAIL_CHANNEL, SMS_CHANNEL, WEBHOOK_CHANNEL
+from models import NotificationChannelPreference, create_tables
+from routing import ChannelPreferenceCache, ChannelRouter
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RoutingTest(unittest.TestCase):
+    """
+        Test the ChannelPreferenceCache and ChannelRouter.
+    """
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        create_tables(engine)
+        self.session_factory = sessionmaker(bind=engine)
+        self.queries = 0
+        self.clock = Clock()
+
+        db_session = self.session_factory()
+        db_session.add_all([
+            NotificationChannelPreference(user_id=1, channel=SMS_CHANNEL, address="+15555550101", enabled=True),
+            NotificationChannelPreference(user_id=2, channel=EMAIL_CHANNEL, enabled=False),
+            NotificationChannelPreference(user_id=2, channel=WEBHOOK_CHANNEL, enabled=True),
+            NotificationChannelPreference(user_id=3, channel=EMAIL_CHANNEL, enabled=False),
+            NotificationChannelPreference(user_id=4, channel=SMS_CHANNEL, address="+15555550104", enabled=False)
+        ])
+        db_session.commit()
+        db_session.close()
+
+        self.cache = ChannelPreferenceCache(
+            db_session_factory=self._db_session_factory,
+            size=2,
+            ttl=60,
+            clock=self.clock)
+        self.router = ChannelRouter(
+            cache=self.cache,
+            channels=[EMAIL_CHANNEL, SMS_CHANNEL, WEBHOOK_CHANNEL])
+
+    def _db_session_factory(self):
+        self.queries += 1
+        return self.session_factory()
+
+    def test_route(self):
+        self.assertEqual(self.router.route(1), [EMAIL_CHANNEL, SMS_CHANNEL])
+        self.assertEqual(self.router.route(2), [WEBHOOK_CHANNEL])
+        self.assertEqual(self.router.route(3), [])
+        self.assertEqual(self.router.route(4), [EMAIL_CHANNEL])
+        self.assertEqual(self.router.route(5), [EMAIL_CHANNEL])
+
+    def test_primary_channel(self):
+        class Job(object):
+            def __init__(self, recipient_id):
+                self.recipient_id = recipient_id
+        self.assertEqual(self.router(Job(1)), EMAIL_CHANNEL)
+        self.assertEqual(self.router(Job(2)), WEBHOOK_CHANNEL)
+        self.assertEqual(self.router(Job(3)), EMAIL_CHANNEL)
+        self.assertEqual(self.router.primary(1), EMAIL_CHANNEL)
+        self.assertEqual(self.router.primary(2), WEBHOOK_CHANNEL)
+
+    def test_address(self):
+        self.assertEqual(self.router.address(1, SMS_CHANNEL), "+15555550101")
+        self.assertIsNone(self.router.address(1, WEBHOOK_CHANNEL))
+
+    def test_cache_hit(self):
+        self.router.route(1)
+        self.router.route(1)
+        self.router.address(1, SMS_CHANNEL)
+        self.assertEqual(self.queries, 1)
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_prefetch(self):
+        self.cache.size = 10
+        self.router.prefetch([1, 2, 3, 1])
+        self.assertEqual(self.queries, 1)
+        for user_id in [1, 2, 3]:
+            self.router.route(user_id)
+        self.assertEqual(self.queries, 1)
+
+    def test_ttl(self):
+        self.router.route(1)
+        self.clock.now += 59
+        self.router.route(1)
+        self.assertEqual(self.queries, 1)
+        self.clock.now += 1
+        self.router.route(1)
+        self.assertEqual(self.queries, 2)
+
+    def test_lru_eviction(self):
+        self.router.route(1)
+        self.router.route(2)
+        self.router.route(1)
+        self.router.route(3)
+        self.assertEqual(self.queries, 3)
+        # 2 was least recently used and evicted
+        self.router.route(1)
+        self.assertEqual(self.queries, 3)
+        self.router.route(2)
+        self.assertEqual(self.queries, 4)
+
+    def test_invalidate(self):
+        self.router.route(1)
+        self.cache.invalidate(1)
+        self.router.route(1)
+        self.assertEqual(self.queries, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
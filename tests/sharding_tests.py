@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from fakezookeeper import FakeZookeeper
+from metrics import MetricRegistry
+from sharding import HashRing, ShardCoordinator
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class HashRingTest(unittest.TestCase):
+    """
+        Test the HashRing.
+    """
+
+    def owners(self, ring, keys=4096):
+        return dict((key, ring.owner(str(key))) for key in range(keys))
+
+    def test_empty(self):
+        self.assertIsNone(HashRing([]).owner("1"))
+
+    def test_balance(self):
+        ring = HashRing(["a", "b", "c", "d"], replicas=128)
+        counts = {}
+        for owner in self.owners(ring).values():
+            counts[owner] = counts.get(owner, 0) + 1
+        self.assertEqual(sorted(counts), ["a", "b", "c", "d"])
+        for count in counts.values():
+            self.assertTrue(700 < count < 1350, counts)
+
+    def test_minimal_movement(self):
+        before = self.owners(HashRing(["a", "b", "c"]))
+        after = self.owners(HashRing(["a", "b", "c", "d"]))
+        moved = [key for key in before if before[key] != after[key]]
+        # Only keys taken over by the new member move
+        self.assertTrue(all(after[key] == "d" for key in moved))
+        self.assertTrue(len(moved) < len(before) / 2)
+
+
+class ShardCoordinatorTest(unittest.TestCase):
+    """
+        Test the ShardCoordinator with a fake Zookeeper.
+    """
+
+    def setUp(self):
+        self.zookeeper = FakeZookeeper()
+        self.coordinators = []
+
+    def tearDown(self):
+        for coordinator in self.coordinators:
+            coordinator.stop()
+            coordinator.zookeeper_client.stop()
+            coordinator.join(5)
+
+    def create(self, member, start=True):
+        client = self.zookeeper.client()
+        client.start()
+        coordinator = ShardCoordinator(
+            zookeeper_client=client,
+            path="/notificationsvc/shards",
+            member=member,
+            bucket_count=256,
+            refresh_seconds=0.05,
+            metrics=MetricRegistry())
+        self.coordinators.append(coordinator)
+        if start:
+            coordinator.start()
+        return coordinator
+
+    def assert_partitioned(self, coordinators):
+        buckets = []
+        for coordinator in coordinators:
+            buckets.extend(coordinator.buckets())
+        self.assertEqual(sorted(buckets), range(256))
+
+    def converged(self, coordinators):
+        members = sorted(coordinator.member for coordinator in coordinators)
+        return all(coordinator.members == members for coordinator in coordinators)
+
+    def test_unregistered(self):
+        coordinator = self.create("a", start=False)
+        self.assertIsNone(coordinator.buckets())
+        self.assertTrue(coordinator.owns(12345))
+        self.assertEqual(coordinator.metrics.get("notifier_shard_buckets_owned"), 256)
+
+    def test_single(self):
+        coordinator = self.create("a")
+        self.assertTrue(wait_for(lambda: coordinator.buckets() is not None))
+        self.assertEqual(coordinator.buckets(), range(256))
+
+    def test_partition(self):
+        coordinators = [self.create(member) for member in ["a", "b", "c"]]
+        self.assertTrue(wait_for(lambda: self.converged(coordinators)))
+        self.assert_partitioned(coordinators)
+        for coordinator in coordinators:
+            self.assertTrue(len(coordinator.buckets()) > 30)
+            owned = coordinator.buckets()[0]
+            self.assertTrue(coordinator.owns(owned + 256 * 7))
+
+    def test_join_and_leave(self):
+        a, b = self.create("a"), self.create("b")
+        self.assertTrue(wait_for(lambda: self.converged([a, b])))
+        self.assert_partitioned([a, b])
+
+        c = self.create("c")
+        self.assertTrue(wait_for(lambda: self.converged([a, b, c])))
+        self.assert_partitioned([a, b, c])
+
+        c.stop()
+        self.assertTrue(wait_for(lambda: self.converged([a, b])))
+        self.assert_partitioned([a, b])
+        self.assertTrue(a.rebalances >= 3)
+
+    def test_session_expired(self):
+        a, b = self.create("a"), self.create("b")
+        self.assertTrue(wait_for(lambda: self.converged([a, b])))
+
+        # b's ephemeral node is deleted and a takes over; b
+        # re-registers on its next refresh and they rebalance.
+        b.zookeeper_client.expire()
+        self.assertTrue(wait_for(lambda: a.members == ["a", "b"] and \
+                len(a.buckets()) < 256 and self.converged([a, b])))
+        self.assert_partitioned([a, b])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import threading
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from providers.exceptions import InvalidParameterException, ProviderRequestException
+from providers.http import HttpConnectionPool
+from providers.sms import HttpSmsProvider, SmsGatewayClient
+
+from fakehttp import FakeSmsGateway
+
+
+class SmsProviderTest(unittest.TestCase):
+    """
+        Test the HttpSmsProvider against a local FakeSmsGateway.
+    """
+
+    def setUp(self):
+        self.gateway = FakeSmsGateway()
+        self.gateway.start()
+        self.connection_pool = HttpConnectionPool(
+            host=self.gateway.host,
+            port=self.gateway.port,
+            size=4,
+            timeout=5)
+
+    def tearDown(self):
+        self.connection_pool.close()
+        self.gateway.stop()
+
+    def _create_provider(self, max_batch_size=1, max_batch_delay=0.05):
+        self.client = SmsGatewayClient(
+            connection_pool=self.connection_pool,
+            path=self.gateway.path,
+            max_batch_size=max_batch_size,
+            max_batch_delay=max_batch_delay,
+            timeout=5)
+        return HttpSmsProvider(self.client, "+15555550100")
+
+    def test_send(self):
+        provider = self._create_provider()
+        message_id = provider.send(recipient="+15555550101", text="test message")
+        self.assertIsNotNone(message_id)
+        self.assertEqual(len(self.gateway.messages), 1)
+        self.assertEqual(self.gateway.messages[0]["to"], "+15555550101")
+        self.assertEqual(self.gateway.messages[0]["from"], "+15555550100")
+
+    def test_send_invalid(self):
+        provider = self._create_provider()
+        with self.assertRaises(InvalidParameterException):
+            provider.send(recipient=None, text="test message")
+        with self.assertRaises(InvalidParameterException):
+            provider.send(recipient="+15555550101", text="")
+
+    def test_connection_reuse(self):
+        provider = self._create_provider()
+        for i in range(10):
+            provider.send(recipient="+15555550101", text="test message %d" % i)
+        self.assertEqual(len(self.gateway.messages), 10)
+        self.assertEqual(self.gateway.connections, 1)
+        self.assertEqual(self.connection_pool.connections_created, 1)
+
+    def test_rejected(self):
+        provider = self._create_provider()
+        self.gateway.rejected_numbers.add("+15555550199")
+        with self.assertRaises(ProviderRequestException) as context:
+            provider.send(recipient="+15555550199", text="test message")
+        self.assertFalse(provider.is_throttle_error(context.exception))
+
+    def test_throttled(self):
+        provider = self._create_provider()
+        self.gateway.throttle_requests = 1
+        with self.assertRaises(ProviderRequestException) as context:
+            provider.send(recipient="+15555550101", text="test message")
+        self.assertTrue(provider.is_throttle_error(context.exception))
+
+    def test_batching(self):
+        provider = self._create_provider(max_batch_size=10, max_batch_delay=0.5)
+        self.gateway.rejected_numbers.add("+15555550199")
+        errors = []
+
+        def send(number):
+            try:
+                provider.send(recipient=number, text="test message")
+            except Exception as error:
+                errors.append(error)
+
+        numbers = ["+155555501%02d" % i for i in range(9)] + ["+15555550199"]
+        threads = [threading.Thread(target=send, args=(number,)) for number in numbers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.client.close()
+
+        self.assertEqual(len(self.gateway.requests), 1)
+        self.assertEqual(len(self.gateway.messages), 9)
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], ProviderRequestException)
+
+
+if __name__ == '__main__':
+    unittest.main()
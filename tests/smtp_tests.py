@@ -0,0 +1,160 @@
+import os
+import smtplib
+import socket
+import sys
+import threading
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from providers.exceptions import InvalidParameterException, OutcomeUnknownException
+from providers.smtp import SmtpProvider
+
+from fakesmtp import FakeSmtpServer
+
+
+class SmtpProviderTest(unittest.TestCase):
+    """
+        Test the SmtpProvider against a local FakeSmtpServer.
+    """
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _start_server(self, **kwargs):
+        self.server = FakeSmtpServer(**kwargs)
+        self.server.start()
+
+    def _create_provider(self, username=None, password=None, read_timeout=5):
+        return SmtpProvider(
+            username=username,
+            password=password,
+            host=self.server.host,
+            port=self.server.port,
+            from_email="Support <support@techresidents.com>",
+            use_tls=False,
+            connect_timeout=5,
+            read_timeout=read_timeout)
+
+    def _send(self, provider, recipient="user@techresidents.com"):
+        provider.send(
+            recipient=recipient,
+            subject="subject",
+            plain_text="plain text",
+            html_text="<p>html text</p>")
+
+    def test_send(self):
+        self._start_server()
+        self._send(self._create_provider())
+        self.assertEqual(len(self.server.messages), 1)
+        message = self.server.messages[0]
+        self.assertEqual(message.rcpt_tos, ["<user@techresidents.com>"])
+        self.assertIn("Subject: =?utf-8?q?subject?=", message.data)
+
+    def test_send_invalid(self):
+        self._start_server()
+        with self.assertRaises(InvalidParameterException):
+            self._send(self._create_provider(), recipient=None)
+        self.assertEqual(self.server.connections, 0)
+
+    def test_auth(self):
+        self._start_server(username="user", password="secret")
+        self._send(self._create_provider(username="user", password="secret"))
+        self.assertEqual(len(self.server.messages), 1)
+
+        with self.assertRaises(smtplib.SMTPAuthenticationError):
+            self._send(self._create_provider(username="user", password="wrong"))
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_transient_error(self):
+        self._start_server(transient_error_rate=1)
+        provider = self._create_provider()
+        with self.assertRaises(smtplib.SMTPResponseException) as context:
+            self._send(provider)
+        self.assertTrue(provider.is_throttle_error(context.exception))
+
+    def test_permanent_error(self):
+        self._start_server(permanent_error_rate=1)
+        provider = self._create_provider()
+        with self.assertRaises(smtplib.SMTPResponseException) as context:
+            self._send(provider)
+        self.assertFalse(provider.is_throttle_error(context.exception))
+
+    def test_disconnect(self):
+        self._start_server(disconnect_rate=1)
+        provider = self._create_provider()
+        with self.assertRaises(smtplib.SMTPServerDisconnected) as context:
+            self._send(provider)
+        self.assertTrue(provider.is_throttle_error(context.exception))
+
+    def test_latency_timeout(self):
+        self._start_server(latency={"MAIL": 1})
+        provider = self._create_provider(read_timeout=0.2)
+        with self.assertRaises((socket.timeout, smtplib.SMTPServerDisconnected)) as context:
+            self._send(provider)
+        self.assertTrue(provider.is_throttle_error(context.exception))
+
+    def test_data_timeout_outcome_unknown(self):
+        # The server has the message when the reply times out
+        self._start_server(latency={"DATA": 1})
+        provider = self._create_provider(read_timeout=0.2)
+        with self.assertRaises(OutcomeUnknownException):
+            self._send(provider)
+
+    def _send_aborted(self, provider, delay=0.2):
+        timer = threading.Timer(delay, provider.abort)
+        timer.start()
+        try:
+            self._send(provider)
+        finally:
+            timer.cancel()
+
+    def test_abort_before_data(self):
+        self._start_server(latency={"RCPT": 1})
+        provider = self._create_provider(read_timeout=None)
+        with self.assertRaises((socket.error, smtplib.SMTPServerDisconnected)):
+            self._send_aborted(provider)
+
+    def test_abort_after_data(self):
+        self._start_server(latency={"DATA": 1})
+        provider = self._create_provider(read_timeout=None)
+        with self.assertRaises(OutcomeUnknownException):
+            self._send_aborted(provider)
+
+    def test_throughput_cap(self):
+        self._start_server(max_messages_per_second=2)
+        provider = self._create_provider()
+        self._send(provider)
+        self._send(provider)
+        # The server closes the connection after its 421 reply,
+        # which smtplib may surface as a disconnect.
+        with self.assertRaises((smtplib.SMTPResponseException, smtplib.SMTPServerDisconnected)) as context:
+            self._send(provider)
+        self.assertTrue(provider.is_throttle_error(context.exception))
+        self.assertEqual(len(self.server.messages), 2)
+
+    def test_deterministic_faults(self):
+        outcomes = []
+        for run in range(2):
+            self._start_server(transient_error_rate=0.5, seed=42)
+            provider = self._create_provider()
+            result = []
+            for i in range(10):
+                try:
+                    self._send(provider)
+                    result.append(True)
+                except smtplib.SMTPException:
+                    result.append(False)
+            outcomes.append(result)
+            self.server.stop()
+        self._start_server()
+        self.assertEqual(outcomes[0], outcomes[1])
+        self.assertIn(True, outcomes[0])
+        self.assertIn(False, outcomes[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import datetime
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trsvcscore.db.models import Notification as NotificationModel
+from trsvcscore.db.models import NotificationJob as NotificationJobModel
+
+from constants import CANCELLED_JOB_OWNER
+from jobqueue import JobDeferred, JobOutcomeUnknown
+from status import create_status, load_statuses, update_status
+
+from jobqueue_tests import JobQueueTestCase, OWNER
+
+
+class StatusTest(JobQueueTestCase):
+
+    def _counts(self, token="token"):
+        self.db_session.expire_all()
+        return load_statuses(self.db_session, [token])[token][:5]
+
+    def test_create(self):
+        notification = NotificationModel(
+            created=self.now,
+            token="created",
+            context="test",
+            priority=50,
+            subject="subject",
+            plain_text="text",
+            html_text="html")
+        self.db_session.add(notification)
+        self.db_session.flush()
+        create_status(self.db_session, notification.id, "created", pending=3, created=self.now)
+        self.db_session.commit()
+
+        statuses = load_statuses(self.db_session, ["created", "missing"])
+        self.assertEqual(statuses.keys(), ["created"])
+        self.assertEqual(statuses["created"],
+                         (3, 0, 0, 0, 0, self.now, self.now, None))
+
+    def test_update(self):
+        other = self._notification(token="other")
+        update_status(self.db_session, self.notification.id, pending=4)
+        update_status(self.db_session, self.notification.id, pending=-1, sent=1)
+        update_status(self.db_session, self.notification.id, pending=-1, failed=1)
+        update_status(self.db_session, self.notification.id, pending=-1, cancelled=1)
+        update_status(self.db_session, self.notification.id, pending=-1, unknown=1)
+        self.db_session.commit()
+
+        self.assertEqual(self._counts(), (0, 1, 1, 1, 1))
+        self.assertIsNotNone(load_statuses(self.db_session, ["token"])["token"][7])
+
+        # Only the updated notification's status changes
+        self.assertEqual(self._counts(other.token), (0, 0, 0, 0, 0))
+        self.assertIsNone(load_statuses(self.db_session, ["other"])["other"][7])
+
+    def test_job_outcomes(self):
+        def run(error=None):
+            try:
+                with self._database_job(self._job()):
+                    if error is not None:
+                        raise error
+            except Exception:
+                pass
+
+        run()
+        run(RuntimeError())
+        run(JobOutcomeUnknown())
+        self.assertEqual(self._counts(), (0, 1, 1, 0, 1))
+
+    def test_deferral_not_counted(self):
+        job_id = self._job()
+        with self.assertRaises(JobDeferred):
+            with self._database_job(job_id):
+                raise JobDeferred()
+        self.assertEqual(self._counts(), (1, 0, 0, 0, 0))
+
+        # The deferred job is counted once when it's processed
+        with self._database_job(job_id):
+            pass
+        self.assertEqual(self._counts(), (0, 1, 0, 0, 0))
+
+    def test_aggregate_without_status(self):
+        notification = NotificationModel(
+            created=self.now,
+            token="legacy",
+            context="test",
+            priority=50,
+            subject="subject",
+            plain_text="text",
+            html_text="html")
+        self.db_session.add(notification)
+        self.db_session.flush()
+
+        end = self.now + datetime.timedelta(seconds=1)
+        for owner, job_end, successful in [
+                (None, None, None),
+                (OWNER, None, None),
+                (OWNER, end, True),
+                (OWNER, end, False),
+                (CANCELLED_JOB_OWNER, end, False),
+                (OWNER, end, None)]:
+            self.db_session.add(NotificationJobModel(
+                created=self.now,
+                not_before=self.now,
+                notification_id=notification.id,
+                recipient_id=1,
+                priority=50,
+                retries_remaining=0,
+                owner=owner,
+                start=self.now if owner is not None else None,
+                end=job_end,
+                successful=successful))
+        self.db_session.commit()
+
+        self.assertEqual(load_statuses(self.db_session, ["legacy"])["legacy"],
+                         (2, 1, 1, 1, 1, self.now, end, end))
+
+
+if __name__ == '__main__':
+    unittest.main()
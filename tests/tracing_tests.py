@@ -0,0 +1,133 @@
+import datetime
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from constants import NOTIFICATION_PRIORITY_VALUES
+from metrics import Histogram, MetricRegistry
+from tracing import LatencyTracer, to_timestamp, \
+    TRACE_ACCEPTED, TRACE_CLAIMED, TRACE_DEQUEUED, TRACE_RENDERED
+
+
+class Notification(object):
+    def __init__(self, created):
+        self.created = created
+
+
+class Job(object):
+    def __init__(self, created, not_before, priority):
+        self.id = 1
+        self.notification_id = 2
+        self.notification = Notification(created)
+        self.not_before = not_before
+        self.priority = priority
+
+
+class HistogramTest(unittest.TestCase):
+    """
+        Test the Histogram.
+    """
+
+    def test_percentiles(self):
+        histogram = Histogram(bounds=(10, 100, 1000))
+        for value in range(1, 101):
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.sum, 5050)
+        self.assertEqual(histogram.max, 100)
+        self.assertEqual(histogram.percentile(5), 10)
+        self.assertEqual(histogram.percentile(50), 100)
+        self.assertEqual(histogram.percentile(99), 100)
+
+    def test_overflow(self):
+        histogram = Histogram(bounds=(10,))
+        histogram.observe(5)
+        histogram.observe(5000)
+        self.assertEqual(histogram.percentile(99), 5000)
+
+    def test_empty(self):
+        self.assertEqual(Histogram().percentile(50), 0)
+
+    def test_registry(self):
+        metrics = MetricRegistry()
+        metrics.observe("latency_ms", 3)
+        metrics.observe("latency_ms", 7)
+        counters = metrics.as_dict()
+        self.assertEqual(counters["latency_ms_count"], 2)
+        self.assertEqual(counters["latency_ms_sum"], 10)
+        self.assertEqual(counters["latency_ms_max"], 7)
+        self.assertEqual(metrics.get("latency_ms_count"), 2)
+        self.assertEqual(metrics.get("latency_ms_p50"), 5)
+        self.assertIsNone(metrics.get("latency_other_count"))
+
+
+class LatencyTracerTest(unittest.TestCase):
+    """
+        Test the LatencyTracer.
+    """
+
+    def setUp(self):
+        self.metrics = MetricRegistry()
+        self.created = datetime.datetime(2013, 1, 1, 12, 0, 0)
+        self.ready = to_timestamp(self.created)
+
+    def test_to_timestamp(self):
+        self.assertEqual(to_timestamp(datetime.datetime(1970, 1, 1, 0, 0, 1, 500000)), 1.5)
+
+    def test_record(self):
+        tracer = LatencyTracer(self.metrics)
+        job = Job(self.created, self.created, NOTIFICATION_PRIORITY_VALUES["HIGH_PRIORITY"])
+        tracer.record(job, {
+            TRACE_DEQUEUED: self.ready + 2.0,
+            TRACE_CLAIMED: self.ready + 2.125,
+            TRACE_RENDERED: self.ready + 2.25,
+            TRACE_ACCEPTED: self.ready + 3.0
+        })
+
+        counters = self.metrics.as_dict()
+        self.assertEqual(counters["latency_high_queued_ms_sum"], 2000)
+        self.assertEqual(counters["latency_high_claim_ms_sum"], 125)
+        self.assertEqual(counters["latency_high_render_ms_sum"], 125)
+        self.assertEqual(counters["latency_high_send_ms_sum"], 750)
+        self.assertEqual(counters["latency_high_total_ms_sum"], 3000)
+        self.assertEqual(counters["latency_high_total_ms_count"], 1)
+
+    def test_not_before(self):
+        tracer = LatencyTracer(self.metrics)
+        not_before = self.created + datetime.timedelta(seconds=60)
+        job = Job(self.created, not_before, NOTIFICATION_PRIORITY_VALUES["LOW_PRIORITY"])
+        tracer.record(job, {
+            TRACE_DEQUEUED: self.ready + 61,
+            TRACE_ACCEPTED: self.ready + 62
+        })
+        counters = self.metrics.as_dict()
+        self.assertEqual(counters["latency_low_queued_ms_sum"], 1000)
+        self.assertEqual(counters["latency_low_total_ms_sum"], 2000)
+        self.assertNotIn("latency_low_claim_ms_count", counters)
+
+    def test_record_commit(self):
+        tracer = LatencyTracer(self.metrics)
+        tracer.record_commit(NOTIFICATION_PRIORITY_VALUES["DEFAULT_PRIORITY"], 100.0, 100.25)
+        self.assertEqual(self.metrics.get("latency_default_commit_ms_sum"), 250)
+
+    def test_sampling(self):
+        samples = iter([0.5, 0.05])
+        tracer = LatencyTracer(self.metrics, sample_rate=0.1, random=lambda: next(samples))
+        logged = []
+        tracer.log.info = logged.append
+        job = Job(self.created, self.created, NOTIFICATION_PRIORITY_VALUES["HIGH_PRIORITY"])
+        trace = {TRACE_DEQUEUED: self.ready + 1, TRACE_ACCEPTED: self.ready + 2}
+        tracer.record(job, trace)
+        tracer.record(job, trace)
+        self.assertEqual(len(logged), 1)
+        self.assertIn("notification_job_id=1", logged[0])
+        self.assertIn("total=2000.0ms", logged[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from metrics import MetricRegistry
+from watchdog import SendWatchdog
+
+
+class SendWatchdogTest(unittest.TestCase):
+    """
+        Test the SendWatchdog.
+    """
+
+    def setUp(self):
+        self.metrics = MetricRegistry()
+        self.watchdog = SendWatchdog(timeout=10, metrics=self.metrics)
+        self.aborted = []
+
+    def _abort(self):
+        self.aborted.append(True)
+
+    def test_watch_within_deadline(self):
+        with self.watchdog.watch("job=1", self._abort) as send:
+            self.assertEqual(self.metrics.get("notifier_sends_in_flight"), 1)
+            self.assertEqual(self.watchdog.check(), [])
+        self.assertFalse(send.expired)
+        self.assertEqual(self.aborted, [])
+        self.assertEqual(self.metrics.get("notifier_sends_in_flight"), 0)
+        self.assertIsNone(self.metrics.get("notifier_send_timeouts"))
+
+    def test_watch_exceeds_deadline(self):
+        with self.watchdog.watch("job=1", self._abort) as send:
+            overdue = self.watchdog.check(now=time.time() + 11)
+            self.assertEqual(overdue, ["job=1"])
+
+            # Overdue sends are only reported once
+            overdue = self.watchdog.check(now=time.time() + 12)
+            self.assertEqual(overdue, [])
+
+        self.assertTrue(send.expired)
+        self.assertEqual(self.aborted, [True])
+        self.assertEqual(self.metrics.get("notifier_send_timeouts"), 1)
+
+    def test_start_stop(self):
+        self.watchdog.start()
+        self.watchdog.stop()
+        self.watchdog.join(1)
+        self.assertFalse(self.watchdog.watchdog_thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
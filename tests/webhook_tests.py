@@ -0,0 +1,109 @@
+import os
+import sys
+import threading
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from providers.exceptions import InvalidParameterException, ProviderRequestException
+from providers.webhook import WebhookClient, WebhookProvider
+
+from fakehttp import FakeWebhookEndpoint
+
+
+class WebhookProviderTest(unittest.TestCase):
+    """
+        Test the WebhookProvider against a local FakeWebhookEndpoint.
+    """
+
+    def setUp(self):
+        self.endpoint = FakeWebhookEndpoint()
+        self.endpoint.start()
+        self.client = None
+
+    def tearDown(self):
+        if self.client is not None:
+            self.client.close()
+        self.endpoint.stop()
+
+    def _create_provider(self, secret="secret", max_batch_size=50, max_batch_delay=0.01):
+        self.client = WebhookClient(
+            secret=secret,
+            pool_size=4,
+            max_batch_size=max_batch_size,
+            max_batch_delay=max_batch_delay,
+            timeout=5,
+            clock=lambda: 1000)
+        return WebhookProvider(
+            client=self.client,
+            urls={"billing": self.endpoint.url("/billing")},
+            default_url=self.endpoint.url("/default"))
+
+    def test_send(self):
+        provider = self._create_provider()
+        provider.send(context="billing", event={"id": 1})
+        provider.send(context="other", event={"id": 2})
+        self.assertEqual(self.endpoint.events, {
+            "/billing": [{"id": 1}],
+            "/default": [{"id": 2}]
+        })
+
+    def test_send_invalid(self):
+        provider = self._create_provider()
+        with self.assertRaises(InvalidParameterException):
+            provider.send(context="billing", event=None)
+
+        provider.default_url = None
+        with self.assertRaises(InvalidParameterException):
+            provider.send(context="other", event={"id": 1})
+
+    def test_signature(self):
+        provider = self._create_provider()
+        provider.send(context="billing", event={"id": 1})
+        timestamp, signature, body = self.endpoint.signatures[0]
+        self.assertEqual(timestamp, "1000")
+        self.assertEqual(signature, self.client.sign(timestamp, body))
+        self.assertNotEqual(signature, self.client.sign("1001", body))
+
+    def test_unsigned(self):
+        provider = self._create_provider(secret=None)
+        provider.send(context="billing", event={"id": 1})
+        timestamp, signature, body = self.endpoint.signatures[0]
+        self.assertIsNone(timestamp)
+        self.assertIsNone(signature)
+
+    def test_failure(self):
+        provider = self._create_provider()
+        self.endpoint.fail_requests = 1
+        with self.assertRaises(ProviderRequestException) as context:
+            provider.send(context="billing", event={"id": 1})
+        self.assertFalse(provider.is_throttle_error(context.exception))
+
+    def test_connection_reuse(self):
+        provider = self._create_provider()
+        for i in range(10):
+            provider.send(context="billing", event={"id": i})
+        self.assertEqual(len(self.endpoint.events["/billing"]), 10)
+        self.assertEqual(self.endpoint.connections, 1)
+
+    def test_batching(self):
+        provider = self._create_provider(max_batch_size=10, max_batch_delay=0.5)
+
+        def send(index):
+            provider.send(context="billing", event={"id": index})
+
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.endpoint.requests), 1)
+        self.assertEqual(sorted(event["id"] for event in self.endpoint.events["/billing"]), range(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import signal
+import sys
+import threading
+import time
+import unittest
+
+SERVICE_NAME = "notificationsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from metrics import MetricRegistry
+from workers import WorkerSupervisor
+
+
+class FakeWorker(object):
+    """Worker counting jobs until stopped."""
+    def __init__(self, index, count):
+        self.index = index
+        self.metrics = MetricRegistry()
+        self.metrics.set("worker_index_%d" % index, 1)
+        self.exit_event = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+
+    def run(self):
+        while not self.exit_event.is_set():
+            self.metrics.increment("jobs")
+            self.metrics.observe("latency_ms", 3)
+            self.exit_event.wait(0.01)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.exit_event.set()
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class WorkerSupervisorTest(unittest.TestCase):
+    """
+        Test the WorkerSupervisor.
+    """
+
+    def setUp(self):
+        self.supervisor = WorkerSupervisor(
+            num_processes=2,
+            factory=FakeWorker,
+            metrics_seconds=0.05,
+            restart_seconds=0.1,
+            stop_timeout=5,
+            poll_seconds=0.05)
+        self.supervisor.start()
+        self.assertTrue(wait_for(lambda: self.supervisor.alive() == 2))
+
+    def tearDown(self):
+        self.supervisor.stop()
+        self.supervisor.join(10)
+
+    def test_metrics(self):
+        metrics = MetricRegistry()
+        metrics.increment("jobs", 1000)
+        metrics.register_source(self.supervisor.metrics)
+
+        self.assertTrue(wait_for(lambda: len(self.supervisor.metrics()) == 2))
+        counters = metrics.as_dict()
+        self.assertEqual(counters["worker_index_0"], 1)
+        self.assertEqual(counters["worker_index_1"], 1)
+        self.assertTrue(counters["jobs"] > 1000)
+        self.assertTrue(counters["latency_ms_count"] > 0)
+        self.assertEqual(metrics.get("latency_ms_max"), 3)
+        self.assertEqual(metrics.counters["jobs"], 1000)
+
+    def test_stop(self):
+        self.supervisor.stop()
+        self.supervisor.join(10)
+        self.assertFalse(self.supervisor.monitor_thread.is_alive())
+        self.assertEqual(self.supervisor.exitcodes, {0: 0, 1: 0})
+        self.assertEqual(self.supervisor.zygote.exitcode, 0)
+        self.assertEqual(self.supervisor.alive(), 0)
+
+    def test_stop_on_start(self):
+        # Workers stopped before they've installed their
+        # SIGTERM handler still exit cleanly.
+        supervisor = WorkerSupervisor(
+            num_processes=2,
+            factory=FakeWorker,
+            stop_timeout=5,
+            poll_seconds=0.05)
+        supervisor.start()
+        supervisor.stop()
+        supervisor.join(10)
+        self.assertEqual(supervisor.exitcodes, {0: 0, 1: 0})
+
+    def test_restart(self):
+        pid = self.supervisor.pids[0]
+        os.kill(pid, signal.SIGKILL)
+        self.assertTrue(wait_for(lambda: self.supervisor.restarts == 1 and \
+                self.supervisor.alive() == 2))
+        self.assertNotEqual(self.supervisor.pids[0], pid)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,2 +1,2 @@
-VERSION = "0.5.0"
+VERSION = "0.6.0"
 BUILD = None
\ No newline at end of file